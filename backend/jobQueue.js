@@ -0,0 +1,691 @@
+/**
+ * GradStat analysis job queue
+ * Durable job records (file journal by default, Redis with JOB_STORE=redis)
+ * and a bounded number of concurrent runs per backend, in priority then
+ * FIFO order, with retries, cancellation, idempotency keys and TTL-based
+ * cleanup
+ *
+ * Copyright (c) 2024-2025 Kashif Ramay
+ * All rights reserved.
+ */
+
+const EventEmitter = require('events');
+const fsp = require('fs').promises;
+const os = require('os');
+const path = require('path');
+const { v4: uuidv4 } = require('uuid');
+
+const MAX_PRIORITY = 9;
+const DEFAULT_PRIORITY = 5;
+// Journal lines appended before the file store rewrites its journal
+const COMPACT_AFTER_WRITES = 1000;
+// Statuses a job does not leave
+const FINISHED_STATUSES = ['done', 'failed', 'cancelled'];
+// Finished jobs that a repeated idempotency key does not return
+const RESUBMITTABLE_STATUSES = ['failed', 'cancelled'];
+
+/**
+ * Queue order of a job: higher priority first, then oldest first
+ */
+function jobScore(priority, createdMs) {
+  return (MAX_PRIORITY - priority) * 1e13 + createdMs;
+}
+
+/**
+ * Clamp a requested priority to 0 (lowest) .. MAX_PRIORITY (highest)
+ */
+function normalizePriority(value) {
+  const priority = parseInt(value, 10);
+  if (Number.isNaN(priority)) return DEFAULT_PRIORITY;
+  return Math.min(Math.max(priority, 0), MAX_PRIORITY);
+}
+
+/**
+ * Whether a failed run is worth retrying: the worker was unreachable or
+ * overloaded. Analysis errors (4xx/500) and timeouts of long analyses are not.
+ */
+function isRetryable(error) {
+  const status = error.response?.status;
+  if (status) return [429, 502, 503, 504].includes(status);
+  return ['ECONNREFUSED', 'ECONNRESET', 'EPIPE', 'EAI_AGAIN', 'ENOTFOUND'].includes(error.code);
+}
+
+/**
+ * Job store backed by an append-only JSON-lines journal
+ *
+ * Every change appends the full job record; the journal is replayed on
+ * start and rewritten (compacted) on start and every COMPACT_AFTER_WRITES
+ * changes. Meant for a single backend instance: jobs found running on
+ * start belonged to a previous process and are queued again, and every
+ * job's upload is local, so claims ignore the job's uploadHost.
+ */
+class FileJobStore {
+  constructor(dir) {
+    this.dir = dir;
+    this.file = path.join(dir, 'jobs.jsonl');
+    this.jobs = new Map();
+    this.idempotency = new Map();
+    this.seq = 0;
+    this.writes = Promise.resolve();
+    this.appended = 0;
+  }
+
+  async open() {
+    await fsp.mkdir(this.dir, { recursive: true });
+    let text = '';
+    try {
+      text = await fsp.readFile(this.file, 'utf-8');
+    } catch (error) {
+      if (error.code !== 'ENOENT') throw error;
+    }
+    for (const line of text.split('\n')) {
+      if (!line.trim()) continue;
+      let entry;
+      try {
+        entry = JSON.parse(line);
+      } catch {
+        // Torn last line from a crash mid-write
+        continue;
+      }
+      if (entry.deleted) {
+        this.jobs.delete(entry.id);
+      } else {
+        this.jobs.set(entry.id, entry);
+      }
+    }
+    for (const job of this.jobs.values()) {
+      this.seq = Math.max(this.seq, job.seq || 0);
+      if (job.idempotencyKey) this.idempotency.set(job.idempotencyKey, job.id);
+      if (job.status === 'running') {
+        job.status = 'pending';
+        job.logs.push('Backend restarted, job queued again');
+      }
+    }
+    await this._write(() => this._compact());
+    return this.jobs.size;
+  }
+
+  _write(operation) {
+    this.writes = this.writes.then(operation).catch((error) => {
+      console.error('Job journal write failed:', error.message);
+    });
+    return this.writes;
+  }
+
+  async _compact() {
+    const tmp = `${this.file}.tmp`;
+    const lines = [...this.jobs.values()].map((job) => JSON.stringify(job) + '\n').join('');
+    await fsp.writeFile(tmp, lines);
+    await fsp.rename(tmp, this.file);
+    this.appended = 0;
+  }
+
+  _save(entry) {
+    return this._write(async () => {
+      await fsp.appendFile(this.file, JSON.stringify(entry) + '\n');
+      this.appended += 1;
+      if (this.appended >= COMPACT_AFTER_WRITES) {
+        await this._compact();
+      }
+    });
+  }
+
+  async create(job) {
+    if (job.idempotencyKey) {
+      const existing = this.jobs.get(this.idempotency.get(job.idempotencyKey));
+      if (existing && !RESUBMITTABLE_STATUSES.includes(existing.status)) {
+        return { job: structuredClone(existing), created: false };
+      }
+      this.idempotency.set(job.idempotencyKey, job.id);
+    }
+    const record = { ...job, seq: ++this.seq };
+    this.jobs.set(record.id, record);
+    await this._save(record);
+    return { job: structuredClone(record), created: true };
+  }
+
+  async get(id) {
+    const job = this.jobs.get(id);
+    return job ? structuredClone(job) : null;
+  }
+
+  async update(id, patch, log) {
+    const job = this.jobs.get(id);
+    if (!job) return null;
+    Object.assign(job, patch, { updatedAt: new Date().toISOString() });
+    if (log) job.logs.push(log);
+    await this._save(job);
+    return structuredClone(job);
+  }
+
+  async claim(owner) {
+    const now = Date.now();
+    let next = null;
+    for (const job of this.jobs.values()) {
+      if (job.status !== 'pending' || (job.runAfter && job.runAfter > now)) continue;
+      if (!next || job.score < next.score || (job.score === next.score && job.seq < next.seq)) {
+        next = job;
+      }
+    }
+    if (!next) return null;
+    return this.update(next.id, {
+      status: 'running',
+      owner,
+      attempts: next.attempts + 1,
+      startedAt: new Date().toISOString(),
+      heartbeatAt: now,
+    });
+  }
+
+  async release(id, runAfter, log) {
+    return this.update(id, { status: 'pending', owner: null, runAfter }, log);
+  }
+
+  async list(status) {
+    return [...this.jobs.values()].filter((job) => job.status === status).map((job) => structuredClone(job));
+  }
+
+  async position(id) {
+    const job = this.jobs.get(id);
+    if (!job || job.status !== 'pending') return null;
+    let ahead = 0;
+    for (const other of this.jobs.values()) {
+      if (other.status === 'pending' && (other.score < job.score || (other.score === job.score && other.seq < job.seq))) {
+        ahead += 1;
+      }
+    }
+    return ahead;
+  }
+
+  async remove(id) {
+    const job = this.jobs.get(id);
+    if (!job) return;
+    this.jobs.delete(id);
+    if (job.idempotencyKey && this.idempotency.get(job.idempotencyKey) === id) {
+      this.idempotency.delete(job.idempotencyKey);
+    }
+    await this._save({ id, deleted: true });
+  }
+
+  async counts() {
+    const counts = { pending: 0, running: 0, done: 0, failed: 0, cancelled: 0 };
+    for (const job of this.jobs.values()) {
+      counts[job.status] = (counts[job.status] || 0) + 1;
+    }
+    return counts;
+  }
+
+  async close() {
+    await this.writes;
+  }
+}
+
+/**
+ * Job store in Redis (ioredis client), shared by several backends
+ *
+ * Job records are JSON strings; pending jobs sit in a sorted set scored by
+ * jobScore (claimed atomically with ZPOPMIN), retries wait in a second
+ * sorted set scored by their due time, and finished jobs expire after the
+ * job TTL. A job whose upload is on one backend's local disk (uploadHost)
+ * waits in that host's own pending set, so only that backend claims it;
+ * jobs without uploadHost (no file, or uploads on shared storage) can be
+ * claimed by any backend.
+ */
+class RedisJobStore {
+  constructor(redis, { prefix = 'gradstat:jobs:', ttlMs = 24 * 60 * 60 * 1000 } = {}) {
+    this.redis = redis;
+    this.prefix = prefix;
+    this.ttlMs = ttlMs;
+  }
+
+  _key(name) {
+    return `${this.prefix}${name}`;
+  }
+
+  _pendingKey(job) {
+    return this._key(job.uploadHost ? `pending:${job.uploadHost}` : 'pending');
+  }
+
+  async open() {
+    await this.redis.ping();
+    return this.redis.scard(this._key('status:pending'));
+  }
+
+  async _put(job, previousStatus) {
+    const multi = this.redis.multi();
+    if (FINISHED_STATUSES.includes(job.status)) {
+      multi.set(this._key(`job:${job.id}`), JSON.stringify(job), 'PX', this.ttlMs);
+    } else {
+      multi.set(this._key(`job:${job.id}`), JSON.stringify(job));
+    }
+    if (previousStatus !== job.status) {
+      if (previousStatus) multi.srem(this._key(`status:${previousStatus}`), job.id);
+      multi.sadd(this._key(`status:${job.status}`), job.id);
+    }
+    await multi.exec();
+  }
+
+  async create(job) {
+    if (job.idempotencyKey) {
+      const idemKey = this._key(`idem:${job.idempotencyKey}`);
+      const reserved = await this.redis.set(idemKey, job.id, 'PX', this.ttlMs, 'NX');
+      if (!reserved) {
+        const existing = await this.get(await this.redis.get(idemKey));
+        if (existing && !RESUBMITTABLE_STATUSES.includes(existing.status)) {
+          return { job: existing, created: false };
+        }
+        await this.redis.set(idemKey, job.id, 'PX', this.ttlMs);
+      }
+    }
+    await this._put(job, null);
+    await this.redis.zadd(this._pendingKey(job), job.score, job.id);
+    return { job, created: true };
+  }
+
+  async get(id) {
+    if (!id) return null;
+    const text = await this.redis.get(this._key(`job:${id}`));
+    return text ? JSON.parse(text) : null;
+  }
+
+  async update(id, patch, log) {
+    const job = await this.get(id);
+    if (!job) return null;
+    const previousStatus = job.status;
+    Object.assign(job, patch, { updatedAt: new Date().toISOString() });
+    if (log) job.logs.push(log);
+    await this._put(job, previousStatus);
+    return job;
+  }
+
+  /**
+   * Claim the next job this backend can run: the first of the shared
+   * pending set and the pending set of its own uploads (host)
+   */
+  async claim(owner, host = null) {
+    // Move retries that are due back to their pending set
+    const due = await this.redis.zrangebyscore(this._key('delayed'), 0, Date.now());
+    for (const id of due) {
+      const job = await this.get(id);
+      if (await this.redis.zrem(this._key('delayed'), id) && job) {
+        await this.redis.zadd(this._pendingKey(job), job.score, id);
+      }
+    }
+
+    const keys = [this._key('pending')];
+    if (host) keys.push(this._pendingKey({ uploadHost: host }));
+    for (;;) {
+      let next = null;
+      for (const key of keys) {
+        const [, score] = await this.redis.zrange(key, 0, 0, 'WITHSCORES');
+        if (score !== undefined && (next === null || Number(score) < next.score)) {
+          next = { key, score: Number(score) };
+        }
+      }
+      if (!next) return null;
+      const popped = await this.redis.zpopmin(next.key);
+      if (!popped || popped.length === 0) continue;
+      const job = await this.get(popped[0]);
+      if (!job || job.status !== 'pending') continue;
+      return this.update(job.id, {
+        status: 'running',
+        owner,
+        attempts: job.attempts + 1,
+        startedAt: new Date().toISOString(),
+        heartbeatAt: Date.now(),
+      });
+    }
+  }
+
+  async release(id, runAfter, log) {
+    const job = await this.update(id, { status: 'pending', owner: null, runAfter }, log);
+    if (!job) return null;
+    if (runAfter && runAfter > Date.now()) {
+      await this.redis.zadd(this._key('delayed'), runAfter, id);
+    } else {
+      await this.redis.zadd(this._pendingKey(job), job.score, id);
+    }
+    return job;
+  }
+
+  async list(status) {
+    const ids = await this.redis.smembers(this._key(`status:${status}`));
+    if (ids.length === 0) return [];
+    const texts = await this.redis.mget(ids.map((id) => this._key(`job:${id}`)));
+    const jobs = [];
+    const expired = [];
+    texts.forEach((text, i) => (text ? jobs.push(JSON.parse(text)) : expired.push(ids[i])));
+    if (expired.length > 0) {
+      await this.redis.srem(this._key(`status:${status}`), ...expired);
+    }
+    return jobs;
+  }
+
+  async position(id) {
+    const job = await this.get(id);
+    return job ? this.redis.zrank(this._pendingKey(job), id) : null;
+  }
+
+  async remove(id) {
+    const job = await this.get(id);
+    const multi = this.redis.multi()
+      .del(this._key(`job:${id}`))
+      .zrem(this._key('delayed'), id);
+    if (job) {
+      multi.zrem(this._pendingKey(job), id).srem(this._key(`status:${job.status}`), id);
+    }
+    await multi.exec();
+    if (job?.idempotencyKey && (await this.redis.get(this._key(`idem:${job.idempotencyKey}`))) === id) {
+      await this.redis.del(this._key(`idem:${job.idempotencyKey}`));
+    }
+  }
+
+  async counts() {
+    // Pending jobs are spread over the shared, per-host and delayed sets
+    const [pending, running, done, failed, cancelled] = await Promise.all([
+      this.redis.scard(this._key('status:pending')),
+      this.redis.scard(this._key('status:running')),
+      this.redis.scard(this._key('status:done')),
+      this.redis.scard(this._key('status:failed')),
+      this.redis.scard(this._key('status:cancelled')),
+    ]);
+    return { pending, running, done, failed, cancelled };
+  }
+
+  async close() {
+    await this.redis.quit();
+  }
+}
+
+/**
+ * Runs jobs from a store with bounded concurrency
+ *
+ * The handler receives the claimed job, a report(patch, log) function for
+ * progress updates and an AbortSignal that fires when the job is cancelled,
+ * and resolves with the fields to store on success. Failed runs are retried
+ * with exponential backoff while isRetryable and attempts remain; onSettled
+ * is called once a job is done, failed for good or cancelled. Every change
+ * to a job made through the queue is emitted as a 'job' event.
+ *
+ * Uploads are assumed to be on this backend's local disk: jobs with a file
+ * record the backend's host (options.host, default os.hostname()) and only
+ * that backend claims them. Pass host: null when uploads are on storage
+ * every backend mounts.
+ */
+class JobQueue extends EventEmitter {
+  constructor(store, handler, options = {}) {
+    super();
+    this.store = store;
+    this.handler = handler;
+    this.concurrency = options.concurrency || 2;
+    this.maxAttempts = options.maxAttempts || 3;
+    this.retryDelayMs = options.retryDelayMs || 5000;
+    this.ttlMs = options.ttlMs || 24 * 60 * 60 * 1000;
+    this.staleMs = options.staleMs || 15 * 60 * 1000;
+    this.pollMs = options.pollMs || 1000;
+    this.onSettled = options.onSettled || (async () => {});
+    this.owner = options.owner || uuidv4();
+    this.host = options.host === undefined ? os.hostname() : options.host;
+    this.active = 0;
+    this.pumping = false;
+    this.timer = null;
+    // AbortControllers of the jobs running on this backend, by job id
+    this.controllers = new Map();
+    this.counters = { submitted: 0, deduplicated: 0, completed: 0, failed: 0, retried: 0, cancelled: 0 };
+  }
+
+  async start() {
+    const restored = await this.store.open();
+    console.log(`Job queue started (${this.concurrency} concurrent, ${restored} jobs restored)`);
+    // Polling picks up retries that become due, jobs queued by other backends
+    // and cancellations of local jobs requested through other backends
+    this.timer = setInterval(() => {
+      this.pump();
+      this._abortCancelled();
+    }, this.pollMs);
+    this.timer.unref();
+    this.pump();
+  }
+
+  async stop() {
+    clearInterval(this.timer);
+    this.timer = null;
+    await this.store.close();
+  }
+
+  /**
+   * Queue a job; a job with the same idempotency key that has not failed
+   * or been cancelled is returned instead of creating a new one
+   *
+   * @param {object} [fields] Further fields to store on the job
+   * @param {string} [log] First line of the job's log
+   * @returns {Promise<{job: object, created: boolean}>}
+   */
+  async submit({ options, filePath = null, priority, idempotencyKey = null, fields = {}, log = null }) {
+    const now = new Date();
+    const normalized = normalizePriority(priority);
+    const { job, created } = await this.store.create({
+      id: uuidv4(),
+      status: 'pending',
+      progress: 0,
+      priority: normalized,
+      score: jobScore(normalized, now.getTime()),
+      createdAt: now.toISOString(),
+      updatedAt: now.toISOString(),
+      filePath,
+      // Backend whose local disk holds the upload (null: any backend can read it)
+      uploadHost: filePath ? this.host : null,
+      options,
+      logs: log ? [log] : [],
+      attempts: 0,
+      idempotencyKey,
+      ...fields,
+    });
+    if (created) {
+      this.counters.submitted += 1;
+      this.emit('job', job);
+      this.pump();
+    } else {
+      this.counters.deduplicated += 1;
+    }
+    return { job, created };
+  }
+
+  async get(id) {
+    return this.store.get(id);
+  }
+
+  /**
+   * Cancel a job: a queued job is cancelled at once, a running one is
+   * aborted by the backend running it (through the handler's signal)
+   *
+   * @returns {Promise<object|null>} The job, or null if there is none
+   */
+  async cancel(id) {
+    const job = await this.store.get(id);
+    if (!job || FINISHED_STATUSES.includes(job.status)) return job;
+    if (job.status === 'pending') {
+      const cancelled = await this._update(id, {
+        status: 'cancelled',
+        finishedAt: new Date().toISOString(),
+      }, 'Cancelled before it started');
+      this.counters.cancelled += 1;
+      await this.onSettled(cancelled || job);
+      return cancelled;
+    }
+    const running = await this._update(id, { cancelRequested: true }, 'Cancellation requested');
+    this.controllers.get(id)?.abort();
+    return running;
+  }
+
+  async _abortCancelled() {
+    for (const [id, controller] of this.controllers) {
+      if (controller.signal.aborted) continue;
+      try {
+        if ((await this.store.get(id))?.cancelRequested) controller.abort();
+      } catch (error) {
+        console.error('Job queue error:', error.message);
+      }
+    }
+  }
+
+  async position(id) {
+    return this.store.position(id);
+  }
+
+  async _update(id, patch, log) {
+    const job = await this.store.update(id, patch, log);
+    if (job) this.emit('job', job);
+    return job;
+  }
+
+  async _release(id, runAfter, log) {
+    const job = await this.store.release(id, runAfter, log);
+    if (job) this.emit('job', job);
+    return job;
+  }
+
+  async pump() {
+    // Nothing runs before start() or after stop()
+    if (this.pumping || !this.timer) return;
+    this.pumping = true;
+    try {
+      while (this.active < this.concurrency) {
+        const job = await this.store.claim(this.owner, this.host);
+        if (!job) break;
+        this.emit('job', job);
+        this.active += 1;
+        this._run(job).finally(() => {
+          this.active -= 1;
+          this.pump();
+        });
+      }
+    } catch (error) {
+      console.error('Job queue error:', error.message);
+    } finally {
+      this.pumping = false;
+    }
+  }
+
+  async _run(job) {
+    const report = (patch, log) => this._update(job.id, { ...patch, heartbeatAt: Date.now() }, log);
+    const controller = new AbortController();
+    this.controllers.set(job.id, controller);
+    if (job.cancelRequested) controller.abort();
+    try {
+      const result = await this.handler(job, report, controller.signal);
+      const done = await this._update(job.id, {
+        ...result,
+        status: 'done',
+        progress: 100,
+        finishedAt: new Date().toISOString(),
+      }, 'Results ready for download');
+      this.counters.completed += 1;
+      await this.onSettled(done || job);
+    } catch (error) {
+      if (controller.signal.aborted) {
+        const cancelled = await this._update(job.id, {
+          status: 'cancelled',
+          finishedAt: new Date().toISOString(),
+        }, 'Cancelled');
+        this.counters.cancelled += 1;
+        await this.onSettled(cancelled || job);
+        return;
+      }
+      const message = error.response?.data?.error || error.response?.data?.detail || error.message;
+      if (isRetryable(error) && job.attempts < this.maxAttempts) {
+        const delay = this.retryDelayMs * 2 ** (job.attempts - 1);
+        this.counters.retried += 1;
+        await this._release(job.id, Date.now() + delay,
+          `Attempt ${job.attempts} failed (${message}); retrying in ${Math.round(delay / 1000)}s`);
+        return;
+      }
+      console.error(`Job ${job.id} failed:`, message);
+      const failed = await this._update(job.id, {
+        status: 'failed',
+        error: message,
+        errorDetails: error.details || null,
+        finishedAt: new Date().toISOString(),
+      }, `Error: ${message}`);
+      this.counters.failed += 1;
+      await this.onSettled(failed || job);
+    } finally {
+      this.controllers.delete(job.id);
+    }
+  }
+
+  /**
+   * Delete finished jobs older than the TTL and queue again running jobs
+   * whose backend stopped reporting (no progress for staleMs)
+   *
+   * @returns {Promise<object[]>} Removed jobs
+   */
+  async prune() {
+    const now = Date.now();
+    const removed = [];
+    for (const status of FINISHED_STATUSES) {
+      for (const job of await this.store.list(status)) {
+        if (now - Date.parse(job.finishedAt || job.updatedAt) > this.ttlMs) {
+          await this.store.remove(job.id);
+          removed.push(job);
+        }
+      }
+    }
+    for (const job of await this.store.list('running')) {
+      if (now - (job.heartbeatAt || 0) > this.staleMs) {
+        await this._release(job.id, null, 'No progress from its backend, job queued again');
+      }
+    }
+    return removed;
+  }
+
+  /**
+   * Files referenced by jobs that are not finished (must not be cleaned up)
+   */
+  async activeFiles() {
+    const jobs = [...(await this.store.list('pending')), ...(await this.store.list('running'))];
+    return new Set(jobs.map((job) => job.filePath).filter(Boolean).map((file) => path.resolve(file)));
+  }
+
+  async stats() {
+    const counts = await this.store.counts();
+    const pending = await this.store.list('pending');
+    const oldest = pending.reduce((min, job) => Math.min(min, Date.parse(job.createdAt)), Date.now());
+    return {
+      queued: counts.pending,
+      running: counts.running,
+      done: counts.done,
+      failed: counts.failed,
+      running_here: this.active,
+      concurrency: this.concurrency,
+      oldest_queued_seconds: Math.round((Date.now() - oldest) / 1000),
+      ...this.counters,
+    };
+  }
+}
+
+/**
+ * Job store selected by JOB_STORE ('file', the default, or 'redis')
+ * ioredis is an optional dependency; without it the file store is used.
+ */
+function createJobStore({ dir, ttlMs }) {
+  if ((process.env.JOB_STORE || 'file') === 'redis') {
+    try {
+      const Redis = require('ioredis');
+      return new RedisJobStore(new Redis(process.env.REDIS_URL || 'redis://localhost:6379'), { ttlMs });
+    } catch (error) {
+      console.warn(`JOB_STORE=redis but ioredis is unavailable (${error.message}); using the file job store`);
+    }
+  }
+  return new FileJobStore(dir);
+}
+
+module.exports = {
+  JobQueue,
+  FileJobStore,
+  RedisJobStore,
+  createJobStore,
+  isRetryable,
+  normalizePriority,
+  jobScore,
+};
@@ -0,0 +1,261 @@
+/**
+ * Job queue tests
+ */
+
+const fs = require('fs').promises;
+const os = require('os');
+const path = require('path');
+const { JobQueue, FileJobStore, RedisJobStore, isRetryable } = require('./jobQueue');
+
+const waitFor = async (predicate, timeoutMs = 2000) => {
+  const start = Date.now();
+  while (!(await predicate())) {
+    if (Date.now() - start > timeoutMs) throw new Error('Timed out waiting');
+    await new Promise((resolve) => setTimeout(resolve, 10));
+  }
+};
+
+/**
+ * In-memory stand-in for the ioredis commands RedisJobStore uses
+ */
+class FakeRedis {
+  constructor() {
+    this.strings = new Map();
+    this.sets = new Map();
+    this.zsets = new Map();
+  }
+
+  _set(key) {
+    if (!this.sets.has(key)) this.sets.set(key, new Set());
+    return this.sets.get(key);
+  }
+
+  _zset(key) {
+    if (!this.zsets.has(key)) this.zsets.set(key, new Map());
+    return this.zsets.get(key);
+  }
+
+  _sorted(key) {
+    return [...this._zset(key)].sort((a, b) => a[1] - b[1] || (a[0] < b[0] ? -1 : 1));
+  }
+
+  async ping() { return 'PONG'; }
+  async get(key) { return this.strings.get(key) ?? null; }
+  async set(key, value, ...args) {
+    if (args.includes('NX') && this.strings.has(key)) return null;
+    this.strings.set(key, value);
+    return 'OK';
+  }
+  async del(key) { return this.strings.delete(key) ? 1 : 0; }
+  async mget(keys) { return keys.map((key) => this.strings.get(key) ?? null); }
+  async sadd(key, member) { this._set(key).add(member); return 1; }
+  async srem(key, ...members) { members.forEach((member) => this._set(key).delete(member)); return 1; }
+  async scard(key) { return this._set(key).size; }
+  async smembers(key) { return [...this._set(key)]; }
+  async zadd(key, score, member) { this._zset(key).set(member, Number(score)); return 1; }
+  async zrem(key, member) { return this._zset(key).delete(member) ? 1 : 0; }
+  async zcard(key) { return this._zset(key).size; }
+  async zrank(key, member) {
+    const index = this._sorted(key).findIndex(([id]) => id === member);
+    return index < 0 ? null : index;
+  }
+  async zrange(key, start, stop) {
+    return this._sorted(key).slice(start, stop + 1).flatMap(([id, score]) => [id, String(score)]);
+  }
+  async zrangebyscore(key, min, max) {
+    return this._sorted(key).filter(([, score]) => score >= min && score <= max).map(([id]) => id);
+  }
+  async zpopmin(key) {
+    const [first] = this._sorted(key);
+    if (!first) return [];
+    this._zset(key).delete(first[0]);
+    return [first[0], String(first[1])];
+  }
+  async quit() {}
+
+  multi() {
+    const commands = [];
+    const chain = new Proxy({}, {
+      get: (target, name) => (name === 'exec'
+        ? async () => Promise.all(commands.map(([command, args]) => this[command](...args)))
+        : (...args) => { commands.push([name, args]); return chain; }),
+    });
+    return chain;
+  }
+}
+
+describe('Job queue', () => {
+  let dir;
+
+  beforeEach(async () => {
+    dir = await fs.mkdtemp(path.join(os.tmpdir(), 'gradstat-jobs-'));
+  });
+
+  afterEach(async () => {
+    await fs.rm(dir, { recursive: true, force: true });
+  });
+
+  it('should run jobs by priority, then in submission order, within the concurrency limit', async () => {
+    const order = [];
+    let running = 0;
+    let maxRunning = 0;
+    const queue = new JobQueue(new FileJobStore(dir), async (job) => {
+      running += 1;
+      maxRunning = Math.max(maxRunning, running);
+      order.push(job.options.name);
+      await new Promise((resolve) => setTimeout(resolve, 20));
+      running -= 1;
+      return { resultMeta: { name: job.options.name } };
+    }, { concurrency: 2, pollMs: 10 });
+
+    // Submitted before start, so all are queued when scheduling begins
+    await queue.store.open();
+    for (const [name, priority] of [['a', 5], ['b', 5], ['urgent', 9], ['c', 5], ['low', 0]]) {
+      await queue.submit({ options: { name }, priority });
+    }
+    await queue.start();
+    await waitFor(async () => (await queue.stats()).done === 5);
+
+    expect(order).toEqual(['urgent', 'a', 'b', 'c', 'low']);
+    expect(maxRunning).toBe(2);
+    await queue.stop();
+  });
+
+  it('should keep jobs across restarts and requeue interrupted ones', async () => {
+    const store = new FileJobStore(dir);
+    await store.open();
+    const queue = new JobQueue(store, async () => ({}));
+    const { job } = await queue.submit({ options: { name: 'a' } });
+    await store.claim('old-backend');
+    await store.close();
+
+    const restarted = new FileJobStore(dir);
+    expect(await restarted.open()).toBe(1);
+    const restored = await restarted.get(job.id);
+    expect(restored.status).toBe('pending');
+    expect(restored.attempts).toBe(1);
+  });
+
+  it('should return the existing job for a repeated idempotency key', async () => {
+    const queue = new JobQueue(new FileJobStore(dir), async () => ({}), { pollMs: 10 });
+    await queue.store.open();
+    const first = await queue.submit({ options: {}, idempotencyKey: 'upload-1' });
+    const second = await queue.submit({ options: {}, idempotencyKey: 'upload-1' });
+
+    expect(second.created).toBe(false);
+    expect(second.job.id).toBe(first.job.id);
+  });
+
+  it('should retry worker outages and fail analysis errors at once', async () => {
+    const unavailable = Object.assign(new Error('connect ECONNREFUSED'), { code: 'ECONNREFUSED' });
+    const badRequest = Object.assign(new Error('Request failed'), { response: { status: 500, data: { detail: 'bad column' } } });
+    expect(isRetryable(unavailable)).toBe(true);
+    expect(isRetryable(badRequest)).toBe(false);
+
+    let calls = 0;
+    const settled = [];
+    const queue = new JobQueue(new FileJobStore(dir), async (job) => {
+      calls += 1;
+      if (job.options.name === 'flaky' && calls === 1) throw unavailable;
+      if (job.options.name === 'broken') throw badRequest;
+      return {};
+    }, { retryDelayMs: 10, pollMs: 10, onSettled: async (job) => settled.push(job.status) });
+    await queue.start();
+
+    const { job: flaky } = await queue.submit({ options: { name: 'flaky' } });
+    await waitFor(async () => (await queue.get(flaky.id)).status === 'done');
+    expect((await queue.get(flaky.id)).attempts).toBe(2);
+
+    const { job: broken } = await queue.submit({ options: { name: 'broken' } });
+    await waitFor(async () => (await queue.get(broken.id)).status === 'failed');
+    expect((await queue.get(broken.id)).error).toBe('bad column');
+    expect(settled).toEqual(['done', 'failed']);
+    await queue.stop();
+  });
+
+  it('should emit every change to a job', async () => {
+    const queue = new JobQueue(new FileJobStore(dir), async (job, report) => {
+      await report({ progress: 50, stage: 'fit' }, 'Running analysis...');
+      return {};
+    }, { pollMs: 10 });
+    const seen = [];
+    queue.on('job', (job) => seen.push([job.status, job.progress, job.stage || null]));
+    await queue.start();
+
+    const { job } = await queue.submit({ options: {} });
+    await waitFor(async () => (await queue.get(job.id)).status === 'done');
+
+    expect(seen).toEqual([
+      ['pending', 0, null],
+      ['running', 0, null],
+      ['running', 50, 'fit'],
+      ['done', 100, 'fit'],
+    ]);
+    await queue.stop();
+  });
+
+  it('should cancel queued and running jobs', async () => {
+    const settled = [];
+    const queue = new JobQueue(new FileJobStore(dir), (job, report, signal) => new Promise((resolve, reject) => {
+      signal.addEventListener('abort', () => reject(new Error('aborted')));
+    }), { concurrency: 1, pollMs: 10, onSettled: async (job) => settled.push(job.status) });
+    await queue.start();
+
+    const { job: running } = await queue.submit({ options: { name: 'running' } });
+    const { job: queued } = await queue.submit({ options: { name: 'queued' }, idempotencyKey: 'upload-1' });
+    await waitFor(async () => (await queue.get(running.id)).status === 'running');
+
+    expect((await queue.cancel(queued.id)).status).toBe('cancelled');
+    await queue.cancel(running.id);
+    await waitFor(async () => settled.length === 2);
+
+    expect((await queue.get(running.id)).status).toBe('cancelled');
+    expect(settled).toEqual(['cancelled', 'cancelled']);
+    expect((await queue.stats()).cancelled).toBe(2);
+    await queue.stop();
+
+    // A cancelled job's idempotency key may be used again
+    expect((await queue.submit({ options: {}, idempotencyKey: 'upload-1' })).created).toBe(true);
+  });
+
+  it('should leave jobs with a local upload to the backend that holds it', async () => {
+    const redis = new FakeRedis();
+    const ran = { a: [], b: [] };
+    const backend = (name) => new JobQueue(new RedisJobStore(redis), async (job) => {
+      ran[name].push(job.options.name);
+      return {};
+    }, { host: `host-${name}`, pollMs: 10 });
+    const a = backend('a');
+    const b = backend('b');
+    await b.start();
+
+    await a.store.open();
+    const { job: upload } = await a.submit({ options: { name: 'upload' }, filePath: '/uploads/a.csv', priority: 9 });
+    const { job: sample } = await a.submit({ options: { name: 'sample' } });
+    expect(upload.uploadHost).toBe('host-a');
+    expect(sample.uploadHost).toBeNull();
+    await waitFor(async () => (await b.get(sample.id)).status === 'done');
+    expect((await b.get(upload.id)).status).toBe('pending');
+    expect(await b.position(upload.id)).toBe(0);
+
+    await a.start();
+    await waitFor(async () => (await a.get(upload.id)).status === 'done');
+    expect(ran).toEqual({ a: ['upload'], b: ['sample'] });
+    expect((await a.stats()).queued).toBe(0);
+    await a.stop();
+    await b.stop();
+  });
+
+  it('should remove finished jobs after their TTL', async () => {
+    const queue = new JobQueue(new FileJobStore(dir), async () => ({}), { ttlMs: 50, pollMs: 10 });
+    await queue.start();
+    const { job } = await queue.submit({ options: {} });
+    await waitFor(async () => (await queue.get(job.id)).status === 'done');
+
+    await new Promise((resolve) => setTimeout(resolve, 60));
+    const removed = await queue.prune();
+    expect(removed.map((j) => j.id)).toEqual([job.id]);
+    expect(await queue.get(job.id)).toBeNull();
+    await queue.stop();
+  });
+});
@@ -21,8 +21,10 @@ const axios = require('axios');
 const FormData = require('form-data');
 const { v4: uuidv4 } = require('uuid');
 const fs = require('fs').promises;
+const { createReadStream } = require('fs');
 const path = require('path');
 require('dotenv').config();
+const { JobQueue, createJobStore, normalizePriority } = require('./jobQueue');
 
 const app = express();
 
@@ -31,11 +33,17 @@ app.set('trust proxy', 1);
 
 const PORT = process.env.PORT || 3001;
 const WORKER_URL = process.env.WORKER_URL || 'http://localhost:8001';
+// Worker pool for jobs the cost estimate marks heavy (the same pool if unset)
+const WORKER_HEAVY_URL = process.env.WORKER_HEAVY_URL || WORKER_URL;
+// Over-budget jobs run with the cheaper options the worker suggests (else refused)
+const JOB_AUTO_DOWNGRADE = process.env.JOB_AUTO_DOWNGRADE !== 'false';
+// Heavy jobs queue behind light jobs of the default priority
+const HEAVY_MAX_PRIORITY = 4;
 const UPLOAD_DIR = process.env.UPLOAD_DIR || './uploads';
 const RESULTS_DIR = process.env.RESULTS_DIR || './results';
-
-// In-memory job store (use Redis in production)
-const jobs = new Map();
+const JOBS_DIR = process.env.JOBS_DIR || './jobs';
+const JOB_TTL_MS = (parseFloat(process.env.JOB_TTL_HOURS) || 24) * 60 * 60 * 1000;
+const JOB_EVENTS_CHECK_MS = 5000;
 
 // Ensure directories exist
 async function ensureDirectories() {
@@ -68,7 +76,7 @@ app.use(cors({
   },
   credentials: true,
   methods: ['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
-  allowedHeaders: ['Content-Type', 'Authorization', 'testing-password', 'x-testing-password'],
+  allowedHeaders: ['Content-Type', 'Authorization', 'testing-password', 'x-testing-password', 'Idempotency-Key'],
   exposedHeaders: ['Content-Type']
 }));
 app.use(express.json());
@@ -192,6 +200,25 @@ app.get('/ping', (req, res) => {
   res.status(200).type('text/plain').send('OK');
 });
 
+/**
+ * Multipart body for the worker that streams a file from disk instead of
+ * reading it into memory; the known length lets it send a Content-Length
+ *
+ * Returns the form and the headers to post it with
+ */
+async function fileFormData(filePath, { filename, contentType }, fields = {}) {
+  const { size } = await fs.stat(filePath);
+  const formData = new FormData();
+  formData.append('file', createReadStream(filePath), { filename, contentType, knownLength: size });
+  for (const [name, value] of Object.entries(fields)) {
+    formData.append(name, value);
+  }
+  const length = await new Promise((resolve, reject) => {
+    formData.getLength((error, total) => (error ? reject(error) : resolve(total)));
+  });
+  return { formData, headers: { ...formData.getHeaders(), 'Content-Length': length } };
+}
+
 /**
  * POST /api/validate
  * Validate uploaded file and return preview
@@ -221,17 +248,13 @@ app.post('/api/validate', upload.single('file'), async (req, res) => {
     console.log('✅ FILE RECEIVED SUCCESSFULLY');
 
     // Forward to Python worker for validation
-    const formData = new FormData();
-    const fileBuffer = await fs.readFile(req.file.path);
-    formData.append('file', fileBuffer, {
+    const { formData, headers } = await fileFormData(req.file.path, {
       filename: req.file.originalname,
       contentType: req.file.mimetype
     });
 
     const response = await axios.post(`${WORKER_URL}/validate`, formData, {
-      headers: {
-        'Content-Type': 'multipart/form-data',
-      },
+      headers,
       maxContentLength: Infinity,
       maxBodyLength: Infinity,
     });
@@ -276,30 +299,50 @@ app.post('/api/analyze', analysisLimiter, upload.single('file'), async (req, res
       return res.status(400).json({ error: 'No file uploaded' });
     }
 
-    const jobId = uuidv4();
+    // Pre-flight cost estimate: over-budget jobs run with cheaper options or
+    // are refused; heavy jobs go to the heavy worker pool, behind light jobs
+    const estimate = analysisType === 'power' ? null : await estimateAnalysis(options, req.file.path);
+    let jobOptions = options;
+    let tier = estimate?.tier || null;
+    let seconds = estimate?.seconds ?? null;
+    let log = null;
+    if (tier === 'over_budget' && estimate.admission) {
+      if (!estimate.downgrade || !JOB_AUTO_DOWNGRADE) {
+        admissionCounters.rejected += 1;
+        await fs.unlink(req.file.path).catch(() => {});
+        return res.status(422).json({
+          error: `This analysis is too large to run: it would take about ${formatSeconds(estimate.seconds)} `
+            + `and ${Math.round(estimate.memory_mb)} MB of memory. Try a smaller dataset or fewer variables.`,
+          code: 'over_budget',
+          estimate,
+        });
+      }
+      ({ options: jobOptions, tier, seconds } = estimate.downgrade);
+      log = `Options changed to fit the limits: ${estimate.downgrade.changes.join(', ')}`;
+      admissionCounters.downgraded += 1;
+    }
+    if (tier === 'light' || tier === 'heavy') admissionCounters[tier] += 1;
+    const heavy = tier === 'heavy';
+    const priority = req.body.priority ?? options.priority;
 
-    // Create job record
-    jobs.set(jobId, {
-      id: jobId,
-      status: 'pending',
-      progress: 0,
-      createdAt: new Date().toISOString(),
+    // Queue the job; a retried submit with the same Idempotency-Key gets the original job
+    const { job, created } = await jobQueue.submit({
+      options: jobOptions,
       filePath: req.file ? req.file.path : null,
-      options,
-      logs: [],
+      priority: heavy ? Math.min(normalizePriority(priority), HEAVY_MAX_PRIORITY) : priority,
+      idempotencyKey: req.get('Idempotency-Key') || null,
+      fields: {
+        pool: heavy ? 'heavy' : 'light',
+        estimate: estimate && { seconds, tier },
+      },
+      log,
     });
 
-    // Start analysis asynchronously
-    processAnalysis(jobId, req.file ? req.file.path : null, options).catch((error) => {
-      console.error(`Job ${jobId} failed:`, error);
-      const job = jobs.get(jobId);
-      if (job) {
-        job.status = 'failed';
-        job.error = error.message;
-      }
-    });
+    if (!created && req.file) {
+      await fs.unlink(req.file.path).catch(() => {});
+    }
 
-    res.json({ job_id: jobId });
+    res.status(created ? 202 : 200).json({ job_id: job.id, status: job.status, estimate: job.estimate || null });
   } catch (error) {
     console.error('Analysis start error:', error);
     console.error('Error stack:', error.stack);
@@ -315,31 +358,308 @@ app.post('/api/analyze', analysisLimiter, upload.single('file'), async (req, res
   }
 });
 
+// Pre-flight admission decisions of this backend
+const admissionCounters = { light: 0, heavy: 0, downgraded: 0, rejected: 0 };
+
+function formatSeconds(seconds) {
+  return seconds < 120 ? `${Math.round(seconds)} seconds` : `${Math.round(seconds / 60)} minutes`;
+}
+
+/**
+ * Rows and columns of an uploaded CSV, counted without parsing it
+ * (null for other formats)
+ */
+async function csvShape(filePath) {
+  if (path.extname(filePath).toLowerCase() !== '.csv') return null;
+  const headerChunks = [];
+  let headerDone = false;
+  let lineBreaks = 0;
+  let lastByte = 10;
+  for await (const chunk of createReadStream(filePath)) {
+    if (!headerDone) {
+      const end = chunk.indexOf(10);
+      headerChunks.push(end === -1 ? chunk : chunk.subarray(0, end));
+      headerDone = end !== -1;
+    }
+    for (let i = chunk.indexOf(10); i !== -1; i = chunk.indexOf(10, i + 1)) {
+      lineBreaks += 1;
+    }
+    if (chunk.length > 0) lastByte = chunk[chunk.length - 1];
+  }
+
+  let columns = 1;
+  let quoted = false;
+  for (const char of Buffer.concat(headerChunks).toString('latin1')) {
+    if (char === '"') quoted = !quoted;
+    else if (char === ',' && !quoted) columns += 1;
+  }
+  // Lines after the header; the last one may lack its line break
+  return { rows: Math.max(lineBreaks - 1 + (lastByte !== 10 ? 1 : 0), 0), columns };
+}
+
+/**
+ * Ask a worker pool what an analysis will cost there (its calibration and limits)
+ */
+async function poolEstimate(workerUrl, options, shape) {
+  const form = new URLSearchParams({
+    options: JSON.stringify(options),
+    n_rows: String(shape.rows),
+    n_columns: String(shape.columns),
+  });
+  const response = await axios.post(`${workerUrl}/analyze/estimate`, form, { timeout: 5000 });
+  return response.data;
+}
+
+/**
+ * Ask the workers what an analysis will cost before queueing it
+ * The light pool estimates first; a job it would not run as light is
+ * estimated again by the heavy pool, whose limits (and calibration) then
+ * decide whether it is admitted (tier heavy: it runs there). Resolves to
+ * the estimate ({seconds, memory_mb, tier, downgrade, ...}), or null if the
+ * data shape or the estimate is unavailable: the job is then queued as a
+ * light one, and the worker still refuses it if it is over budget
+ */
+async function estimateAnalysis(options, filePath) {
+  try {
+    const shape = await csvShape(filePath);
+    if (!shape) return null;
+    const estimate = await poolEstimate(WORKER_URL, options, shape);
+    if (estimate.tier === 'light' || WORKER_HEAVY_URL === WORKER_URL) return estimate;
+    const heavy = await poolEstimate(WORKER_HEAVY_URL, options, shape);
+    // Whatever the heavy pool can run, it runs (its own light/heavy split is not used)
+    const tier = heavy.tier === 'over_budget' ? 'over_budget' : 'heavy';
+    const downgrade = heavy.downgrade && { ...heavy.downgrade, tier: 'heavy' };
+    return { ...heavy, tier, downgrade };
+  } catch (error) {
+    console.error('Cost estimate failed:', error.message);
+    return null;
+  }
+}
+
+/**
+ * Pass a run measured by one worker pool on to the cost models of the others
+ */
+function shareCostRun(run, fromUrl) {
+  for (const workerUrl of new Set([WORKER_URL, WORKER_HEAVY_URL])) {
+    if (workerUrl === fromUrl) continue;
+    axios.post(`${workerUrl}/analyze/cost/runs`, { runs: [run] }, { timeout: 5000 })
+      .catch((error) => console.error('Sharing the cost model run failed:', error.message));
+  }
+}
+
+/**
+ * POST /api/analyze/batch
+ * Run several analyses on one uploaded file
+ */
+app.post('/api/analyze/batch', analysisLimiter, upload.single('file'), async (req, res) => {
+  try {
+    if (!req.file) {
+      return res.status(400).json({ error: 'No file uploaded' });
+    }
+
+    const requests = JSON.parse(req.body.requests || '[]');
+    if (!Array.isArray(requests) || requests.length === 0) {
+      await fs.unlink(req.file.path).catch(() => {});
+      return res.status(400).json({ error: 'requests must be a non-empty list of analysis options' });
+    }
+
+    const { formData, headers } = await fileFormData(req.file.path, {
+      filename: req.file.originalname,
+      contentType: req.file.mimetype
+    }, { requests: JSON.stringify(requests) });
+
+    const response = await axios.post(`${WORKER_URL}/analyze/batch`, formData, {
+      headers,
+      maxContentLength: Infinity,
+      maxBodyLength: Infinity,
+      timeout: 600000, // 10 minutes
+    });
+
+    await fs.unlink(req.file.path).catch(() => {});
+
+    res.json({
+      ...response.data,
+      report_url: `/api/analyze/batch/${response.data.batch_id}/report`,
+    });
+  } catch (error) {
+    console.error('Batch analysis error:', error.message);
+
+    if (req.file) {
+      await fs.unlink(req.file.path).catch(() => {});
+    }
+
+    res.status(error.response?.status || 500).json({
+      error: 'Failed to run batch analysis',
+      details: error.response?.data || error.message,
+    });
+  }
+});
+
+/**
+ * GET /api/analyze/batch/:batchId/report
+ * Download the combined report of a batch (built on demand by the worker)
+ */
+app.get('/api/analyze/batch/:batchId/report', async (req, res) => {
+  try {
+    const { batchId } = req.params;
+    const response = await axios.get(`${WORKER_URL}/analyze/batch/${encodeURIComponent(batchId)}/report`, {
+      maxContentLength: Infinity,
+      timeout: 300000, // 5 minutes
+    });
+
+    const zipBuffer = Buffer.from(response.data.report_zip, 'base64');
+    res.setHeader('Content-Type', 'application/zip');
+    res.setHeader('Content-Disposition', `attachment; filename="gradstat-batch-report-${batchId}.zip"`);
+    res.setHeader('Content-Length', zipBuffer.length);
+    res.send(zipBuffer);
+  } catch (error) {
+    console.error('Batch report error:', error.message);
+    res.status(error.response?.status || 500).json({
+      error: 'Failed to build batch report',
+      details: error.response?.data || error.message,
+    });
+  }
+});
+
 /**
  * GET /api/job-status
  * Get status of an analysis job
  */
-app.get('/api/job-status', (req, res) => {
+app.get('/api/job-status', async (req, res) => {
   const jobId = req.query.id;
 
   if (!jobId) {
     return res.status(400).json({ error: 'Job ID is required' });
   }
 
-  const job = jobs.get(jobId);
+  const job = await jobQueue.get(jobId);
 
   if (!job) {
     return res.status(404).json({ error: 'Job not found' });
   }
 
-  res.json({
+  res.json(await jobStatusPayload(job));
+});
+
+/**
+ * Job status as sent to the client
+ */
+async function jobStatusPayload(job) {
+  return {
     status: job.status,
     progress: job.progress,
+    stage: job.stage || null,
+    eta_seconds: job.etaSeconds ?? null,
+    queue_position: job.status === 'pending' ? await jobQueue.position(job.id) : null,
     result_url: job.resultUrl,
+    results_url: job.resultsUrl || null,
+    summary: job.summary || null,
+    // Pre-flight estimate ({seconds, tier}), if there was one
+    estimate: job.estimate || null,
+    // Only jobs finished before results moved to the artifact store
     result_meta: job.resultMeta,
     logs: job.logs,
     error: job.error,
+    // Why the worker stopped the analysis ({code, limit}), if it did
+    error_details: job.errorDetails || null,
+  };
+}
+
+/**
+ * GET /api/jobs/:id/events
+ * Server-sent job status: the current status, then every change until the
+ * job is done, has failed or was cancelled
+ */
+app.get('/api/jobs/:id/events', async (req, res) => {
+  const jobId = req.params.id;
+  const job = await jobQueue.get(jobId);
+
+  if (!job) {
+    return res.status(404).json({ error: 'Job not found' });
+  }
+
+  // no-transform also keeps the compression middleware from buffering events
+  res.status(200).set({
+    'Content-Type': 'text/event-stream',
+    'Cache-Control': 'no-cache, no-transform',
+    Connection: 'keep-alive',
+    'X-Accel-Buffering': 'no',
   });
+  res.flushHeaders();
+
+  let lastVersion = null;
+  let closed = false;
+  let timer = null;
+
+  const finish = () => {
+    if (closed) return;
+    closed = true;
+    clearInterval(timer);
+    jobQueue.off('job', onJob);
+    res.end();
+  };
+
+  const send = async (current) => {
+    if (closed || !current) return;
+    const version = `${current.updatedAt}:${current.status}:${current.progress}:${current.logs.length}`;
+    if (version === lastVersion) return;
+    lastVersion = version;
+    res.write(`event: status\ndata: ${JSON.stringify(await jobStatusPayload(current))}\n\n`);
+    if (['done', 'failed', 'cancelled'].includes(current.status)) finish();
+  };
+
+  function onJob(updated) {
+    if (updated.id === jobId) send(updated).catch(finish);
+  }
+
+  jobQueue.on('job', onJob);
+  // Jobs run by another backend (shared store) only show up in the store;
+  // the check also keeps idle connections open through proxies
+  timer = setInterval(async () => {
+    try {
+      const current = await jobQueue.get(jobId);
+      if (!current) return finish();
+      await send(current);
+      if (!closed) res.write(': keep-alive\n\n');
+    } catch (error) {
+      finish();
+    }
+  }, JOB_EVENTS_CHECK_MS);
+  req.on('close', finish);
+
+  await send(job).catch(finish);
+});
+
+/**
+ * POST /api/jobs/:id/cancel
+ * Cancel a queued or running job (a no-op for finished jobs)
+ */
+app.post('/api/jobs/:id/cancel', async (req, res) => {
+  try {
+    const job = await jobQueue.cancel(req.params.id);
+
+    if (!job) {
+      return res.status(404).json({ error: 'Job not found' });
+    }
+
+    res.json({ job_id: job.id, status: job.status, cancel_requested: Boolean(job.cancelRequested) });
+  } catch (error) {
+    console.error('Job cancel error:', error.message);
+    res.status(500).json({ error: 'Failed to cancel job' });
+  }
+});
+
+/**
+ * GET /api/jobs/stats
+ * Job queue length, running jobs and counters
+ */
+app.get('/api/jobs/stats', async (req, res) => {
+  try {
+    res.json({ ...(await jobQueue.stats()), admission: admissionCounters });
+  } catch (error) {
+    console.error('Job stats error:', error.message);
+    res.status(500).json({ error: 'Failed to read job queue stats' });
+  }
 });
 
 /**
@@ -372,16 +692,24 @@ app.post('/api/test-advisor/auto-detect', upload.single('file'), async (req, res
       return res.status(400).json({ error: 'No file uploaded' });
     }
 
-    const formData = new FormData();
-    formData.append('file', req.file.buffer, req.file.originalname);
+    // multer stores uploads on disk, so the file is streamed from there
+    const { formData, headers } = await fileFormData(req.file.path, {
+      filename: req.file.originalname,
+      contentType: req.file.mimetype || 'text/csv'
+    });
 
     const response = await axios.post(`${WORKER_URL}/test-advisor/auto-detect`, formData, {
-      headers: formData.getHeaders(),
+      headers,
     });
 
+    await fs.unlink(req.file.path).catch(() => {});
+
     res.json(response.data);
   } catch (error) {
     console.error('Auto-detect error:', error.message);
+    if (req.file) {
+      await fs.unlink(req.file.path).catch(() => {});
+    }
     res.status(500).json({ error: error.message });
   }
 });
@@ -401,19 +729,14 @@ app.post('/api/test-advisor/auto-answer', upload.single('file'), async (req, res
       return res.status(400).json({ error: 'questionKey is required' });
     }
 
-    // Read file from disk (multer uses diskStorage)
-    const fileBuffer = await fs.readFile(req.file.path);
-    
-    const formData = new FormData();
-    formData.append('file', fileBuffer, {
+    // Stream the file from disk (multer uses diskStorage)
+    const { formData, headers } = await fileFormData(req.file.path, {
       filename: req.file.originalname,
-      contentType: req.file.mimetype || 'text/csv',
-      knownLength: fileBuffer.length
-    });
-    formData.append('question_key', questionKey);
+      contentType: req.file.mimetype || 'text/csv'
+    }, { question_key: questionKey });
 
     const response = await axios.post(`${WORKER_URL}/test-advisor/auto-answer`, formData, {
-      headers: formData.getHeaders(),
+      headers,
     });
 
     // Clean up uploaded file
@@ -440,18 +763,14 @@ app.post('/api/test-advisor/analyze-dataset', upload.single('file'), async (req,
       return res.status(400).json({ error: 'No file uploaded' });
     }
 
-    // Read file from disk (multer uses diskStorage)
-    const fileBuffer = await fs.readFile(req.file.path);
-    
-    const formData = new FormData();
-    formData.append('file', fileBuffer, {
+    // Stream the file from disk (multer uses diskStorage)
+    const { formData, headers } = await fileFormData(req.file.path, {
       filename: req.file.originalname,
-      contentType: req.file.mimetype || 'text/csv',
-      knownLength: fileBuffer.length
+      contentType: req.file.mimetype || 'text/csv'
     });
 
     const response = await axios.post(`${WORKER_URL}/test-advisor/analyze-dataset`, formData, {
-      headers: formData.getHeaders(),
+      headers,
     });
 
     // Clean up uploaded file
@@ -480,141 +799,248 @@ app.get('/api/report', async (req, res) => {
     return res.status(400).json({ error: 'Job ID is required' });
   }
 
-  const job = jobs.get(jobId);
+  const job = await jobQueue.get(jobId);
   console.log('Job status:', job?.status);
 
   if (!job || job.status !== 'done') {
     return res.status(404).json({ error: 'Report not available' });
   }
 
-  try {
-    const reportPath = path.join(RESULTS_DIR, `${jobId}.zip`);
-    console.log('Looking for file at:', reportPath);
-    
-    // Check if file exists
-    try {
-      await fs.access(reportPath);
-      const stats = await fs.stat(reportPath);
-      console.log('File found! Size:', stats.size, 'bytes');
-    } catch (err) {
-      console.error('Report file not found:', reportPath);
-      console.error('Error:', err.message);
-      return res.status(404).json({ error: 'Report file not found. The analysis may not have completed successfully.' });
-    }
-    
-    // Read the file and send with proper headers
-    const fileBuffer = await fs.readFile(reportPath);
-    const fileName = `gradstat-report-${jobId}.zip`;
-    
-    console.log('Sending file:', fileName, 'Size:', fileBuffer.length);
-    
-    res.setHeader('Content-Type', 'application/zip');
-    res.setHeader('Content-Disposition', `attachment; filename="${fileName}"`);
-    res.setHeader('Content-Length', fileBuffer.length);
-    res.send(fileBuffer);
-    
-    console.log('File sent successfully');
-  } catch (error) {
-    console.error('Report download error:', error);
-    res.status(500).json({ error: 'Failed to download report: ' + error.message });
+  sendArtifact(req, res, `${job.id}.zip`, {
+    contentType: 'application/zip',
+    downloadName: `gradstat-report-${jobId}.zip`,
+    missing: 'Report file not found. The analysis may not have completed successfully.',
+  });
+});
+
+/**
+ * GET /api/jobs/:id/results
+ * Full analysis results (JSON, including plots) of a finished job
+ */
+app.get('/api/jobs/:id/results', async (req, res) => {
+  const job = await jobQueue.get(req.params.id);
+
+  if (!job || job.status !== 'done') {
+    return res.status(404).json({ error: 'Results not available' });
   }
+
+  // Jobs finished before results moved to disk still carry them
+  if (job.resultMeta) {
+    return res.json(job.resultMeta);
+  }
+
+  sendArtifact(req, res, `${job.id}.json`, {
+    contentType: 'application/json',
+    missing: 'Results file not found',
+  });
 });
 
 /**
- * Process analysis job
- * Calls Python worker and updates job status
+ * Stream a file from RESULTS_DIR with Range, ETag and Last-Modified support
+ */
+function sendArtifact(req, res, fileName, { contentType, downloadName, missing }) {
+  // Byte ranges refer to the stored file, so ranged responses skip compression
+  res.set('Cache-Control', req.headers.range ? 'private, no-transform' : 'private, max-age=0');
+  res.type(contentType);
+  if (downloadName) {
+    res.attachment(downloadName);
+  }
+
+  res.sendFile(path.resolve(RESULTS_DIR, fileName), { cacheControl: false }, (error) => {
+    if (!error || res.headersSent) return;
+    if (error.code === 'ENOENT' || error.status === 404) {
+      console.error('Artifact not found:', fileName);
+      return res.status(404).json({ error: missing });
+    }
+    console.error('Artifact download error:', error.message);
+    res.status(error.status || 500).json({ error: 'Failed to send file: ' + error.message });
+  });
+}
+
+const STAGE_MESSAGES = {
+  parse: 'Reading data...',
+  fit: 'Running analysis...',
+  plots: 'Creating plots...',
+  report: 'Building report...',
+};
+
+/**
+ * Read server-sent events from a stream, awaiting onEvent(event, data)
+ * for each one (data parsed as JSON)
  */
-async function processAnalysis(jobId, filePath, options) {
-  const job = jobs.get(jobId);
-  if (!job) return;
+async function readEventStream(stream, onEvent) {
+  stream.setEncoding('utf8');
+  let buffer = '';
+  for await (const chunk of stream) {
+    // Only the new text (and the separator it may complete) needs scanning
+    let searchFrom = Math.max(buffer.length - 1, 0);
+    buffer += chunk;
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n', searchFrom)) !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      searchFrom = 0;
+
+      let event = 'message';
+      const data = [];
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data.push(line.slice(5).replace(/^ /, ''));
+      }
+      if (data.length) await onEvent(event, JSON.parse(data.join('\n')));
+    }
+  }
+}
 
+/**
+ * Process analysis job
+ * Streams the analysis from the Python worker, passing its stage events
+ * on as job progress; runs under the job queue, which stores the returned
+ * fields when the job is done and handles failures, retries and
+ * cancellation (signal)
+ */
+async function processAnalysis(job, report, signal) {
+  const jobId = job.id;
+  const workerUrl = job.pool === 'heavy' ? WORKER_HEAVY_URL : WORKER_URL;
+
+  // Closing the stream stops the worker's analysis too, but a worker behind
+  // a proxy may only notice that when it next writes; tell it directly
+  const cancelWorker = () => {
+    axios.post(`${workerUrl}/analyze/${encodeURIComponent(jobId)}/cancel`, null, { timeout: 5000 })
+      .catch((error) => console.error(`Worker cancel of job ${jobId} failed:`, error.message));
+  };
+  signal?.addEventListener('abort', cancelWorker, { once: true });
   try {
-    job.status = 'running';
-    job.progress = 10;
-    job.logs.push('Starting analysis...');
+    return await streamAnalysis(job, report, signal, workerUrl);
+  } finally {
+    signal?.removeEventListener('abort', cancelWorker);
+  }
+}
 
-    const formData = new FormData();
-    
-    // Only read and attach file if it exists (not for power analysis)
-    if (filePath) {
-      const fileBuffer = await fs.readFile(filePath);
-      formData.append('file', fileBuffer, {
-        filename: path.basename(filePath),
-        contentType: 'text/csv'
-      });
-    } else {
-      // For power analysis, create a dummy file
-      const dummyBuffer = Buffer.from('', 'utf-8');
-      formData.append('file', dummyBuffer, {
-        filename: 'dummy.txt',
-        contentType: 'text/plain'
+/**
+ * Send a job's data to the worker and follow its analysis stream
+ */
+async function streamAnalysis(job, report, signal, workerUrl) {
+  const jobId = job.id;
+  const filePath = job.filePath;
+
+  await report({ progress: 10, stage: null, etaSeconds: null }, 'Starting analysis...');
+
+  let formData;
+  let headers;
+
+  // Stream the file from disk if there is one (not for power analysis)
+  if (filePath) {
+    ({ formData, headers } = await fileFormData(filePath, {
+      filename: path.basename(filePath),
+      contentType: 'text/csv'
+    }, { options: JSON.stringify(job.options), artifact_id: jobId, job_id: jobId }));
+  } else {
+    // For power analysis, create a dummy file
+    formData = new FormData();
+    const dummyBuffer = Buffer.from('', 'utf-8');
+    formData.append('file', dummyBuffer, {
+      filename: 'dummy.txt',
+      contentType: 'text/plain'
+    });
+    formData.append('options', JSON.stringify(job.options));
+    formData.append('artifact_id', jobId);
+    formData.append('job_id', jobId);
+    headers = formData.getHeaders();
+  }
+
+  await report({ progress: 20 }, 'Sending data to analysis worker...');
+
+  const stream = await axios.post(`${workerUrl}/analyze/stream`, formData, {
+    headers: {
+      ...headers,
+      Accept: 'text/event-stream',
+    },
+    responseType: 'stream',
+    maxContentLength: Infinity,
+    maxBodyLength: Infinity,
+    timeout: 300000, // 5 minutes
+    signal,
+  });
+
+  // Worker progress (0-100) maps onto 20-90 of the job's progress
+  const response = { data: null };
+  await readEventStream(stream.data, async (event, data) => {
+    if (event === 'stage') {
+      await report({
+        progress: 20 + Math.round(0.7 * data.progress),
+        stage: data.stage,
+        etaSeconds: data.eta_ms == null ? null : Math.round(data.eta_ms / 1000),
+      }, STAGE_MESSAGES[data.stage] || `Stage: ${data.stage}`);
+    } else if (event === 'result') {
+      response.data = data;
+      if (data.cost_run) shareCostRun(data.cost_run, workerUrl);
+    } else if (event === 'error') {
+      // Limit hits and cancellations carry a code (memory_limit, deadline, ...)
+      throw Object.assign(new Error(data.message || 'Analysis failed'), {
+        details: data.code ? { code: data.code, limit: data.limit ?? null } : null,
       });
     }
-    
-    formData.append('options', JSON.stringify(options));
+  });
 
-    job.progress = 20;
-    job.logs.push('Sending data to analysis worker...');
+  if (!response.data) {
+    throw new Error('Analysis stream ended without a result');
+  }
 
-    const response = await axios.post(`${WORKER_URL}/analyze`, formData, {
-      headers: {
-        'Content-Type': 'multipart/form-data',
-      },
-      maxContentLength: Infinity,
-      maxBodyLength: Infinity,
-      timeout: 300000, // 5 minutes
-    });
+  await report({ progress: 90, stage: 'report', etaSeconds: 0 }, 'Analysis complete, preparing results...');
 
-    job.progress = 90;
-    job.logs.push('Analysis complete, preparing results...');
+  const resultPath = path.join(RESULTS_DIR, `${jobId}.zip`);
+  let summary;
 
-    // Save results
-    const resultPath = path.join(RESULTS_DIR, `${jobId}.zip`);
-    
-    if (response.data.report_zip) {
-      // Ensure results directory exists
-      await fs.mkdir(RESULTS_DIR, { recursive: true });
-      
-      // Save base64 zip file
-      const zipBuffer = Buffer.from(response.data.report_zip, 'base64');
+  if (response.data.artifacts) {
+    // The worker wrote <jobId>.json and <jobId>.zip to the shared results directory
+    const { results, report_zip: reportZip } = response.data.artifacts;
+    await fs.access(path.join(RESULTS_DIR, results.name));
+    summary = response.data.summary;
+    await report({}, reportZip
+      ? `Report saved: ${resultPath} (${reportZip.bytes} bytes)`
+      : 'Warning: No report ZIP received from worker');
+  } else {
+    // Worker without the shared directory: results came inline
+    await fs.mkdir(RESULTS_DIR, { recursive: true });
+    const { results, report_zip: reportZip } = response.data;
+    await fs.writeFile(path.join(RESULTS_DIR, `${jobId}.json`), JSON.stringify(results));
+    summary = { analysis_type: results?.analysis_type, summary: results?.summary };
+
+    if (reportZip) {
+      const zipBuffer = Buffer.from(reportZip, 'base64');
       await fs.writeFile(resultPath, zipBuffer);
       console.log(`Report saved to: ${resultPath} (${zipBuffer.length} bytes)`);
-      job.logs.push(`Report saved: ${resultPath}`);
-      
-      // Verify file was written
-      try {
-        const stats = await fs.stat(resultPath);
-        console.log(`File verified: ${stats.size} bytes`);
-      } catch (err) {
-        console.error('File verification failed:', err);
-      }
+      await report({}, `Report saved: ${resultPath}`);
     } else {
       console.error('No report_zip in response');
-      job.logs.push('Warning: No report ZIP received from worker');
+      await report({}, 'Warning: No report ZIP received from worker');
     }
+  }
 
-    job.status = 'done';
-    job.progress = 100;
-    job.resultUrl = `/api/report?id=${jobId}`;
-    job.resultMeta = response.data.results;
-    job.logs.push('Results ready for download');
+  // The job keeps references only; results and report are served from disk
+  return {
+    resultUrl: `/api/report?id=${jobId}`,
+    resultsUrl: `/api/jobs/${jobId}/results`,
+    summary,
+  };
+}
 
-    // Clean up uploaded file (only if it exists)
-    if (filePath) {
-      await fs.unlink(filePath).catch(() => {});
+// Durable job queue: bounded concurrent worker calls per backend
+const jobQueue = new JobQueue(createJobStore({ dir: JOBS_DIR, ttlMs: JOB_TTL_MS }), processAnalysis, {
+  concurrency: parseInt(process.env.JOB_CONCURRENCY) || 2,
+  maxAttempts: parseInt(process.env.JOB_MAX_ATTEMPTS) || 3,
+  ttlMs: JOB_TTL_MS,
+  // Uploads on this pod's disk are only readable here, so jobs with a file are
+  // claimed by this backend unless UPLOAD_DIR is storage every backend mounts
+  host: process.env.SHARED_UPLOADS === 'true' ? null : undefined,
+  // Clean up the uploaded file once the job is done, cancelled or has failed for good
+  onSettled: async (job) => {
+    if (job.filePath) {
+      await fs.unlink(job.filePath).catch(() => {});
     }
-  } catch (error) {
-    console.error(`Analysis processing error for job ${jobId}:`, error);
-    job.status = 'failed';
-    job.error = error.response?.data?.error || error.message;
-    job.logs.push(`Error: ${job.error}`);
-    
-    // Clean up on error (only if file exists)
-    if (filePath) {
-      await fs.unlink(filePath).catch(() => {});
-    }
-  }
-}
+  },
+});
 
 // Automatic file cleanup - runs every hour
 cron.schedule('0 * * * *', async () => {
@@ -625,13 +1051,15 @@ cron.schedule('0 * * * *', async () => {
     const ONE_HOUR = 60 * 60 * 1000;
     const ONE_DAY = 24 * 60 * 60 * 1000;
     
-    // Clean uploads older than 1 hour
+    // Clean uploads older than 1 hour (except those of queued or running jobs)
     try {
       const uploadFiles = await fs.readdir(UPLOAD_DIR);
+      const activeFiles = await jobQueue.activeFiles();
       let uploadsCleaned = 0;
       
       for (const file of uploadFiles) {
         const filePath = path.join(UPLOAD_DIR, file);
+        if (activeFiles.has(path.resolve(filePath))) continue;
         const stats = await fs.stat(filePath);
         const age = now - stats.mtimeMs;
         
@@ -671,6 +1099,16 @@ cron.schedule('0 * * * *', async () => {
       console.error('Error cleaning results:', err.message);
     }
     
+    // Remove finished jobs past their TTL and requeue jobs of backends that stopped
+    try {
+      const removed = await jobQueue.prune();
+      if (removed.length > 0) {
+        console.log(`Removed ${removed.length} expired jobs`);
+      }
+    } catch (err) {
+      console.error('Error pruning jobs:', err.message);
+    }
+    
   } catch (error) {
     console.error('File cleanup error:', error);
   }
@@ -770,6 +1208,73 @@ app.post('/api/what-if', async (req, res) => {
   }
 });
 
+/**
+ * Relay a worker server-sent event stream to the client as it arrives
+ */
+async function proxyEventStream(req, res, workerPath, label) {
+  // Stop the worker stream (and its LLM call) if the client goes away
+  const controller = new AbortController();
+  res.on('close', () => controller.abort());
+
+  try {
+    const response = await axios.post(`${WORKER_URL}${workerPath}`, req.body, {
+      headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+      responseType: 'stream',
+      timeout: 30000,  // until the stream starts
+      signal: controller.signal,
+    });
+    // no-transform also keeps the compression middleware from buffering events
+    res.status(200).set({
+      'Content-Type': 'text/event-stream',
+      'Cache-Control': 'no-cache, no-transform',
+      Connection: 'keep-alive',
+      'X-Accel-Buffering': 'no',
+    });
+    res.flushHeaders();
+    response.data.on('error', (error) => {
+      if (!controller.signal.aborted) {
+        console.error(`${label} stream error:`, error.message);
+      }
+      res.end();
+    });
+    response.data.pipe(res);
+  } catch (error) {
+    if (controller.signal.aborted) return;
+    console.error(`${label} stream error:`, error.message);
+    res.status(error.response?.status || 500).json({
+      error: `Failed to stream ${label}`,
+      details: error.message
+    });
+  }
+}
+
+/**
+ * POST /api/interpret/stream
+ * Stream AI interpretation (insights first, then text as it is generated)
+ */
+app.post('/api/interpret/stream', (req, res) => {
+  console.log('AI interpretation stream request');
+  proxyEventStream(req, res, '/interpret/stream', 'interpretation');
+});
+
+/**
+ * POST /api/ask/stream
+ * Stream the answer to a question about analysis results
+ */
+app.post('/api/ask/stream', (req, res) => {
+  console.log('AI question (stream):', req.body.question);
+  proxyEventStream(req, res, '/ask/stream', 'answer');
+});
+
+/**
+ * POST /api/what-if/stream
+ * Stream a what-if scenario exploration
+ */
+app.post('/api/what-if/stream', (req, res) => {
+  console.log('What-if scenario (stream):', req.body.scenario);
+  proxyEventStream(req, res, '/what-if/stream', 'scenario analysis');
+});
+
 /**
  * POST /api/test-advisor/ask
  * Ask AI a question about statistical tests
@@ -883,6 +1388,7 @@ app.use((req, res) => {
 // Start server
 async function startServer() {
   await ensureDirectories();
+  await jobQueue.start();
   
   app.listen(PORT, () => {
     console.log('='.repeat(50));
@@ -895,7 +1401,8 @@ async function startServer() {
     console.log(`Rate Limit: ${process.env.RATE_LIMIT_MAX || 20} requests per ${(parseInt(process.env.RATE_LIMIT_WINDOW) || 900000) / 60000} minutes`);
     console.log(`Analysis Limit: ${process.env.ANALYSIS_LIMIT_MAX || 5} per hour`);
     console.log(`Password Protection: ${process.env.TESTING_PASSWORD ? 'ENABLED ✅' : 'DISABLED ⚠️'}`);
-    console.log(`Auto Cleanup: ENABLED (uploads: 1h, results: 24h)`);
+    console.log(`Auto Cleanup: ENABLED (uploads: 1h, results: 24h, jobs: ${JOB_TTL_MS / 3600000}h)`);
+    console.log(`Job Queue: ${jobQueue.store.constructor.name}, ${jobQueue.concurrency} concurrent`);
     console.log('='.repeat(50));
   });
 }
@@ -908,6 +1415,8 @@ startServer().catch((error) => {
 // Graceful shutdown
 process.on('SIGTERM', async () => {
   console.log('SIGTERM received, shutting down gracefully...');
+  // Flush the job journal; unfinished jobs run again on the next start
+  await jobQueue.stop().catch(() => {});
   process.exit(0);
 });
 
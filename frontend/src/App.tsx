@@ -22,10 +22,14 @@ import ExampleDatasets from './components/ExampleDatasets';
 import useKeyboardShortcuts from './hooks/useKeyboardShortcuts';
 import { PreviewData, AnalysisOptions, JobStatusData } from './types';
 import { initGA } from './utils/analytics';
+import { getEventStream } from './utils/eventStream';
 
 // Configure API base URL
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:3001';
 
+// Job statuses after which nothing changes
+const isFinished = (status?: string) => status === 'done' || status === 'failed' || status === 'cancelled';
+
 function App() {
   const [showHomePage, setShowHomePage] = useState<boolean>(true);
   const [file, setFileInternal] = useState<File | null>(null);
@@ -306,6 +310,11 @@ function App() {
       return;
     }
 
+    // A new analysis replaces the one still running
+    if (jobId && !isFinished(jobStatus?.status)) {
+      axios.post(`/api/jobs/${jobId}/cancel`).catch((err) => console.error('Failed to cancel job:', err));
+    }
+
     setLoading(true);
     setError(null);
     setJobId(null);
@@ -354,6 +363,16 @@ function App() {
     }
   };
 
+  // Cancel the current analysis job (the status stream reports the outcome)
+  const handleCancelJob = async () => {
+    if (!jobId) return;
+    try {
+      await axios.post(`/api/jobs/${jobId}/cancel`);
+    } catch (err) {
+      console.error('Failed to cancel job:', err);
+    }
+  };
+
   // Keyboard shortcuts
   useKeyboardShortcuts([
     {
@@ -393,26 +412,67 @@ function App() {
     }
   ]);
 
-  // Poll job status
+  // Follow job status as server-sent events, falling back to polling if the stream fails
   useEffect(() => {
     if (!jobId) return;
 
-    const pollInterval = setInterval(async () => {
-      try {
-        const response = await axios.get(`/api/job-status?id=${jobId}`);
-        setJobStatus(response.data);
+    const controller = new AbortController();
+    let pollInterval: ReturnType<typeof setInterval> | null = null;
+    let finished = false;
+
+    const startPolling = () => {
+      pollInterval = setInterval(async () => {
+        try {
+          const response = await axios.get(`/api/job-status?id=${jobId}`);
+          setJobStatus(response.data);
 
-        if (response.data.status === 'done' || response.data.status === 'failed') {
-          clearInterval(pollInterval);
+          if (isFinished(response.data.status)) {
+            if (pollInterval) clearInterval(pollInterval);
+          }
+        } catch (err) {
+          console.error('Failed to fetch job status:', err);
         }
-      } catch (err) {
-        console.error('Failed to fetch job status:', err);
-      }
-    }, 2000);
+      }, 2000);
+    };
 
-    return () => clearInterval(pollInterval);
+    getEventStream(`${API_BASE_URL}/api/jobs/${jobId}/events`, (event, data) => {
+      if (event === 'status') {
+        setJobStatus(data);
+        finished = isFinished(data.status);
+      }
+    }, controller.signal)
+      .then(() => {
+        // Stream closed before the job finished (e.g. a proxy timeout)
+        if (!finished) startPolling();
+      })
+      .catch((err) => {
+        if (controller.signal.aborted) return;
+        console.error('Job status stream failed, polling instead:', err);
+        startPolling();
+      });
+
+    return () => {
+      controller.abort();
+      if (pollInterval) clearInterval(pollInterval);
+    };
   }, [jobId]);
 
+  // Cancel an unfinished job when the page is closed, so it does not hold a worker
+  useEffect(() => {
+    if (!jobId || isFinished(jobStatus?.status)) return;
+
+    const handlePageHide = () => {
+      // keepalive lets the request outlive the page
+      fetch(`${API_BASE_URL}/api/jobs/${jobId}/cancel`, {
+        method: 'POST',
+        keepalive: true,
+        headers: testingPassword ? { 'X-Testing-Password': testingPassword } : {},
+      }).catch(() => {});
+    };
+    window.addEventListener('pagehide', handlePageHide);
+    return () => window.removeEventListener('pagehide', handlePageHide);
+  }, [jobId, jobStatus?.status, testingPassword]);
+
   // Password authentication screen
   if (!isAuthenticated) {
     return (
@@ -681,6 +741,7 @@ function App() {
                   <JobStatus
                     jobId={jobId}
                     status={jobStatus}
+                    onCancel={handleCancelJob}
                   />
                 )}
 
@@ -689,6 +750,7 @@ function App() {
                     jobId={jobId}
                     resultUrl={jobStatus.result_url}
                     resultMeta={jobStatus.result_meta}
+                    resultsUrl={jobStatus.results_url}
                   />
                 )}
               </div>
@@ -753,6 +815,7 @@ function App() {
                 <JobStatus
                   jobId={jobId}
                   status={jobStatus}
+                  onCancel={handleCancelJob}
                 />
               )}
 
@@ -761,6 +824,7 @@ function App() {
                   jobId={jobId}
                   resultUrl={jobStatus.result_url}
                   resultMeta={jobStatus.result_meta}
+                  resultsUrl={jobStatus.results_url}
                 />
               )}
             </div>
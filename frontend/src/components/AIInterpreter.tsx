@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import axios from 'axios';
+import { postEventStream } from '../utils/eventStream';
 
 // Configure API base URL
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:3001';
@@ -29,25 +29,50 @@ const AIInterpreter: React.FC<AIInterpreterProps> = ({ analysisData }) => {
     }
   }, [analysisData, activeTab]);
 
+  const analysisContext = () => ({
+    analysis_type: analysisData.analysis_type || 'Unknown',
+    sample_size: analysisData.sample_size || 0,
+    variables: analysisData.variables || [],
+    results: analysisData.results || {},
+    assumptions: analysisData.assumptions || {}
+  });
+
+  // Append streamed text to the last (assistant) message
+  const appendToLastMessage = (text: string) => {
+    setConversation(prev => {
+      const last = prev[prev.length - 1];
+      return [...prev.slice(0, -1), { ...last, content: last.content + text }];
+    });
+  };
+
+  // Drop the assistant placeholder if the stream failed before any text arrived
+  const dropEmptyReply = () => {
+    setConversation(prev => {
+      const last = prev[prev.length - 1];
+      return last && last.role === 'assistant' && !last.content ? prev.slice(0, -1) : prev;
+    });
+  };
+
   const loadInterpretation = async () => {
     console.log('loadInterpretation called');
     setLoading(true);
     setError(null);
     try {
       console.log('Sending interpretation request...');
-      const response = await axios.post(`${API_BASE_URL}/api/interpret`, {
-        analysis_type: analysisData.analysis_type || 'Unknown',
-        sample_size: analysisData.sample_size || 0,
-        variables: analysisData.variables || [],
-        results: analysisData.results || {},
-        assumptions: analysisData.assumptions || {}
+      // Rule-based insights arrive first, then the interpretation text as it is generated
+      await postEventStream(`${API_BASE_URL}/api/interpret/stream`, analysisContext(), (event, data) => {
+        if (event === 'insights') {
+          setInterpretation({ interpretation: '', ...data });
+          setLoading(false);
+        } else if (event === 'token') {
+          setInterpretation((prev: any) => ({ ...prev, interpretation: (prev?.interpretation || '') + data.text }));
+        } else if (event === 'error') {
+          setError(data.message);
+        }
       });
-      console.log('Interpretation response:', response.data);
-      setInterpretation(response.data);
     } catch (error: any) {
       console.error('Interpretation error:', error);
-      console.error('Error response:', error.response);
-      setError(error.response?.data?.error || error.response?.data?.detail || 'Failed to generate interpretation. AI features may not be available yet.');
+      setError(error.message || 'Failed to generate interpretation. AI features may not be available yet.');
     } finally {
       setLoading(false);
     }
@@ -56,63 +81,55 @@ const AIInterpreter: React.FC<AIInterpreterProps> = ({ analysisData }) => {
   const askQuestion = async () => {
     if (!question.trim()) return;
 
+    const asked = question;
+    const history = conversation;
+    setConversation([...history, { role: 'user', content: asked }, { role: 'assistant', content: '' }]);
+    setQuestion('');
     setLoading(true);
     setError(null);
     try {
-      const response = await axios.post(`${API_BASE_URL}/api/ask`, {
-        question,
-        analysis_data: {
-          analysis_type: analysisData.analysis_type || 'Unknown',
-          sample_size: analysisData.sample_size || 0,
-          variables: analysisData.variables || [],
-          results: analysisData.results || {},
-          assumptions: analysisData.assumptions || {}
-        },
-        conversation_history: conversation
+      await postEventStream(`${API_BASE_URL}/api/ask/stream`, {
+        question: asked,
+        analysis_data: analysisContext(),
+        conversation_history: history
+      }, (event, data) => {
+        if (event === 'token') {
+          setLoading(false);
+          appendToLastMessage(data.text);
+        } else if (event === 'error') {
+          setError(data.message);
+        }
       });
-
-      const newConversation = [
-        ...conversation,
-        { role: 'user', content: question },
-        { role: 'assistant', content: response.data.answer }
-      ];
-
-      setConversation(newConversation);
-      setQuestion('');
     } catch (error: any) {
       console.error('Question error:', error);
-      setError(error.response?.data?.error || 'Failed to answer question');
+      setError(error.message || 'Failed to answer question');
     } finally {
+      dropEmptyReply();
       setLoading(false);
     }
   };
 
   const askWhatIf = async (scenario: string) => {
+    setConversation(prev => [...prev, { role: 'user', content: `What if: ${scenario}` }, { role: 'assistant', content: '' }]);
     setLoading(true);
     setError(null);
     try {
-      const response = await axios.post(`${API_BASE_URL}/api/what-if`, {
+      await postEventStream(`${API_BASE_URL}/api/what-if/stream`, {
         scenario,
-        analysis_data: {
-          analysis_type: analysisData.analysis_type || 'Unknown',
-          sample_size: analysisData.sample_size || 0,
-          variables: analysisData.variables || [],
-          results: analysisData.results || {},
-          assumptions: analysisData.assumptions || {}
+        analysis_data: analysisContext()
+      }, (event, data) => {
+        if (event === 'token') {
+          setLoading(false);
+          appendToLastMessage(data.text);
+        } else if (event === 'error') {
+          setError(data.message);
         }
       });
-
-      const newConversation = [
-        ...conversation,
-        { role: 'user', content: `What if: ${scenario}` },
-        { role: 'assistant', content: response.data.response }
-      ];
-
-      setConversation(newConversation);
     } catch (error: any) {
       console.error('What-if error:', error);
-      setError(error.response?.data?.error || 'Failed to analyze scenario');
+      setError(error.message || 'Failed to analyze scenario');
     } finally {
+      dropEmptyReply();
       setLoading(false);
     }
   };
@@ -587,6 +587,24 @@ const AnalysisSelector: React.FC<AnalysisSelectorProps> = ({
             </select>
           </div>
 
+          <div className="mb-4">
+            <label className="block text-sm font-medium text-gray-700 mb-2">
+              Cross-Validation
+            </label>
+            <select
+              value={options.cvFolds || 0}
+              onChange={(e) => updateOption('cvFolds', parseInt(e.target.value))}
+              className="w-full px-3 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500"
+            >
+              <option value="0">Off - single train/test split (Default)</option>
+              <option value="5">5-fold</option>
+              <option value="10">10-fold</option>
+            </select>
+            <p className="text-xs text-gray-500 mt-1">
+              Reports the mean AUC across folds with a 95% confidence interval
+            </p>
+          </div>
+
           <div className="mb-4">
             <label className="block text-sm font-medium text-gray-700 mb-2">
               Random State (Seed)
@@ -939,23 +957,46 @@ const AnalysisSelector: React.FC<AnalysisSelectorProps> = ({
       )}
 
       {analysisType === 'time-series' && (
-        <div className="mb-4">
-          <label className="block text-sm font-medium text-gray-700 mb-2">
-            Date/Time Column
-          </label>
-          <select
-            value={options.dateColumn || ''}
-            onChange={(e) => updateOption('dateColumn', e.target.value)}
-            className="w-full px-3 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500"
-          >
-            <option value="">Select column...</option>
-            {columns.map((col) => (
-              <option key={col} value={col}>
-                {col}
-              </option>
-            ))}
-          </select>
-        </div>
+        <>
+          <div className="mb-4">
+            <label className="block text-sm font-medium text-gray-700 mb-2">
+              Date/Time Column
+            </label>
+            <select
+              value={options.dateColumn || ''}
+              onChange={(e) => updateOption('dateColumn', e.target.value)}
+              className="w-full px-3 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500"
+            >
+              <option value="">Select column...</option>
+              {columns.map((col) => (
+                <option key={col} value={col}>
+                  {col}
+                </option>
+              ))}
+            </select>
+          </div>
+
+          <div className="mb-4">
+            <label className="block text-sm font-medium text-gray-700 mb-2">
+              Resample To
+            </label>
+            <select
+              value={options.resampleFrequency || ''}
+              onChange={(e) => updateOption('resampleFrequency', e.target.value || undefined)}
+              className="w-full px-3 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500"
+            >
+              <option value="">Auto (detected frequency)</option>
+              <option value="h">Hourly</option>
+              <option value="D">Daily</option>
+              <option value="W">Weekly</option>
+              <option value="MS">Monthly</option>
+              <option value="QS">Quarterly</option>
+            </select>
+            <p className="text-xs text-gray-500 mt-1">
+              Values within each period are averaged
+            </p>
+          </div>
+        </>
       )}
 
       {/* Common Options */}
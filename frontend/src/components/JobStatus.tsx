@@ -1,12 +1,32 @@
 import React from 'react';
 import { JobStatusData } from '../types';
 
+const STAGE_LABELS: Record<string, string> = {
+  parse: 'Reading data',
+  fit: 'Running analysis',
+  plots: 'Creating plots',
+  report: 'Building report',
+};
+
+const LIMIT_MESSAGES: Record<string, string> = {
+  memory_limit: 'The analysis needed more memory than one job may use. Try a smaller dataset or fewer variables.',
+  cpu_limit: 'The analysis needed more computing time than one job may use. Try a smaller dataset or fewer variables.',
+  deadline: 'The analysis took longer than the time limit. Try a smaller dataset or fewer variables.',
+  killed: 'The analysis was stopped because the server ran short of memory. Please try again.',
+};
+
+const formatEta = (seconds: number) =>
+  seconds < 60 ? `${Math.max(seconds, 1)}s` : `${Math.round(seconds / 60)} min`;
+
 interface JobStatusProps {
   jobId: string;
   status: JobStatusData | null;
+  onCancel?: () => void;
 }
 
-const JobStatus: React.FC<JobStatusProps> = ({ jobId, status }) => {
+const JobStatus: React.FC<JobStatusProps> = ({ jobId, status, onCancel }) => {
+  const canCancel = onCancel && (!status || status.status === 'pending' || status.status === 'running');
+
   const getStatusColor = () => {
     switch (status?.status) {
       case 'done':
@@ -15,6 +35,8 @@ const JobStatus: React.FC<JobStatusProps> = ({ jobId, status }) => {
         return 'bg-red-100 border-red-300 text-red-800';
       case 'running':
         return 'bg-blue-100 border-blue-300 text-blue-800';
+      case 'cancelled':
+        return 'bg-yellow-100 border-yellow-300 text-yellow-800';
       default:
         return 'bg-gray-100 border-gray-300 text-gray-800';
     }
@@ -28,6 +50,8 @@ const JobStatus: React.FC<JobStatusProps> = ({ jobId, status }) => {
         return '❌';
       case 'running':
         return '⚙️';
+      case 'cancelled':
+        return '⏹️';
       default:
         return '⏳';
     }
@@ -44,11 +68,38 @@ const JobStatus: React.FC<JobStatusProps> = ({ jobId, status }) => {
             <div>
               <p className="font-semibold capitalize">{status?.status || 'Pending'}</p>
               <p className="text-sm opacity-75">Job ID: {jobId}</p>
+              {status?.status === 'pending' && status.queue_position != null && (
+                <p className="text-sm opacity-75">
+                  {status.queue_position === 0 ? 'Next in queue' : `${status.queue_position} jobs ahead in queue`}
+                </p>
+              )}
+              {status?.status === 'pending' && status.estimate && (
+                <p className="text-sm opacity-75">
+                  Expected to take about {formatEta(Math.round(status.estimate.seconds))}
+                  {status.estimate.tier === 'heavy' && ' (large analysis)'}
+                </p>
+              )}
+              {status?.status === 'running' && status.stage && (
+                <p className="text-sm opacity-75">
+                  {STAGE_LABELS[status.stage]}
+                  {status.eta_seconds != null && ` · about ${formatEta(status.eta_seconds)} left`}
+                </p>
+              )}
             </div>
           </div>
-          {status?.progress !== undefined && (
-            <span className="text-2xl font-bold">{status.progress}%</span>
-          )}
+          <div className="flex items-center gap-3">
+            {status?.progress !== undefined && (
+              <span className="text-2xl font-bold">{status.progress}%</span>
+            )}
+            {canCancel && (
+              <button
+                onClick={onCancel}
+                className="px-3 py-1 text-sm font-medium bg-white border border-current rounded hover:bg-opacity-75"
+              >
+                Cancel
+              </button>
+            )}
+          </div>
         </div>
 
         {/* Progress Bar */}
@@ -67,7 +118,9 @@ const JobStatus: React.FC<JobStatusProps> = ({ jobId, status }) => {
         {status?.status === 'failed' && status.error && (
           <div className="mt-3 p-3 bg-white bg-opacity-50 rounded">
             <p className="text-sm font-medium">Error:</p>
-            <p className="text-sm mt-1">{status.error}</p>
+            <p className="text-sm mt-1">
+              {(status.error_details && LIMIT_MESSAGES[status.error_details.code]) || status.error}
+            </p>
           </div>
         )}
       </div>
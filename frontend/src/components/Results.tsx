@@ -1,4 +1,4 @@
-import React from 'react';
+import React, { useEffect, useState } from 'react';
 import axios from 'axios';
 import { ResultMeta } from '../types';
 import PlotlyChart from './PlotlyChart';
@@ -13,6 +13,7 @@ interface ResultsProps {
   jobId: string;
   resultUrl?: string;
   resultMeta?: ResultMeta;
+  resultsUrl?: string | null;
 }
 
 // Helper function to format numbers to 4 decimal places
@@ -412,7 +413,31 @@ const renderTestResults = (results: any) => {
   );
 };
 
-const Results: React.FC<ResultsProps> = ({ jobId, resultUrl, resultMeta }) => {
+const Results: React.FC<ResultsProps> = ({ jobId, resultUrl, resultMeta: inlineResultMeta, resultsUrl }) => {
+  // Full results (with plots) are fetched once the job is done rather than
+  // carried in every status update
+  const [loadedResultMeta, setLoadedResultMeta] = useState<ResultMeta | undefined>(undefined);
+  const [loadError, setLoadError] = useState<string | null>(null);
+
+  useEffect(() => {
+    if (inlineResultMeta || !resultsUrl) return;
+    let cancelled = false;
+    setLoadError(null);
+    axios.get(resultsUrl)
+      .then((response) => {
+        if (!cancelled) setLoadedResultMeta(response.data);
+      })
+      .catch((error) => {
+        console.error('Failed to load results:', error);
+        if (!cancelled) setLoadError('Failed to load results. Please try again.');
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [inlineResultMeta, resultsUrl]);
+
+  const resultMeta = inlineResultMeta || loadedResultMeta;
+
   const handleDownload = async () => {
     try {
       const response = await axios.get(`/api/report?id=${jobId}`, {
@@ -437,6 +462,10 @@ const Results: React.FC<ResultsProps> = ({ jobId, resultUrl, resultMeta }) => {
     <div className="bg-white rounded-lg shadow-sm p-6">
       <h2 className="text-lg font-semibold text-gray-900 mb-4">Analysis Results</h2>
 
+      {!resultMeta && resultsUrl && (
+        <p className="text-sm text-gray-600 mb-4">{loadError || 'Loading results...'}</p>
+      )}
+
       {/* Summary */}
       {resultMeta?.summary && (
         <div className="mb-6 p-4 bg-blue-50 border border-blue-200 rounded-lg">
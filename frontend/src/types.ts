@@ -31,12 +31,21 @@ export interface AnalysisOptions {
 }
 
 export interface JobStatusData {
-  status: 'pending' | 'running' | 'done' | 'failed';
+  status: 'pending' | 'running' | 'done' | 'failed' | 'cancelled';
   progress: number;
+  stage?: 'parse' | 'fit' | 'plots' | 'report' | null;
+  eta_seconds?: number | null;
+  queue_position?: number | null;
   result_url?: string;
+  results_url?: string | null;
+  summary?: { analysis_type?: string; summary?: string } | null;
+  // Pre-flight cost estimate; heavy jobs run on a separate worker pool
+  estimate?: { seconds: number; tier: 'light' | 'heavy' } | null;
   result_meta?: ResultMeta;
   logs?: string[];
   error?: string;
+  // Set when the worker stopped the analysis (memory_limit, cpu_limit, deadline, ...)
+  error_details?: { code: string; limit?: number | null } | null;
 }
 
 export interface ResultMeta {
@@ -0,0 +1,84 @@
+import axios from 'axios';
+
+type EventHandler = (event: string, data: any) => void;
+
+// Fetch a server-sent event stream and handle its events as they arrive
+// (EventSource cannot send the testing password header or a POST body, so
+// the stream is read with fetch)
+const readEventStream = async (
+  url: string,
+  init: RequestInit,
+  onEvent: EventHandler
+): Promise<void> => {
+  const headers: Record<string, string> = {
+    ...(init.headers as Record<string, string>),
+    Accept: 'text/event-stream',
+  };
+  // Same testing password header that App.tsx sets on axios
+  const password = axios.defaults.headers.common['X-Testing-Password'];
+  if (password) {
+    headers['X-Testing-Password'] = String(password);
+  }
+
+  const response = await fetch(url, { ...init, headers });
+  if (!response.ok || !response.body) {
+    let message = `Request failed with status ${response.status}`;
+    try {
+      const error = await response.json();
+      message = error.error || error.detail || message;
+    } catch {
+      // Not JSON; keep the status message
+    }
+    throw new Error(message);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events are separated by a blank line
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = 'message';
+      const dataLines: string[] = [];
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) {
+          event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+          dataLines.push(line.slice(5).trimStart());
+        }
+      }
+      if (dataLines.length > 0) {
+        onEvent(event, JSON.parse(dataLines.join('\n')));
+      }
+      boundary = buffer.indexOf('\n\n');
+    }
+  }
+};
+
+// POST a JSON body and handle the server-sent events of the response
+export const postEventStream = (
+  url: string,
+  body: unknown,
+  onEvent: EventHandler,
+  signal?: AbortSignal
+): Promise<void> =>
+  readEventStream(url, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body),
+    signal,
+  }, onEvent);
+
+// GET a server-sent event stream (e.g. job status updates)
+export const getEventStream = (
+  url: string,
+  onEvent: EventHandler,
+  signal?: AbortSignal
+): Promise<void> => readEventStream(url, { method: 'GET', signal }, onEvent);
@@ -5,6 +5,7 @@ Run this to verify OpenAI integration works
 
 import sys
 import os
+import asyncio
 
 # Add worker directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'worker'))
@@ -13,6 +14,11 @@ from llm_interpreter import StatisticalInterpreter
 
 def test_interpreter():
     """Test the LLM interpreter with sample data"""
+    # The interpreter's methods are coroutines; run them all on one event loop
+    return asyncio.run(check_interpreter())
+
+async def check_interpreter():
+    """Run the interpreter checks (see test_interpreter)"""
     
     print("=" * 60)
     print("Testing LLM Statistical Interpreter")
@@ -62,7 +68,7 @@ def test_interpreter():
     print("=" * 60)
     
     try:
-        interpretation = interpreter.interpret_results(sample_data)
+        interpretation = await interpreter.interpret_results(sample_data)
         
         print("\n📊 Interpretation:")
         print(interpretation['interpretation'])
@@ -94,7 +100,7 @@ def test_interpreter():
         question = "What does Cohen's d mean?"
         print(f"\n❓ Question: {question}")
         
-        answer = interpreter.answer_question(question, sample_data)
+        answer = await interpreter.answer_question(question, sample_data)
         print(f"\n💬 Answer:\n{answer}")
         
         print("\n✅ Test 2 PASSED")
@@ -111,7 +117,7 @@ def test_interpreter():
         scenario = "What if I doubled my sample size?"
         print(f"\n🔮 Scenario: {scenario}")
         
-        response = interpreter.what_if_analysis(scenario, sample_data)
+        response = await interpreter.what_if_analysis(scenario, sample_data)
         print(f"\n🤖 Analysis:\n{response}")
         
         print("\n✅ Test 3 PASSED")
@@ -14,19 +14,26 @@ from statsmodels.formula.api import ols
 from statsmodels.stats.anova import anova_lm
 from statsmodels.stats.multicomp import pairwise_tukeyhsd, MultiComparison
 import logging
+import time
+from progress import report_stage
+from metrics import observe_stage
 
 logger = logging.getLogger(__name__)
 
 
 def plot_to_base64(fig):
     """Convert matplotlib figure to base64 string"""
+    report_stage('plots')
+    start = time.perf_counter()
     import io
     import base64
     buf = io.BytesIO()
     fig.savefig(buf, format='png', dpi=100, bbox_inches='tight')
     plt.close(fig)
     buf.seek(0)
-    return base64.b64encode(buf.read()).decode('utf-8')
+    img_base64 = base64.b64encode(buf.read()).decode('utf-8')
+    observe_stage('plot_render', time.perf_counter() - start)
+    return img_base64
 
 
 def calculate_cohens_d(group1, group2):
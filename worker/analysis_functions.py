@@ -4,19 +4,18 @@ Statistical analysis functions for GradStat
 
 import pandas as pd
 import numpy as np
-from logger_config import logger, log_analysis_start, log_analysis_complete, log_analysis_error, log_inf_nan_detected
+from logger_config import logger, log_analysis_start, log_analysis_complete, log_analysis_error
+from fast_json import convert_to_python_types
+from progress import report_stage
+from metrics import observe_stage
 import time
 from scipy import stats
-from sklearn.decomposition import PCA
 from sklearn.cluster import KMeans, DBSCAN
-from sklearn.preprocessing import StandardScaler
 from sklearn.linear_model import LinearRegression, LogisticRegression
 from sklearn.metrics import (
     confusion_matrix, classification_report, roc_curve, roc_auc_score,
     accuracy_score, precision_score, recall_score, f1_score
 )
-from lifelines import KaplanMeierFitter, CoxPHFitter
-from lifelines.statistics import logrank_test
 import statsmodels.api as sm
 from statsmodels.formula.api import ols
 from statsmodels.stats.multicomp import pairwise_tukeyhsd
@@ -25,14 +24,29 @@ import seaborn as sns
 import io
 import base64
 from typing import Dict, List, Any
+from categorical_engine import (
+    build_contingency, chi_square, adjusted_residuals, largest_residuals,
+    monte_carlo_test, collapse_for_display, MAX_MONTE_CARLO_SIMULATIONS
+)
+from logistic_engine import fit_logistic_model, code_snippet as logistic_code_snippet
+from numeric_prep import get_numeric_prep
+from pca_engine import fit_pca, transform as pca_transform
+from timeseries_engine import prepare_frame, analyze_frame, downsample_minmax, MAX_DISPLAY_POINTS
+from survival_engine import (
+    kaplan_meier_groups, median_survival, survival_at, logrank_test_k, fit_cox_cached
+)
 
 def plot_to_base64(fig) -> str:
     """Convert matplotlib figure to base64 string"""
+    # The first rendered figure ends the model fitting stage of a request
+    report_stage('plots')
+    start = time.perf_counter()
     buf = io.BytesIO()
     fig.savefig(buf, format='png', dpi=100, bbox_inches='tight')
     buf.seek(0)
     img_base64 = base64.b64encode(buf.read()).decode('utf-8')
     plt.close(fig)
+    observe_stage('plot_render', time.perf_counter() - start)
     return img_base64
 
 def format_pvalue(p: float) -> str:
@@ -42,39 +56,13 @@ def format_pvalue(p: float) -> str:
     else:
         return f"{p:.4f}"
 
-def convert_to_python_types(obj, path="root"):
-    """Convert numpy types to Python native types for JSON serialization and handle inf/nan"""
-    if isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        val = float(obj)
-        # Replace inf and nan with None for JSON compatibility
-        if np.isinf(val) or np.isnan(val):
-            log_inf_nan_detected(path, "numpy_float")
-            return None
-        return val
-    elif isinstance(obj, float):
-        # Also check regular Python floats
-        if np.isinf(obj) or np.isnan(obj):
-            log_inf_nan_detected(path, "python_float")
-            return None
-        return obj
-    elif isinstance(obj, np.bool_):
-        return bool(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, dict):
-        return {key: convert_to_python_types(value, f"{path}.{key}") for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_to_python_types(item, f"{path}[{i}]") for i, item in enumerate(obj)]
-    return obj
-
 def descriptive_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
     """Perform descriptive statistical analysis"""
-    numeric_cols = df.select_dtypes(include=[np.number]).columns
+    prep = get_numeric_prep(df)
+    numeric_cols = prep.columns
     
     # Summary statistics
-    summary = df[numeric_cols].describe().to_dict()
+    summary = prep.describe().to_dict()
     
     # Plots
     plots = []
@@ -95,7 +83,7 @@ def descriptive_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
     # Correlation heatmap if multiple numeric columns
     if len(numeric_cols) > 1:
         fig, ax = plt.subplots(figsize=(10, 8))
-        corr = df[numeric_cols].corr()
+        corr = prep.pairwise_correlation()
         sns.heatmap(corr, annot=True, fmt='.2f', cmap='coolwarm', ax=ax)
         ax.set_title('Correlation Matrix')
         plots.append({
@@ -755,18 +743,31 @@ def nonparametric_test(df: pd.DataFrame, opts: Dict) -> Dict:
     return convert_to_python_types(result)
 
 def categorical_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
-    """Perform categorical data analysis (Chi-square, Fisher's exact test)"""
+    """Perform categorical data analysis (Chi-square, Fisher's exact test, Monte Carlo exact test)"""
     var1 = opts.get('variable1')
     var2 = opts.get('variable2')
     alpha = opts.get('alpha', 0.05)
+    max_levels = int(opts.get('maxDisplayCategories', 10))
     
     if not var1 or not var2:
         raise ValueError("Two categorical variables required")
     
+    requested_simulations = opts.get('monteCarloSimulations')
+    if requested_simulations is not None:
+        requested_simulations = int(requested_simulations)
+        if not 1 <= requested_simulations <= MAX_MONTE_CARLO_SIMULATIONS:
+            raise ValueError(f"monteCarloSimulations must be between 1 and {MAX_MONTE_CARLO_SIMULATIONS}, "
+                             f"got {requested_simulations}")
+    
     data = df[[var1, var2]].dropna()
     
-    # Create contingency table
-    contingency_table = pd.crosstab(data[var1], data[var2])
+    # Sparse contingency table from factorized codes; only the display table is dense
+    ct = build_contingency(data[var1], data[var2])
+    n_rows, n_cols = len(ct['row_labels']), len(ct['col_labels'])
+    if n_rows < 2 or n_cols < 2:
+        raise ValueError("Each variable needs at least 2 categories")
+    contingency_table = collapse_for_display(ct, max_levels)
+    collapsed = contingency_table.shape != (n_rows, n_cols)
     
     plots = []
     assumptions = []
@@ -774,7 +775,7 @@ def categorical_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
     # Stacked bar chart
     fig, ax = plt.subplots(figsize=(10, 6))
     contingency_table.plot(kind='bar', stacked=True, ax=ax, colormap='viridis')
-    ax.set_title(f'{var1} vs {var2}')
+    ax.set_title(f'{var1} vs {var2}' + (f' (top {max_levels} levels)' if collapsed else ''))
     ax.set_xlabel(var1)
     ax.set_ylabel('Count')
     ax.legend(title=var2)
@@ -796,11 +797,27 @@ def categorical_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
     })
     
     # Determine which test to use
-    expected_freq = stats.contingency.expected_freq(contingency_table)
-    min_expected = expected_freq.min()
+    chi = chi_square(ct)
+    min_expected = chi['min_expected']
+    
+    # Expected counts and adjusted residuals of the display table (margins pool exactly)
+    display_rows = contingency_table.sum(axis=1).to_numpy()[:, None]
+    display_cols = contingency_table.sum(axis=0).to_numpy()[None, :]
+    expected_display = display_rows * display_cols / ct['n']
+    residuals_display = adjusted_residuals(contingency_table.to_numpy(), display_rows, display_cols, ct['n'])
+    
+    table_info = {
+        "contingency_table": contingency_table.to_dict(),
+        "table_collapsed": collapsed,
+        "n_levels": {var1: n_rows, var2: n_cols},
+        "standardized_residuals": pd.DataFrame(residuals_display,
+                                               index=contingency_table.index,
+                                               columns=contingency_table.columns).to_dict(),
+        "largest_residuals": largest_residuals(ct)
+    }
     
     # Use Fisher's exact for 2x2 tables with small expected frequencies
-    use_fisher = (contingency_table.shape == (2, 2) and min_expected < 5)
+    use_fisher = ((n_rows, n_cols) == (2, 2) and min_expected < 5)
     
     if use_fisher:
         # Fisher's exact test
@@ -810,7 +827,7 @@ def categorical_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
             "test": "Fisher's Exact Test",
             "p_value": float(p_value),
             "odds_ratio": float(oddsratio),
-            "contingency_table": contingency_table.to_dict(),
+            **table_info,
             "significant": p_value < alpha
         }
         
@@ -825,29 +842,42 @@ def categorical_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
         })
         
     else:
-        # Chi-square test
-        chi2, p_value, dof, expected = stats.chi2_contingency(contingency_table)
+        if chi['dof'] == 1:
+            # 2x2 table: keep scipy's Yates continuity correction
+            chi2, p_value, dof, _ = stats.chi2_contingency(contingency_table)
+            cramers_v = np.sqrt(chi2 / ct['n'])
+        else:
+            chi2, p_value, dof, cramers_v = chi['chi2'], chi['p_value'], chi['dof'], chi['cramers_v']
         
-        # Cramér's V (effect size)
-        n = contingency_table.sum().sum()
-        min_dim = min(contingency_table.shape[0], contingency_table.shape[1]) - 1
-        cramers_v = np.sqrt(chi2 / (n * min_dim))
+        # Monte Carlo exact test when the chi-square approximation is doubtful
+        use_monte_carlo = min_expected < 5 and chi['dof'] > 1
+        if use_monte_carlo:
+            n_simulations = requested_simulations or min(MAX_MONTE_CARLO_SIMULATIONS,
+                                                         max(1000, 50_000_000 // ct['n']))
+            monte_carlo = monte_carlo_test(ct, chi2, n_simulations, int(opts.get('randomState', 42)))
+            asymptotic_p = p_value
+            p_value = monte_carlo['p_value']
         
         test_results = {
-            "test": "Chi-Square Test of Independence",
+            "test": "Monte Carlo Exact Test (Pearson χ²)" if use_monte_carlo else "Chi-Square Test of Independence",
             "chi2_statistic": float(chi2),
             "p_value": float(p_value),
             "degrees_of_freedom": int(dof),
             "cramers_v": float(cramers_v),
-            "contingency_table": contingency_table.to_dict(),
-            "expected_frequencies": pd.DataFrame(expected, 
+            **table_info,
+            "expected_frequencies": pd.DataFrame(expected_display,
                                                  index=contingency_table.index,
                                                  columns=contingency_table.columns).to_dict(),
             "significant": p_value < alpha
         }
+        if use_monte_carlo:
+            test_results["asymptotic_p_value"] = float(asymptotic_p)
+            test_results["monte_carlo_simulations"] = monte_carlo['n_simulations']
+            test_results["monte_carlo_standard_error"] = monte_carlo['standard_error']
         
         p_formatted = format_pvalue(p_value)
-        interpretation = f"Chi-square test {'found a significant association' if p_value < alpha else 'found no significant association'} between {var1} and {var2} (χ² = {chi2:.2f}, p = {p_formatted}). "
+        test_name = "Monte Carlo exact test" if use_monte_carlo else "Chi-square test"
+        interpretation = f"{test_name} {'found a significant association' if p_value < alpha else 'found no significant association'} between {var1} and {var2} (χ² = {chi2:.2f}, p = {p_formatted}). "
         
         if cramers_v < 0.1:
             effect = "negligible"
@@ -861,13 +891,20 @@ def categorical_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
         interpretation += f"Effect size (Cramér's V = {cramers_v:.3f}) is {effect}."
         
         # Check assumption
-        all_expected_ok = (expected >= 5).all()
+        all_expected_ok = bool(min_expected >= 5)
         assumptions.append({
             "name": "Expected Frequencies ≥ 5",
             "passed": all_expected_ok,
             "message": f"All expected frequencies ≥ 5: {all_expected_ok}. Min expected = {min_expected:.2f}"
+                       + ("" if all_expected_ok or not use_monte_carlo else
+                          f". p-value from {monte_carlo['n_simulations']} Monte Carlo simulations instead of the χ² approximation")
         })
     
+    recommendations = ["Examine the contingency table to understand the pattern of association"]
+    if collapsed:
+        recommendations.append(f"Display limited to the {max_levels} most frequent levels per variable; "
+                               "tests use the full table")
+    
     result = {
         "analysis_type": "categorical",
         "summary": f"{test_results['test']}: {var1} × {var2} (p = {format_pvalue(p_value)})",
@@ -876,7 +913,7 @@ def categorical_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
         "plots": plots,
         "interpretation": interpretation,
         "code_snippet": generate_code_snippet("categorical", opts),
-        "recommendations": ["Examine the contingency table to understand the pattern of association"]
+        "recommendations": recommendations
     }
     result["conclusion"] = generate_conclusion(result, opts)
     return convert_to_python_types(result)
@@ -891,31 +928,25 @@ def clustering_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
     method = opts.get('method', 'kmeans')  # 'kmeans' or 'hierarchical'
     show_elbow = opts.get('showElbow', True)
     
-    # Select numeric columns
-    numeric_data = df.select_dtypes(include=[np.number]).dropna()
+    # Select numeric columns and standardize (shared with PCA and the detectors)
+    prep = get_numeric_prep(df)
+    numeric_data = prep.complete
     
     if len(numeric_data.columns) < 2:
         raise ValueError("Need at least 2 numeric columns for clustering")
     
-    # Standardize data
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(numeric_data)
+    X_scaled = prep.standardized()
     
     plots = []
     
     # Elbow method and silhouette analysis
     if show_elbow:
-        inertias = []
-        silhouette_scores_list = []
-        # Ensure we test at least k=2 to k=10, or up to n_samples-1 if dataset is small
-        max_k = min(11, len(X_scaled))
-        K_range = range(2, max_k) if max_k > 2 else range(2, 3)
-        
-        for k in K_range:
-            kmeans_temp = KMeans(n_clusters=k, random_state=42, n_init=10)
-            kmeans_temp.fit(X_scaled)
-            inertias.append(kmeans_temp.inertia_)
-            silhouette_scores_list.append(silhouette_score(X_scaled, kmeans_temp.labels_))
+        # k = 2 to 10 (or up to n_samples-1 if dataset is small), shared with
+        # the wizard's k suggestion: only k values it has not fitted yet run here
+        sweep = prep.k_sweep()
+        K_range = sweep['k']
+        inertias = sweep['inertia']
+        silhouette_scores_list = sweep['silhouette']
         
         # Plot elbow curve and silhouette scores
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 5))
@@ -923,7 +954,8 @@ def clustering_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
         ax1.plot(list(K_range), inertias, 'bo-', linewidth=2, markersize=8)
         ax1.set_xlabel('Number of Clusters (k)', fontsize=11)
         ax1.set_ylabel('Inertia (Within-cluster sum of squares)', fontsize=11)
-        ax1.set_title('Elbow Method For Optimal k', fontsize=12, fontweight='bold')
+        sample_note = f" ({sweep['sampled_rows']} sampled rows)" if sweep['sampled_rows'] < sweep['n_rows'] else ''
+        ax1.set_title(f'Elbow Method For Optimal k{sample_note}', fontsize=12, fontweight='bold')
         ax1.grid(True, alpha=0.3)
         ax1.axvline(x=n_clusters, color='r', linestyle='--', alpha=0.7, label=f'Selected k={n_clusters}')
         ax1.legend()
@@ -1093,28 +1125,36 @@ def pca_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
     """Perform PCA analysis"""
     n_components = opts.get('nComponents', 2)
     
-    # Select numeric columns
-    numeric_data = df.select_dtypes(include=[np.number]).dropna()
+    # Select numeric columns (shared preparation: complete cases, standardized matrix)
+    prep = get_numeric_prep(df)
+    numeric_data = prep.complete
     
     if len(numeric_data.columns) < 2:
         raise ValueError("Need at least 2 numeric columns for PCA")
     
-    # Standardize
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(numeric_data)
+    # Decompose (cached, so changing nComponents does not refit)
+    n_components = min(n_components, numeric_data.shape[1])
+    decomposition = fit_pca(prep, n_components)
+    X_pca = pca_transform(prep, decomposition, n_components)
     
-    # Perform PCA
-    pca = PCA(n_components=min(n_components, X_scaled.shape[1]))
-    X_pca = pca.fit_transform(X_scaled)
+    eigenvalues = decomposition['eigenvalues']
+    all_ratios = eigenvalues / decomposition['total_variance']
+    explained_variance_ratio = all_ratios[:n_components]
+    components = decomposition['components'][:n_components]
     
     plots = []
     
-    # Scree plot
+    # Scree plot (full spectrum when available, retained components highlighted)
     fig, ax = plt.subplots(figsize=(10, 6))
-    ax.bar(range(1, len(pca.explained_variance_ratio_) + 1), pca.explained_variance_ratio_)
+    positions = range(1, len(all_ratios) + 1)
+    colors = ['steelblue' if i < n_components else 'lightgray' for i in range(len(all_ratios))]
+    ax.bar(positions, all_ratios, color=colors)
+    ax.plot(positions, np.cumsum(all_ratios), color='darkorange', marker='o', markersize=3,
+            label='Cumulative')
     ax.set_xlabel('Principal Component')
     ax.set_ylabel('Explained Variance Ratio')
     ax.set_title('Scree Plot')
+    ax.legend()
     plots.append({
         "title": "Scree Plot",
         "type": "bar",
@@ -1125,8 +1165,8 @@ def pca_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
     if X_pca.shape[1] >= 2:
         fig, ax = plt.subplots(figsize=(10, 8))
         ax.scatter(X_pca[:, 0], X_pca[:, 1], alpha=0.5)
-        ax.set_xlabel(f'PC1 ({pca.explained_variance_ratio_[0]:.1%} variance)')
-        ax.set_ylabel(f'PC2 ({pca.explained_variance_ratio_[1]:.1%} variance)')
+        ax.set_xlabel(f'PC1 ({explained_variance_ratio[0]:.1%} variance)')
+        ax.set_ylabel(f'PC2 ({explained_variance_ratio[1]:.1%} variance)')
         ax.set_title('PCA Biplot')
         plots.append({
             "title": "PCA Biplot",
@@ -1135,18 +1175,21 @@ def pca_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
         })
     
     test_results = {
-        "n_components": int(pca.n_components_),
-        "explained_variance_ratio": [float(x) for x in pca.explained_variance_ratio_],
-        "cumulative_variance": [float(x) for x in np.cumsum(pca.explained_variance_ratio_)],
-        "components": pca.components_.tolist()
+        "n_components": int(n_components),
+        "explained_variance_ratio": [float(x) for x in explained_variance_ratio],
+        "cumulative_variance": [float(x) for x in np.cumsum(explained_variance_ratio)],
+        "components": components.tolist(),
+        "eigenvalues": [float(x) for x in eigenvalues],
+        "spectrum_complete": bool(decomposition['spectrum_complete']),
+        "solver": decomposition['method']
     }
     
     result = {
         "analysis_type": "pca",
-        "summary": f"PCA reduced {len(numeric_data.columns)} variables to {pca.n_components_} components",
+        "summary": f"PCA reduced {len(numeric_data.columns)} variables to {n_components} components",
         "test_results": test_results,
         "plots": plots,
-        "interpretation": f"First {pca.n_components_} components explain {np.sum(pca.explained_variance_ratio_):.1%} of variance",
+        "interpretation": f"First {n_components} components explain {np.sum(explained_variance_ratio):.1%} of variance",
         "code_snippet": generate_code_snippet("pca", opts),
         "recommendations": ["Examine component loadings", "Consider number of components to retain"]
     }
@@ -1154,42 +1197,140 @@ def pca_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
     return convert_to_python_types(result)
 
 def time_series_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
-    """Perform basic time series analysis"""
+    """Perform time series analysis (resampling, rolling statistics, STL decomposition, ACF/PACF)"""
     date_col = opts.get('dateColumn')
     
     if not date_col:
         raise ValueError("Date column required for time series analysis")
     
-    # Convert to datetime
-    df[date_col] = pd.to_datetime(df[date_col])
-    df = df.sort_values(date_col)
+    # Select numeric columns (the caller's DataFrame is left untouched)
+    value_cols = opts.get('valueColumns') or [
+        col for col in df.select_dtypes(include=[np.number]).columns if col != date_col
+    ]
+    if not value_cols:
+        raise ValueError("Need at least one numeric column for time series analysis")
     
-    # Select numeric columns
-    numeric_cols = df.select_dtypes(include=[np.number]).columns
+    frame = prepare_frame(df, date_col, value_cols)
+    analysis = analyze_frame(frame, opts)
+    regular = analysis['regular']
+    max_points = int(opts.get('maxDisplayPoints', MAX_DISPLAY_POINTS))
     
     plots = []
-    
-    # Time series plot
-    for col in numeric_cols[:3]:  # Limit to 3
+    series_results = {}
+    display_series = {}
+    
+    for i, (col, res) in enumerate(analysis['series'].items()):
+        display = downsample_minmax(regular[col], max_points)
+        display_series[col] = {
+            'timestamps': [ts.isoformat() for ts in display.index],
+            'values': display.to_numpy()
+        }
+        
+        series_results[col] = {
+            key: res[key] for key in [
+                'n_observations', 'mean', 'std', 'min', 'max', 'rolling_window',
+                'n_lags', 'acf', 'pacf', 'confidence_bound', 'significant_lags', 'seasonal_period'
+            ]
+        }
+        series_results[col]['decomposed'] = res['decomposition'] is not None
+        if res['decomposition'] is not None:
+            series_results[col]['decomposition_method'] = res['decomposition_method']
+            series_results[col]['trend_strength'] = res['trend_strength']
+            series_results[col]['seasonal_strength'] = res['seasonal_strength']
+        
+        if i >= 3:  # Limit plots to 3 series
+            continue
+        
+        # Time series plot with rolling mean +/- std
+        rolling_mean = res['rolling_mean'].loc[display.index]
+        rolling_std = res['rolling_std'].loc[display.index].fillna(0)
         fig, ax = plt.subplots(figsize=(12, 6))
-        ax.plot(df[date_col], df[col])
+        ax.plot(display.index, display.to_numpy(), linewidth=0.8, label=col)
+        ax.plot(rolling_mean.index, rolling_mean.to_numpy(), color='darkorange', linewidth=1.5,
+                label=f'Rolling mean ({res["rolling_window"]})')
+        ax.fill_between(rolling_mean.index, rolling_mean - rolling_std, rolling_mean + rolling_std,
+                        color='darkorange', alpha=0.2, label='Rolling mean ± 1 SD')
         ax.set_xlabel('Date')
         ax.set_ylabel(col)
         ax.set_title(f'Time Series: {col}')
+        ax.legend(loc='best', fontsize=9)
         plt.xticks(rotation=45)
         plots.append({
             "title": f"Time Series: {col}",
             "type": "line",
             "base64": plot_to_base64(fig)
         })
+        
+        # Seasonal decomposition
+        if res['decomposition'] is not None:
+            fig, axes = plt.subplots(4, 1, figsize=(12, 9), sharex=True)
+            panels = [('Observed', regular[col])] + [
+                (name.capitalize(), res['decomposition'][name]) for name in ['trend', 'seasonal', 'resid']
+            ]
+            for ax, (name, component) in zip(axes, panels):
+                component = component.loc[display.index]
+                ax.plot(component.index, component.to_numpy(), linewidth=0.8)
+                ax.set_ylabel(name)
+            axes[0].set_title(f'{res["decomposition_method"]} Decomposition: {col} '
+                              f'(period = {res["seasonal_period"]})')
+            plots.append({
+                "title": f"Seasonal Decomposition: {col}",
+                "type": "line",
+                "base64": plot_to_base64(fig)
+            })
+        
+        # ACF / PACF
+        fig, axes = plt.subplots(1, 2, figsize=(12, 4))
+        lags = np.arange(len(res['acf']))
+        for ax, name in zip(axes, ['acf', 'pacf']):
+            ax.bar(lags, res[name], width=0.4)
+            ax.axhline(res['confidence_bound'], color='red', linestyle='--', linewidth=1)
+            ax.axhline(-res['confidence_bound'], color='red', linestyle='--', linewidth=1)
+            ax.set_xlabel('Lag')
+            ax.set_title(name.upper())
+        plots.append({
+            "title": f"ACF / PACF: {col}",
+            "type": "bar",
+            "base64": plot_to_base64(fig)
+        })
+    
+    test_results = {
+        "date_column": date_col,
+        "start": regular.index[0].isoformat(),
+        "end": regular.index[-1].isoformat(),
+        "frequency": analysis['frequency'],
+        "resampled": analysis['resampled'],
+        "n_raw_observations": int(len(frame)),
+        "n_observations": int(len(regular)),
+        "series": series_results
+    }
+    
+    # Interpretation
+    notes = []
+    for col, res in series_results.items():
+        if res['decomposed']:
+            notes.append(f"{col}: trend strength {res['trend_strength']:.2f}, "
+                         f"seasonal strength {res['seasonal_strength']:.2f} (period {res['seasonal_period']})")
+        else:
+            notes.append(f"{col}: {len(res['significant_lags'])} significant autocorrelation lags, no seasonal decomposition")
+    interpretation = f"Analyzed {len(series_results)} series at frequency {analysis['frequency']} ({len(regular)} points). "
+    interpretation += "; ".join(notes[:3]) + "."
+    
+    recommendations = ["Check for trends and patterns"]
+    if any(res['significant_lags'] for res in series_results.values()):
+        recommendations.append("Significant autocorrelation detected - consider ARIMA-type models rather than independent-observation tests")
+    if any(res.get('seasonal_strength', 0) > 0.6 for res in series_results.values()):
+        recommendations.append("Strong seasonality detected - account for it when forecasting or comparing periods")
     
     result = {
         "analysis_type": "time-series",
-        "summary": f"Time series analysis of {len(numeric_cols)} variables",
+        "summary": f"Time series analysis of {len(series_results)} variables",
+        "test_results": test_results,
+        "display_series": display_series,
         "plots": plots,
-        "interpretation": "Time series plotted. Consider seasonal decomposition for deeper analysis.",
+        "interpretation": interpretation,
         "code_snippet": generate_code_snippet("time-series", opts),
-        "recommendations": ["Consider seasonal decomposition", "Check for trends and patterns"]
+        "recommendations": recommendations
     }
     result["conclusion"] = generate_conclusion(result, opts)
     return convert_to_python_types(result)
@@ -1458,39 +1599,6 @@ chi2, p_value, dof, expected = stats.chi2_contingency(contingency_table)
 print(f'Chi-square: {{chi2:.2f}}, p-value: {{p_value:.4f}}')
 print(contingency_table)"""
     
-    elif analysis_type == "logistic_regression":
-        predictor_cols = opts.get('predictorColumns', [])
-        return f"""import pandas as pd
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import roc_auc_score, confusion_matrix, classification_report
-
-df = pd.read_csv('data.csv')
-X = df[{predictor_cols}]
-y = df['{opts.get('targetColumn')}']
-
-# Split data
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size={opts.get('testSize', 0.3)}, random_state={opts.get('randomState', 42)}, stratify=y
-)
-
-# Train model
-model = LogisticRegression(random_state={opts.get('randomState', 42)}, max_iter=1000)
-model.fit(X_train, y_train)
-
-# Predictions
-y_pred = model.predict(X_test)
-y_pred_proba = model.predict_proba(X_test)[:, 1]
-
-# Evaluate
-auc = roc_auc_score(y_test, y_pred_proba)
-cm = confusion_matrix(y_test, y_pred)
-print(f'AUC-ROC: {{auc:.3f}}')
-print('\\nConfusion Matrix:')
-print(cm)
-print('\\nClassification Report:')
-print(classification_report(y_test, y_pred))"""
-    
     elif analysis_type == "survival":
         duration_col = opts.get('durationColumn', 'time')
         event_col = opts.get('eventColumn', 'event')
@@ -1861,13 +1969,19 @@ def power_analysis(opts: Dict) -> Dict:
 def logistic_regression_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
     """
     Perform enhanced logistic regression with ROC curve, confusion matrix, and classification metrics
-    """
-    from sklearn.model_selection import train_test_split
     
+    Parameters:
+    - target_column: Binary target variable (0/1 or categorical with 2 classes)
+    - predictor_columns: List of predictor variables
+    - test_size: Proportion of data for testing (default 0.3)
+    - random_state: Random seed for reproducibility (default 42)
+    - cvFolds: Number of stratified CV folds; >= 2 reports out-of-fold metrics
+      instead of a holdout split (default 0)
+    - cvRepeats: Number of CV repetitions with different shuffles (default 1)
+    - solver: LogisticRegression solver, or 'auto' to pick one from the data size (default 'auto')
+    """
     target_col = opts.get('targetColumn')
     predictor_cols = opts.get('predictorColumns', [])
-    test_size = float(opts.get('testSize', 0.3))
-    random_state = int(opts.get('randomState', 42))
     
     if not target_col or not predictor_cols:
         raise ValueError("Target column and at least one predictor column are required")
@@ -1885,26 +1999,24 @@ def logistic_regression_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
         unique_vals = y.unique()
         if len(unique_vals) != 2:
             raise ValueError(f"Target must be binary. Found {len(unique_vals)} unique values")
-        y = (y == unique_vals[1]).astype(int)
+        positive_label = unique_vals[1]
+        y = (y == positive_label).astype(int)
         class_names = [str(unique_vals[0]), str(unique_vals[1])]
     else:
         unique_vals = y.unique()
         if len(unique_vals) != 2:
             raise ValueError(f"Target must be binary. Found {len(unique_vals)} unique values")
         class_names = [str(int(v)) for v in sorted(unique_vals)]
+        positive_label = max(unique_vals)
+        y = (y == positive_label).astype(int)
     
-    # Split data
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=test_size, random_state=random_state, stratify=y
-    )
-    
-    # Train logistic regression model
-    model = LogisticRegression(random_state=random_state, max_iter=1000)
-    model.fit(X_train, y_train)
-    
-    # Predictions
-    y_pred = model.predict(X_test)
-    y_pred_proba = model.predict_proba(X_test)[:, 1]
+    # Fit model (holdout split, or parallel k-fold CV when cvFolds >= 2)
+    fit = fit_logistic_model(X, y, opts)
+    cv = fit['cross_validation']
+    y_test = fit['y_eval']
+    y_pred_proba = fit['proba_eval']
+    y_pred = (y_pred_proba >= 0.5).astype(int)
+    coefficients_raw = fit['coefficients']
     
     # Calculate metrics
     accuracy = accuracy_score(y_test, y_pred)
@@ -1931,7 +2043,11 @@ def logistic_regression_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
     
     # 1. ROC Curve
     fig, ax = plt.subplots(figsize=(8, 6))
-    ax.plot(fpr, tpr, color='darkorange', lw=2, label=f'ROC curve (AUC = {auc_score:.3f})')
+    roc_label = f'ROC curve (AUC = {auc_score:.3f})'
+    if cv:
+        roc_label = (f'Out-of-fold ROC ({cv["n_folds"]}-fold CV, '
+                     f'AUC = {cv["auc_mean"]:.3f} [{cv["auc_ci_lower"]:.3f}, {cv["auc_ci_upper"]:.3f}])')
+    ax.plot(fpr, tpr, color='darkorange', lw=2, label=roc_label)
     ax.plot([0, 1], [0, 1], color='navy', lw=2, linestyle='--', label='Random Classifier')
     ax.scatter(fpr[optimal_idx], tpr[optimal_idx], marker='o', color='red', s=100, 
                label=f'Optimal Threshold = {optimal_threshold:.3f}', zorder=3)
@@ -1970,8 +2086,8 @@ def logistic_regression_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
     # 3. Feature Importance
     coefficients = pd.DataFrame({
         'Feature': predictor_cols,
-        'Coefficient': model.coef_[0],
-        'Abs_Coefficient': np.abs(model.coef_[0])
+        'Coefficient': coefficients_raw,
+        'Abs_Coefficient': np.abs(coefficients_raw)
     }).sort_values('Abs_Coefficient', ascending=False)
     
     fig, ax = plt.subplots(figsize=(8, max(6, len(predictor_cols) * 0.4)))
@@ -2009,8 +2125,8 @@ def logistic_regression_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
     # Test results
     test_results = {
         "model_type": "Logistic Regression",
-        "n_train": int(len(X_train)),
-        "n_test": int(len(X_test)),
+        "n_train": int(fit['n_train']),
+        "n_test": int(fit['n_test']),
         "n_predictors": len(predictor_cols),
         "target_variable": target_col,
         "predictor_variables": predictor_cols,
@@ -2027,14 +2143,20 @@ def logistic_regression_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
         "true_positives": int(tp),
         "default_threshold": 0.5,
         "optimal_threshold": float(optimal_threshold),
-        "intercept": float(model.intercept_[0]),
-        "coefficients": {col: float(coef) for col, coef in zip(predictor_cols, model.coef_[0])}
+        "intercept": float(fit['intercept']),
+        "coefficients": {col: float(coef) for col, coef in zip(predictor_cols, coefficients_raw)},
+        "solver": fit['solver']
     }
+    if cv:
+        test_results["cross_validation"] = cv
     
     # Interpretation
     interpretation = f"The logistic regression model achieved an accuracy of {accuracy*100:.1f}% with an AUC-ROC of {auc_score:.3f}. "
     interpretation += f"Precision: {precision*100:.1f}%, Recall: {recall*100:.1f}%, F1-Score: {f1:.3f}. "
     interpretation += f"The optimal classification threshold is {optimal_threshold:.3f}."
+    if cv:
+        interpretation += (f" Across {cv['n_folds']}-fold cross-validation ({cv['n_repeats']} repeat(s)) "
+                           f"the mean AUC was {cv['auc_mean']:.3f} (95% CI {cv['auc_ci_lower']:.3f}-{cv['auc_ci_upper']:.3f}).")
     
     # Recommendations
     recommendations = []
@@ -2056,7 +2178,10 @@ def logistic_regression_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
         "test_results": test_results,
         "plots": plots,
         "interpretation": interpretation,
-        "code_snippet": generate_code_snippet("logistic_regression", opts),
+        "code_snippet": "import pandas as pd\n\ndf = pd.read_csv('data.csv')\n\n" + logistic_code_snippet(
+            fit, target_col, predictor_cols, positive_label,
+            float(opts.get('testSize', 0.3)), int(opts.get('randomState', 42))
+        ),
         "recommendations": recommendations,
         "conclusion": f"Model achieved {accuracy*100:.1f}% accuracy with AUC of {auc_score:.3f}"
     }
@@ -2064,6 +2189,20 @@ def logistic_regression_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
     return convert_to_python_types(result)
 
 
+def _plot_survival_curve(ax, km: Dict, group_idx: int, show_ci: bool = True, cumulative: bool = False):
+    """Draw one Kaplan-Meier step curve (or 1 - S(t)) with its confidence band"""
+    timeline = np.concatenate([[0.0], km['timeline']])
+    survival = np.concatenate([[1.0], km['survival'][:, group_idx]])
+    lower = np.concatenate([[1.0], km['ci_lower'][:, group_idx]])
+    upper = np.concatenate([[1.0], km['ci_upper'][:, group_idx]])
+    if cumulative:
+        survival, lower, upper = 1 - survival, 1 - upper, 1 - lower
+    
+    line, = ax.step(timeline, survival, where='post', label=km['labels'][group_idx])
+    if show_ci:
+        ax.fill_between(timeline, lower, upper, step='post', alpha=0.25, color=line.get_color())
+
+
 def survival_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
     """
     Perform survival analysis with Kaplan-Meier curves, Log-Rank test, and Cox regression
@@ -2117,35 +2256,35 @@ def survival_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
     
     plots = []
     test_results = {}
+    show_ci = opts.get('showConfidenceIntervals', True)
     
-    # 1. Kaplan-Meier Analysis
-    kmf = KaplanMeierFitter()
+    # 1. Kaplan-Meier Analysis (all groups from a single sort, shared by both plots)
+    km = kaplan_meier_groups(
+        df_clean[duration_col].to_numpy(),
+        df_clean[event_col].to_numpy(),
+        df_clean[group_col] if group_col else None
+    )
+    groups = km['labels']
     
     if group_col:
         # Kaplan-Meier by groups
-        groups = df_clean[group_col].unique()
-        
         fig, ax = plt.subplots(figsize=(10, 6))
         
+        quantile_times = [df_clean[duration_col].quantile(q) for q in [0.25, 0.5, 0.75]]
+        quantile_times = [t for t in quantile_times if t <= df_clean[duration_col].max()]
+        
         group_results = {}
-        for group in groups:
-            mask = df_clean[group_col] == group
-            kmf.fit(
-                durations=df_clean[mask][duration_col],
-                event_observed=df_clean[mask][event_col],
-                label=str(group)
-            )
-            kmf.plot_survival_function(ax=ax, ci_show=True)
+        for i, group in enumerate(groups):
+            _plot_survival_curve(ax, km, i, show_ci)
             
             # Store group statistics
-            group_results[str(group)] = {
-                'n': int(mask.sum()),
-                'events': int(df_clean[mask][event_col].sum()),
-                'median_survival': float(kmf.median_survival_time_) if not np.isnan(kmf.median_survival_time_) else None,
+            surv_values = survival_at(km, quantile_times, i)
+            group_results[group] = {
+                'n': int(km['group_n'][i]),
+                'events': int(km['group_events'][i]),
+                'median_survival': median_survival(km, i),
                 'survival_at_times': {
-                    f't_{int(t)}': float(kmf.survival_function_at_times(t).values[0])
-                    for t in [df_clean[duration_col].quantile(q) for q in [0.25, 0.5, 0.75]]
-                    if t <= df_clean[duration_col].max()
+                    f't_{int(t)}': float(s) for t, s in zip(quantile_times, surv_values)
                 }
             }
         
@@ -2165,39 +2304,30 @@ def survival_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
         
         test_results['group_statistics'] = group_results
         
-        # Log-Rank Test
-        if len(groups) == 2:
-            group1_mask = df_clean[group_col] == groups[0]
-            group2_mask = df_clean[group_col] == groups[1]
-            
-            logrank_result = logrank_test(
-                durations_A=df_clean[group1_mask][duration_col],
-                durations_B=df_clean[group2_mask][duration_col],
-                event_observed_A=df_clean[group1_mask][event_col],
-                event_observed_B=df_clean[group2_mask][event_col]
-            )
+        # Log-Rank Test (generalized to k groups)
+        if len(groups) >= 2:
+            logrank_result = logrank_test_k(km)
             
             test_results['logrank_test'] = {
-                'test_statistic': float(logrank_result.test_statistic),
-                'p_value': float(logrank_result.p_value),
-                'significant': logrank_result.p_value < 0.05,
-                'group1': str(groups[0]),
-                'group2': str(groups[1])
+                'test_statistic': logrank_result['test_statistic'],
+                'p_value': logrank_result['p_value'],
+                'degrees_of_freedom': logrank_result['degrees_of_freedom'],
+                'significant': logrank_result['p_value'] < 0.05,
+                'group1': groups[0],
+                'group2': groups[1],
+                'groups': groups,
+                'observed_events': dict(zip(groups, logrank_result['observed'])),
+                'expected_events': dict(zip(groups, logrank_result['expected']))
             }
     
     else:
         # Overall Kaplan-Meier
-        kmf.fit(
-            durations=df_clean[duration_col],
-            event_observed=df_clean[event_col],
-            label='Overall'
-        )
-        
         fig, ax = plt.subplots(figsize=(10, 6))
-        kmf.plot_survival_function(ax=ax, ci_show=True)
+        _plot_survival_curve(ax, km, 0, show_ci)
         ax.set_xlabel('Time', fontsize=12, fontweight='bold')
         ax.set_ylabel('Survival Probability', fontsize=12, fontweight='bold')
         ax.set_title('Kaplan-Meier Survival Curve', fontsize=14, fontweight='bold')
+        ax.legend(loc='best', fontsize=10)
         ax.grid(True, alpha=0.3)
         ax.set_ylim([0, 1.05])
         
@@ -2209,24 +2339,24 @@ def survival_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
         plt.close(fig)
         
         test_results['overall_statistics'] = {
-            'n': int(len(df_clean)),
-            'events': int(df_clean[event_col].sum()),
-            'median_survival': float(kmf.median_survival_time_) if not np.isnan(kmf.median_survival_time_) else None
+            'n': int(km['group_n'][0]),
+            'events': int(km['group_events'][0]),
+            'median_survival': median_survival(km, 0)
         }
     
     # 2. Cox Proportional Hazards Regression
     if covariates:
         print(f"Cox regression requested with covariates: {covariates}")
-        cph = CoxPHFitter()
         
         # Prepare data for Cox model
-        cox_data = df_clean[[duration_col, event_col] + covariates].copy()
-        cox_data.columns = ['duration', 'event'] + covariates
+        cox_data = df_clean[[duration_col, event_col] + covariates].set_axis(
+            ['duration', 'event'] + covariates, axis=1
+        )
         print(f"Cox data shape: {cox_data.shape}")
-        print(f"Cox data columns: {cox_data.columns.tolist()}")
         
         try:
-            cph.fit(cox_data, duration_col='duration', event_col='event')
+            # Reuses a previous fit for the same data and covariate set
+            cph = fit_cox_cached(cox_data, 'duration', 'event', covariates)
             
             # Extract results
             c_index = float(cph.concordance_index_)
@@ -2338,21 +2468,11 @@ def survival_analysis(df: pd.DataFrame, opts: Dict) -> Dict:
             test_results['cox_regression_error'] = str(e)
             print(f"Cox regression error: {e}")
     
-    # 3. Cumulative Hazard Plot
+    # 3. Cumulative Hazard Plot (reuses the Kaplan-Meier estimates above)
     fig, ax = plt.subplots(figsize=(10, 6))
     
-    if group_col:
-        for group in groups:
-            mask = df_clean[group_col] == group
-            kmf_temp = KaplanMeierFitter()
-            kmf_temp.fit(
-                durations=df_clean[mask][duration_col],
-                event_observed=df_clean[mask][event_col],
-                label=str(group)
-            )
-            kmf_temp.plot_cumulative_density(ax=ax)
-    else:
-        kmf.plot_cumulative_density(ax=ax)
+    for i in range(len(groups)):
+        _plot_survival_curve(ax, km, i, show_ci, cumulative=True)
     
     ax.set_xlabel('Time', fontsize=12, fontweight='bold')
     ax.set_ylabel('Cumulative Hazard', fontsize=12, fontweight='bold')
@@ -0,0 +1,189 @@
+"""
+Analysis registry and startup for GradStat
+Maps analysis types to the modules that implement them and imports each
+module on first use, records how long every import took, and warms the
+heavy modules up so the service can report readiness once they are loaded
+"""
+
+import gc
+import os
+import sys
+import time
+import threading
+import importlib
+from typing import Dict, List, Any, Callable, Tuple
+
+from logger_config import logger
+
+# Module and function implementing each analysis type
+ENTRY_POINTS: Dict[str, Tuple[str, str]] = {
+    'descriptive': ('analysis_functions', 'descriptive_analysis'),
+    'group-comparison': ('analysis_functions', 'group_comparison_analysis'),
+    'regression': ('analysis_functions', 'regression_analysis'),
+    'logistic-regression': ('analysis_functions', 'logistic_regression_analysis'),
+    'survival': ('analysis_functions', 'survival_analysis'),
+    'nonparametric': ('analysis_functions', 'nonparametric_test'),
+    'categorical': ('analysis_functions', 'categorical_analysis'),
+    'clustering': ('analysis_functions', 'clustering_analysis'),
+    'pca': ('analysis_functions', 'pca_analysis'),
+    'time-series': ('analysis_functions', 'time_series_analysis'),
+    'correlation': ('analysis_functions', 'correlation_analysis'),
+    'power': ('analysis_functions', 'power_analysis'),
+    'ancova': ('advanced_tests', 'ancova_analysis'),
+    'repeated-measures': ('advanced_tests', 'repeated_measures_anova'),
+    'posthoc-tukey': ('advanced_tests', 'posthoc_tukey'),
+}
+
+# Libraries imported lazily by the analyses, loaded up front during warm-up
+# so that the first request of each type does not pay for them
+WARMUP_MODULES = [
+    'scipy.stats',
+    'sklearn.cluster',
+    'sklearn.linear_model',
+    'statsmodels.api',
+    'statsmodels.formula.api',
+    'statsmodels.stats.multicomp',
+    'statsmodels.tsa.seasonal',
+    'lifelines',
+    'matplotlib.pyplot',
+    'seaborn',
+    'analysis_functions',
+    'advanced_tests',
+    'report_generator',
+]
+
+# Warm-up mode: 'off' (ready immediately), 'imports' (load WARMUP_MODULES) or
+# 'full' (also run a small analysis to fill font and plotting caches)
+WARMUP_MODE = os.getenv('WARMUP_MODE', 'imports')
+
+_lock = threading.Lock()
+_import_profile: List[Dict[str, Any]] = []
+_readiness: Dict[str, Any] = {'ready': False, 'phase': 'starting', 'warmup_ms': None, 'error': None}
+
+
+def _timed_import(module_name: str, trigger: str):
+    """Import a module, recording its cost if it was not loaded yet"""
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+    record_import(module_name, elapsed_ms, trigger)
+    logger.info(f"Imported {module_name} in {elapsed_ms} ms ({trigger})")
+    return module
+
+
+def record_import(module_name: str, elapsed_ms: float, trigger: str) -> None:
+    """Add an import measured elsewhere (e.g. the service modules at startup) to the profile"""
+    with _lock:
+        _import_profile.append({'module': module_name, 'ms': round(elapsed_ms, 1), 'trigger': trigger})
+
+
+def load_analysis(analysis_type: str) -> Callable:
+    """
+    Return the function implementing an analysis type, importing its module on first use
+
+    Raises:
+        ValueError: If the analysis type is unknown
+    """
+    if analysis_type not in ENTRY_POINTS:
+        raise ValueError(f"Unknown analysis type: {analysis_type}")
+    module_name, function_name = ENTRY_POINTS[analysis_type]
+    return getattr(_timed_import(module_name, f"analysis:{analysis_type}"), function_name)
+
+
+def run_analysis(df, opts: Dict[str, Any]) -> Dict[str, Any]:
+    """Run the analysis selected by opts['analysisType'] (power analysis ignores df)"""
+    analysis_type = opts.get('analysisType', 'descriptive')
+    function = load_analysis(analysis_type)
+    if analysis_type == 'power':
+        return function(opts)
+    return function(df, opts)
+
+
+def _smoke_test() -> None:
+    """Run a tiny descriptive analysis to fill matplotlib's font and plotting caches"""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'a': rng.normal(size=20), 'b': rng.normal(size=20)})
+    run_analysis(df, {'analysisType': 'descriptive'})
+
+
+def warm_up(mode: str = None) -> Dict[str, Any]:
+    """
+    Load the heavy modules (and optionally run a smoke test), then mark the service ready
+
+    Safe to call more than once; modules that are already loaded cost nothing.
+
+    Args:
+        mode: 'off', 'imports' or 'full' (default: WARMUP_MODE)
+
+    Returns:
+        dict: Readiness state
+    """
+    mode = mode or WARMUP_MODE
+    start = time.perf_counter()
+    try:
+        if mode != 'off':
+            _readiness['phase'] = 'importing'
+            for module_name in WARMUP_MODULES:
+                try:
+                    _timed_import(module_name, 'warmup')
+                except ImportError as e:
+                    # Optional libraries (e.g. lifelines) may be missing
+                    logger.warning(f"Warm-up could not import {module_name}: {e}")
+        if mode == 'full':
+            _readiness['phase'] = 'smoke-test'
+            _smoke_test()
+        _readiness.update({'ready': True, 'phase': 'ready',
+                           'warmup_ms': round((time.perf_counter() - start) * 1000, 1)})
+        logger.info(f"Warm-up ({mode}) complete in {_readiness['warmup_ms']} ms")
+    except Exception as e:
+        logger.error(f"Warm-up failed: {e}")
+        _readiness.update({'ready': False, 'phase': 'failed', 'error': str(e)})
+    return dict(_readiness)
+
+
+def start_warm_up() -> None:
+    """Warm up in a background thread unless an earlier warm-up (e.g. before fork) already finished"""
+    if _readiness['ready'] or _readiness['phase'] not in ('starting', 'failed'):
+        return
+    _readiness['phase'] = 'queued'
+    threading.Thread(target=warm_up, name='warmup', daemon=True).start()
+
+
+def prefork_warm_up() -> None:
+    """
+    Warm up in a pre-fork server's master process before workers are forked
+
+    Workers then inherit the loaded libraries copy-on-write. gc.freeze()
+    moves the loaded objects out of the collector's generations so that
+    collections in the workers do not touch (and copy) their pages.
+    """
+    warm_up()
+    gc.collect()
+    gc.freeze()
+
+
+def readiness() -> Dict[str, Any]:
+    """Current readiness state"""
+    return dict(_readiness)
+
+
+def import_profile() -> Dict[str, Any]:
+    """
+    Import-time profile of the process
+
+    Returns:
+        dict: imports (module, ms, trigger) slowest first, their total, and
+        the readiness state
+    """
+    with _lock:
+        imports = sorted(_import_profile, key=lambda entry: entry['ms'], reverse=True)
+    return {
+        'imports': imports,
+        'total_import_ms': round(sum(entry['ms'] for entry in imports), 1),
+        'readiness': readiness(),
+    }
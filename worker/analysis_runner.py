@@ -0,0 +1,371 @@
+"""
+Isolated analysis processes for GradStat
+Each analysis runs in a child process started from a forkserver, with an
+address-space limit (RLIMIT_AS), a CPU-time limit (RLIMIT_CPU) and a
+wall-clock deadline, and can be cancelled by job id from any worker process
+on the same host. Limit hits and cancellations raise AnalysisAborted with a
+machine-readable code.
+"""
+
+import os
+import re
+import signal
+import tempfile
+import time
+import uuid
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterator, Optional
+
+from logger_config import logger
+from analysis_registry import WARMUP_MODULES
+from progress import reporting
+from metrics import registry as metrics_registry
+from cache_manager import cache_sync
+
+# Resource limits are Unix-only; without them analyses run in-process
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ISOLATE_ANALYSES = os.getenv('ISOLATE_ANALYSES', 'true').lower() in ('true', '1', 'yes')
+# Memory an analysis may allocate on top of its process's own address space
+ANALYSIS_MEMORY_MB = int(os.getenv('ANALYSIS_MEMORY_MB', '2048'))
+ANALYSIS_CPU_SECONDS = int(os.getenv('ANALYSIS_CPU_SECONDS', '600'))
+# Below the backend's 5-minute request timeout, so the limit error reaches it
+ANALYSIS_DEADLINE_SECONDS = float(os.getenv('ANALYSIS_DEADLINE_SECONDS', '290'))
+# Pid files of running analyses and cancel markers (shared by the worker processes)
+RUN_DIR = os.getenv('ANALYSIS_RUN_DIR') or os.path.join(tempfile.gettempdir(), 'gradstat-runs')
+
+POLL_SECONDS = 0.1
+
+# Analysis (and batch pool) processes are started by a forkserver: a clean,
+# single-threaded process that preloads the analysis modules. Forking this
+# multi-threaded server instead could copy locks held by other threads
+# (logging, BLAS, the LLM client, the metrics flusher) into the child and
+# deadlock it.
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+# Imported once by the forkserver, so analysis processes start warm
+PRELOAD_MODULES = WARMUP_MODULES + ['analysis_registry', 'analyze']
+process_context = multiprocessing.get_context(START_METHOD)
+if START_METHOD == 'forkserver':
+    process_context.set_forkserver_preload(PRELOAD_MODULES)
+
+_JOB_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# Analyses that run in-process (without isolation; analyze and batch_runner)
+# take turns per worker process: pyplot figures are not thread-safe
+analysis_lock = threading.Lock()
+
+
+class AnalysisAborted(Exception):
+    """An analysis stopped by a resource limit or by cancellation"""
+
+    def __init__(self, code: str, message: str, limit: Optional[float] = None,
+                 details: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            code: memory_limit, cpu_limit, deadline, cancelled, killed,
+                crashed or over_budget (refused before it ran)
+            message: Explanation for the user
+            limit: The limit that was hit (MB or seconds), if any
+            details: Further fields for to_dict (e.g. the cost estimate)
+        """
+        super().__init__(message)
+        self.code = code
+        self.limit = limit
+        self.details = details or {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'code': self.code, 'message': str(self), 'limit': self.limit, **self.details}
+
+
+class AnalysisProcessError(Exception):
+    """An exception raised by the analysis in its process (same message)"""
+
+    def __init__(self, error_type: str, message: str):
+        super().__init__(message)
+        self.error_type = error_type
+
+
+def start_process_server() -> None:
+    """Start the forkserver now (at startup) rather than on the first analysis"""
+    if START_METHOD == 'forkserver':
+        from multiprocessing import forkserver
+        forkserver.ensure_running()
+
+
+def isolation_available() -> bool:
+    """Whether analyses run in limited child processes here"""
+    return ISOLATE_ANALYSES and resource is not None
+
+
+def valid_job_id(job_id: str) -> bool:
+    """Whether job_id is a safe file name stem"""
+    return bool(_JOB_ID.match(job_id))
+
+
+def _pid_file(job_id: str) -> str:
+    return os.path.join(RUN_DIR, f'{job_id}.pid')
+
+
+def _cancel_file(job_id: str) -> str:
+    return os.path.join(RUN_DIR, f'{job_id}.cancel')
+
+
+def _pending_file(job_id: str) -> str:
+    return os.path.join(RUN_DIR, f'{job_id}.pending')
+
+
+def _remove(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _known(job_id: str) -> bool:
+    """Whether the job is waiting or running on this host"""
+    return os.path.exists(_pending_file(job_id)) or os.path.exists(_pid_file(job_id))
+
+
+@contextmanager
+def pending(job_id: Optional[str]) -> Iterator[None]:
+    """
+    Mark a job as waiting on this host until the block ends
+
+    Wrap everything from queueing to the end of the run, so that cancel()
+    reaches the job before its analysis process starts; a cancel marker
+    left for it is removed on exit.
+    """
+    if not job_id or not valid_job_id(job_id):
+        yield
+        return
+    os.makedirs(RUN_DIR, exist_ok=True)
+    open(_pending_file(job_id), 'w').close()
+    try:
+        yield
+    finally:
+        _remove(_pending_file(job_id))
+        _remove(_cancel_file(job_id))
+
+
+def cancel(job_id: str) -> bool:
+    """
+    Cancel the waiting or running analysis of a job
+
+    Works from any worker process on the host. Only jobs known here (see
+    pending and run_isolated) are cancelled: a cancel marker is left for the
+    job (so an analysis still waiting to start does not run) and its
+    analysis process, found through its pid file, is killed; the parent
+    reports the cancellation.
+
+    Returns:
+        bool: Whether a running analysis was found and killed
+    """
+    if not valid_job_id(job_id) or not _known(job_id):
+        return False
+    open(_cancel_file(job_id), 'w').close()
+    if not _known(job_id):
+        # Finished meanwhile: its run no longer removes the marker
+        _remove(_cancel_file(job_id))
+        return False
+    try:
+        with open(_pid_file(job_id)) as f:
+            pid = int(f.read())
+    except (OSError, ValueError):
+        return False
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        return False
+    logger.info(f"Cancelled analysis {job_id} (pid {pid})")
+    return True
+
+
+def _statm_bytes(field: int) -> int:
+    """A /proc/self/statm size of this process in bytes: 0 virtual, 1 resident (0 if unknown)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[field]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _usage(start_resident: int) -> Dict[str, float]:
+    """Peak memory added since start_resident (MB) and CPU time used by this process"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss (KiB) of a forked child starts from its resident size at the fork
+    return {'peak_mb': max(usage.ru_maxrss * 1024 - start_resident, 0) / 2 ** 20,
+            'cpu_seconds': usage.ru_utime + usage.ru_stime}
+
+
+class _PipeReporter:
+    """Stands in for the request's ProgressReporter in the child: stages go to the parent"""
+
+    def __init__(self, conn, lock: threading.Lock):
+        self.conn = conn
+        self.lock = lock
+
+    def stage(self, name: str, **info: Any) -> None:
+        with self.lock:
+            self.conn.send(('stage', name, info))
+
+
+class _WorkerFetch:
+    """Fetches cache entries from the worker over the pipe (see CacheSync.use_worker)"""
+
+    def __init__(self, conn, lock: threading.Lock):
+        self.conn = conn
+        # Analyses may report stages and look caches up from several threads
+        self.lock = lock
+
+    def __call__(self, name: str, key: str) -> Optional[bytes]:
+        with self.lock:
+            self.conn.send(('fetch', name, key))
+            return self.conn.recv()
+
+
+def _child_main(conn, fn: Callable, args: tuple, memory_mb: int, cpu_seconds: int) -> None:
+    """
+    Apply the limits, run fn and send back its metrics and cache entries,
+    then its result (with the resources used) or error
+    """
+    start_resident = _statm_bytes(1)
+    pipe_lock = threading.Lock()
+    cache_sync.use_worker(_WorkerFetch(conn, pipe_lock))
+    metrics_start = metrics_registry.values(('counter', 'histogram'))
+    caches_start = cache_sync.snapshot()
+    try:
+        if memory_mb:
+            limit = _statm_bytes(0) + memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        if cpu_seconds:
+            # SIGXCPU at the soft limit, SIGKILL at the hard one
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 5))
+        with reporting(_PipeReporter(conn, pipe_lock)):
+            result = fn(*args)
+        conn.send(('metrics', metrics_registry.delta(metrics_start)))
+        conn.send(('caches', cache_sync.delta(caches_start)))
+        conn.send(('result', result, _usage(start_resident)))
+    except MemoryError:
+        conn.send(('memory_limit',))
+    except BaseException as e:
+        conn.send(('metrics', metrics_registry.delta(metrics_start)))
+        conn.send(('caches', cache_sync.delta(caches_start)))
+        conn.send(('error', type(e).__name__, str(e)))
+    finally:
+        conn.close()
+
+
+def run_isolated(fn: Callable, args: tuple = (), job_id: Optional[str] = None,
+                 on_stage: Optional[Callable[..., None]] = None,
+                 on_usage: Optional[Callable[[Dict[str, float]], None]] = None,
+                 cancel_id: Optional[str] = None, memory_mb: int = ANALYSIS_MEMORY_MB,
+                 cpu_seconds: int = ANALYSIS_CPU_SECONDS, deadline_seconds: float = ANALYSIS_DEADLINE_SECONDS) -> Any:
+    """
+    Run fn(*args) in a child process with resource limits
+
+    fn, args and the result must be picklable (fn by reference: a
+    module-level function). report_stage calls in the child are passed to
+    on_stage. The child looks up cache entries it lacks in this process's
+    caches, and the metrics it recorded and the entries it added to the
+    computation caches (see cache_manager.CacheSync) are added to this
+    process's. Without isolation support fn runs in-process, without limits.
+
+    Args:
+        fn: Function to run
+        args: Its arguments
+        job_id: Id to cancel the run by (see cancel)
+        on_stage: Called as on_stage(name, **info) for stages reported by fn
+        on_usage: Called with the peak_mb (memory added) and cpu_seconds of
+            a successful run
+        cancel_id: Id of a job this run belongs to (a batch): cancelling it
+            stops the run too
+        memory_mb: Address space fn may add (0 for no limit)
+        cpu_seconds: CPU time limit (0 for no limit)
+        deadline_seconds: Wall-clock limit
+
+    Returns:
+        fn's return value
+
+    Raises:
+        AnalysisAborted: On a limit hit, cancellation or crash of the child
+        AnalysisProcessError: If fn raised (with its message)
+    """
+    if not isolation_available():
+        return fn(*args)
+
+    job_id = job_id if job_id and valid_job_id(job_id) else uuid.uuid4().hex
+    os.makedirs(RUN_DIR, exist_ok=True)
+    cancel_files = [_cancel_file(job_id)]
+    if cancel_id and valid_job_id(cancel_id):
+        cancel_files.append(_cancel_file(cancel_id))
+    if any(os.path.exists(path) for path in cancel_files):
+        _remove(_cancel_file(job_id))
+        raise AnalysisAborted('cancelled', 'Analysis cancelled')
+    # Duplex: the child also fetches cache entries through it
+    parent_conn, child_conn = process_context.Pipe()
+    # Not a daemon, so analyses may start processes of their own (joblib)
+    process = process_context.Process(target=_child_main, args=(child_conn, fn, args, memory_mb, cpu_seconds))
+    process.start()
+    child_conn.close()
+    with open(_pid_file(job_id), 'w') as f:
+        f.write(str(process.pid))
+
+    deadline = time.monotonic() + deadline_seconds
+    try:
+        while True:
+            if parent_conn.poll(POLL_SECONDS):
+                try:
+                    message = parent_conn.recv()
+                except EOFError:
+                    break
+                if message[0] == 'stage':
+                    if on_stage is not None:
+                        on_stage(message[1], **message[2])
+                    continue
+                if message[0] == 'metrics':
+                    metrics_registry.merge(message[1])
+                    continue
+                if message[0] == 'caches':
+                    cache_sync.merge(message[1])
+                    continue
+                if message[0] == 'fetch':
+                    parent_conn.send(cache_sync.entry_bytes(message[1], message[2]))
+                    continue
+                if message[0] == 'result':
+                    if on_usage is not None:
+                        on_usage(message[2])
+                    return message[1]
+                if message[0] == 'memory_limit':
+                    raise AnalysisAborted('memory_limit', f'Analysis needed more than the {memory_mb} MB '
+                                          'memory limit; try fewer rows or variables', limit=memory_mb)
+                raise AnalysisProcessError(message[1], message[2])
+            if any(os.path.exists(path) for path in cancel_files):
+                break
+            if time.monotonic() > deadline:
+                raise AnalysisAborted('deadline', f'Analysis did not finish within {deadline_seconds:g} s',
+                                      limit=deadline_seconds)
+            if not process.is_alive() and not parent_conn.poll():
+                break
+
+        # The child exited (or was killed) without sending a result
+        process.join(timeout=5)
+        if any(os.path.exists(path) for path in cancel_files):
+            raise AnalysisAborted('cancelled', 'Analysis cancelled')
+        if process.exitcode == -signal.SIGXCPU:
+            raise AnalysisAborted('cpu_limit', f'Analysis used more than the {cpu_seconds} s CPU time limit',
+                                  limit=cpu_seconds)
+        if process.exitcode == -signal.SIGKILL:
+            raise AnalysisAborted('killed', 'Analysis process was killed (the worker may be out of memory)')
+        raise AnalysisAborted('crashed', f'Analysis process exited unexpectedly (exit code {process.exitcode})')
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        parent_conn.close()
+        _remove(_pid_file(job_id))
+        _remove(_cancel_file(job_id))
@@ -3,31 +3,45 @@ GradStat Analysis Worker
 FastAPI service that performs statistical analyses
 """
 
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, Form, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from fast_json import FastJSONResponse, sse_event
+from contextlib import asynccontextmanager, nullcontext
 import pandas as pd
 import numpy as np
-from scipy import stats
-from sklearn.decomposition import PCA
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-import statsmodels.api as sm
-from statsmodels.formula.api import ols
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
 import io
 import base64
+import csv
 import json
 import os
+import time
+import asyncio
+import uuid
 from pathlib import Path
-import tempfile
-import zipfile
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Callable, Optional
 import logging
-from cache_manager import get_cached_result, cache_result, get_cache_stats, clear_cache
+
+# Headless plotting; set before any analysis module imports pyplot
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+from cache_manager import (
+    get_cached_result, cache_result, get_projected_result, cache_projected_result, projection_fingerprint,
+    get_cache_stats, clear_cache, spool_upload, spooled_upload, remove_spooled
+)
 from test_advisor import recommend_test, auto_detect_from_data
+from batch_runner import normalize_items, run_batch, batch_store, build_batch_report
+from analysis_registry import run_analysis, start_warm_up, readiness, import_profile
+from llm_client import llm_client, get_llm_stats
+from progress import ProgressReporter, reporting, report_stage, stage_history
+from artifact_store import artifact_store
+from analysis_runner import (
+    run_isolated, cancel as cancel_analysis, pending as pending_job, valid_job_id, start_process_server,
+    isolation_available, analysis_lock, AnalysisAborted
+)
+from cost_model import cost_model, COST_ADMISSION
+import metrics
+import profiler
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -51,7 +65,17 @@ except Exception as e:
     TestAdvisorAI = None
     TEST_ADVISOR_AI_AVAILABLE = False
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start warming up the analysis modules once the server is accepting connections"""
+    start_warm_up()
+    start_process_server()
+    metrics.start_sharing()
+    yield
+    await llm_client.aclose()
+
 app = FastAPI(
+    lifespan=lifespan,
     title="GradStat Analysis API",
     description="""
     ## Statistical Analysis API for Graduate Research
@@ -112,8 +136,10 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "health": "/health",
+            "metrics": "/metrics",
             "docs": "/docs",
-            "analyze": "/analyze"
+            "analyze": "/analyze",
+            "batch": "/analyze/batch"
         }
     }
 
@@ -130,6 +156,37 @@ async def health_check():
     """
     return {"status": "healthy"}
 
+@app.get(
+    "/ready",
+    summary="Readiness Check",
+    description="Ready once the analysis modules are loaded (503 while warming up)",
+    tags=["System"]
+)
+async def ready_check():
+    """
+    Readiness endpoint for load balancers and Kubernetes readiness probes
+    
+    /health only says the process is up; this turns ready after warm-up
+    (see analysis_registry.WARMUP_MODE).
+    """
+    state = readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+@app.get(
+    "/startup/profile",
+    summary="Import-Time Profile",
+    description="Import timings of the service and analysis modules",
+    tags=["System"]
+)
+async def startup_profile():
+    """
+    Get the import-time profile of this process
+    
+    Returns:
+        dict: Imports (module, ms, trigger) slowest first, total and readiness
+    """
+    return import_profile()
+
 @app.get("/ping", include_in_schema=False)
 async def ping():
     """Ultra-minimal ping - returns plain text OK"""
@@ -151,6 +208,140 @@ async def cache_stats():
     """
     return get_cache_stats()
 
+@app.get(
+    "/llm/stats",
+    summary="Get LLM Client Statistics",
+    description="Get request counts, latency, queueing, circuit breaker state and response cache hit rates of the AI features",
+    tags=["System"]
+)
+async def llm_stats():
+    """
+    Get LLM client statistics
+    
+    Returns:
+        dict: Request counts, in-flight and queued calls, latency and queue-wait percentiles,
+        circuit state, and response cache hit rates
+    """
+    return get_llm_stats()
+
+@app.get(
+    "/metrics",
+    summary="Get Prometheus Metrics",
+    description="Analysis requests and per-stage latency by type, cache lookups and evictions, queue depth, memory and LLM call latency in the Prometheus text format",
+    tags=["System"]
+)
+async def prometheus_metrics():
+    """
+    Get metrics in the Prometheus text exposition format
+    
+    Returns:
+        PlainTextResponse: Metrics of all server processes (see metrics.py)
+    """
+    from fastapi.responses import PlainTextResponse
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get(
+    "/profiles",
+    summary="List Analysis Profiles",
+    description="List the stored sampling profiles of requested and slow analyses, newest first",
+    tags=["System"]
+)
+async def list_profiles():
+    """
+    List stored analysis profiles
+    
+    Returns:
+        dict: Profiling settings and summaries of the most recent profiles
+    """
+    return {
+        "requests_enabled": profiler.PROFILING_ENABLED,
+        "slow_seconds": profiler.PROFILE_SLOW_SECONDS or None,
+        "profiles": await run_in_threadpool(profiler.list_profiles),
+    }
+
+@app.get(
+    "/profiles/{profile_id}",
+    summary="Get Analysis Profile",
+    description="Get a stored profile: timings, top functions and memory, or with ?format=folded its sampled stacks (flamegraph input)",
+    tags=["System"]
+)
+async def get_profile(profile_id: str, format: str = "json"):
+    """
+    Get a stored analysis profile
+    
+    Args:
+        profile_id: Profile id (from /profiles or an analysis response)
+        format: json, or folded for the stacks as text ("frame;frame;... count"
+            lines, the input of flamegraph.pl and speedscope)
+    
+    Returns:
+        FileResponse: The profile file
+    """
+    from fastapi.responses import FileResponse
+    path = profiler.profile_path(profile_id, folded=format == "folded")
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain" if format == "folded" else "application/json")
+
+@app.get(
+    "/analyze/stages",
+    summary="Get Analysis Stage Timings",
+    description="Get the typical duration of each analysis stage by analysis type, used for progress ETAs",
+    tags=["System"]
+)
+async def analysis_stages():
+    """
+    Get analysis stage timings
+    
+    Returns:
+        dict: Average parse/fit/plots/report durations (ms) and row counts by analysis type
+    """
+    return stage_history.get_stats()
+
+@app.get(
+    "/analyze/cost",
+    summary="Get Cost Model Statistics",
+    description="Get admission decisions and predicted-vs-actual runtime and memory of analyses by type",
+    tags=["System"]
+)
+async def analysis_cost():
+    """
+    Get cost model statistics
+    
+    Returns:
+        dict: Budgets, admission decision counts, calibration and estimate
+        errors by analysis type, and the latest predicted/actual pairs
+    """
+    return cost_model.get_stats()
+
+@app.post(
+    "/analyze/cost/runs",
+    summary="Add Measured Runs to the Cost Model",
+    description="Calibrate the cost model with runs measured by another worker pool",
+    tags=["System"]
+)
+async def add_cost_runs(request: Request):
+    """
+    Add runs measured elsewhere to the cost model
+    
+    The backend forwards the cost_run of every streamed analysis to the
+    other worker pools, so each pool's estimates learn from all runs.
+    
+    Args:
+        request: {"runs": [{analysis_type, units, seconds, memory_units, peak_mb}, ...]}
+        
+    Returns:
+        dict: Number of runs added
+    """
+    try:
+        body = await request.json()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+    runs = body.get("runs") if isinstance(body, dict) else None
+    if not isinstance(runs, list):
+        raise HTTPException(status_code=400, detail="runs must be a list")
+    return {"ok": True, "added": cost_model.add_runs([run for run in runs if isinstance(run, dict)])}
+
 @app.post(
     "/cache/clear",
     summary="Clear Cache",
@@ -212,8 +403,8 @@ async def auto_detect_data(file: UploadFile = File(...)):
         Data characteristics and suggested tests
     """
     try:
-        content = await file.read()
-        df = read_datafile(content, file.filename)
+        async with spooled_upload(file) as (path, _):
+            df = read_datafile(path, file.filename)
         
         characteristics = auto_detect_from_data(df)
         
@@ -242,8 +433,8 @@ async def auto_answer_question(file: UploadFile = File(...), question_key: str =
     try:
         from test_advisor import auto_detect_answer
         
-        content = await file.read()
-        df = read_datafile(content, file.filename)
+        async with spooled_upload(file) as (path, _):
+            df = read_datafile(path, file.filename)
         
         result = auto_detect_answer(df, question_key)
         
@@ -271,8 +462,8 @@ async def analyze_dataset(file: UploadFile = File(...)):
     try:
         from test_advisor import analyze_dataset_comprehensive
         
-        content = await file.read()
-        df = read_datafile(content, file.filename)
+        async with spooled_upload(file) as (path, _):
+            df = read_datafile(path, file.filename)
         
         result = analyze_dataset_comprehensive(df)
         
@@ -307,8 +498,8 @@ async def validate_data(file: UploadFile = File(...)):
     """
     try:
         # Read file
-        content = await file.read()
-        df = read_datafile(content, file.filename)
+        async with spooled_upload(file) as (path, _):
+            df = read_datafile(path, file.filename)
         
         # Infer types
         types_dict = infer_column_types(df)
@@ -353,7 +544,8 @@ async def validate_data(file: UploadFile = File(...)):
 )
 async def analyze_data(
     file: UploadFile = File(..., description="CSV or Excel data file"),
-    options: str = Form(..., description="JSON string with analysis options including analysisType and type-specific parameters")
+    options: str = Form(..., description="JSON string with analysis options including analysisType and type-specific parameters"),
+    x_profile: Optional[str] = Header(None, description="Profile this analysis (the profiling token, if one is configured)")
 ):
     """
     Perform statistical analysis
@@ -365,6 +557,9 @@ async def analyze_data(
                            logistic-regression, survival, nonparametric, categorical,
                            clustering, pca, time-series, power]
             - Type-specific options (see documentation for each type)
+            - profile: Profile this analysis, like the X-Profile header
+        x_profile: Ask for a profile of the analysis (see profiler.py); it
+            skips the result caches and the response gets a profile summary
             
     Returns:
         dict: Analysis results including:
@@ -389,91 +584,547 @@ async def analyze_data(
         ```
     """
     try:
-        # Parse options
         opts = json.loads(options)
         analysis_type = opts.get("analysisType", "descriptive")
-        
+        profile = profiler.requested(x_profile, opts.get("profile"))
         # Power analysis doesn't need data file
+        path, content_key = (None, None) if analysis_type == "power" else await spool_upload(file)
+        # Stage timings still feed the ETAs of streamed requests
+        reporter = ProgressReporter(lambda event: None, analysis_type)
+        kept = {}
+        response, cache_hit = await run_in_threadpool(_analyze_spooled, path, content_key, file.filename, opts,
+                                                      reporter, profile=profile, on_profile=kept.update)
+        reporter.finish(record=not cache_hit)
+        if kept:
+            response = {**response, "profile": kept}
+        return FastJSONResponse(_inline_response(response))
+        
+    except profiler.ProfilingDenied as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except AnalysisAborted as e:
+        logger.warning(f"Analysis stopped ({e.code}): {str(e)}")
+        raise HTTPException(status_code=409 if e.code == "cancelled" else 422, detail=e.to_dict())
+    except Exception as e:
+        logger.error(f"Analysis error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _analyze_spooled(path: Optional[str], content_key: Optional[str], filename: Optional[str],
+                     opts: Dict[str, Any], reporter: Optional[ProgressReporter] = None,
+                     job_id: Optional[str] = None, **callbacks):
+    """Run _analyze_upload on a spooled upload, removing the file afterwards"""
+    try:
+        return _analyze_upload(path, content_key, filename, opts, reporter, job_id, **callbacks)
+    finally:
+        remove_spooled(path)
+
+def _analyze_upload(path: Optional[str], content_key: Optional[str], filename: Optional[str],
+                    opts: Dict[str, Any], reporter: Optional[ProgressReporter] = None,
+                    job_id: Optional[str] = None, profile: bool = False,
+                    on_profile: Optional[Callable[[Dict[str, Any]], None]] = None,
+                    on_cost_run: Optional[Callable[[Dict[str, Any]], None]] = None):
+    """
+    Run one analysis request: cache lookups, parsing, the analysis and its report
+    
+    Reports its stages (parse, fit, plots, report) to reporter. path is the
+    spooled upload (None for power analysis). Parsing, the analysis and the
+    report run in a limited process (see analysis_runner) that job_id can
+    cancel, alongside those of other requests; the caches are read and
+    written here. Without isolation, analyses take turns on analysis_lock.
+    
+    A requested profile (profile=True) bypasses the caches and traces
+    memory too; with PROFILE_SLOW_SECONDS set every analysis is sampled and
+    slow ones keep their profile. on_profile is called with the summary of
+    a kept profile, on_cost_run with the measured run added to the cost
+    model (see CostModel.record).
+    
+    Returns:
+        tuple: response dict (results, report_zip as raw ZIP bytes) and whether it came from the cache
+    
+    Raises:
+        AnalysisAborted: If the analysis hit a resource limit, was cancelled
+            or is over the cost budget
+    """
+    analysis_type = opts.get("analysisType", "descriptive")
+    with pending_job(job_id), reporting(reporter):
+        request_start = time.perf_counter()
+        outcome = "error"
+        try:
+            estimate = None
+            if analysis_type != "power":
+                report_stage('parse')
+                
+                # Check cache first (a requested profile measures the analysis itself)
+                cached_result = None if profile else get_cached_result(content_key, opts)
+                if cached_result is not None:
+                    logger.info(f"Returning cached result for {analysis_type}")
+                    outcome = "cached"
+                    return cached_result, True
+                
+                estimate = _admit(path, filename, opts)
+            
+            usage = {}
+            profile_mode = profiler.mode(profile)
+            # Isolated analyses run side by side in their own processes;
+            # in-process ones take turns (pyplot is not thread-safe)
+            metrics.QUEUE_WAITING.inc()
+            with nullcontext() if isolation_available() else analysis_lock:
+                metrics.QUEUE_WAITING.dec()
+                metrics.QUEUE_RUNNING.inc()
+                try:
+                    start = time.perf_counter()
+                    if profile_mode is None:
+                        response, cache_hit, fingerprint = run_isolated(
+                            _compute_analysis, (path, filename, opts), job_id=job_id, on_stage=report_stage,
+                            on_usage=usage.update)
+                    else:
+                        (response, cache_hit, fingerprint), profile_data = run_isolated(
+                            _compute_profiled, (path, filename, opts, profile_mode == "full"), job_id=job_id,
+                            on_stage=report_stage, on_usage=usage.update)
+                finally:
+                    metrics.QUEUE_RUNNING.dec()
+            if estimate is not None and not cache_hit:
+                cost_run = cost_model.record(estimate, time.perf_counter() - start, usage.get('peak_mb'))
+                if on_cost_run is not None:
+                    on_cost_run(cost_run)
+            if profile_mode is not None and not cache_hit:
+                kept = profiler.keep(profile_data, analysis_type, time.perf_counter() - request_start, profile,
+                                     details={"options": opts, "estimate": estimate})
+                if kept is not None and on_profile is not None:
+                    on_profile(kept)
+            
+            # Cache the result (only for non-power analyses with file content)
+            if analysis_type != "power":
+                cache_result(content_key, opts, response)
+                if not cache_hit:
+                    cache_projected_result(None, opts, response, fingerprint=fingerprint)
+                logger.info(f"Cached result for {analysis_type}")
+            
+            outcome = "cached" if cache_hit else "success"
+            return response, cache_hit
+        except AnalysisAborted as e:
+            outcome = e.code
+            raise
+        finally:
+            metrics.record_analysis(analysis_type, outcome, time.perf_counter() - request_start)
+
+def _admit(path: str, filename: Optional[str], opts: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Estimate an analysis from the shape of its upload and refuse it if it is over budget
+    
+    Returns:
+        dict: The cost estimate (None if the file's shape is unknown)
+    
+    Raises:
+        AnalysisAborted: over_budget, with the estimate (and cheaper options, if any)
+    """
+    n_rows, n_columns = datafile_shape(path, filename)
+    if n_rows is None:
+        return None
+    estimate = cost_model.estimate(opts.get("analysisType", "descriptive"), n_rows, n_columns, opts)
+    if estimate["tier"] == "over_budget" and COST_ADMISSION:
+        cost_model.count_rejection()
+        message = (f"This analysis would take about {estimate['seconds']:.0f} s and "
+                   f"{estimate['memory_mb']:.0f} MB on {n_rows} rows; the limits are "
+                   f"{estimate['budget_seconds']:g} s and {estimate['budget_mb']:g} MB")
+        if estimate["downgrade"]:
+            message += f" (it fits with: {', '.join(estimate['downgrade']['changes'])})"
+        over_time = estimate["seconds"] > estimate["budget_seconds"]
+        raise AnalysisAborted("over_budget", message,
+                              limit=estimate["budget_seconds"] if over_time else estimate["budget_mb"],
+                              details={"estimate": estimate})
+    return estimate
+
+def _compute_profiled(path: Optional[str], filename: Optional[str], opts: Dict[str, Any], requested: bool):
+    """
+    Run _compute_analysis under the sampling profiler (in the analysis process)
+    
+    A requested profile also traces memory and skips the projected cache.
+    
+    Returns:
+        tuple: _compute_analysis's result and the profile (see profiler.Profile.to_dict)
+    """
+    with profiler.Profile(trace_memory=requested) as profile:
+        result = _compute_analysis(path, filename, opts, use_cache=not requested)
+    return result, profile.to_dict()
+
+def _compute_analysis(path: Optional[str], filename: Optional[str], opts: Dict[str, Any],
+                      use_cache: bool = True):
+    """
+    Parse the upload, run the analysis and build its report (in the analysis process)
+    
+    Args:
+        use_cache: Whether to look the result up in the projected cache
+    
+    Returns:
+        tuple: response dict, whether it came from the projected cache, and
+        the projection fingerprint to cache it under (None for power analysis)
+    """
+    analysis_type = opts.get("analysisType", "descriptive")
+    with metrics.analysis_stages(analysis_type):
         if analysis_type == "power":
-            results = power_analysis(opts)
+            report_stage('fit')
+            start = time.perf_counter()
+            results = run_analysis(None, opts)
+            metrics.observe_stage('compute', time.perf_counter() - start)
             # Create empty dataframe for report generation
             df = pd.DataFrame()
+            fingerprint = None
         else:
-            # Read data for other analyses
-            content = await file.read()
-            
-            # Check cache first
-            cached_result = get_cached_result(content, opts)
+            # Try the columns this analysis uses (an earlier upload may differ
+            # only in other columns)
+            start = time.perf_counter()
+            df = read_datafile(path, filename)
+            metrics.observe_stage('read_datafile', time.perf_counter() - start)
+            fingerprint = projection_fingerprint(df, opts)
+            cached_result = get_projected_result(None, opts, fingerprint=fingerprint) if use_cache else None
             if cached_result is not None:
-                logger.info(f"Returning cached result for {analysis_type}")
-                return cached_result
-            
-            # Cache miss - perform analysis
-            df = read_datafile(content, file.filename)
+                logger.info(f"Returning cached result for {analysis_type} (projected columns)")
+                return cached_result, True, fingerprint
             
-            # Route to appropriate analysis
-            if analysis_type == "descriptive":
-                results = descriptive_analysis(df, opts)
-            elif analysis_type == "group-comparison":
-                results = group_comparison_analysis(df, opts)
-            elif analysis_type == "regression":
-                results = regression_analysis(df, opts)
-            elif analysis_type == "logistic-regression":
-                results = logistic_regression_analysis(df, opts)
-            elif analysis_type == "survival":
-                results = survival_analysis(df, opts)
-            elif analysis_type == "nonparametric":
-                results = nonparametric_test(df, opts)
-            elif analysis_type == "categorical":
-                results = categorical_analysis(df, opts)
-            elif analysis_type == "clustering":
-                results = clustering_analysis(df, opts)
-            elif analysis_type == "pca":
-                results = pca_analysis(df, opts)
-            elif analysis_type == "time-series":
-                results = time_series_analysis(df, opts)
-            elif analysis_type == "correlation":
-                results = correlation_analysis(df, opts)
-            elif analysis_type == "ancova":
-                from advanced_tests import ancova_analysis
-                results = ancova_analysis(df, opts)
-            elif analysis_type == "repeated-measures":
-                from advanced_tests import repeated_measures_anova
-                results = repeated_measures_anova(df, opts)
-            elif analysis_type == "posthoc-tukey":
-                from advanced_tests import posthoc_tukey
-                results = posthoc_tukey(df, opts)
-            else:
-                raise ValueError(f"Unknown analysis type: {analysis_type}")
+            # Route to the analysis (its module is imported on first use)
+            report_stage('fit', n_rows=len(df), n_columns=len(df.columns))
+            start = time.perf_counter()
+            results = run_analysis(df, opts)
+            metrics.observe_stage('compute', time.perf_counter() - start)
         
         # Generate report ZIP
-        report_zip_b64 = generate_report_package(results, df, opts)
-        
-        response = {
-            "results": results,
-            "report_zip": report_zip_b64
-        }
-        
-        # Cache the result (only for non-power analyses with file content)
-        if analysis_type != "power" and 'content' in locals():
-            cache_result(content, opts, response)
-            logger.info(f"Cached result for {analysis_type}")
-        
+        report_stage('report')
+        start = time.perf_counter()
+        from report_generator import generate_report_package
+        # Raw bytes: the artifact store writes them as they are, and inline
+        # responses encode them (see _inline_response)
+        report_zip = generate_report_package(results, df, opts, encode=False)
+        metrics.observe_stage('report', time.perf_counter() - start)
+    
+    return {"results": results, "report_zip": report_zip}, False, fingerprint
+
+def _inline_response(response: Dict[str, Any]) -> Dict[str, Any]:
+    """An analysis response for a JSON body: the report ZIP base64-encoded"""
+    report_zip = response.get("report_zip")
+    if not report_zip:
         return response
-        
+    return {**response, "report_zip": base64.b64encode(report_zip).decode("ascii")}
+
+@app.post(
+    "/analyze/stream",
+    summary="Perform Statistical Analysis (Streaming Progress)",
+    description="Run an analysis like /analyze, streaming its progress as server-sent events",
+    tags=["Analysis"]
+)
+async def analyze_data_stream(
+    request: Request,
+    file: UploadFile = File(..., description="CSV or Excel data file"),
+    options: str = Form(..., description="JSON string with analysis options (as for /analyze)"),
+    artifact_id: Optional[str] = Form(None, description="Write results and report to the shared artifact directory under this name"),
+    job_id: Optional[str] = Form(None, description="Id to cancel the analysis by (POST /analyze/{job_id}/cancel)"),
+    x_profile: Optional[str] = Header(None, description="Profile the analysis (the profiling token, if one is set)")
+):
+    """
+    Perform statistical analysis, streaming progress
+    
+    Takes the same form fields as /analyze. Events:
+    - stage: {stage, elapsed_ms, timings, eta_ms, progress} when a stage
+      (parse, fit, plots, report) starts; eta_ms is null until this analysis
+      type has run before
+    - result: {results, report_zip, cache_hit, timings} once finished; with
+      artifact_id (and ARTIFACT_DIR set) {artifacts, summary, cache_hit,
+      timings} instead, where artifacts references <artifact_id>.json and
+      <artifact_id>.zip in the shared directory; a profiled analysis (the
+      X-Profile header or "profile" option, as for /analyze) adds profile,
+      and a measured run adds cost_run (for POST /analyze/cost/runs of the
+      other worker pools)
+    - error: {message} if the analysis failed; {message, code, limit} if it
+      hit a resource limit (code memory_limit, cpu_limit, deadline, killed
+      or crashed), was cancelled (code cancelled) or was refused as over the
+      cost budget (code over_budget, with its estimate)
+    
+    The analysis is cancelled if the client disconnects.
+    """
+    try:
+        opts = json.loads(options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid options: {e}")
+    analysis_type = opts.get("analysisType", "descriptive")
+    if artifact_id is not None and not artifact_store.valid_id(artifact_id):
+        raise HTTPException(status_code=400, detail="Invalid artifact_id")
+    if job_id is not None and not valid_job_id(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job_id")
+    if not artifact_store.enabled:
+        artifact_id = None
+    try:
+        profile = profiler.requested(x_profile, opts.get("profile"))
+    except profiler.ProfilingDenied as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    path, content_key = (None, None) if analysis_type == "power" else await spool_upload(file)
+    return _event_stream(_analysis_events(path, content_key, file.filename, opts, artifact_id,
+                                          job_id or uuid.uuid4().hex, request.is_disconnected, profile))
+
+# How often a streamed analysis checks whether its client is still there
+DISCONNECT_CHECK_SECONDS = 1.0
+
+async def _analysis_events(path, content_key, filename, opts, artifact_id=None, job_id=None,
+                           is_disconnected=None, profile=False):
+    """Run _analyze_spooled on a thread, yielding its stage events as they happen and then the result"""
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    reporter = ProgressReporter(lambda event: loop.call_soon_threadsafe(events.put_nowait, event),
+                                opts.get("analysisType", "descriptive"))
+    kept = {}
+    cost_run = {}
+    task = asyncio.ensure_future(run_in_threadpool(_analyze_spooled, path, content_key, filename, opts,
+                                                   reporter, job_id, profile=profile, on_profile=kept.update,
+                                                   on_cost_run=cost_run.update))
+    
+    getter = None
+    try:
+        while not task.done() or not events.empty():
+            getter = asyncio.ensure_future(events.get())
+            done, _ = await asyncio.wait({getter, task}, timeout=DISCONNECT_CHECK_SECONDS,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                yield "stage", getter.result()
+                continue
+            getter.cancel()
+            if not done and is_disconnected is not None and await is_disconnected():
+                logger.info(f"Client left, cancelling analysis {job_id}")
+                break
+    finally:
+        # Client gone (or the response was cancelled): stop the analysis process.
+        # Called directly: awaiting here could be cancelled along with the response
+        if getter is not None:
+            getter.cancel()
+        if not task.done():
+            if job_id is not None:
+                cancel_analysis(job_id)
+            # Nobody reads the outcome of the cancelled run
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    if not task.done():
+        return
+    
+    try:
+        response, cache_hit = task.result()
+        if artifact_id is not None:
+            artifacts = await run_in_threadpool(artifact_store.store_response, artifact_id, response)
+    except AnalysisAborted as e:
+        logger.warning(f"Analysis stopped ({e.code}): {str(e)}")
+        yield "error", e.to_dict()
+        return
     except Exception as e:
         logger.error(f"Analysis error: {str(e)}")
+        yield "error", {"message": str(e)}
+        return
+    timings = reporter.finish(record=not cache_hit)
+    extras = {"profile": kept} if kept else {}
+    if cost_run:
+        extras["cost_run"] = cost_run
+    if artifact_id is not None:
+        results = response["results"]
+        summary = {"analysis_type": results.get("analysis_type"), "summary": results.get("summary")}
+        yield "result", {"artifacts": artifacts, "summary": summary, "cache_hit": cache_hit, "timings": timings,
+                         **extras}
+    else:
+        yield "result", {**_inline_response(response), "cache_hit": cache_hit, "timings": timings, **extras}
+
+@app.post(
+    "/analyze/estimate",
+    summary="Estimate an Analysis",
+    description="Estimate the runtime and memory of an analysis from the data shape, and how it would be admitted",
+    tags=["Analysis"]
+)
+async def estimate_analysis(
+    options: str = Form(..., description="JSON string with analysis options (as for /analyze)"),
+    n_rows: int = Form(..., ge=0, description="Rows of the dataset"),
+    n_columns: int = Form(..., ge=0, description="Columns of the dataset")
+):
+    """
+    Estimate an analysis before uploading its data
+    
+    Args:
+        options: Analysis options including analysisType
+        n_rows: Rows of the dataset
+        n_columns: Columns of the dataset
+        
+    Returns:
+        dict: seconds, memory_mb, tier (light, heavy or over_budget), and for
+        over-budget analyses downgrade: cheaper options that fit ({options,
+        changes, seconds, memory_mb, tier}) or null
+    """
+    try:
+        opts = json.loads(options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid options: {e}")
+    estimate = cost_model.estimate(opts.get("analysisType", "descriptive"), n_rows, n_columns, opts)
+    cost_model.count_decision(estimate)
+    return {"ok": True, "admission": COST_ADMISSION, **estimate}
+
+@app.post(
+    "/analyze/{job_id}/cancel",
+    summary="Cancel a Running Analysis",
+    description="Stop the analysis (or batch) started with this job_id on /analyze/stream (or /analyze/batch)",
+    tags=["Analysis"]
+)
+async def cancel_analysis_run(job_id: str):
+    """
+    Cancel a running analysis
+    
+    Args:
+        job_id: job_id given to /analyze/stream or /analyze/batch
+        
+    Returns:
+        dict: cancelled (whether a running analysis process was stopped on
+        this host; a batch's items stop without it)
+    """
+    if not valid_job_id(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job_id")
+    return {"ok": True, "cancelled": await run_in_threadpool(cancel_analysis, job_id)}
+
+@app.post(
+    "/analyze/batch",
+    summary="Perform Several Analyses",
+    description="""
+    Run a list of analyses on one uploaded dataset.
+
+    The file is uploaded and parsed once; the analyses are admitted by their
+    summed cost estimate and run concurrently, each in its own limited
+    analysis process. The combined report is built on demand from the report URL.
+    """,
+    tags=["Analysis"]
+)
+async def analyze_batch(
+    file: UploadFile = File(..., description="CSV or Excel data file"),
+    requests: str = Form(..., description="JSON list of analysis option objects, each optionally with a requestId"),
+    job_id: Optional[str] = Form(None, description="Id to cancel the batch by (POST /analyze/{job_id}/cancel)")
+):
+    """
+    Perform a batch of statistical analyses
+
+    Args:
+        file: Data file (CSV or Excel)
+        requests: JSON list of option objects as accepted by /analyze
+        job_id: Optional id to cancel the batch by
+
+    Returns:
+        dict: batch_id, per-request outcomes keyed by requestId (status,
+        results or error, elapsed_ms, cache_hit), batch timing and report_url
+    """
+    if job_id is not None and not valid_job_id(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job_id")
+    start = time.perf_counter()
+    try:
+        items = normalize_items(json.loads(requests))
+        async with spooled_upload(file) as (path, content_key):
+            df = read_datafile(path, file.filename)
+    except Exception as e:
+        logger.error(f"Batch request error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    parse_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    try:
+        outcomes = await run_in_threadpool(_run_batch_job, df, content_key, items, job_id)
+    except AnalysisAborted as e:
+        logger.warning(f"Batch stopped ({e.code}): {str(e)}")
+        raise HTTPException(status_code=409 if e.code == "cancelled" else 422, detail=e.to_dict())
+    except Exception as e:
+        logger.error(f"Batch analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-def read_datafile(content: bytes, filename: str) -> pd.DataFrame:
-    """Read CSV or Excel file"""
+    timing = {
+        "parse_ms": parse_ms,
+        "total_ms": round((time.perf_counter() - start) * 1000, 1),
+        "cache_hits": sum(1 for outcome in outcomes.values() if outcome["cache_hit"]),
+        "errors": sum(1 for outcome in outcomes.values() if outcome["status"] == "error"),
+    }
+    batch_id = batch_store.add(items, outcomes, timing)
+    logger.info(f"Batch {batch_id}: {len(items)} analyses in {timing['total_ms']} ms")
+
+    return FastJSONResponse({
+        "batch_id": batch_id,
+        "results": outcomes,
+        "timing": timing,
+        "report_url": f"/analyze/batch/{batch_id}/report"
+    })
+
+def _run_batch_job(df, content_key: str, items: List[Dict[str, Any]], job_id: Optional[str]):
+    """Run a batch, cancellable by job_id while it waits or runs"""
+    with pending_job(job_id):
+        return run_batch(df, content_key, items, job_id=job_id)
+
+@app.get(
+    "/analyze/batch/{batch_id}/report",
+    summary="Batch Report",
+    description="Build the combined report ZIP of a finished batch",
+    tags=["Analysis"]
+)
+async def batch_report(batch_id: str):
+    """
+    Build the combined report of a batch
+
+    Returns:
+        dict: report_zip (base64 ZIP with one folder per successful analysis
+        and a summary.json)
+    """
+    batch = batch_store.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found or expired")
+    report_zip_b64 = await run_in_threadpool(build_batch_report, batch)
+    return FastJSONResponse({"batch_id": batch_id, "report_zip": report_zip_b64})
+
+def datafile_shape(path: str, filename: Optional[str]):
+    """
+    Rows and columns of a data file without parsing it
+    
+    CSV rows are counted by line breaks (quoted line breaks count too) and
+    columns from the header; Excel sizes come from the sheet's dimensions.
+    
+    Returns:
+        tuple: (n_rows, n_columns), or (None, None) if unknown
+    """
+    filename = filename or ""
+    try:
+        if filename.endswith('.csv'):
+            with open(path, 'rb') as f:
+                header = f.readline()
+                n_rows = 0
+                last = b'\n'
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    n_rows += chunk.count(b'\n')
+                    last = chunk[-1:]
+            n_rows += last != b'\n'
+            n_columns = len(next(csv.reader([header.decode('latin-1')]), []))
+            return n_rows, n_columns
+        if filename.endswith('.xlsx'):
+            from openpyxl import load_workbook
+            workbook = load_workbook(path, read_only=True)
+            try:
+                sheet = workbook.worksheets[0]
+                if sheet.max_row is not None:
+                    return max(sheet.max_row - 1, 0), sheet.max_column
+            finally:
+                workbook.close()
+    except Exception as e:
+        logger.warning(f"Could not size {filename}: {str(e)}")
+    return None, None
+
+def read_datafile(source, filename: str) -> pd.DataFrame:
+    """
+    Read CSV or Excel file
+    
+    Args:
+        source: Path of the file (CSVs are memory-mapped rather than read
+            into memory first) or its content as bytes
+        filename: Original file name (its extension picks the format)
+    """
+    is_path = isinstance(source, (str, os.PathLike))
     if filename.endswith('.csv'):
+        csv_source = source if is_path else io.BytesIO(source)
         # Try to read with explicit encoding and error handling
         try:
-            df = pd.read_csv(io.BytesIO(content), encoding='utf-8')
+            df = pd.read_csv(csv_source, encoding='utf-8', memory_map=is_path)
         except UnicodeDecodeError:
             # Try with different encoding
-            df = pd.read_csv(io.BytesIO(content), encoding='latin-1')
+            if not is_path:
+                csv_source.seek(0)
+            df = pd.read_csv(csv_source, encoding='latin-1', memory_map=is_path)
         
         # Log for debugging
         logger.info(f"CSV read successfully: {df.shape[0]} rows, {df.shape[1]} columns")
@@ -482,7 +1133,7 @@ def read_datafile(content: bytes, filename: str) -> pd.DataFrame:
         
         return df
     elif filename.endswith(('.xlsx', '.xls')):
-        return pd.read_excel(io.BytesIO(content))
+        return pd.read_excel(source if is_path else io.BytesIO(source))
     else:
         raise ValueError("Unsupported file format")
 
@@ -581,7 +1232,7 @@ async def interpret_results(request: Request):
     
     try:
         data = await request.json()
-        interpretation = llm_interpreter.interpret_results(data)
+        interpretation = await llm_interpreter.interpret_results(data)
         return interpretation
     except Exception as e:
         logger.error(f"Interpretation error: {str(e)}")
@@ -616,7 +1267,7 @@ async def ask_question(request: Request):
         if not analysis_data:
             raise HTTPException(status_code=400, detail="Analysis data is required")
         
-        answer = llm_interpreter.answer_question(
+        answer = await llm_interpreter.answer_question(
             question, 
             analysis_data, 
             history
@@ -656,7 +1307,7 @@ async def what_if_scenario(request: Request):
         if not analysis_data:
             raise HTTPException(status_code=400, detail="Analysis data is required")
         
-        response = llm_interpreter.what_if_analysis(scenario, analysis_data)
+        response = await llm_interpreter.what_if_analysis(scenario, analysis_data)
         
         return {"response": response}
     except HTTPException:
@@ -665,6 +1316,84 @@ async def what_if_scenario(request: Request):
         logger.error(f"What-if analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _event_stream(events) -> StreamingResponse:
+    """Send (event, data) pairs from an async iterator as server-sent events"""
+    async def body():
+        async for event, data in events:
+            yield sse_event(event, data)
+    
+    # no-transform/X-Accel-Buffering keep proxies from buffering the stream
+    return StreamingResponse(body(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"})
+
+async def _unavailable_events(message: str):
+    yield "error", {"message": message}
+
+@app.post(
+    "/interpret/stream",
+    summary="AI Interpretation (Streaming)",
+    description="Stream the AI interpretation as server-sent events",
+    tags=["AI Assistant"]
+)
+async def interpret_results_stream(request: Request):
+    """
+    Stream the AI interpretation of statistical results
+    
+    Takes the same body as /interpret. Events:
+    - insights: key_findings, concerns and next_steps (rule-based, sent immediately)
+    - token: {"text"} pieces of the interpretation as they are generated
+    - done: {"text"} the complete interpretation
+    - error: {"message"} if the interpretation failed
+    """
+    data = await request.json()
+    if not LLM_AVAILABLE or llm_interpreter is None:
+        return _event_stream(_unavailable_events("AI interpretation requires the OpenAI package. Install with: pip install openai>=1.0.0"))
+    return _event_stream(llm_interpreter.stream_interpretation(data))
+
+@app.post(
+    "/ask/stream",
+    summary="Ask Question (Streaming)",
+    description="Stream the answer to a question about your analysis results",
+    tags=["AI Assistant"]
+)
+async def ask_question_stream(request: Request):
+    """
+    Stream the answer to a question as server-sent events
+    
+    Takes the same body as /ask; sends token events, then done (or error).
+    """
+    data = await request.json()
+    if not data.get('question'):
+        raise HTTPException(status_code=400, detail="Question is required")
+    if not data.get('analysis_data'):
+        raise HTTPException(status_code=400, detail="Analysis data is required")
+    if not LLM_AVAILABLE or llm_interpreter is None:
+        return _event_stream(_unavailable_events("AI question answering requires the OpenAI package. Install with: pip install openai>=1.0.0"))
+    return _event_stream(llm_interpreter.stream_answer(
+        data['question'], data['analysis_data'], data.get('conversation_history', [])
+    ))
+
+@app.post(
+    "/what-if/stream",
+    summary="What-If Analysis (Streaming)",
+    description="Stream the exploration of a hypothetical scenario",
+    tags=["AI Assistant"]
+)
+async def what_if_scenario_stream(request: Request):
+    """
+    Stream a "what if" response as server-sent events
+    
+    Takes the same body as /what-if; sends token events, then done (or error).
+    """
+    data = await request.json()
+    if not data.get('scenario'):
+        raise HTTPException(status_code=400, detail="Scenario is required")
+    if not data.get('analysis_data'):
+        raise HTTPException(status_code=400, detail="Analysis data is required")
+    if not LLM_AVAILABLE or llm_interpreter is None:
+        return _event_stream(_unavailable_events("AI scenario analysis requires the OpenAI package. Install with: pip install openai>=1.0.0"))
+    return _event_stream(llm_interpreter.stream_what_if(data['scenario'], data['analysis_data']))
+
 @app.post(
     "/test-advisor/recommend",
     summary="Get Test Recommendations",
@@ -699,7 +1428,7 @@ async def recommend_test_unified(request: Request):
             data_summary = data.get('data_summary')
             
             logger.info("AI recommendation mode")
-            result = test_advisor_ai.recommend_from_description(description, data_summary)
+            result = await test_advisor_ai.recommend_from_description(description, data_summary)
             return result
         else:
             # Wizard Mode
@@ -739,7 +1468,7 @@ async def ai_ask_question(request: Request):
         if not question:
             raise HTTPException(status_code=400, detail="Question is required")
         
-        answer = test_advisor_ai.answer_question(question, context)
+        answer = await test_advisor_ai.answer_question(question, context)
         return {"answer": answer}
         
     except HTTPException:
@@ -773,7 +1502,7 @@ async def ai_explain_assumption(request: Request):
         if not assumption:
             raise HTTPException(status_code=400, detail="Assumption name is required")
         
-        explanation = test_advisor_ai.explain_assumption(assumption, test_type)
+        explanation = await test_advisor_ai.explain_assumption(assumption, test_type)
         return {"explanation": explanation}
         
     except HTTPException:
@@ -812,7 +1541,7 @@ async def ai_compare_tests(request: Request):
         if not test1 or not test2:
             raise HTTPException(status_code=400, detail="Both test names are required")
         
-        result = test_advisor_ai.compare_tests(test1, test2, context)
+        result = await test_advisor_ai.compare_tests(test1, test2, context)
         return result
         
     except HTTPException:
@@ -846,7 +1575,7 @@ async def ai_enhance_detection(request: Request):
         if not detection_result or not question_type:
             raise HTTPException(status_code=400, detail="Detection result and question type are required")
         
-        enhanced = test_advisor_ai.enhance_auto_detection(detection_result, question_type)
+        enhanced = await test_advisor_ai.enhance_auto_detection(detection_result, question_type)
         return {"enhanced_explanation": enhanced}
         
     except HTTPException:
@@ -885,7 +1614,7 @@ async def ai_sample_size_guidance(request: Request):
         if not test_type:
             raise HTTPException(status_code=400, detail="Test type is required")
         
-        result = test_advisor_ai.suggest_sample_size(test_type, current_n, effect_size)
+        result = await test_advisor_ai.suggest_sample_size(test_type, current_n, effect_size)
         return result
         
     except HTTPException:
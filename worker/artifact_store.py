@@ -0,0 +1,118 @@
+"""
+Shared artifact store for GradStat
+Writes analysis results (JSON) and report ZIPs as files to a directory the
+backend also mounts (ARTIFACT_DIR), so they are passed by reference instead
+of as base64 inside the response body.
+"""
+
+import os
+import re
+import tempfile
+from typing import Dict, Any, Callable, Optional, BinaryIO
+
+from fast_json import dumps
+from logger_config import logger
+
+# Shared directory for artifacts (artifacts are returned inline if unset)
+ARTIFACT_DIR = os.getenv('ARTIFACT_DIR') or None
+
+_ARTIFACT_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class ArtifactStore:
+    """
+    Files named <artifact_id>.json (results) and <artifact_id>.zip (report)
+
+    Each file is written to a temporary name and renamed into place, so a
+    reader never sees a partial artifact.
+    """
+
+    def __init__(self, directory: Optional[str] = ARTIFACT_DIR):
+        """
+        Args:
+            directory: Shared artifact directory (None disables the store)
+        """
+        self.directory = directory
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def _write(self, name: str, write: Callable[[BinaryIO], None]) -> Dict[str, Any]:
+        """Write one artifact atomically; returns its reference"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f'.{name}.', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, os.path.join(self.directory, name))
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return {'name': name, 'bytes': os.path.getsize(os.path.join(self.directory, name))}
+
+    @staticmethod
+    def valid_id(artifact_id: str) -> bool:
+        """Whether artifact_id is a safe file name stem"""
+        return bool(_ARTIFACT_ID.match(artifact_id))
+
+    def store_response(self, artifact_id: str, response: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Write the results and report ZIP of an analysis response
+
+        Args:
+            artifact_id: Name of the artifacts (letters, digits, - and _)
+            response: Analysis response with results and report_zip (the
+                ZIP's raw bytes, as _compute_analysis returns it)
+
+        Returns:
+            dict: results and report_zip references ({name, bytes}; report_zip
+            is None if the response has no report)
+        """
+        if not self.enabled:
+            raise RuntimeError('ARTIFACT_DIR is not set')
+        if not self.valid_id(artifact_id):
+            raise ValueError(f'Invalid artifact id: {artifact_id!r}')
+
+        results = self._write(f'{artifact_id}.json', lambda f: f.write(dumps(response['results'])))
+        report_zip = None
+        zip_bytes = response.get('report_zip')
+        if zip_bytes:
+            report_zip = self._write(f'{artifact_id}.zip', lambda f: f.write(zip_bytes))
+        logger.info(f"Stored artifacts {artifact_id}: results {results['bytes']} bytes, "
+                    f"report {report_zip['bytes'] if report_zip else 0} bytes")
+        return {'results': results, 'report_zip': report_zip}
+
+    def store_profile(self, profile_id: str, profile: Dict[str, Any], folded: str) -> Dict[str, Any]:
+        """
+        Write an analysis profile: <profile_id>.profile.json and its folded stacks, <profile_id>.folded
+
+        Returns:
+            dict: profile and folded references ({name, bytes})
+        """
+        if not self.enabled:
+            raise RuntimeError('No profile directory')
+        if not self.valid_id(profile_id):
+            raise ValueError(f'Invalid profile id: {profile_id!r}')
+        return {'profile': self._write(f'{profile_id}.profile.json', lambda f: f.write(dumps(profile))),
+                'folded': self._write(f'{profile_id}.folded', lambda f: f.write(folded.encode('utf-8')))}
+
+    def store_batch(self, batch_id: str, batch: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Write a finished batch (items, outcomes and timing): <batch_id>.batch.json
+
+        Returns:
+            dict: batch reference ({name, bytes})
+        """
+        if not self.enabled:
+            raise RuntimeError('No batch directory')
+        if not self.valid_id(batch_id):
+            raise ValueError(f'Invalid batch id: {batch_id!r}')
+        return self._write(f'{batch_id}.batch.json', lambda f: f.write(dumps(batch)))
+
+
+# Global artifact store
+artifact_store = ArtifactStore()
@@ -0,0 +1,329 @@
+"""
+Batch analysis runner for GradStat
+Runs several analyses over one parsed dataset, each in its own limited
+analysis process, records per-item timing, errors and cache hits, and keeps
+finished batches on disk so that any worker process can build the combined
+report on demand
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Dict, List, Any, Optional
+
+import pandas as pd
+
+from logger_config import logger
+from analysis_registry import run_analysis
+from analysis_runner import (
+    run_isolated, isolation_available, analysis_lock, AnalysisAborted, AnalysisProcessError
+)
+from artifact_store import ArtifactStore, ARTIFACT_DIR
+from cache_manager import get_cached_result, cache_result, get_projected_result, cache_projected_result
+from cost_model import cost_model, COST_ADMISSION
+
+# Maximum number of analyses in one batch
+BATCH_MAX_ITEMS = 20
+# Maximum number of analyses of one batch running at once
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', os.cpu_count() or 1))
+# Finished batches; under ARTIFACT_DIR (a volume shared by the worker
+# replicas) every replica can build their reports, otherwise only the
+# processes of the replica that ran them
+BATCH_DIR = os.getenv('BATCH_DIR') or os.path.join(ARTIFACT_DIR or tempfile.gettempdir(), 'gradstat-batches')
+
+# requestIds name the item's folder in the combined report ZIP
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+def _run_item(opts: Dict[str, Any], frame: Any) -> Dict[str, Any]:
+    """
+    Run one batch item, capturing its duration and any error
+
+    frame is the dataset, or the path of its pickle (written once per batch)
+    when the item runs in an analysis process.
+    """
+    start = time.perf_counter()
+    try:
+        df = pd.read_pickle(frame) if isinstance(frame, str) else frame
+        results = run_analysis(df, opts)
+        outcome = {'status': 'ok', 'results': results}
+    except Exception as e:
+        outcome = {'status': 'error', 'error': str(e)}
+    outcome['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return outcome
+
+
+def _run_pending(opts: Dict[str, Any], frame: Any, cancel_id: Optional[str],
+                 estimate: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Run one item in its own analysis process (see run_isolated), with the
+    limits, deadline and cancellation of a single analysis; without
+    isolation it runs in-process, one analysis at a time
+    """
+    start = time.perf_counter()
+    usage = {}
+    try:
+        with nullcontext() if isolation_available() else analysis_lock:
+            outcome = run_isolated(_run_item, (opts, frame), cancel_id=cancel_id, on_usage=usage.update)
+    except AnalysisAborted as e:
+        return {'status': 'error', 'error': str(e), 'code': e.code,
+                'elapsed_ms': round((time.perf_counter() - start) * 1000, 1)}
+    except AnalysisProcessError as e:
+        return {'status': 'error', 'error': str(e), 'elapsed_ms': round((time.perf_counter() - start) * 1000, 1)}
+    if estimate is not None and outcome['status'] == 'ok':
+        cost_model.record(estimate, time.perf_counter() - start, usage.get('peak_mb'))
+    return outcome
+
+
+def _admit(df: pd.DataFrame, pending: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Estimate the pending items of a batch and refuse the batch if it is over budget
+
+    Returns:
+        dict: The batch estimate (see CostModel.estimate_batch)
+
+    Raises:
+        AnalysisAborted: over_budget, with the estimate
+    """
+    estimate = cost_model.estimate_batch([item['options'] for item in pending], len(df), len(df.columns))
+    if estimate['tier'] == 'over_budget' and COST_ADMISSION:
+        cost_model.count_rejection()
+        over = [item['request_id'] for item, item_estimate in zip(pending, estimate['estimates'])
+                if item_estimate['tier'] == 'over_budget']
+        if over:
+            message = f"Over the budget of a single analysis: {', '.join(over)}"
+        else:
+            message = (f"This batch would take about {estimate['seconds']:.0f} s in total on {len(df)} rows; "
+                       f"the limit is {estimate['budget_seconds']:g} s")
+        raise AnalysisAborted('over_budget', message, limit=estimate['budget_seconds'],
+                              details={'estimate': estimate})
+    return estimate
+
+
+# Suffix of the cache keys of batch results. Batch items are cached without a
+# report ZIP, so they use their own keys and never answer a plain /analyze
+# request with a missing report.
+RESULTS_KEY_SUFFIX = '|batch-results'
+
+
+def _lookup_cached(df: pd.DataFrame, content_key: str, opts: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Cached results of an item from an earlier /analyze call or batch (whole file, then projected columns)"""
+    cached = (get_cached_result(content_key, opts)
+              or get_cached_result(content_key + RESULTS_KEY_SUFFIX, opts)
+              or get_projected_result(df, opts)
+              or get_projected_result(df, opts, suffix=RESULTS_KEY_SUFFIX))
+    return cached['results'] if cached is not None else None
+
+
+def normalize_items(requests: Any) -> List[Dict[str, Any]]:
+    """
+    Validate a batch request list and assign request IDs
+
+    Args:
+        requests: List of analysis option objects; each may carry a
+                  'requestId' used as its key in the response and as its
+                  folder in the report (letters, digits, - and _)
+
+    Returns:
+        List of dicts with request_id and options (requestId removed)
+    """
+    if not isinstance(requests, list) or not requests:
+        raise ValueError("Batch requests must be a non-empty list of option objects")
+    if len(requests) > BATCH_MAX_ITEMS:
+        raise ValueError(f"At most {BATCH_MAX_ITEMS} analyses per batch")
+
+    items = []
+    seen = set()
+    for index, opts in enumerate(requests):
+        if not isinstance(opts, dict):
+            raise ValueError(f"Batch request {index} is not an option object")
+        opts = dict(opts)
+        request_id = str(opts.pop('requestId', None) or f"{index}-{opts.get('analysisType', 'descriptive')}")
+        if not _REQUEST_ID.match(request_id):
+            raise ValueError(f"Invalid requestId in batch request {index}: use 1-64 letters, digits, - or _")
+        if request_id in seen:
+            raise ValueError(f"Duplicate requestId in batch: {request_id}")
+        seen.add(request_id)
+        items.append({'request_id': request_id, 'options': opts})
+    return items
+
+
+def run_batch(df: pd.DataFrame, content_key: str, items: List[Dict[str, Any]],
+              max_workers: Optional[int] = None, job_id: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Run a batch of analyses over one parsed dataset
+
+    Cached items are answered from the analysis cache. The rest are admitted
+    by their summed cost estimate and then run concurrently, each in its own
+    limited analysis process like a single analysis (see run_isolated);
+    the dataset is pickled to a file once and read there, instead of being
+    sent to each process. Cancelling job_id stops the items still running
+    and raises.
+
+    Args:
+        df: Parsed dataset shared by all items
+        content_key: content_digest of the upload (cache key)
+        items: Output of normalize_items
+        max_workers: Items running at once (default: BATCH_MAX_WORKERS)
+        job_id: Id to cancel the batch by (see analysis_runner.cancel)
+
+    Returns:
+        dict of request_id -> status, analysis_type, results or error (with
+        the code of a limit hit), elapsed_ms and cache_hit, in request order
+
+    Raises:
+        AnalysisAborted: If the batch is over budget or was cancelled
+    """
+    outcomes: Dict[str, Dict[str, Any]] = {}
+    pending = []
+    for item in items:
+        cached = _lookup_cached(df, content_key, item['options'])
+        if cached is not None:
+            outcomes[item['request_id']] = {'status': 'ok', 'results': cached, 'elapsed_ms': 0.0, 'cache_hit': True}
+        else:
+            pending.append(item)
+
+    if pending:
+        estimate = _admit(df, pending)
+        n_workers = min(len(pending), max_workers or BATCH_MAX_WORKERS) if isolation_available() else 1
+        logger.info(f"Batch: running {len(pending)} analyses, {n_workers} at a time")
+        frame_path = None
+        try:
+            if isolation_available():
+                fd, frame_path = tempfile.mkstemp(prefix='gradstat-batch-', suffix='.pkl')
+                os.close(fd)
+                df.to_pickle(frame_path)
+            with ThreadPoolExecutor(max_workers=n_workers) as pool:
+                futures = {
+                    item['request_id']: pool.submit(_run_pending, item['options'], frame_path or df, job_id,
+                                                    item_estimate)
+                    for item, item_estimate in zip(pending, estimate['estimates'])
+                }
+                for request_id, future in futures.items():
+                    outcomes[request_id] = future.result()
+        finally:
+            if frame_path is not None:
+                os.unlink(frame_path)
+
+    for item in pending:
+        outcome = outcomes[item['request_id']]
+        outcome['cache_hit'] = False
+        if outcome['status'] == 'ok':
+            entry = {'results': outcome['results']}
+            cache_result(content_key + RESULTS_KEY_SUFFIX, item['options'], entry)
+            cache_projected_result(df, item['options'], entry, suffix=RESULTS_KEY_SUFFIX)
+    if any(outcome.get('code') == 'cancelled' for outcome in outcomes.values()):
+        raise AnalysisAborted('cancelled', 'Batch cancelled')
+
+    return {
+        item['request_id']: {'analysis_type': item['options'].get('analysisType', 'descriptive'),
+                             **outcomes[item['request_id']]}
+        for item in items
+    }
+
+
+class BatchStore:
+    """
+    Finished batches, one JSON file each (see ArtifactStore.store_batch)
+
+    Keeps the options and results of recent batches so that the combined
+    report is only built when it is requested, by whichever worker process
+    (or replica, with a shared directory) the request reaches.
+    """
+
+    def __init__(self, directory: str = BATCH_DIR, ttl_seconds: int = 3600, max_entries: int = 20):
+        """
+        Initialize store
+
+        Args:
+            directory: Directory of the batch files
+            ttl_seconds: Time to live for stored batches (default: 1 hour)
+            max_entries: Maximum number of batches to keep (default: 20)
+        """
+        self.store = ArtifactStore(directory)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+    def _path(self, batch_id: str) -> str:
+        return os.path.join(self.store.directory, f'{batch_id}.batch.json')
+
+    def _files(self) -> List[str]:
+        """Paths of the stored batches, newest first"""
+        try:
+            names = [name for name in os.listdir(self.store.directory) if name.endswith('.batch.json')]
+        except FileNotFoundError:
+            return []
+        paths = []
+        for name in names:
+            path = os.path.join(self.store.directory, name)
+            try:
+                paths.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                pass
+        return [path for _, path in sorted(paths, reverse=True)]
+
+    def add(self, items: List[Dict[str, Any]], outcomes: Dict[str, Dict[str, Any]],
+            timing: Dict[str, Any]) -> str:
+        """Store a finished batch and return its ID"""
+        batch_id = uuid.uuid4().hex
+        self.store.store_batch(batch_id, {'items': items, 'outcomes': outcomes, 'timing': timing,
+                                          'timestamp': time.time()})
+        for path in self._files()[self.max_entries:]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        return batch_id
+
+    def get(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """Return a stored batch, or None if unknown or expired"""
+        if not self.store.valid_id(batch_id):
+            return None
+        try:
+            with open(self._path(batch_id), 'rb') as f:
+                batch = json.load(f)
+        except FileNotFoundError:
+            return None
+        if time.time() - batch['timestamp'] > self.ttl_seconds:
+            try:
+                os.unlink(self._path(batch_id))
+            except FileNotFoundError:
+                pass
+            return None
+        return batch
+
+    def clear(self) -> None:
+        """Remove all stored batches"""
+        for path in self._files():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+# Global batch store
+batch_store = BatchStore()
+
+
+def build_batch_report(batch: Dict[str, Any]) -> str:
+    """Combined base64 ZIP report of the successful items of a stored batch"""
+    from report_generator import generate_batch_report_package
+
+    entries = [
+        {'request_id': item['request_id'], 'options': item['options'],
+         'results': batch['outcomes'][item['request_id']]['results']}
+        for item in batch['items']
+        if batch['outcomes'][item['request_id']]['status'] == 'ok'
+    ]
+    summary = {
+        'timing': batch['timing'],
+        'items': {
+            request_id: {key: value for key, value in outcome.items() if key != 'results'}
+            for request_id, outcome in batch['outcomes'].items()
+        },
+    }
+    return generate_batch_report_package(entries, summary)
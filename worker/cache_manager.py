@@ -3,11 +3,230 @@ Simple in-memory cache for analysis results
 Reduces computation time for repeated analyses
 """
 
+import os
+import re
 import hashlib
 import json
 import time
-from typing import Dict, Any, Optional
+import pickle
+import importlib
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, List, Any, Callable, Optional, Tuple, Union
+import numpy as np
+import pandas as pd
 from logger_config import logger
+from metrics import CACHE_LOOKUPS, CACHE_EVICTIONS, CACHE_ENTRIES
+
+# Fast non-cryptographic hash for upload content (optional); SHA-256 is the
+# fallback, which beats BLAKE2 on CPUs with SHA extensions
+try:
+    import xxhash
+    CONTENT_HASH = 'xxh3_128'
+    _new_content_hasher = xxhash.xxh3_128
+except ImportError:
+    try:
+        from blake3 import blake3 as _new_content_hasher
+        CONTENT_HASH = 'blake3'
+    except ImportError:
+        CONTENT_HASH = 'sha256'
+        _new_content_hasher = hashlib.sha256
+
+# Chunk size for hashing uploads while spooling them
+UPLOAD_CHUNK_BYTES = 1 << 20
+
+# Directory for spooled uploads (system temp directory if unset)
+UPLOAD_SPOOL_DIR = os.getenv('UPLOAD_SPOOL_DIR') or None
+
+# Option fields that change the result of each analysis type, with their kind
+# and default. Anything else a client sends (options left over from another
+# analysis type, UI state) is not part of the cache key. Options read by an
+# analysis must be listed here, or changing them would return stale results.
+# Kinds: column (name), ordered (list of names; kept in order, which shows in
+# coefficient tables, matrix axes and code snippets), float, int, bool, str
+OPTION_SCHEMAS: Dict[str, Dict[str, tuple]] = {
+    'descriptive': {},
+    'group-comparison': {
+        'groupVar': ('column', None), 'dependentVar': ('column', None), 'alpha': ('float', 0.05),
+    },
+    'regression': {
+        'dependentVar': ('column', None), 'independentVar': ('column', None),
+        'independentVars': ('ordered', []), 'alpha': ('float', 0.05),
+    },
+    'logistic-regression': {
+        'targetColumn': ('column', None), 'predictorColumns': ('ordered', []),
+        'testSize': ('float', 0.3), 'randomState': ('int', 42),
+        'cvFolds': ('int', 0), 'cvRepeats': ('int', 1), 'solver': ('str', 'auto'),
+    },
+    'survival': {
+        'durationColumn': ('column', None), 'eventColumn': ('column', None),
+        'groupColumn': ('column', None), 'covariates': ('ordered', []),
+        'showConfidenceIntervals': ('bool', True),
+    },
+    'nonparametric': {
+        'testType': ('str', 'mann-whitney'), 'groupVar': ('column', None),
+        'dependentVar': ('column', None), 'variable1': ('column', None),
+        'variable2': ('column', None), 'alpha': ('float', 0.05),
+    },
+    'categorical': {
+        'variable1': ('column', None), 'variable2': ('column', None), 'alpha': ('float', 0.05),
+        'maxDisplayCategories': ('int', 10), 'monteCarloSimulations': ('int', None),
+        'randomState': ('int', 42),
+    },
+    'clustering': {
+        'method': ('str', 'kmeans'), 'nClusters': ('int', 3), 'showElbow': ('bool', True),
+    },
+    'pca': {
+        'nComponents': ('int', 2),
+    },
+    'time-series': {
+        'dateColumn': ('column', None), 'valueColumns': ('ordered', None),
+        'maxDisplayPoints': ('int', 2000), 'resampleFrequency': ('str', None),
+        'aggregation': ('str', 'mean'), 'rollingWindow': ('int', None),
+        'seasonalPeriod': ('int', None), 'nLags': ('int', None),
+        'robustDecomposition': ('bool', False),
+    },
+    'correlation': {
+        'variables': ('ordered', []), 'correlationMethod': ('str', 'pearson'), 'alpha': ('float', 0.05),
+    },
+    'ancova': {
+        'dependentVar': ('column', None), 'groupVar': ('column', None),
+        'covariates': ('ordered', []), 'alpha': ('float', 0.05),
+    },
+    'repeated-measures': {
+        'dependentVar': ('column', None), 'subjectVar': ('column', None),
+        'timeVar': ('column', None), 'alpha': ('float', 0.05),
+    },
+    'posthoc-tukey': {
+        'dependentVar': ('column', None), 'groupVar': ('column', None), 'alpha': ('float', 0.05),
+    },
+    'power': {
+        'powerAnalysisType': ('str', 't-test'), 'calculate': ('str', 'sample_size'),
+        'effectSize': ('float', 0.5), 'alpha': ('float', 0.05), 'power': ('float', 0.8),
+        'sampleSize': ('int', 30), 'nGroups': ('int', 2),
+    },
+}
+
+
+def content_digest(content: bytes) -> str:
+    """Hash of raw upload bytes (see CONTENT_HASH)"""
+    return _new_content_hasher(content).hexdigest()
+
+
+async def spool_upload(file) -> tuple:
+    """
+    Copy an uploaded file to a temporary file in chunks, hashing it on the way
+    
+    Only one chunk is held in memory whatever the upload size; the file is
+    then parsed from disk (see read_datafile). The caller removes it with
+    remove_spooled, or uses spooled_upload.
+    
+    Args:
+        file: FastAPI UploadFile
+        
+    Returns:
+        tuple: (path of the spooled file, content_digest of the content)
+    """
+    hasher = _new_content_hasher()
+    suffix = os.path.splitext(file.filename or '')[1]
+    fd, path = tempfile.mkstemp(prefix='upload-', suffix=suffix, dir=UPLOAD_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as spool:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                spool.write(chunk)
+    except BaseException:
+        remove_spooled(path)
+        raise
+    return path, hasher.hexdigest()
+
+
+def remove_spooled(path: Optional[str]) -> None:
+    """Delete a file written by spool_upload (None and missing files are ignored)"""
+    if path:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+@asynccontextmanager
+async def spooled_upload(file):
+    """Spool an upload for the duration of the block, yielding (path, digest)"""
+    path, digest = await spool_upload(file)
+    try:
+        yield path, digest
+    finally:
+        remove_spooled(path)
+
+
+def _canonical_value(kind: str, value: Any) -> Any:
+    """Normalize one option value so equivalent spellings compare equal"""
+    if kind == 'float':
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return str(value)
+    if kind == 'int':
+        try:
+            number = float(value)
+            return int(number) if number.is_integer() else number
+        except (TypeError, ValueError):
+            return str(value)
+    if kind == 'bool':
+        if isinstance(value, str):
+            return value.strip().lower() in ('true', '1', 'yes', 'on')
+        return bool(value)
+    if kind == 'ordered':
+        values = value if isinstance(value, (list, tuple)) else [value]
+        return [str(v) for v in values]
+    return str(value)
+
+
+def canonical_options(options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reduce analysis options to the fields that affect the result
+    
+    Known analysis types keep only the fields in OPTION_SCHEMAS, with
+    defaults filled in and values normalized (numeric strings as numbers,
+    single column names as lists). Unknown types keep every option.
+    
+    Args:
+        options: Analysis options as sent by the client
+        
+    Returns:
+        dict: Canonical options including analysisType
+    """
+    analysis_type = options.get('analysisType', 'descriptive')
+    schema = OPTION_SCHEMAS.get(analysis_type)
+    if schema is None:
+        return dict(options)
+    
+    canonical = {'analysisType': analysis_type}
+    for field, (kind, default) in schema.items():
+        value = options.get(field)
+        if value is None or value == '' or value == []:
+            value = default
+        canonical[field] = None if value is None else _canonical_value(kind, value)
+    return canonical
+
+
+def dataframe_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Content hash of a DataFrame (values and column names, ignoring the index)
+    
+    Used to key caches of intermediate results (model fits, design matrices)
+    that depend only on the data, not on where it came from.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    hasher.update('|'.join(map(str, df.columns)).encode())
+    return hasher.hexdigest()
 
 
 class AnalysisCache:
@@ -15,101 +234,116 @@ class AnalysisCache:
     In-memory cache for analysis results
     
     Features:
-    - Hash-based cache keys (file content + analysis options)
+    - Hash-based cache keys (file content + canonical analysis options)
     - TTL (Time To Live) expiration
     - Automatic cleanup of expired entries
     - Memory-efficient (stores only results, not raw data)
     """
     
-    def __init__(self, ttl_seconds: int = 3600, max_entries: int = 100):
+    def __init__(self, ttl_seconds: int = 3600, max_entries: int = 100, name: str = 'Analysis'):
         """
         Initialize cache
         
         Args:
             ttl_seconds: Time to live for cache entries (default: 1 hour)
             max_entries: Maximum number of entries to store (default: 100)
+            name: Label used in log messages and metrics
         """
         self.cache: Dict[str, Dict[str, Any]] = {}
         self.ttl_seconds = ttl_seconds
         self.max_entries = max_entries
-        logger.info(f"Analysis cache initialized (TTL: {ttl_seconds}s, Max: {max_entries} entries)")
+        self.name = name
+        self.lookups = 0
+        self.hits = 0
+        # Request threads look up and fill the cache concurrently
+        self._lock = threading.Lock()
+        label = name.lower()
+        self._hit_counter = CACHE_LOOKUPS.labels(label, 'hit')
+        self._miss_counter = CACHE_LOOKUPS.labels(label, 'miss')
+        self._expired_counter = CACHE_LOOKUPS.labels(label, 'expired')
+        self._eviction_counter = CACHE_EVICTIONS.labels(label)
+        logger.info(f"{name} cache initialized (TTL: {ttl_seconds}s, Max: {max_entries} entries)")
     
-    def _generate_key(self, file_content: bytes, options: Dict[str, Any]) -> str:
+    def _generate_key(self, file_content: Union[bytes, str], options: Dict[str, Any]) -> str:
         """
         Generate cache key from file content and analysis options
         
         Args:
-            file_content: Raw file bytes
+            file_content: Raw file bytes, or their content_digest when the
+                          upload was already hashed (avoids a second pass)
             options: Analysis options dictionary
             
         Returns:
-            str: SHA256 hash as cache key
+            str: Cache key
         """
-        # Create a deterministic string from options
-        options_str = json.dumps(options, sort_keys=True)
-        
-        # Combine file content hash and options
-        combined = hashlib.sha256(file_content).hexdigest() + options_str
+        if isinstance(file_content, bytes):
+            file_content = content_digest(file_content)
         
-        # Generate final cache key
-        cache_key = hashlib.sha256(combined.encode()).hexdigest()
+        # Deterministic string of the options that affect the result
+        options_str = json.dumps(canonical_options(options), sort_keys=True, separators=(',', ':'), default=str)
         
-        return cache_key
+        return content_digest(f"{file_content}|{options_str}".encode())
     
-    def get(self, file_content: bytes, options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    def get(self, file_content: Union[bytes, str], options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
         Get cached analysis result
         
         Args:
-            file_content: Raw file bytes
+            file_content: Raw file bytes or their content_digest
             options: Analysis options
             
         Returns:
             Cached result if found and not expired, None otherwise
         """
         cache_key = self._generate_key(file_content, options)
+        self.lookups += 1
         
-        # Check if key exists
-        if cache_key not in self.cache:
+        # Check if key exists (another thread may remove it meanwhile)
+        entry = self.cache.get(cache_key) if cache_key in self.cache else None
+        if entry is None:
             logger.debug(f"Cache MISS: {cache_key[:16]}...")
+            self._miss_counter.inc()
             return None
         
-        entry = self.cache[cache_key]
-        
         # Check if expired
         if time.time() - entry['timestamp'] > self.ttl_seconds:
             logger.debug(f"Cache EXPIRED: {cache_key[:16]}...")
-            del self.cache[cache_key]
+            with self._lock:
+                self.cache.pop(cache_key, None)
+            self._expired_counter.inc()
             return None
         
         # Cache hit!
         logger.info(f"Cache HIT: {cache_key[:16]}... (age: {int(time.time() - entry['timestamp'])}s)")
         entry['hits'] += 1
+        self.hits += 1
+        self._hit_counter.inc()
         
         return entry['result']
     
-    def set(self, file_content: bytes, options: Dict[str, Any], result: Dict[str, Any]) -> None:
+    def set(self, file_content: Union[bytes, str], options: Dict[str, Any], result: Dict[str, Any]) -> None:
         """
         Store analysis result in cache
         
         Args:
-            file_content: Raw file bytes
+            file_content: Raw file bytes or their content_digest
             options: Analysis options
             result: Analysis result to cache
         """
         cache_key = self._generate_key(file_content, options)
         
-        # Check if we need to evict old entries
-        if len(self.cache) >= self.max_entries:
-            self._evict_oldest()
-        
-        # Store result
-        self.cache[cache_key] = {
-            'result': result,
-            'timestamp': time.time(),
-            'hits': 0,
-            'analysis_type': options.get('analysisType', 'unknown')
-        }
+        with self._lock:
+            # Check if we need to evict old entries
+            if len(self.cache) >= self.max_entries:
+                self._evict_oldest()
+            
+            # Store result
+            self.cache[cache_key] = {
+                'result': result,
+                'timestamp': time.time(),
+                'hits': 0,
+                'analysis_type': options.get('analysisType', 'unknown')
+            }
         
         logger.info(f"Cache SET: {cache_key[:16]}... (type: {options.get('analysisType')})")
     
@@ -123,6 +357,7 @@ class AnalysisCache:
         
         logger.debug(f"Cache EVICT: {oldest_key[:16]}... (age: {int(time.time() - self.cache[oldest_key]['timestamp'])}s)")
         del self.cache[oldest_key]
+        self._eviction_counter.inc()
     
     def clear(self) -> None:
         """Clear all cache entries"""
@@ -138,13 +373,14 @@ class AnalysisCache:
             Number of entries removed
         """
         current_time = time.time()
-        expired_keys = [
-            key for key, entry in self.cache.items()
-            if current_time - entry['timestamp'] > self.ttl_seconds
-        ]
-        
-        for key in expired_keys:
-            del self.cache[key]
+        with self._lock:
+            expired_keys = [
+                key for key, entry in self.cache.items()
+                if current_time - entry['timestamp'] > self.ttl_seconds
+            ]
+            
+            for key in expired_keys:
+                del self.cache[key]
         
         if expired_keys:
             logger.info(f"Cache CLEANUP: {len(expired_keys)} expired entries removed")
@@ -158,17 +394,21 @@ class AnalysisCache:
         Returns:
             dict: Cache statistics including size, hit rate, etc.
         """
-        total_hits = sum(entry['hits'] for entry in self.cache.values())
+        with self._lock:
+            entries = list(self.cache.values())
+        total_hits = sum(entry['hits'] for entry in entries)
         
         return {
-            'entries': len(self.cache),
+            'entries': len(entries),
             'max_entries': self.max_entries,
             'total_hits': total_hits,
+            'lookups': self.lookups,
+            'hit_rate': round(self.hits / self.lookups, 4) if self.lookups else 0.0,
             'ttl_seconds': self.ttl_seconds,
             'oldest_entry_age': int(time.time() - min(
-                (entry['timestamp'] for entry in self.cache.values()),
+                (entry['timestamp'] for entry in entries),
                 default=time.time()
-            )) if self.cache else 0
+            )) if entries else 0
         }
     
     def invalidate_by_type(self, analysis_type: str) -> int:
@@ -181,13 +421,14 @@ class AnalysisCache:
         Returns:
             Number of entries invalidated
         """
-        keys_to_remove = [
-            key for key, entry in self.cache.items()
-            if entry['analysis_type'] == analysis_type
-        ]
-        
-        for key in keys_to_remove:
-            del self.cache[key]
+        with self._lock:
+            keys_to_remove = [
+                key for key, entry in self.cache.items()
+                if entry['analysis_type'] == analysis_type
+            ]
+            
+            for key in keys_to_remove:
+                del self.cache[key]
         
         if keys_to_remove:
             logger.info(f"Cache INVALIDATE: {len(keys_to_remove)} {analysis_type} entries removed")
@@ -195,29 +436,477 @@ class AnalysisCache:
         return len(keys_to_remove)
 
 
-# Global cache instance
+def _projection(df: pd.DataFrame, options: Dict[str, Any]) -> Optional[Tuple[List[str], bool]]:
+    """
+    Columns an analysis reads from df, and whether it drops incomplete rows of them first
+    
+    Mirrors the column selection of the analysis functions. Row dropping is
+    only claimed where the analysis immediately works on df[columns].dropna()
+    and reports nothing about the dropped rows.
+    
+    Returns:
+        (columns, drop_incomplete), or None if the analysis is not projectable
+    """
+    analysis_type = options.get('analysisType', 'descriptive')
+    numeric = list(df.select_dtypes(include=[np.number]).columns)
+    
+    def named(*fields):
+        return [options[f] for f in fields if options.get(f)]
+    
+    if analysis_type in ('descriptive', 'pca', 'clustering'):
+        return numeric, False
+    if analysis_type == 'regression':
+        return named('dependentVar') + list(options.get('independentVars') or named('independentVar')), True
+    if analysis_type == 'group-comparison':
+        # Same ID-column detection as group_comparison_analysis (paired designs)
+        id_cols = [c for c in df.columns if any(k in str(c).lower() for k in ('id', 'subject', 'patient'))]
+        return id_cols + named('groupVar', 'dependentVar'), not id_cols
+    if analysis_type == 'categorical':
+        return named('variable1', 'variable2'), True
+    if analysis_type == 'correlation':
+        return list(options.get('variables') or []), True
+    if analysis_type == 'survival':
+        return named('durationColumn', 'eventColumn', 'groupColumn') + list(options.get('covariates') or []), True
+    if analysis_type == 'nonparametric':
+        return named('groupVar', 'dependentVar', 'variable1', 'variable2'), False
+    if analysis_type == 'logistic-regression':
+        return list(options.get('predictorColumns') or []) + named('targetColumn'), False
+    if analysis_type == 'time-series':
+        date_col = options.get('dateColumn')
+        return [date_col] + list(options.get('valueColumns') or [c for c in numeric if c != date_col]), False
+    return None
+
+
+def projection_fingerprint(df: pd.DataFrame, options: Dict[str, Any]) -> Optional[str]:
+    """
+    Content hash of the part of df an analysis consumes
+    
+    Two uploads that differ only in columns (or, for analyses that drop
+    incomplete rows, rows) the analysis does not use get the same fingerprint.
+    
+    Returns:
+        Fingerprint, or None if the analysis is not projectable or refers to
+        columns that are missing from df
+    """
+    projection = _projection(df, options)
+    if projection is None:
+        return None
+    columns, drop_incomplete = projection
+    columns = list(dict.fromkeys(columns))
+    if not columns or any(col not in df.columns for col in columns):
+        return None
+    projected = df[columns]
+    if drop_incomplete:
+        projected = projected.dropna()
+    # A blank cell elsewhere in an integer column turns it into float on re-upload
+    integer_cols = projected.select_dtypes(include=['integer']).columns
+    if len(integer_cols):
+        projected = projected.astype({col: 'float64' for col in integer_cols})
+    return 'projection:' + dataframe_fingerprint(projected)
+
+
+# Spellings of common statistical terms mapped to one form, so that e.g.
+# "Student's t-test" and "t test" share a cached LLM response
+STAT_TERM_ALIASES = [
+    (r"\bstudent ?s t test\b", "t test"),
+    (r"\bttest\b", "t test"),
+    (r"\bmann whitney( u)?( test)?\b", "mann whitney"),
+    (r"\bwilcoxon rank sum( test)?\b", "mann whitney"),
+    (r"\b(homoscedasticity|equal variances?|homogeneity of variances)\b", "homogeneity of variance"),
+    (r"\bnormal distribution\b", "normality"),
+    (r"\banalysis of variance\b", "anova"),
+    (r"\bchi squared?\b", "chi square"),
+]
+
+# Time to live of cached LLM responses per kind. Explanations and
+# comparisons depend only on the terms asked about, so they keep longest.
+LLM_CACHE_TTLS = {
+    'explain': 7 * 24 * 3600,
+    'compare': 7 * 24 * 3600,
+    'sample-size': 24 * 3600,
+    'interpret': 3600,
+}
+
+
+def normalize_prompt_input(value: Any) -> str:
+    """
+    Normalize an LLM prompt input for use in a cache key
+    
+    Strings are lower-cased, punctuation and spacing are collapsed and
+    STAT_TERM_ALIASES applied; other values become canonical JSON.
+    """
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        return json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+    text = re.sub(r"[^a-z0-9.]+", " ", value.lower().replace("'", "")).strip(" .")
+    for pattern, replacement in STAT_TERM_ALIASES:
+        text = re.sub(pattern, replacement, text)
+    return re.sub(r"\s+", " ", text)
+
+
+class LLMResponseCache:
+    """
+    In-memory cache for LLM responses
+    
+    Features:
+    - Keys from the response kind and normalized prompt inputs
+    - TTL per kind (LLM_CACHE_TTLS)
+    - Byte budget: the oldest entries are evicted once the cached text
+      exceeds max_bytes
+    - Hit rates per kind
+    """
+    
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024, ttls: Optional[Dict[str, int]] = None,
+                 default_ttl: int = 3600):
+        """
+        Initialize cache
+        
+        Args:
+            max_bytes: Byte budget of the cached responses (default: 8 MB)
+            ttls: Time to live per kind (default: LLM_CACHE_TTLS)
+            default_ttl: Time to live of other kinds (default: 1 hour)
+        """
+        self.cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.max_bytes = max_bytes
+        self.ttls = dict(LLM_CACHE_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self.total_bytes = 0
+        self.lookups: Dict[str, int] = {}
+        self.hits: Dict[str, int] = {}
+        self._hit_counter = CACHE_LOOKUPS.labels('llm', 'hit')
+        self._miss_counter = CACHE_LOOKUPS.labels('llm', 'miss')
+        self._expired_counter = CACHE_LOOKUPS.labels('llm', 'expired')
+        self._eviction_counter = CACHE_EVICTIONS.labels('llm')
+        logger.info(f"LLM response cache initialized (Max: {max_bytes} bytes)")
+    
+    def _generate_key(self, kind: str, inputs: tuple) -> str:
+        """Cache key from the kind and the normalized inputs"""
+        normalized = '|'.join(normalize_prompt_input(value) for value in inputs)
+        return content_digest(f"{kind}|{normalized}".encode())
+    
+    def _remove(self, key: str) -> None:
+        entry = self.cache.pop(key)
+        self.total_bytes -= entry['size']
+    
+    def get(self, kind: str, *inputs: Any) -> Optional[Any]:
+        """
+        Get a cached response
+        
+        Args:
+            kind: Response kind (e.g. 'explain', 'compare')
+            *inputs: Prompt inputs the response depends on
+            
+        Returns:
+            Cached response if found and not expired, None otherwise
+        """
+        key = self._generate_key(kind, inputs)
+        self.lookups[kind] = self.lookups.get(kind, 0) + 1
+        entry = self.cache.get(key)
+        if entry is None:
+            self._miss_counter.inc()
+            return None
+        if time.time() - entry['timestamp'] > self.ttls.get(kind, self.default_ttl):
+            self._remove(key)
+            self._expired_counter.inc()
+            return None
+        logger.info(f"LLM cache HIT: {kind} {key[:16]}...")
+        self.hits[kind] = self.hits.get(kind, 0) + 1
+        self._hit_counter.inc()
+        return entry['response']
+    
+    def set(self, kind: str, response: Any, *inputs: Any) -> None:
+        """
+        Store a response, evicting the oldest entries to stay within the byte budget
+        
+        Args:
+            kind: Response kind
+            response: Response text (or JSON-serializable value)
+            *inputs: Prompt inputs the response depends on
+        """
+        key = self._generate_key(kind, inputs)
+        text = response if isinstance(response, str) else json.dumps(response, default=str)
+        size = len(text.encode('utf-8')) + len(key)
+        if size > self.max_bytes:
+            return
+        if key in self.cache:
+            self._remove(key)
+        while self.cache and self.total_bytes + size > self.max_bytes:
+            self._remove(next(iter(self.cache)))
+            self._eviction_counter.inc()
+        self.cache[key] = {'response': response, 'timestamp': time.time(), 'size': size, 'kind': kind}
+        self.total_bytes += size
+    
+    def clear(self) -> None:
+        """Clear all cache entries"""
+        self.cache.clear()
+        self.total_bytes = 0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics
+        
+        Returns:
+            dict: Entries, bytes used and budget, and lookups, hits and hit rate per kind
+        """
+        kinds = sorted(set(self.lookups) | set(self.ttls))
+        lookups = sum(self.lookups.values())
+        return {
+            'entries': len(self.cache),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'lookups': lookups,
+            'hit_rate': round(sum(self.hits.values()) / lookups, 4) if lookups else 0.0,
+            'by_kind': {
+                kind: {
+                    'lookups': self.lookups.get(kind, 0),
+                    'hits': self.hits.get(kind, 0),
+                    'hit_rate': round(self.hits.get(kind, 0) / self.lookups[kind], 4) if self.lookups.get(kind) else 0.0,
+                    'ttl_seconds': self.ttls.get(kind, self.default_ttl),
+                }
+                for kind in kinds
+            },
+        }
+
+
+# Largest cache entry an analysis process sends back to the worker (MB)
+CACHE_SYNC_MAX_ENTRY_MB = float(os.getenv('CACHE_SYNC_MAX_ENTRY_MB', '256'))
+
+
+class _WorkerBackedEntries(dict):
+    """
+    Entries of a cache in an analysis process
+
+    A key missing here is fetched from the worker's cache (see
+    CacheSync.use_worker) and kept; fetched entries are remembered with
+    their version so that delta() does not send them back unchanged.
+    """
+
+    def __init__(self, name: str, fetch: Callable[[str, str], Optional[bytes]],
+                 version: Optional[Callable[[Any], Any]]):
+        super().__init__()
+        self.name = name
+        self.fetch = fetch
+        self.version = version
+        self.fetched: Dict[str, Tuple[int, Any]] = {}
+
+    def _load(self, key: str) -> bool:
+        if dict.__contains__(self, key):
+            return True
+        data = self.fetch(self.name, key)
+        if data is None:
+            return False
+        entry = pickle.loads(data)
+        self.fetched[key] = (id(entry), self.version(entry) if self.version else None)
+        dict.__setitem__(self, key, entry)
+        return True
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self._load(key)
+
+    def __getitem__(self, key: str) -> Any:
+        if not self._load(key):
+            raise KeyError(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return dict.__getitem__(self, key) if self._load(key) else default
+
+
+class CacheSync:
+    """
+    Computation caches shared with isolated analysis processes
+
+    Analyses run in child processes started from a clean forkserver (see
+    analysis_runner), which begin with empty caches and exit when the
+    analysis is done. The caches are registered here. In the child,
+    use_worker() makes a lookup that misses fetch the entry from the
+    worker's cache over the pipe; the child takes a snapshot() before the
+    analysis and sends delta(snapshot) back, and the worker merge()s it,
+    like the metrics delta. Registered caches keep their entries in a
+    `cache` dict of {'timestamp': ...} records and count `hits` and
+    `misses`; `version` tells entries grown in place (e.g. a longer k-means
+    sweep) apart. Read-only caches are only looked up by the child; the
+    worker fills them itself.
+    """
+
+    def __init__(self):
+        self.caches: Dict[str, Tuple[Any, Optional[Any]]] = {}
+        self.read_only: set = set()
+        self.fetch: Optional[Callable[[str, str], Optional[bytes]]] = None
+        # Batch items merge their deltas from several threads
+        self._merge_lock = threading.Lock()
+
+    def register(self, name: str, cache: Any, version: Optional[Any] = None, read_only: bool = False) -> None:
+        """
+        Args:
+            name: Name of the cache in deltas
+            cache: The cache object
+            version: Function of an entry that changes when the entry is
+                extended in place (default: entries are only replaced)
+            read_only: Never send the child's entries back (the worker
+                fills this cache from the analysis result)
+        """
+        self.caches[name] = (cache, version)
+        if read_only:
+            self.read_only.add(name)
+        if self.fetch is not None:
+            cache.cache = _WorkerBackedEntries(name, self.fetch, version)
+
+    def use_worker(self, fetch: Callable[[str, str], Optional[bytes]]) -> None:
+        """
+        Fetch entries missing from this process's caches from the worker (call in the analysis process)
+
+        Args:
+            fetch: Called as fetch(name, key); returns entry_bytes(name, key) of the worker
+        """
+        self.fetch = fetch
+        for name, (cache, version) in self.caches.items():
+            cache.cache = _WorkerBackedEntries(name, fetch, version)
+
+    def entry_bytes(self, name: str, key: str) -> Optional[bytes]:
+        """A cache entry pickled for an analysis process (None if absent, unpicklable or too large)"""
+        if name not in self.caches:
+            return None
+        entry = self.caches[name][0].cache.get(key)
+        if entry is None:
+            return None
+        try:
+            data = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError, MemoryError) as e:
+            logger.warning(f"Cache entry {name}:{key[:16]}... not shared: {str(e)}")
+            return None
+        return data if len(data) <= CACHE_SYNC_MAX_ENTRY_MB * 2 ** 20 else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Identity and version of every entry, and the hit and miss counts"""
+        return {name: {'entries': {key: (id(entry), version(entry) if version else None)
+                                   for key, entry in list(cache.cache.items())},
+                       'hits': cache.hits, 'misses': cache.misses}
+                for name, (cache, version) in self.caches.items() if name not in self.read_only}
+
+    def delta(self, since: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Entries added, replaced or extended since an earlier snapshot(), pickled,
+        and the hits and misses counted since
+
+        Entries fetched from the worker and not changed since, and entries
+        that cannot be pickled or are larger than CACHE_SYNC_MAX_ENTRY_MB,
+        are left out.
+        """
+        changes = {}
+        for name, (cache, version) in self.caches.items():
+            if name in self.read_only:
+                continue
+            before = since.get(name, {'entries': {}, 'hits': 0, 'misses': 0})
+            fetched = getattr(cache.cache, 'fetched', {})
+            entries = {}
+            for key, entry in list(cache.cache.items()):
+                current = (id(entry), version(entry) if version else None)
+                if before['entries'].get(key) == current or fetched.get(key) == current:
+                    continue
+                try:
+                    data = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+                except (pickle.PicklingError, TypeError, AttributeError, MemoryError) as e:
+                    logger.warning(f"Cache entry {name}:{key[:16]}... not kept: {str(e)}")
+                    continue
+                if len(data) > CACHE_SYNC_MAX_ENTRY_MB * 2 ** 20:
+                    logger.info(f"Cache entry {name}:{key[:16]}... not kept ({len(data) / 2 ** 20:.0f} MB)")
+                    continue
+                entries[key] = data
+            hits, misses = cache.hits - before['hits'], cache.misses - before['misses']
+            if entries or hits or misses:
+                changes[name] = {'module': type(cache).__module__, 'entries': entries, 'hits': hits, 'misses': misses}
+        return changes
+
+    def merge(self, changes: Dict[str, Any]) -> None:
+        """Add a delta (e.g. from an analysis process) to the caches of this process"""
+        with self._merge_lock:
+            for name, change in changes.items():
+                if name not in self.caches:
+                    # First used in the analysis process: importing the module registers it here
+                    importlib.import_module(change['module'])
+                cache = self.caches[name][0]
+                cache.hits += change['hits']
+                cache.misses += change['misses']
+                for key, data in change['entries'].items():
+                    cache.cache[key] = pickle.loads(data)
+                while len(cache.cache) > cache.max_entries:
+                    oldest_key = min(cache.cache.keys(), key=lambda k: cache.cache[k]['timestamp'])
+                    del cache.cache[oldest_key]
+
+
+# Global registry of the computation caches filled by analysis processes
+cache_sync = CacheSync()
+
+
+# Global cache instances: whole-file keys (level 1) and projected-column keys (level 2)
 analysis_cache = AnalysisCache(ttl_seconds=3600, max_entries=100)
+projected_cache = AnalysisCache(ttl_seconds=3600, max_entries=100, name='Projected')
+llm_response_cache = LLMResponseCache(max_bytes=int(os.getenv('LLM_CACHE_MAX_BYTES', 8 * 1024 * 1024)))
+
+# Entry counts of the global caches, read when the metrics are collected
+CACHE_ENTRIES.labels('analysis').set_function(lambda: len(analysis_cache.cache))
+CACHE_ENTRIES.labels('projected').set_function(lambda: len(projected_cache.cache))
+CACHE_ENTRIES.labels('llm').set_function(lambda: len(llm_response_cache.cache))
+# Analysis processes look projected results up in the worker's cache
+cache_sync.register('projected', projected_cache, read_only=True)
 
 
 # Convenience functions
-def get_cached_result(file_content: bytes, options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+def get_cached_result(file_content: Union[bytes, str], options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """Get cached analysis result"""
     return analysis_cache.get(file_content, options)
 
 
-def cache_result(file_content: bytes, options: Dict[str, Any], result: Dict[str, Any]) -> None:
+def cache_result(file_content: Union[bytes, str], options: Dict[str, Any], result: Dict[str, Any]) -> None:
     """Cache analysis result"""
     analysis_cache.set(file_content, options, result)
 
 
+def get_projected_result(df: Optional[pd.DataFrame], options: Dict[str, Any], suffix: str = '',
+                         fingerprint: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Get a result cached for the same projected columns (given, or computed from df) of another upload"""
+    if fingerprint is None and df is not None:
+        fingerprint = projection_fingerprint(df, options)
+    if fingerprint is None:
+        return None
+    return projected_cache.get(fingerprint + suffix, options)
+
+
+def cache_projected_result(df: Optional[pd.DataFrame], options: Dict[str, Any], result: Dict[str, Any],
+                           suffix: str = '', fingerprint: Optional[str] = None) -> None:
+    """Cache analysis result under the fingerprint of its projected columns (given, or computed from df)"""
+    if fingerprint is None and df is not None:
+        fingerprint = projection_fingerprint(df, options)
+    if fingerprint is not None:
+        projected_cache.set(fingerprint + suffix, options, result)
+
+
+def get_llm_response(kind: str, *inputs: Any) -> Optional[Any]:
+    """Get cached LLM response"""
+    return llm_response_cache.get(kind, *inputs)
+
+
+def cache_llm_response(kind: str, response: Any, *inputs: Any) -> None:
+    """Cache LLM response"""
+    llm_response_cache.set(kind, response, *inputs)
+
+
 def clear_cache() -> None:
     """Clear all cached results"""
     analysis_cache.clear()
+    projected_cache.clear()
 
 
 def get_cache_stats() -> Dict[str, Any]:
-    """Get cache statistics"""
-    return analysis_cache.get_stats()
+    """Get cache statistics (whole-file level at the top, both levels under 'levels')"""
+    stats = analysis_cache.get_stats()
+    stats['levels'] = {
+        'file': analysis_cache.get_stats(),
+        'projected': projected_cache.get_stats(),
+    }
+    return stats
 
 
 # Example usage
@@ -0,0 +1,215 @@
+"""
+Categorical analysis engine for GradStat
+Builds contingency tables as sparse matrices from factorized codes, computes
+chi-square statistics, Cramér's V and residuals from the non-zero cells and
+the margins, runs Monte Carlo exact tests for sparse r x c tables, and
+collapses rare levels for display
+"""
+
+import os
+from typing import Dict, List, Any
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy import sparse
+
+# Simulated tables per Monte Carlo batch are limited so that the permuted
+# codes of one batch stay around this many elements
+MC_BATCH_ELEMENTS = 4_000_000
+# Upper bound on simulated tables per Monte Carlo test
+MAX_MONTE_CARLO_SIMULATIONS = 10_000
+
+
+def build_contingency(a: pd.Series, b: pd.Series) -> Dict[str, Any]:
+    """
+    Sparse contingency table of two categorical variables
+
+    Levels are factorized (sorted like pd.crosstab) and the table is a CSR
+    matrix with one entry per observed combination, so memory grows with the
+    number of distinct pairs rather than rows x columns.
+
+    Returns:
+        dict with table (CSR counts), row_labels, col_labels, row_totals,
+        col_totals, n and the row/column codes of every observation
+    """
+    row_codes, row_labels = pd.factorize(a, sort=True)
+    col_codes, col_labels = pd.factorize(b, sort=True)
+    shape = (len(row_labels), len(col_labels))
+    table = sparse.coo_matrix(
+        (np.ones(len(row_codes), dtype=np.int64), (row_codes, col_codes)), shape=shape
+    ).tocsr()
+    table.sum_duplicates()
+    return {
+        'table': table,
+        'row_labels': list(row_labels),
+        'col_labels': list(col_labels),
+        'row_totals': np.asarray(table.sum(axis=1)).ravel(),
+        'col_totals': np.asarray(table.sum(axis=0)).ravel(),
+        'n': int(len(row_codes)),
+        'row_codes': row_codes,
+        'col_codes': col_codes,
+    }
+
+
+def _pearson_from_counts(observed: np.ndarray, row_total: np.ndarray, col_total: np.ndarray,
+                         n: int) -> float:
+    """Pearson chi-square from the non-zero cells: sum(O^2 / E) - n"""
+    return float(np.sum(observed.astype(float) ** 2 * n / (row_total * col_total)) - n)
+
+
+def chi_square(ct: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Pearson chi-square test, Cramér's V and minimum expected count without densifying
+
+    Since sum(E) = sum(O) = n, the statistic equals sum(O^2 / E) - n, which only
+    needs the non-zero cells. The minimum expected count is
+    min(row totals) * min(column totals) / n.
+    """
+    from scipy import stats
+
+    coo = ct['table'].tocoo()
+    r, c = coo.shape
+    n = ct['n']
+    chi2 = _pearson_from_counts(coo.data, ct['row_totals'][coo.row], ct['col_totals'][coo.col], n)
+    dof = (r - 1) * (c - 1)
+    min_dim = min(r, c) - 1
+    return {
+        'chi2': chi2,
+        'dof': dof,
+        'p_value': float(stats.chi2.sf(chi2, dof)) if dof > 0 else 1.0,
+        'cramers_v': float(np.sqrt(chi2 / (n * min_dim))) if min_dim > 0 else 0.0,
+        'min_expected': float(ct['row_totals'].min() * ct['col_totals'].min() / n),
+    }
+
+
+def adjusted_residuals(observed, row_totals, col_totals, n: int):
+    """Adjusted standardized residuals (O - E) / sqrt(E (1 - r/n) (1 - c/n))"""
+    expected = row_totals * col_totals / n
+    variance = expected * (1 - row_totals / n) * (1 - col_totals / n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(variance > 0, (observed - expected) / np.sqrt(variance), 0.0)
+
+
+def largest_residuals(ct: Dict[str, Any], k: int = 10) -> List[Dict[str, Any]]:
+    """
+    Observed cells with the largest adjusted residuals (over-represented combinations)
+
+    Only non-zero cells are scanned, so this stays cheap for tables with
+    thousands of levels.
+    """
+    coo = ct['table'].tocoo()
+    rows_tot = ct['row_totals'][coo.row]
+    cols_tot = ct['col_totals'][coo.col]
+    residuals = adjusted_residuals(coo.data, rows_tot, cols_tot, ct['n'])
+    top = np.argsort(-residuals)[:k]
+    return [
+        {
+            'row': str(ct['row_labels'][coo.row[i]]),
+            'column': str(ct['col_labels'][coo.col[i]]),
+            'observed': int(coo.data[i]),
+            'expected': float(rows_tot[i] * cols_tot[i] / ct['n']),
+            'residual': float(residuals[i]),
+        }
+        for i in top
+    ]
+
+
+def _simulate_batch(ct: Dict[str, Any], n_sims: int, seed) -> np.ndarray:
+    """Chi-square statistics of n_sims tables with the observed margins"""
+    rng = np.random.default_rng(seed)
+    row_codes, col_codes, n = ct['row_codes'], ct['col_codes'], ct['n']
+    row_totals, col_totals = ct['row_totals'], ct['col_totals']
+    n_cols = len(col_totals)
+    n_cells = len(row_totals) * n_cols
+    # Permuting the column codes against fixed row codes keeps both margins
+    permuted = rng.permuted(np.broadcast_to(col_codes, (n_sims, n)), axis=1)
+    keys = (np.arange(n_sims)[:, None] * n_cells + row_codes * n_cols + permuted).ravel()
+
+    if n_sims * n_cells <= MC_BATCH_ELEMENTS:
+        # Small tables: dense counts per simulated table, sum(O^2 n / (r_i c_j)) - n
+        counts = np.bincount(keys, minlength=n_sims * n_cells).reshape(n_sims, n_cells)
+        weights = (n / np.outer(row_totals, col_totals)).ravel()
+        return (counts.astype(float) ** 2 @ weights) - n
+
+    # Large sparse tables: count only the occupied cells
+    unique_keys, counts = np.unique(keys, return_counts=True)
+    sim_idx, cell = np.divmod(unique_keys, n_cells)
+    row, col = np.divmod(cell, n_cols)
+    weights = n / (row_totals[row] * col_totals[col].astype(float))
+    return np.bincount(sim_idx, weights=counts.astype(float) ** 2 * weights, minlength=n_sims) - n
+
+
+def monte_carlo_test(ct: Dict[str, Any], observed_chi2: float, n_simulations: int = 10000,
+                     random_state: int = 42) -> Dict[str, Any]:
+    """
+    Monte Carlo exact test of independence for an r x c table
+
+    Tables with the observed margins are drawn by permuting one variable
+    against the other (the conditional null distribution), in vectorized
+    batches run in parallel. The p-value is (1 + #{chi2_sim >= chi2_obs}) / (B + 1).
+
+    Args:
+        ct: Output of build_contingency
+        observed_chi2: Pearson statistic of the observed table
+        n_simulations: Number of simulated tables
+        random_state: Seed for reproducibility
+
+    Returns:
+        dict with p_value, n_simulations and the Monte Carlo standard error
+    """
+    n = ct['n']
+    batch = max(1, min(n_simulations, MC_BATCH_ELEMENTS // max(n, 1)))
+    sizes = [batch] * (n_simulations // batch)
+    if n_simulations % batch:
+        sizes.append(n_simulations % batch)
+    seeds = np.random.SeedSequence(random_state).spawn(len(sizes))
+
+    n_jobs = min(len(sizes), os.cpu_count() or 1)
+    batches = Parallel(n_jobs=n_jobs, prefer='threads')(
+        delayed(_simulate_batch)(ct, size, seed)
+        for size, seed in zip(sizes, seeds)
+    )
+    simulated = np.concatenate(batches)
+
+    # Tolerance guards against ties being lost to rounding
+    exceed = int(np.sum(simulated >= observed_chi2 - 1e-7 * max(1.0, observed_chi2)))
+    p_value = (exceed + 1) / (n_simulations + 1)
+    return {
+        'p_value': float(p_value),
+        'n_simulations': int(n_simulations),
+        'standard_error': float(np.sqrt(p_value * (1 - p_value) / n_simulations)),
+    }
+
+
+def collapse_for_display(ct: Dict[str, Any], max_levels: int = 10) -> pd.DataFrame:
+    """
+    Dense table of the most frequent levels, with the rest pooled into 'Other'
+
+    Only the kept rows and columns are densified, so the display table is at
+    most (max_levels + 1) x (max_levels + 1) regardless of cardinality.
+    """
+    def keep_levels(totals, labels):
+        if len(labels) <= max_levels:
+            return np.arange(len(labels)), None
+        top = np.sort(np.argsort(-totals, kind='mergesort')[:max_levels])
+        return top, f"Other ({len(labels) - max_levels} levels)"
+
+    rows, other_row = keep_levels(ct['row_totals'], ct['row_labels'])
+    cols, other_col = keep_levels(ct['col_totals'], ct['col_labels'])
+
+    table = ct['table']
+    kept_rows = table[rows]
+    block = kept_rows[:, cols].toarray()
+    if other_col is not None:
+        block = np.column_stack([block, ct['row_totals'][rows] - block.sum(axis=1)])
+    if other_row is not None:
+        col_totals = ct['col_totals'][cols]
+        other = col_totals - block[:, :len(cols)].sum(axis=0)
+        if other_col is not None:
+            other = np.append(other, ct['n'] - block.sum() - other.sum())
+        block = np.vstack([block, other])
+
+    index = [ct['row_labels'][i] for i in rows] + ([other_row] if other_row else [])
+    columns = [ct['col_labels'][j] for j in cols] + ([other_col] if other_col else [])
+    return pd.DataFrame(block.astype(np.int64), index=index, columns=columns)
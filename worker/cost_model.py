@@ -0,0 +1,408 @@
+"""
+Cost model for GradStat analyses
+Estimates the runtime and memory of an analysis before it runs, from the
+data shape, the analysis type and its options, and decides how it is
+admitted: light, heavy (sent to the heavy worker pool) or over budget
+(rejected, or run with cheaper options when there are some). Runtime and
+memory estimates are calibrated by the measured runs, whose
+predicted-vs-actual errors are kept for the metrics.
+"""
+
+import os
+import math
+import threading
+from collections import deque
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+from logger_config import logger
+from analysis_runner import ANALYSIS_MEMORY_MB, ANALYSIS_DEADLINE_SECONDS
+from numeric_prep import SWEEP_MAX_K, SWEEP_SAMPLE_ROWS
+
+# Admission control on or off (estimates and metrics are kept either way)
+COST_ADMISSION = os.getenv('COST_ADMISSION', 'true').lower() in ('true', '1', 'yes')
+# Estimated runtime above which a job is heavy
+HEAVY_SECONDS = float(os.getenv('COST_HEAVY_SECONDS', '20'))
+# Budgets beyond which a job is not admitted (default: the analysis process limits)
+BUDGET_SECONDS = float(os.getenv('COST_BUDGET_SECONDS') or ANALYSIS_DEADLINE_SECONDS)
+BUDGET_MB = float(os.getenv('COST_BUDGET_MB') or ANALYSIS_MEMORY_MB)
+# Summed runtime of a batch's analyses beyond which the batch is not admitted
+# (below the backend's 10-minute batch request timeout)
+BATCH_BUDGET_SECONDS = float(os.getenv('COST_BATCH_BUDGET_SECONDS', '540'))
+
+# Work of one plot, in work units (about 0.2 s)
+PLOT_UNITS = 2e7
+# Prior runtime model until an analysis type has calibration runs:
+# seconds = overhead + units * seconds per unit (the overhead is mostly the report)
+PRIOR_OVERHEAD_SECONDS = 3.0
+PRIOR_SECONDS_PER_UNIT = 1e-8
+# Memory: fixed part (plotting and the report) plus copies of the numeric data
+# held while analysing
+MEMORY_BASE_MB = 160
+MEMORY_DATA_COPIES = 8
+# Working memory scikit-learn uses for chunked pairwise distances (silhouette)
+PAIRWISE_CHUNK_BYTES = 1 << 30
+
+# Measured runs kept per analysis type, and runs needed before they replace the prior
+CALIBRATION_RUNS = 50
+MIN_CALIBRATION_RUNS = 5
+# Predicted-vs-actual pairs kept for the metrics
+RECENT_RUNS = 200
+
+
+def _selected_columns(opts: Dict[str, Any], *keys: str) -> int:
+    """Number of columns named by the first of keys that the options set"""
+    for key in keys:
+        value = opts.get(key)
+        if value:
+            return len(value) if isinstance(value, (list, tuple)) else 1
+    return 0
+
+
+def work_units(analysis_type: str, n_rows: int, n_columns: int, opts: Dict[str, Any]) -> float:
+    """
+    Work of an analysis, roughly in floating-point operations
+
+    Args:
+        analysis_type: Analysis type
+        n_rows: Rows of the dataset
+        n_columns: Columns of the dataset
+        opts: Analysis options (k, method, simulation counts, selected columns)
+
+    Returns:
+        float: Work units (calibrated to seconds by CostModel)
+    """
+    n = max(n_rows, 1)
+    p = max(n_columns, 1)
+    log_n = math.log2(n + 1)
+
+    if analysis_type == 'power':
+        return PLOT_UNITS
+    if analysis_type == 'descriptive':
+        # Quantiles sort every column; one distribution plot per column (up to 6)
+        return n * p * log_n + PLOT_UNITS * (2 + min(p, 6))
+    if analysis_type in ('regression', 'logistic-regression', 'survival'):
+        k = 1 + (_selected_columns(opts, 'independentVars', 'predictorColumns', 'covariates', 'independentVar')
+                 or p - 1)
+        return n * k * k + PLOT_UNITS * 4
+    if analysis_type == 'correlation':
+        k = _selected_columns(opts, 'variables') or p
+        return k * k * n * log_n + PLOT_UNITS * 2
+    if analysis_type == 'pca':
+        return n * p * p + p ** 3 + PLOT_UNITS * 3
+    if analysis_type == 'clustering':
+        k = int(opts.get('nClusters', 3))
+        # Final fit (10 inits of ~20 iterations) and silhouette over all rows
+        units = n * p * k * 10 * 20 + 2 * n * n * p
+        if opts.get('method', 'kmeans') != 'kmeans':
+            # Ward linkage over all pairs of rows
+            units += n * n * p
+        if opts.get('showElbow', True):
+            sample = min(n, SWEEP_SAMPLE_ROWS)
+            units += sum(sample * p * k_sweep * 3 * 20 + sample * sample * p
+                         for k_sweep in range(2, SWEEP_MAX_K + 1))
+        return units + PLOT_UNITS * 4
+    if analysis_type == 'categorical':
+        # Monte Carlo test (when the chi-square approximation is doubtful) permutes all rows
+        simulations = int(opts.get('monteCarloSimulations') or min(10000, max(1000, 50_000_000 // n)))
+        return n * log_n + simulations * n + PLOT_UNITS * 3
+    if analysis_type == 'time-series':
+        k = _selected_columns(opts, 'valueColumns') or p
+        return n * k * log_n * 10 + PLOT_UNITS * (1 + k)
+    # Group comparisons and their variants: sorting and grouping the rows
+    return n * p * log_n + PLOT_UNITS * 3
+
+
+def memory_units_mb(analysis_type: str, n_rows: int, n_columns: int, opts: Dict[str, Any]) -> float:
+    """Uncalibrated peak memory (MB) an analysis adds to its process"""
+    n = max(n_rows, 1)
+    data_bytes = n * max(n_columns, 1) * 8
+    quadratic_bytes = 0
+    if analysis_type == 'clustering':
+        # Distance chunks of the silhouette scores
+        quadratic_bytes = min(n * n * 8, PAIRWISE_CHUNK_BYTES)
+        if opts.get('method', 'kmeans') != 'kmeans':
+            # Condensed distance matrix of the linkage, and its working copy
+            quadratic_bytes += n * (n - 1) * 8
+    return MEMORY_BASE_MB + (data_bytes * MEMORY_DATA_COPIES + quadratic_bytes) / 2 ** 20
+
+
+def downgrade_steps(analysis_type: str, opts: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Cheaper variants of the options, as (description, option changes), applied in turn"""
+    steps = []
+    if analysis_type == 'clustering':
+        if opts.get('method', 'kmeans') != 'kmeans':
+            steps.append(('k-means instead of hierarchical clustering', {'method': 'kmeans'}))
+        if opts.get('showElbow', True):
+            steps.append(('no elbow and silhouette sweep over k', {'showElbow': False}))
+    elif analysis_type == 'categorical':
+        if int(opts.get('monteCarloSimulations') or 0) > 1000:
+            steps.append(('1000 Monte Carlo simulations', {'monteCarloSimulations': 1000}))
+    return steps
+
+
+class CostModel:
+    """
+    Pre-flight cost estimates and admission decisions
+
+    Runtime is modelled per analysis type as overhead + units * seconds per
+    unit, fitted by least squares to the latest measured runs of that type
+    (the prior until there are MIN_CALIBRATION_RUNS of them); memory is the
+    formula estimate scaled by the median measured-to-estimated ratio.
+    """
+
+    def __init__(self, heavy_seconds: float = HEAVY_SECONDS, budget_seconds: float = BUDGET_SECONDS,
+                 budget_mb: float = BUDGET_MB, batch_budget_seconds: float = BATCH_BUDGET_SECONDS):
+        """
+        Args:
+            heavy_seconds: Estimated runtime above which a job is heavy
+            budget_seconds: Estimated runtime above which a job is not admitted
+            budget_mb: Estimated memory above which a job is not admitted
+            batch_budget_seconds: Summed estimated runtime above which a batch is not admitted
+        """
+        self.heavy_seconds = heavy_seconds
+        self.budget_seconds = budget_seconds
+        self.budget_mb = budget_mb
+        self.batch_budget_seconds = batch_budget_seconds
+        self.runs: Dict[str, deque] = {}
+        self.coefficients: Dict[str, Tuple[float, float]] = {}
+        self.memory_factors: Dict[str, float] = {}
+        self.recent: deque = deque(maxlen=RECENT_RUNS)
+        self.decisions = {'light': 0, 'heavy': 0, 'over_budget': 0, 'downgraded': 0}
+        self.rejected_runs = 0
+        self._lock = threading.Lock()
+
+    def _predict(self, analysis_type: str, n_rows: int, n_columns: int,
+                 opts: Dict[str, Any]) -> Dict[str, Any]:
+        units = work_units(analysis_type, n_rows, n_columns, opts)
+        overhead, per_unit = self.coefficients.get(analysis_type, (PRIOR_OVERHEAD_SECONDS, PRIOR_SECONDS_PER_UNIT))
+        memory = memory_units_mb(analysis_type, n_rows, n_columns, opts)
+        return {
+            'units': units,
+            'memory_units': memory,
+            'seconds': round(overhead + units * per_unit, 2),
+            'memory_mb': round(memory * self.memory_factors.get(analysis_type, 1.0), 1),
+        }
+
+    def _fits(self, prediction: Dict[str, Any]) -> bool:
+        return prediction['seconds'] <= self.budget_seconds and prediction['memory_mb'] <= self.budget_mb
+
+    def estimate(self, analysis_type: str, n_rows: int, n_columns: int, opts: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Estimate an analysis and classify it
+
+        Args:
+            analysis_type: Analysis type
+            n_rows: Rows of the dataset
+            n_columns: Columns of the dataset
+            opts: Analysis options
+
+        Returns:
+            dict: seconds, memory_mb, tier (light, heavy or over_budget),
+            calibrated, budgets, the shape and work units, and for over-budget
+            jobs downgrade ({options, changes, seconds, memory_mb, tier}, or
+            None if no cheaper options fit)
+        """
+        prediction = self._predict(analysis_type, n_rows, n_columns, opts)
+        if not self._fits(prediction):
+            tier = 'over_budget'
+        else:
+            tier = 'heavy' if prediction['seconds'] > self.heavy_seconds else 'light'
+        estimate = {
+            'analysis_type': analysis_type,
+            'n_rows': n_rows,
+            'n_columns': n_columns,
+            **prediction,
+            'tier': tier,
+            'calibrated': analysis_type in self.coefficients,
+            'budget_seconds': self.budget_seconds,
+            'budget_mb': self.budget_mb,
+        }
+        if tier == 'over_budget':
+            estimate['downgrade'] = self._downgrade(analysis_type, n_rows, n_columns, opts)
+        return estimate
+
+    def estimate_batch(self, analyses: List[Dict[str, Any]], n_rows: int, n_columns: int) -> Dict[str, Any]:
+        """
+        Estimate the analyses of a batch over one dataset and classify the batch
+
+        Args:
+            analyses: Options of each analysis
+            n_rows: Rows of the dataset
+            n_columns: Columns of the dataset
+
+        Returns:
+            dict: seconds (summed), memory_mb (of the largest analysis), tier
+            (over_budget if an analysis is, or the summed runtime is over the
+            batch budget), budget_seconds (the batch budget) and the estimate
+            of each analysis
+        """
+        estimates = [self.estimate(opts.get('analysisType', 'descriptive'), n_rows, n_columns, opts)
+                     for opts in analyses]
+        seconds = round(sum(estimate['seconds'] for estimate in estimates), 2)
+        if seconds > self.batch_budget_seconds or any(e['tier'] == 'over_budget' for e in estimates):
+            tier = 'over_budget'
+        else:
+            tier = 'heavy' if any(estimate['tier'] == 'heavy' for estimate in estimates) else 'light'
+        return {
+            'n_rows': n_rows,
+            'n_columns': n_columns,
+            'seconds': seconds,
+            'memory_mb': max((estimate['memory_mb'] for estimate in estimates), default=0.0),
+            'tier': tier,
+            'budget_seconds': self.batch_budget_seconds,
+            'estimates': estimates,
+        }
+
+    def _downgrade(self, analysis_type: str, n_rows: int, n_columns: int,
+                   opts: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The first cheaper variant of the options that fits the budgets, if any"""
+        options = dict(opts)
+        changes = []
+        for description, change in downgrade_steps(analysis_type, opts):
+            options.update(change)
+            changes.append(description)
+            prediction = self._predict(analysis_type, n_rows, n_columns, options)
+            if self._fits(prediction):
+                return {'options': options, 'changes': changes,
+                        'seconds': prediction['seconds'], 'memory_mb': prediction['memory_mb'],
+                        'tier': 'heavy' if prediction['seconds'] > self.heavy_seconds else 'light'}
+        return None
+
+    def count_decision(self, estimate: Dict[str, Any]) -> None:
+        """Count a pre-flight decision for the metrics"""
+        with self._lock:
+            self.decisions[estimate['tier']] += 1
+            if estimate.get('downgrade'):
+                self.decisions['downgraded'] += 1
+
+    def count_rejection(self) -> None:
+        """Count a run refused at the worker for being over budget"""
+        with self._lock:
+            self.rejected_runs += 1
+
+    def record(self, estimate: Dict[str, Any], seconds: float, peak_mb: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Add a measured run and refit its analysis type
+
+        Args:
+            estimate: The run's estimate (from estimate())
+            seconds: Measured runtime
+            peak_mb: Measured peak memory the run added, if known
+
+        Returns:
+            dict: The run as add_runs takes it, for the cost models of other
+            worker pools
+        """
+        analysis_type = estimate['analysis_type']
+        run = {'analysis_type': analysis_type, 'units': estimate['units'], 'seconds': seconds,
+               'memory_units': estimate['memory_units'], 'peak_mb': peak_mb}
+        with self._lock:
+            self._add_run(run)
+            self.recent.append({
+                'analysis_type': analysis_type,
+                'tier': estimate['tier'],
+                'predicted_seconds': estimate['seconds'],
+                'actual_seconds': round(seconds, 3),
+                'predicted_mb': estimate['memory_mb'],
+                'actual_mb': None if peak_mb is None else round(peak_mb, 1),
+            })
+        return run
+
+    def add_runs(self, runs: List[Dict[str, Any]]) -> int:
+        """
+        Add runs measured elsewhere (another worker pool) to the calibration
+
+        Args:
+            runs: Runs as record() returns them
+
+        Returns:
+            int: Number of runs added (malformed ones are skipped)
+        """
+        added = 0
+        with self._lock:
+            for run in runs:
+                try:
+                    valid = (isinstance(run['analysis_type'], str) and float(run['seconds']) > 0
+                             and float(run['units']) >= 0 and float(run['memory_units']) > 0
+                             and (run.get('peak_mb') is None or float(run['peak_mb']) >= 0))
+                except (KeyError, TypeError, ValueError):
+                    valid = False
+                if valid:
+                    self._add_run(run)
+                    added += 1
+        return added
+
+    def _add_run(self, run: Dict[str, Any]) -> None:
+        """Append a run to its analysis type's calibration runs and refit (under the lock)"""
+        runs = self.runs.setdefault(run['analysis_type'], deque(maxlen=CALIBRATION_RUNS))
+        peak_mb = run.get('peak_mb')
+        runs.append((float(run['units']), float(run['seconds']), float(run['memory_units']),
+                     None if peak_mb is None else float(peak_mb)))
+        if len(runs) >= MIN_CALIBRATION_RUNS:
+            self._refit(run['analysis_type'], runs)
+
+    def _refit(self, analysis_type: str, runs: deque) -> None:
+        units = np.array([run[0] for run in runs])
+        seconds = np.array([run[1] for run in runs])
+        if np.ptp(units) > 0:
+            per_unit, overhead = np.polyfit(units, seconds, 1)
+        else:
+            per_unit, overhead = 0.0, float(np.mean(seconds))
+        if per_unit <= 0 or overhead < 0:
+            # Too little spread in job size to separate the two; scale the prior instead
+            prior = PRIOR_OVERHEAD_SECONDS + units * PRIOR_SECONDS_PER_UNIT
+            ratio = float(np.median(seconds / prior))
+            overhead, per_unit = PRIOR_OVERHEAD_SECONDS * ratio, PRIOR_SECONDS_PER_UNIT * ratio
+        self.coefficients[analysis_type] = (float(overhead), float(per_unit))
+
+        ratios = [run[3] / run[2] for run in runs if run[3] is not None and run[2] > 0]
+        if ratios:
+            self.memory_factors[analysis_type] = min(max(float(np.median(ratios)), 0.25), 4.0)
+        logger.debug(f"Cost model for {analysis_type}: {overhead:.3f} s + {per_unit:.3g} s/unit")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Admission counts and predicted-vs-actual accuracy
+
+        Returns:
+            dict: budgets, decisions, rejected_runs, and per analysis type
+            the run count, calibration and the median and mean absolute
+            error of actual/predicted runtime and memory (log2 ratios: 0 is
+            exact, 1 is off by a factor of two)
+        """
+        with self._lock:
+            recent = list(self.recent)
+            by_type: Dict[str, Dict[str, Any]] = {}
+            for analysis_type, runs in self.runs.items():
+                overhead, per_unit = self.coefficients.get(analysis_type, (None, None))
+                by_type[analysis_type] = {
+                    'runs': len(runs),
+                    'calibrated': analysis_type in self.coefficients,
+                    'overhead_seconds': None if overhead is None else round(overhead, 3),
+                    'seconds_per_unit': per_unit,
+                    'memory_factor': self.memory_factors.get(analysis_type),
+                }
+            stats = {
+                'admission': COST_ADMISSION,
+                'heavy_seconds': self.heavy_seconds,
+                'budget_seconds': self.budget_seconds,
+                'budget_mb': self.budget_mb,
+                'decisions': dict(self.decisions),
+                'rejected_runs': self.rejected_runs,
+            }
+
+        for analysis_type, entry in by_type.items():
+            runs = [run for run in recent if run['analysis_type'] == analysis_type]
+            for name, predicted, actual in (('seconds', 'predicted_seconds', 'actual_seconds'),
+                                            ('memory', 'predicted_mb', 'actual_mb')):
+                errors = [math.log2(run[actual] / run[predicted]) for run in runs
+                          if run[actual] and run[predicted]]
+                entry[f'{name}_log2_error_median'] = round(float(np.median(errors)), 3) if errors else None
+                entry[f'{name}_log2_error_mean_abs'] = round(float(np.mean(np.abs(errors))), 3) if errors else None
+        return {**stats, 'by_type': by_type, 'recent': recent[-20:]}
+
+
+# Global cost model
+cost_model = CostModel()
@@ -13,6 +13,8 @@ import io
 import base64
 import logging
 
+from numeric_prep import get_numeric_prep
+
 logger = logging.getLogger(__name__)
 
 
@@ -377,11 +379,11 @@ def check_correlations(df: pd.DataFrame) -> Dict[str, Any]:
     }
     
     try:
-        numeric_cols = df.select_dtypes(include=[np.number]).columns
-        if len(numeric_cols) < 2:
+        prep = get_numeric_prep(df)
+        if len(prep.columns) < 2:
             return result
         
-        corr_matrix = df[numeric_cols].corr()
+        corr_matrix = prep.pairwise_correlation()
         
         # Check for perfect correlations (excluding diagonal)
         for i in range(len(corr_matrix)):
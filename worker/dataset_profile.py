@@ -0,0 +1,207 @@
+"""
+Dataset profile for GradStat's Test Advisor
+Computes the column statistics that the wizard auto-detection needs (types,
+distinct values, missing values, numeric ranges, name heuristics and
+sampled Shapiro-Wilk tests) in one pass per upload, so every question is
+answered from the cached profile instead of rescanning the data
+"""
+
+import os
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any
+
+import numpy as np
+import pandas as pd
+
+from logger_config import logger
+from cache_manager import dataframe_fingerprint, cache_sync
+
+NUMERIC_DTYPES = ['float64', 'int64', 'int32', 'float32']
+CATEGORICAL_DTYPES = ['object', 'category']
+
+# Rows sampled per column for the Shapiro-Wilk test (its p-value is unreliable above 5000)
+NORMALITY_SAMPLE = 5000
+# Distinct values are kept for columns with at most this many
+MAX_KEPT_UNIQUES = 10
+# Threads for the normality tests
+PROFILE_WORKERS = int(os.getenv('PROFILE_WORKERS', os.cpu_count() or 1))
+
+ID_KEYWORDS = ('id', 'subject', 'patient')
+TIME_KEYWORDS = ('time', 'visit', 'period', 'pre', 'post')
+
+
+def _shapiro(values: np.ndarray) -> Dict[str, Any]:
+    """Shapiro-Wilk test of one column's non-missing values (sampled above NORMALITY_SAMPLE)"""
+    from scipy import stats
+
+    n = len(values)
+    if n < 3:  # Minimum 3 observations for Shapiro-Wilk
+        return {'is_normal': None, 'error': f'Insufficient data: only {n} observations', 'n': n}
+    if n > NORMALITY_SAMPLE:
+        values = np.random.default_rng(0).choice(values, NORMALITY_SAMPLE, replace=False)
+    try:
+        _, p_value = stats.shapiro(values)
+        return {'is_normal': bool(p_value > 0.05), 'p_value': float(p_value), 'test': 'Shapiro-Wilk', 'n': n}
+    except Exception as e:
+        return {'is_normal': None, 'error': str(e), 'n': n}
+
+
+class DatasetProfile:
+    """
+    Column statistics of one dataset for the Test Advisor
+
+    Attributes:
+        n_rows, n_columns: Shape of the dataset
+        columns: Column names
+        dtypes: dtype name per column
+        numeric_columns: float64/int64/int32/float32 columns
+        numeric64_columns: float64/int64 columns
+        categorical_columns: object/category columns
+        n_unique: Distinct non-missing values per column
+        has_missing: Whether each column has missing values
+        uniques: Distinct values (in order of appearance, NaN included) of
+                 columns with at most MAX_KEPT_UNIQUES of them
+        zero_counts: Number of values equal to 0 in two-valued columns
+        numeric_stats: min, max and mean per numeric column
+        normality: Shapiro-Wilk result per numeric column
+        id_columns: Columns named like subject identifiers
+        has_id_column, has_time_column: Name heuristics for paired designs
+        id_has_duplicates: Whether the first ID column repeats values
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        """
+        Args:
+            df: Dataset to profile
+        """
+        start = time.perf_counter()
+        self.n_rows = len(df)
+        self.n_columns = len(df.columns)
+        self.columns: List[str] = list(df.columns)
+        self.dtypes: Dict[str, str] = {col: str(dtype) for col, dtype in df.dtypes.items()}
+        self.numeric_columns = list(df.select_dtypes(include=NUMERIC_DTYPES).columns)
+        self.numeric64_columns = list(df.select_dtypes(include=['float64', 'int64']).columns)
+        self.categorical_columns = list(df.select_dtypes(include=CATEGORICAL_DTYPES).columns)
+
+        n_unique = df.nunique()
+        self.n_unique: Dict[str, int] = {col: int(n_unique[col]) for col in self.columns}
+        missing = df.isna().any()
+        self.has_missing: Dict[str, bool] = {col: bool(missing[col]) for col in self.columns}
+
+        self.uniques: Dict[str, list] = {
+            col: df[col].unique().tolist() for col in self.columns if self.n_unique[col] <= MAX_KEPT_UNIQUES
+        }
+        self.zero_counts: Dict[str, int] = {
+            col: int((df[col] == 0).sum()) for col in self.columns if self.n_unique[col] == 2
+        }
+
+        numeric = df[self.numeric_columns]
+        self.numeric_stats = pd.DataFrame({'min': numeric.min(), 'max': numeric.max(), 'mean': numeric.mean()})
+
+        lowered = {col: str(col).lower() for col in self.columns}
+        self.id_columns = [col for col in self.columns if 'id' in lowered[col] or 'subject' in lowered[col]]
+        self.has_id_column = any(any(k in lowered[col] for k in ID_KEYWORDS) for col in self.columns)
+        self.has_time_column = any(any(k in lowered[col] for k in TIME_KEYWORDS) for col in self.columns)
+        self.id_has_duplicates = bool(df[self.id_columns[0]].duplicated().any()) if self.id_columns else False
+
+        self.normality = self._test_normality(df)
+        self.elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"Dataset profile: {self.n_rows} rows x {self.n_columns} columns "
+                    f"({len(self.numeric_columns)} numeric) in {self.elapsed_ms} ms")
+
+    def _test_normality(self, df: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+        """Shapiro-Wilk tests of the numeric columns, run on a thread pool"""
+        samples = [df[col].dropna().to_numpy() for col in self.numeric_columns]
+        workers = min(PROFILE_WORKERS, len(samples))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_shapiro, samples))
+        else:
+            results = [_shapiro(values) for values in samples]
+        return dict(zip(self.numeric_columns, results))
+
+
+class DatasetProfileCache:
+    """
+    In-memory cache of dataset profiles
+
+    Profiles are found by DataFrame identity first (repeated questions about
+    the same parsed upload cost a dictionary lookup) and then by content
+    hash (the same file uploaded again). DataFrames passed in must not be
+    modified afterwards.
+    """
+
+    def __init__(self, ttl_seconds: int = 3600, max_entries: int = 16):
+        """
+        Initialize cache
+
+        Args:
+            ttl_seconds: Time to live for cached profiles (default: 1 hour)
+            max_entries: Maximum number of profiles to keep (default: 16)
+        """
+        self.cache: Dict[str, Dict[str, Any]] = {}
+        self._by_object: Dict[int, tuple] = {}
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, df: pd.DataFrame) -> DatasetProfile:
+        """
+        Return the profile of df, computing it on first use
+
+        Args:
+            df: Dataset
+
+        Returns:
+            DatasetProfile of df
+        """
+        now = time.time()
+        known = self._by_object.get(id(df))
+        if known is not None and known[0]() is df and now - known[2] <= self.ttl_seconds:
+            self.hits += 1
+            return known[1]
+
+        key = dataframe_fingerprint(df)
+        entry = self.cache.get(key)
+        if entry is not None and now - entry['timestamp'] <= self.ttl_seconds:
+            self.hits += 1
+            profile = entry['profile']
+        else:
+            self.misses += 1
+            profile = DatasetProfile(df)
+            if len(self.cache) >= self.max_entries:
+                oldest_key = min(self.cache.keys(), key=lambda k: self.cache[k]['timestamp'])
+                del self.cache[oldest_key]
+            self.cache[key] = {'profile': profile, 'timestamp': now}
+
+        # Drop identity entries of DataFrames that no longer exist
+        self._by_object = {k: v for k, v in self._by_object.items() if v[0]() is not None}
+        self._by_object[id(df)] = (weakref.ref(df), profile, now)
+        return profile
+
+    def clear(self) -> None:
+        """Clear all cached profiles"""
+        self.cache.clear()
+        self._by_object.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        return {
+            'entries': len(self.cache),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+# Global dataset profile cache
+dataset_profile_cache = DatasetProfileCache()
+cache_sync.register('dataset_profile', dataset_profile_cache)
+
+
+def get_dataset_profile(df: pd.DataFrame) -> DatasetProfile:
+    """Cached profile of df (see DatasetProfileCache.get)"""
+    return dataset_profile_cache.get(df)
@@ -0,0 +1,149 @@
+"""
+Fast JSON encoding for GradStat responses
+Converts analysis results to JSON-safe Python types, and serializes result
+payloads in one pass with orjson (NumPy arrays and scalars natively, NaN/inf
+as null), returning the encoded bytes directly so FastAPI's per-element
+jsonable_encoder walk is skipped
+"""
+
+import json
+import math
+import time
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from fastapi.responses import JSONResponse
+
+from logger_config import log_inf_nan_detected
+from metrics import observe_stage
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+
+def _default(obj: Any) -> Any:
+    """Types orjson does not serialize natively (called only for those values)"""
+    if isinstance(obj, np.ndarray):
+        # Non-contiguous or object arrays
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return obj.tolist()
+    if isinstance(obj, pd.DataFrame):
+        return obj.to_dict()
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if obj is pd.NaT or obj is pd.NA:
+        return None
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _finite(obj: Any) -> Any:
+    """Replace NaN/inf with None for the stdlib encoder (fallback path only)"""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(item) for item in obj]
+    if isinstance(obj, (np.ndarray, np.generic, pd.Series, pd.Index, pd.DataFrame)):
+        return _finite(_default(obj))
+    return obj
+
+
+def _format_path(path) -> str:
+    """Render a lazily built (parent, key) path chain as root.key[index]"""
+    parts = []
+    while isinstance(path, tuple):
+        path, key = path
+        parts.append(f"[{key}]" if isinstance(key, int) else f".{key}")
+    return path + ''.join(reversed(parts))
+
+
+def convert_to_python_types(obj, path="root"):
+    """
+    Convert numpy types to Python native types for JSON serialization and handle inf/nan
+
+    Used by the analyses on their results (re-exported by analysis_functions)
+    and kept here so that lightweight modules need not import the analyses.
+    The path of each value is only rendered when an inf/nan is logged, and
+    arrays are checked for non-finite values in one vectorized pass. The
+    time taken is recorded as the convert_types stage of the analysis.
+    """
+    start = time.perf_counter()
+    converted = _convert(obj, path)
+    observe_stage('convert_types', time.perf_counter() - start)
+    return converted
+
+
+def _convert(obj, path):
+    """convert_to_python_types without the timing (used for the nested values)"""
+    if type(obj) is float:
+        if math.isfinite(obj):
+            return obj
+        log_inf_nan_detected(_format_path(path), "python_float")
+        return None
+    elif isinstance(obj, dict):
+        return {key: _convert(value, (path, key)) for key, value in obj.items()}
+    elif isinstance(obj, list):
+        return [_convert(item, (path, i)) for i, item in enumerate(obj)]
+    elif isinstance(obj, (str, int, type(None))):
+        return obj
+    elif isinstance(obj, np.integer):
+        return int(obj)
+    elif isinstance(obj, (np.floating, float)):
+        val = float(obj)
+        # Replace inf and nan with None for JSON compatibility
+        if not math.isfinite(val):
+            log_inf_nan_detected(_format_path(path), "numpy_float")
+            return None
+        return val
+    elif isinstance(obj, np.bool_):
+        return bool(obj)
+    elif isinstance(obj, np.ndarray):
+        if obj.dtype.kind == 'f':
+            finite = np.isfinite(obj)
+            if not finite.all():
+                log_inf_nan_detected(_format_path(path), "numpy_array")
+                return np.where(finite, obj, None).tolist()
+        return obj.tolist()
+    return obj
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Encode a result payload as JSON bytes
+
+    NumPy arrays and scalars are serialized natively and NaN/inf become
+    null, matching convert_to_python_types. Without orjson the stdlib
+    encoder is used after replacing non-finite floats.
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+    return json.dumps(_finite(obj), default=_default, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+
+def sse_event(event: str, data: Any) -> bytes:
+    """Encode one server-sent event with a JSON data field"""
+    return b"event: " + event.encode('utf-8') + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response encoded with dumps
+
+    Returning an instance from a route bypasses FastAPI's jsonable_encoder,
+    which otherwise walks every element of large payloads in Python.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
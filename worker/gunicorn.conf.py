@@ -0,0 +1,45 @@
+"""
+Gunicorn configuration for the GradStat worker
+
+The app and the analysis libraries are loaded once in the master process
+(preload_app) and the workers are forked from it, sharing the loaded
+modules copy-on-write instead of each importing them again. The workers
+share their metrics through METRICS_DIR (a fresh temporary directory
+unless set), so /metrics reports all of them whichever one is scraped.
+
+One worker process per container by default: the analysis and projected
+caches, /cache/stats, stage ETAs and the LLM response cache are kept in
+process memory, so more workers would each hold (and fill) their own
+copies. Scale with replicas instead; WEB_CONCURRENCY raises it per pod.
+
+Usage:
+    gunicorn -c gunicorn.conf.py main:app
+"""
+
+import os
+import tempfile
+
+# Set before the app is loaded, so that the metrics module sees it
+if not os.getenv('METRICS_DIR'):
+    os.environ['METRICS_DIR'] = tempfile.mkdtemp(prefix='gradstat-metrics-')
+
+bind = f"0.0.0.0:{os.getenv('WORKER_PORT', '8001')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+worker_class = 'uvicorn.workers.UvicornWorker'
+preload_app = True
+# Analyses on large uploads can take a while
+timeout = int(os.getenv('WORKER_TIMEOUT', '300'))
+
+
+def on_starting(server):
+    """Clear the metrics of an earlier run and warm up the analysis modules before the workers are forked"""
+    from analysis_registry import prefork_warm_up
+    import metrics
+    metrics.clear_state_dir()
+    prefork_warm_up()
+
+
+def post_fork(server, worker):
+    """Start each worker's metrics from zero (the master's warm-up is not a request)"""
+    import metrics
+    metrics.registry.reset()
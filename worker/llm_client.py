@@ -0,0 +1,352 @@
+"""
+Shared asynchronous LLM client for GradStat
+One pooled AsyncOpenAI client for the interpreter and the Test Advisor AI,
+with per-call timeouts, bounded concurrency, retries with jittered backoff,
+a circuit breaker, and latency and queueing statistics
+"""
+
+import os
+import time
+import random
+import asyncio
+import importlib.util
+from collections import deque
+from typing import AsyncIterator, Dict, List, Any, Optional
+
+from logger_config import logger
+from cache_manager import llm_response_cache
+from prompt_context import count_message_tokens
+from metrics import LLM_REQUEST_DURATION
+
+# openai is optional; it is imported when the first request is made
+OPENAI_AVAILABLE = importlib.util.find_spec('openai') is not None
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+_LLM_SUCCESS_SECONDS = LLM_REQUEST_DURATION.labels('success')
+_LLM_ERROR_SECONDS = LLM_REQUEST_DURATION.labels('error')
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for the LLM API
+
+    Opens after failure_threshold consecutive failures and rejects calls
+    until reset_seconds have passed; then lets one trial call through
+    (half-open) and closes again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        """
+        Initialize circuit breaker
+
+        Args:
+            failure_threshold: Consecutive failures that open the circuit (default: 5)
+            reset_seconds: Time before a trial call is allowed (default: 30s)
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        """'closed', 'open' or 'half-open'"""
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return 'half-open'
+        return 'open'
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now"""
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half-open' and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful call"""
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def release(self) -> None:
+        """End a call without an outcome (cancelled), so that another trial may go ahead"""
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        """Count a failed call, opening the circuit at the threshold or after a failed trial"""
+        self.failures += 1
+        if self.trial_in_flight or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self.trial_in_flight:
+                self.times_opened += 1
+                logger.warning(f"LLM circuit opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+
+class LLMClient:
+    """
+    Pooled asynchronous client for OpenAI-compatible chat completions
+
+    All callers share one AsyncOpenAI instance and therefore one HTTP
+    connection pool. The SDK's own retries are disabled; calls are retried
+    here so that retries, the concurrency limit and the circuit breaker
+    see every attempt.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 timeout: Optional[float] = None, max_concurrency: Optional[int] = None,
+                 max_retries: Optional[int] = None, backoff_base: float = 0.5,
+                 backoff_max: float = 8.0, breaker: Optional[CircuitBreaker] = None):
+        """
+        Initialize client (settings default to the environment)
+
+        Args:
+            api_key: API key (default: OPENAI_API_KEY)
+            base_url: API base URL, e.g. a local compatible server (default: OPENAI_BASE_URL)
+            timeout: Per-attempt timeout in seconds (default: LLM_TIMEOUT or 30)
+            max_concurrency: Maximum concurrent requests (default: LLM_MAX_CONCURRENCY or 8)
+            max_retries: Retries of timeouts, connection, rate-limit and server errors
+                         (default: LLM_MAX_RETRIES or 2)
+            backoff_base: First retry delay bound in seconds, doubled per retry
+            backoff_max: Largest retry delay bound in seconds
+            breaker: Circuit breaker (default: 5 failures, 30s reset)
+        """
+        self.api_key = api_key if api_key is not None else os.getenv('OPENAI_API_KEY')
+        self.base_url = base_url if base_url is not None else os.getenv('OPENAI_BASE_URL')
+        self.timeout = timeout if timeout is not None else float(os.getenv('LLM_TIMEOUT', '30'))
+        self.max_concurrency = max_concurrency or int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('LLM_MAX_RETRIES', '2'))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+        self._client = None
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._latencies_ms = deque(maxlen=500)
+        self._queue_waits_ms = deque(maxlen=500)
+        self._prompt_tokens = deque(maxlen=500)
+        self.in_flight = 0
+        self.queued = 0
+        self.counts = {'requests': 0, 'successes': 0, 'failures': 0, 'retries': 0,
+                       'timeouts': 0, 'rejected': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+
+    def is_configured(self) -> bool:
+        """Whether the openai package is installed and an API key is set"""
+        return OPENAI_AVAILABLE and bool(self.api_key)
+
+    def _get_client(self):
+        """Create the shared AsyncOpenAI client on first use"""
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url or None,
+                                       timeout=self.timeout, max_retries=0)
+        return self._client
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        """Timeouts, connection errors, rate limiting and server errors"""
+        import openai
+        if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+            return True
+        return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter delay before retry number attempt (0-based)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def chat(self, messages: List[Dict[str, str]], model: str = DEFAULT_MODEL,
+                   temperature: float = 0.7, max_tokens: Optional[int] = None,
+                   timeout: Optional[float] = None) -> str:
+        """
+        Run a chat completion and return the message text
+
+        Args:
+            messages: Chat messages
+            model: Model name
+            temperature: Sampling temperature
+            max_tokens: Completion token limit
+            timeout: Per-attempt timeout override in seconds
+
+        Returns:
+            Content of the first choice
+
+        Raises:
+            CircuitOpenError: If the circuit breaker is open
+            openai.OpenAIError: If the request fails after retries
+        """
+        kwargs = self._request_kwargs(messages, model, temperature, max_tokens, timeout)
+        self.queued += 1
+        wait_start = time.perf_counter()
+        async with self._semaphore:
+            self.queued -= 1
+            self._queue_waits_ms.append((time.perf_counter() - wait_start) * 1000)
+            self.in_flight += 1
+            try:
+                response = await self._create_with_retries(kwargs)
+                self.counts['successes'] += 1
+                self._record_usage(kwargs, getattr(response, 'usage', None))
+                return response.choices[0].message.content
+            finally:
+                self.in_flight -= 1
+
+    async def stream_chat(self, messages: List[Dict[str, str]], model: str = DEFAULT_MODEL,
+                          temperature: float = 0.7, max_tokens: Optional[int] = None,
+                          timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Run a streamed chat completion, yielding the text as it arrives
+
+        Takes the same arguments as chat. Failures are retried only until
+        the stream has opened; an error after that ends the stream. The
+        request holds its concurrency slot until the stream is consumed or
+        closed.
+
+        Yields:
+            Text deltas of the first choice
+        """
+        kwargs = self._request_kwargs(messages, model, temperature, max_tokens, timeout)
+        kwargs['stream'] = True
+        kwargs['stream_options'] = {'include_usage': True}
+        self.queued += 1
+        wait_start = time.perf_counter()
+        async with self._semaphore:
+            self.queued -= 1
+            self._queue_waits_ms.append((time.perf_counter() - wait_start) * 1000)
+            self.in_flight += 1
+            stream = None
+            usage = None
+            try:
+                stream = await self._create_with_retries(kwargs)
+                async for chunk in stream:
+                    # The final chunk carries the token usage and no choices
+                    usage = getattr(chunk, 'usage', None) or usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+                self.counts['successes'] += 1
+                self._record_usage(kwargs, usage)
+            except Exception:
+                if stream is not None:
+                    self.counts['failures'] += 1
+                raise
+            finally:
+                self.in_flight -= 1
+                if stream is not None:
+                    await stream.close()
+
+    def _record_usage(self, kwargs: Dict[str, Any], usage) -> None:
+        """Record the prompt tokens of a call (reported by the API, else estimated)"""
+        if usage is not None and getattr(usage, 'prompt_tokens', None):
+            prompt_tokens, source = usage.prompt_tokens, 'reported'
+            self.counts['completion_tokens'] += usage.completion_tokens or 0
+        else:
+            prompt_tokens, source = count_message_tokens(kwargs['messages']), 'estimated'
+        self.counts['prompt_tokens'] += prompt_tokens
+        self._prompt_tokens.append(prompt_tokens)
+        logger.info(f"LLM call: {prompt_tokens} prompt tokens ({source}), model {kwargs['model']}")
+
+    def _request_kwargs(self, messages, model, temperature, max_tokens, timeout) -> Dict[str, Any]:
+        """Completion request arguments (checks that the client is configured)"""
+        if not self.is_configured():
+            raise RuntimeError("LLM client not configured. Please set OPENAI_API_KEY.")
+        self.counts['requests'] += 1
+        kwargs = {'model': model, 'messages': messages, 'temperature': temperature,
+                  'timeout': timeout or self.timeout}
+        if max_tokens is not None:
+            kwargs['max_tokens'] = max_tokens
+        return kwargs
+
+    async def _create_with_retries(self, kwargs: Dict[str, Any]):
+        """Create a completion, retrying transient failures; latency is measured to the response headers"""
+        import openai
+        client = self._get_client()
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.counts['rejected'] += 1
+                raise CircuitOpenError("LLM service temporarily unavailable (circuit open)")
+            start = time.perf_counter()
+            try:
+                response = await client.chat.completions.create(**kwargs)
+            except Exception as e:
+                _LLM_ERROR_SECONDS.observe(time.perf_counter() - start)
+                if isinstance(e, openai.APITimeoutError):
+                    self.counts['timeouts'] += 1
+                retryable = self._is_retryable(e)
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    # The service answered (e.g. a bad request), so it is up
+                    self.breaker.record_success()
+                if not retryable or attempt >= self.max_retries:
+                    self.counts['failures'] += 1
+                    raise
+                delay = self._backoff(attempt)
+                attempt += 1
+                self.counts['retries'] += 1
+                logger.warning(f"LLM call failed ({type(e).__name__}), retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled (e.g. a streaming client left): says nothing about the service
+                self.breaker.release()
+                raise
+            elapsed = time.perf_counter() - start
+            self._latencies_ms.append(elapsed * 1000)
+            _LLM_SUCCESS_SECONDS.observe(elapsed)
+            self.breaker.record_success()
+            return response
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get client statistics
+
+        Returns:
+            dict: Request and token counts, in-flight and queued requests,
+            latency and queue-wait percentiles (ms) and prompt tokens per call
+            over recent calls, and breaker state
+        """
+        def percentiles(values) -> Dict[str, Optional[float]]:
+            if not values:
+                return {'p50': None, 'p95': None, 'max': None}
+            ordered = sorted(values)
+            pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+            return {'p50': pick(0.5), 'p95': pick(0.95), 'max': round(ordered[-1], 1)}
+
+        return {
+            'configured': self.is_configured(),
+            **self.counts,
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'max_concurrency': self.max_concurrency,
+            'latency_ms': percentiles(self._latencies_ms),
+            'queue_wait_ms': percentiles(self._queue_waits_ms),
+            'prompt_tokens_per_call': percentiles(self._prompt_tokens),
+            'circuit': {'state': self.breaker.state, 'consecutive_failures': self.breaker.failures,
+                        'times_opened': self.breaker.times_opened},
+        }
+
+    async def aclose(self) -> None:
+        """Close the HTTP connection pool"""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+# Global client shared by the LLM features
+llm_client = LLMClient()
+
+
+def get_llm_stats() -> Dict[str, Any]:
+    """Get statistics of the global LLM client and the LLM response cache"""
+    return {**llm_client.get_stats(), 'cache': llm_response_cache.get_stats()}
@@ -3,18 +3,12 @@ LLM-powered statistical interpretation service
 Uses OpenAI GPT to explain results and answer questions
 """
 
-import os
-import json
-from typing import Dict, Any, List, Optional
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 import logging
 
-# Try to import openai, but don't fail if not available
-try:
-    import openai
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
-    openai = None
+from llm_client import LLMClient, llm_client, OPENAI_AVAILABLE, DEFAULT_MODEL
+from cache_manager import get_llm_response, cache_llm_response
+from prompt_context import compact_json, window_history, CONTEXT_TOKEN_BUDGET
 
 logger = logging.getLogger(__name__)
 
@@ -25,27 +19,25 @@ class StatisticalInterpreter:
     Provides plain-language explanations, answers questions, and explores scenarios
     """
     
-    def __init__(self):
+    def __init__(self, client: Optional[LLMClient] = None):
+        # Requests go through the shared pooled client
+        self.client = client or llm_client
         if not OPENAI_AVAILABLE:
             logger.warning("OpenAI package not installed - LLM features will be disabled")
-            self.api_key = None
-            self.model = None
-            return
-            
-        self.api_key = os.getenv('OPENAI_API_KEY')
-        if not self.api_key:
+        elif not self.client.api_key:
             logger.warning("OPENAI_API_KEY not set - LLM features will be disabled")
-        else:
-            openai.api_key = self.api_key
-        self.model = "gpt-4o-mini"  # Cost-effective model
+        self.model = DEFAULT_MODEL  # Cost-effective model
         
     def is_available(self) -> bool:
         """Check if LLM service is available"""
-        return OPENAI_AVAILABLE and self.api_key is not None
+        return self.client.is_configured()
     
     def create_context_prompt(self, analysis_data: Dict[str, Any]) -> str:
         """
         Create a comprehensive context prompt from analysis results
+        
+        Results and assumptions are summarized within CONTEXT_TOKEN_BUDGET
+        (plots dropped, arrays truncated) rather than dumped whole.
         """
         analysis_type = analysis_data.get('analysis_type', 'Unknown')
         sample_size = analysis_data.get('sample_size', 'N/A')
@@ -62,10 +54,10 @@ class StatisticalInterpreter:
 - Variables: {', '.join(variables) if variables else 'Not specified'}
 
 **Statistical Results:**
-{json.dumps(results, indent=2)}
+{compact_json(results, CONTEXT_TOKEN_BUDGET * 3 // 4)}
 
 **Assumptions Checked:**
-{json.dumps(assumptions, indent=2)}
+{compact_json(assumptions, CONTEXT_TOKEN_BUDGET // 4)}
 
 Your role is to:
 1. Explain what these results mean in plain language
@@ -78,7 +70,84 @@ Be clear, accurate, and educational. Use analogies when helpful. Avoid jargon un
 """
         return prompt
     
-    def interpret_results(self, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+    def _interpretation_request(self, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Chat request for the initial interpretation"""
+        context = self.create_context_prompt(analysis_data)
+        return {
+            "messages": [
+                {"role": "system", "content": "You are an expert statistician and educator who explains complex statistical concepts in simple terms."},
+                {"role": "user", "content": context + "\n\nProvide a comprehensive interpretation of these results in 3-4 paragraphs."}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 1000
+        }
+    
+    def _question_request(
+        self,
+        question: str,
+        analysis_data: Dict[str, Any],
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ) -> Dict[str, Any]:
+        """Chat request for a question about the analysis"""
+        context = self.create_context_prompt(analysis_data)
+        
+        messages = [
+            {"role": "system", "content": "You are an expert statistician answering questions about research results. Be concise but thorough."},
+            {"role": "user", "content": context}
+        ]
+        
+        # Add recent conversation history (last 3 exchanges within a token budget)
+        messages.extend(window_history(conversation_history))
+        
+        # Add current question
+        messages.append({"role": "user", "content": question})
+        
+        return {"messages": messages, "temperature": 0.7, "max_tokens": 500}
+    
+    def _what_if_request(self, scenario: str, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Chat request for a "what if" scenario"""
+        context = self.create_context_prompt(analysis_data)
+        
+        prompt = f"""Based on the analysis results above, answer this "what if" question:
+
+{scenario}
+
+Consider:
+- Current sample size and statistical power
+- Effect sizes observed
+- Statistical assumptions
+- Practical significance
+- Methodological implications
+
+Provide a thoughtful, evidence-based response in 2-3 paragraphs."""
+        
+        messages = [
+            {"role": "system", "content": "You are an expert statistician exploring hypothetical scenarios based on research data."},
+            {"role": "user", "content": context},
+            {"role": "user", "content": prompt}
+        ]
+        
+        return {
+            "messages": messages,
+            "temperature": 0.8,  # Slightly more creative for scenarios
+            "max_tokens": 600
+        }
+    
+    @staticmethod
+    def _prompt_inputs(analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Fields of the analysis data used in the context prompt (the interpretation cache key)"""
+        return {key: analysis_data.get(key) for key in
+                ('analysis_type', 'sample_size', 'variables', 'results', 'assumptions')}
+    
+    def _rule_based_insights(self, analysis_data: Dict[str, Any]) -> Dict[str, List[str]]:
+        """Key findings, concerns and next steps derived without the LLM"""
+        return {
+            "key_findings": self._extract_key_findings(analysis_data),
+            "concerns": self._identify_concerns(analysis_data),
+            "next_steps": self._suggest_next_steps(analysis_data)
+        }
+    
+    async def interpret_results(self, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Generate initial interpretation of results
         
@@ -97,38 +166,25 @@ Be clear, accurate, and educational. Use analogies when helpful. Avoid jargon un
                 "next_steps": []
             }
         
+        prompt_inputs = self._prompt_inputs(analysis_data)
+        interpretation = get_llm_response('interpret', prompt_inputs)
+        if interpretation is not None:
+            return {"interpretation": interpretation, **self._rule_based_insights(analysis_data)}
+        
         try:
-            context = self.create_context_prompt(analysis_data)
-            
-            response = openai.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert statistician and educator who explains complex statistical concepts in simple terms."},
-                    {"role": "user", "content": context + "\n\nProvide a comprehensive interpretation of these results in 3-4 paragraphs."}
-                ],
-                temperature=0.7,
-                max_tokens=1000
-            )
-            
-            interpretation = response.choices[0].message.content
+            interpretation = await self.client.chat(model=self.model, **self._interpretation_request(analysis_data))
+            cache_llm_response('interpret', interpretation, prompt_inputs)
             
-            return {
-                "interpretation": interpretation,
-                "key_findings": self._extract_key_findings(analysis_data),
-                "concerns": self._identify_concerns(analysis_data),
-                "next_steps": self._suggest_next_steps(analysis_data)
-            }
+            return {"interpretation": interpretation, **self._rule_based_insights(analysis_data)}
         except Exception as e:
             logger.error(f"Interpretation error: {str(e)}")
             return {
                 "error": str(e),
                 "interpretation": "Failed to generate interpretation. Please try again.",
-                "key_findings": self._extract_key_findings(analysis_data),
-                "concerns": self._identify_concerns(analysis_data),
-                "next_steps": self._suggest_next_steps(analysis_data)
+                **self._rule_based_insights(analysis_data)
             }
     
-    def answer_question(
+    async def answer_question(
         self, 
         question: str, 
         analysis_data: Dict[str, Any],
@@ -149,33 +205,15 @@ Be clear, accurate, and educational. Use analogies when helpful. Avoid jargon un
             return "AI question answering is currently unavailable. Please set OPENAI_API_KEY."
         
         try:
-            context = self.create_context_prompt(analysis_data)
-            
-            messages = [
-                {"role": "system", "content": "You are an expert statistician answering questions about research results. Be concise but thorough."},
-                {"role": "user", "content": context}
-            ]
-            
-            # Add conversation history if exists
-            if conversation_history:
-                messages.extend(conversation_history[-6:])  # Last 3 exchanges
-            
-            # Add current question
-            messages.append({"role": "user", "content": question})
-            
-            response = openai.chat.completions.create(
+            return await self.client.chat(
                 model=self.model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=500
+                **self._question_request(question, analysis_data, conversation_history)
             )
-            
-            return response.choices[0].message.content
         except Exception as e:
             logger.error(f"Question answering error: {str(e)}")
             return f"Sorry, I encountered an error: {str(e)}"
     
-    def what_if_analysis(
+    async def what_if_analysis(
         self, 
         scenario: str, 
         analysis_data: Dict[str, Any]
@@ -194,39 +232,75 @@ Be clear, accurate, and educational. Use analogies when helpful. Avoid jargon un
             return "AI scenario analysis is currently unavailable. Please set OPENAI_API_KEY."
         
         try:
-            context = self.create_context_prompt(analysis_data)
-            
-            prompt = f"""Based on the analysis results above, answer this "what if" question:
-
-{scenario}
-
-Consider:
-- Current sample size and statistical power
-- Effect sizes observed
-- Statistical assumptions
-- Practical significance
-- Methodological implications
-
-Provide a thoughtful, evidence-based response in 2-3 paragraphs."""
-            
-            messages = [
-                {"role": "system", "content": "You are an expert statistician exploring hypothetical scenarios based on research data."},
-                {"role": "user", "content": context},
-                {"role": "user", "content": prompt}
-            ]
-            
-            response = openai.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.8,  # Slightly more creative for scenarios
-                max_tokens=600
-            )
-            
-            return response.choices[0].message.content
+            return await self.client.chat(model=self.model, **self._what_if_request(scenario, analysis_data))
         except Exception as e:
             logger.error(f"What-if analysis error: {str(e)}")
             return f"Sorry, I encountered an error: {str(e)}"
     
+    async def _stream_text(
+        self,
+        request: Dict[str, Any],
+        cache_inputs: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Stream a chat request as ("token", {"text"}) events, then ("done", {"text"})
+        
+        A failure yields ("error", {"message"}) instead of "done". With
+        cache_inputs the complete text is cached as an interpretation.
+        """
+        if not self.is_available():
+            yield "error", {"message": "LLM service not available. Please set OPENAI_API_KEY."}
+            return
+        
+        parts = []
+        try:
+            async for text in self.client.stream_chat(model=self.model, **request):
+                parts.append(text)
+                yield "token", {"text": text}
+        except Exception as e:
+            logger.error(f"Streaming error: {str(e)}")
+            yield "error", {"message": str(e)}
+            return
+        
+        full_text = "".join(parts)
+        if cache_inputs is not None:
+            cache_llm_response('interpret', full_text, cache_inputs)
+        yield "done", {"text": full_text}
+    
+    async def stream_interpretation(self, analysis_data: Dict[str, Any]) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Stream the initial interpretation as (event, data) pairs
+        
+        The rule-based key findings, concerns and next steps come first
+        ("insights"), followed by the interpretation text as "token" events
+        and a final "done" (or "error"). A cached interpretation arrives as
+        a single token.
+        """
+        yield "insights", self._rule_based_insights(analysis_data)
+        
+        prompt_inputs = self._prompt_inputs(analysis_data)
+        cached = get_llm_response('interpret', prompt_inputs) if self.is_available() else None
+        if cached is not None:
+            yield "token", {"text": cached}
+            yield "done", {"text": cached, "cached": True}
+            return
+        
+        async for event in self._stream_text(self._interpretation_request(analysis_data), prompt_inputs):
+            yield event
+    
+    def stream_answer(
+        self,
+        question: str,
+        analysis_data: Dict[str, Any],
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Stream the answer to a question as "token" events followed by "done" (or "error")"""
+        return self._stream_text(self._question_request(question, analysis_data, conversation_history))
+    
+    def stream_what_if(self, scenario: str, analysis_data: Dict[str, Any]) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Stream a "what if" response as "token" events followed by "done" (or "error")"""
+        return self._stream_text(self._what_if_request(scenario, analysis_data))
+    
     def _extract_key_findings(self, data: Dict[str, Any]) -> List[str]:
         """Extract key statistical findings from results"""
         findings = []
@@ -4,27 +4,33 @@ Enhanced Logistic Regression Analysis with ROC, Confusion Matrix, and Classifica
 
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import (
     confusion_matrix, classification_report, roc_curve, roc_auc_score,
     accuracy_score, precision_score, recall_score, f1_score
 )
-from sklearn.model_selection import train_test_split
 import matplotlib.pyplot as plt
 import seaborn as sns
 import io
 import base64
+import time
 from typing import Dict, Any
 
+from logistic_engine import fit_logistic_model, code_snippet as logistic_code_snippet
+from progress import report_stage
+from metrics import observe_stage
+
 
 def plot_to_base64(fig) -> str:
     """Convert matplotlib figure to base64 string"""
+    report_stage('plots')
+    start = time.perf_counter()
     buf = io.BytesIO()
     fig.savefig(buf, format='png', dpi=100, bbox_inches='tight')
     buf.seek(0)
     img_base64 = base64.b64encode(buf.read()).decode('utf-8')
     buf.close()
     plt.close(fig)
+    observe_stage('plot_render', time.perf_counter() - start)
     return img_base64
 
 
@@ -37,6 +43,10 @@ def logistic_regression_analysis(df: pd.DataFrame, opts: Dict) -> Dict[str, Any]
     - predictor_columns: List of predictor variables
     - test_size: Proportion of data for testing (default 0.3)
     - random_state: Random seed for reproducibility (default 42)
+    - cvFolds: Number of stratified CV folds; >= 2 reports out-of-fold metrics
+      instead of a holdout split (default 0)
+    - cvRepeats: Number of CV repetitions with different shuffles (default 1)
+    - solver: LogisticRegression solver, or 'auto' to pick one from the data size (default 'auto')
     """
     
     target_col = opts.get('targetColumn')
@@ -60,26 +70,24 @@ def logistic_regression_analysis(df: pd.DataFrame, opts: Dict) -> Dict[str, Any]
         unique_vals = y.unique()
         if len(unique_vals) != 2:
             raise ValueError(f"Target must be binary. Found {len(unique_vals)} unique values")
-        y = (y == unique_vals[1]).astype(int)
+        positive_label = unique_vals[1]
+        y = (y == positive_label).astype(int)
         class_names = [str(unique_vals[0]), str(unique_vals[1])]
     else:
         unique_vals = y.unique()
         if len(unique_vals) != 2:
             raise ValueError(f"Target must be binary. Found {len(unique_vals)} unique values")
         class_names = [str(int(v)) for v in sorted(unique_vals)]
+        positive_label = max(unique_vals)
+        y = (y == positive_label).astype(int)
     
-    # Split data
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=test_size, random_state=random_state, stratify=y
-    )
-    
-    # Train logistic regression model
-    model = LogisticRegression(random_state=random_state, max_iter=1000)
-    model.fit(X_train, y_train)
-    
-    # Predictions
-    y_pred = model.predict(X_test)
-    y_pred_proba = model.predict_proba(X_test)[:, 1]
+    # Fit model (holdout split, or parallel k-fold CV when cvFolds >= 2)
+    fit = fit_logistic_model(X, y, opts)
+    cv = fit['cross_validation']
+    y_test = fit['y_eval']
+    y_pred_proba = fit['proba_eval']
+    y_pred = (y_pred_proba >= 0.5).astype(int)
+    coefficients_raw = fit['coefficients']
     
     # Calculate metrics
     accuracy = accuracy_score(y_test, y_pred)
@@ -106,7 +114,11 @@ def logistic_regression_analysis(df: pd.DataFrame, opts: Dict) -> Dict[str, Any]
     
     # 1. ROC Curve
     fig, ax = plt.subplots(figsize=(8, 6))
-    ax.plot(fpr, tpr, color='darkorange', lw=2, label=f'ROC curve (AUC = {auc_score:.3f})')
+    roc_label = f'ROC curve (AUC = {auc_score:.3f})'
+    if cv:
+        roc_label = (f'Out-of-fold ROC ({cv["n_folds"]}-fold CV, '
+                     f'AUC = {cv["auc_mean"]:.3f} [{cv["auc_ci_lower"]:.3f}, {cv["auc_ci_upper"]:.3f}])')
+    ax.plot(fpr, tpr, color='darkorange', lw=2, label=roc_label)
     ax.plot([0, 1], [0, 1], color='navy', lw=2, linestyle='--', label='Random Classifier')
     ax.scatter(fpr[optimal_idx], tpr[optimal_idx], marker='o', color='red', s=100, 
                label=f'Optimal Threshold = {optimal_threshold:.3f}', zorder=3)
@@ -145,8 +157,8 @@ def logistic_regression_analysis(df: pd.DataFrame, opts: Dict) -> Dict[str, Any]
     # 3. Feature Importance (Coefficients)
     coefficients = pd.DataFrame({
         'Feature': predictor_cols,
-        'Coefficient': model.coef_[0],
-        'Abs_Coefficient': np.abs(model.coef_[0])
+        'Coefficient': coefficients_raw,
+        'Abs_Coefficient': np.abs(coefficients_raw)
     }).sort_values('Abs_Coefficient', ascending=False)
     
     fig, ax = plt.subplots(figsize=(8, max(6, len(predictor_cols) * 0.4)))
@@ -184,8 +196,8 @@ def logistic_regression_analysis(df: pd.DataFrame, opts: Dict) -> Dict[str, Any]
     # Test results
     test_results = {
         "model_type": "Logistic Regression",
-        "n_train": int(len(X_train)),
-        "n_test": int(len(X_test)),
+        "n_train": int(fit['n_train']),
+        "n_test": int(fit['n_test']),
         "n_predictors": len(predictor_cols),
         "target_variable": target_col,
         "predictor_variables": predictor_cols,
@@ -210,15 +222,18 @@ def logistic_regression_analysis(df: pd.DataFrame, opts: Dict) -> Dict[str, Any]
         "optimal_threshold": float(optimal_threshold),
         
         # Model Coefficients
-        "intercept": float(model.intercept_[0]),
-        "coefficients": {col: float(coef) for col, coef in zip(predictor_cols, model.coef_[0])}
+        "intercept": float(fit['intercept']),
+        "coefficients": {col: float(coef) for col, coef in zip(predictor_cols, coefficients_raw)},
+        "solver": fit['solver']
     }
+    if cv:
+        test_results["cross_validation"] = cv
     
     # Interpretation
     interpretation = f"""
 **Model Performance Summary:**
 
-The logistic regression model achieved an **accuracy of {accuracy*100:.1f}%** on the test set ({len(X_test)} observations).
+The logistic regression model achieved an **accuracy of {accuracy*100:.1f}%** on the {'out-of-fold predictions' if cv else 'test set'} ({fit['n_test']} observations).
 
 **Key Metrics:**
 - **AUC-ROC**: {auc_score:.3f} - {'Excellent' if auc_score >= 0.9 else 'Good' if auc_score >= 0.8 else 'Fair' if auc_score >= 0.7 else 'Poor'} discrimination ability
@@ -235,6 +250,12 @@ The logistic regression model achieved an **accuracy of {accuracy*100:.1f}%** on
 
 **Optimal Threshold:** {optimal_threshold:.3f} (vs. default 0.5)
 Using this threshold maximizes the balance between sensitivity and specificity.
+"""
+    if cv:
+        interpretation += f"""
+**Cross-Validation:** {cv['n_folds']}-fold, {cv['n_repeats']} repeat(s)
+- Mean AUC: {cv['auc_mean']:.3f} (95% CI {cv['auc_ci_lower']:.3f}-{cv['auc_ci_upper']:.3f})
+- Pooled out-of-fold AUC: {cv['pooled_auc']:.3f}
 """
     
     # Recommendations
@@ -260,45 +281,14 @@ Using this threshold maximizes the balance between sensitivity and specificity.
         recommendations.append("  - Decreasing classification threshold")
         recommendations.append("  - Collecting more positive examples")
     
-    if abs(len(y_train[y_train==1]) / len(y_train) - 0.5) > 0.3:
+    if abs(y.mean() - 0.5) > 0.3:
         recommendations.append("⚠️ Class imbalance detected. Consider using class weights or resampling techniques.")
     
     recommendations.append(f"💡 Use optimal threshold ({optimal_threshold:.3f}) for better balanced predictions.")
     recommendations.append("📊 Review feature coefficients to understand variable importance.")
     
     # Code snippet
-    code_snippet = f"""
-# Logistic Regression with ROC and Confusion Matrix
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import roc_auc_score, confusion_matrix, classification_report
-
-# Prepare data
-X = df[{predictor_cols}]
-y = df['{target_col}']
-
-# Split data
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size={test_size}, random_state={random_state}, stratify=y
-)
-
-# Train model
-model = LogisticRegression(random_state={random_state}, max_iter=1000)
-model.fit(X_train, y_train)
-
-# Predictions
-y_pred = model.predict(X_test)
-y_pred_proba = model.predict_proba(X_test)[:, 1]
-
-# Evaluate
-auc = roc_auc_score(y_test, y_pred_proba)
-cm = confusion_matrix(y_test, y_pred)
-print(f"AUC-ROC: {{auc:.3f}}")
-print("\\nConfusion Matrix:")
-print(cm)
-print("\\nClassification Report:")
-print(classification_report(y_test, y_pred))
-"""
+    code_snippet = logistic_code_snippet(fit, target_col, predictor_cols, positive_label, test_size, random_state)
     
     result = {
         "analysis_type": "logistic_regression",
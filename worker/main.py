@@ -8,40 +8,14 @@ All rights reserved.
 This software is provided for educational and research purposes.
 """
 
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+import time
+
+_start = time.perf_counter()
 from analyze import app
-from analysis_functions import (
-    descriptive_analysis,
-    group_comparison_analysis,
-    regression_analysis,
-    logistic_regression_analysis,
-    survival_analysis,
-    nonparametric_test,
-    categorical_analysis,
-    clustering_analysis,
-    pca_analysis,
-    time_series_analysis,
-    power_analysis,
-    correlation_analysis
-)
-from report_generator import generate_report_package
+from analysis_registry import record_import
 
-# Import analysis functions into analyze module
-import analyze
-analyze.descriptive_analysis = descriptive_analysis
-analyze.group_comparison_analysis = group_comparison_analysis
-analyze.regression_analysis = regression_analysis
-analyze.logistic_regression_analysis = logistic_regression_analysis
-analyze.survival_analysis = survival_analysis
-analyze.nonparametric_test = nonparametric_test
-analyze.categorical_analysis = categorical_analysis
-analyze.clustering_analysis = clustering_analysis
-analyze.pca_analysis = pca_analysis
-analyze.time_series_analysis = time_series_analysis
-analyze.power_analysis = power_analysis
-analyze.correlation_analysis = correlation_analysis
-analyze.generate_report_package = generate_report_package
+# Analysis modules are imported on first use or during warm-up (see analysis_registry)
+record_import('analyze', (time.perf_counter() - _start) * 1000, 'startup')
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,454 @@
+"""
+Metrics for GradStat
+Counters, gauges and histograms exported in the Prometheus text format at
+/metrics: analysis requests and latency by type and stage, cache lookups
+and evictions, the analysis queue, process memory and LLM call latency.
+
+Instrumented code resolves the labelled child it updates once (at import or
+construction time) and then only adds to its slots: no lock, no label
+lookup and no new objects beyond the float being added. Updates rely on the
+GIL rather than a lock; two threads updating the same child at the same
+instant can at worst lose one increment.
+
+Analyses run in forked processes (see analysis_runner), which send the
+change in their counters and histograms back to the worker. With several
+server processes (gunicorn), set METRICS_DIR: each process then writes its
+values there and /metrics adds up those of all processes.
+"""
+
+import os
+import glob
+import json
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+from logger_config import logger
+
+# Seconds; analyses are limited to a few minutes (ANALYSIS_DEADLINE_SECONDS)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Directory shared by the server processes (unset: this process only)
+METRICS_DIR = os.getenv('METRICS_DIR')
+FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Values of every child of every family by label values; counters and gauges
+# have one value, histograms their bucket counts (not cumulative) and sum
+Values = Dict[str, Dict[Tuple[str, ...], List[float]]]
+
+
+class CounterChild:
+    """A counter with fixed label values"""
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def _values(self) -> List[float]:
+        return [self.value]
+
+    def _add(self, values: List[float]) -> None:
+        self.value += values[0]
+
+
+class GaugeChild:
+    """A gauge with fixed label values, set directly or read from a function at collection"""
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Report function() instead of the set value"""
+        self.function = function
+
+    def _values(self) -> List[float]:
+        if self.function is not None:
+            try:
+                return [float(self.function())]
+            except Exception as e:
+                logger.warning(f"Metrics gauge callback failed: {str(e)}")
+                return [math.nan]
+        return [self.value]
+
+    def _add(self, values: List[float]) -> None:
+        self.value += values[0]
+
+
+class HistogramChild:
+    """A histogram with fixed label values"""
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # The last slot counts values above the largest bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        # Buckets include their upper bound ("le")
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def _values(self) -> List[float]:
+        return [*self.counts, self.sum]
+
+    def _add(self, values: List[float]) -> None:
+        for i, count in enumerate(values[:-1]):
+            self.counts[i] += count
+        self.sum += values[-1]
+
+
+class MetricFamily:
+    """A metric and its children, one per combination of label values"""
+
+    def __init__(self, kind: str, name: str, documentation: str, labelnames: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = ()):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: Any):
+        """
+        Get the child for the given label values (created on first use)
+
+        Resolve children once, outside the code being measured; updating
+        a resolved child is the cheap part.
+        """
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            with self._lock:
+                child = self.children.get(key)
+                if child is None:
+                    child = HistogramChild(self.buckets) if self.kind == 'histogram' else \
+                        CounterChild() if self.kind == 'counter' else GaugeChild()
+                    self.children[key] = child
+        return child
+
+
+class MetricsRegistry:
+    """The metric families of this process"""
+
+    def __init__(self):
+        self.families: Dict[str, MetricFamily] = {}
+
+    def _register(self, family: MetricFamily) -> MetricFamily:
+        if family.name in self.families:
+            raise ValueError(f"Metric {family.name} is already registered")
+        self.families[family.name] = family
+        return family
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> MetricFamily:
+        return self._register(MetricFamily('counter', name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> MetricFamily:
+        return self._register(MetricFamily('gauge', name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DURATION_BUCKETS) -> MetricFamily:
+        return self._register(MetricFamily('histogram', name, documentation, labelnames,
+                                           buckets=tuple(sorted(buckets))))
+
+    def values(self, kinds: Tuple[str, ...] = ('counter', 'gauge', 'histogram')) -> Values:
+        """Current values of the families of the given kinds (gauge functions are called)"""
+        return {name: {key: child._values() for key, child in list(family.children.items())}
+                for name, family in self.families.items() if family.kind in kinds}
+
+    def delta(self, since: Values) -> Values:
+        """Change in the counters and histograms since an earlier values(); unchanged children are left out"""
+        changes = {}
+        for name, children in self.values(('counter', 'histogram')).items():
+            before = since.get(name, {})
+            for key, values in children.items():
+                previous = before.get(key)
+                if previous is not None:
+                    values = [value - old for value, old in zip(values, previous)]
+                if any(values):
+                    changes.setdefault(name, {})[key] = values
+        return changes
+
+    def merge(self, values: Values) -> None:
+        """Add counter and histogram values (e.g. a delta from an analysis process) to this registry"""
+        for name, children in values.items():
+            family = self.families.get(name)
+            if family is None or family.kind == 'gauge':
+                continue
+            for key, child_values in children.items():
+                family.labels(*key)._add(child_values)
+
+    def reset(self) -> None:
+        """Zero the counters, histograms and set gauges (keeps gauge functions and resolved children)"""
+        for family in self.families.values():
+            for child in list(family.children.values()):
+                if isinstance(child, HistogramChild):
+                    child.counts[:] = [0] * len(child.counts)
+                    child.sum = 0.0
+                else:
+                    child.value = 0.0
+
+    def render(self, values: Optional[Values] = None) -> str:
+        """
+        Format values in the Prometheus text exposition format (version 0.0.4)
+
+        Args:
+            values: Values to export (default: this process's current values)
+        """
+        values = self.values() if values is None else values
+        lines = []
+        for name, family in self.families.items():
+            lines.append(f"# HELP {name} {_escape(family.documentation, quotes=False)}")
+            lines.append(f"# TYPE {name} {family.kind}")
+            for key, child_values in sorted(values.get(name, {}).items()):
+                labels = list(zip(family.labelnames, key))
+                if family.kind != 'histogram':
+                    lines.append(f"{name}{_labels(labels)} {_number(child_values[0])}")
+                    continue
+                cumulative = 0
+                for bound, count in zip([*family.buckets, math.inf], child_values[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + [('le', _number(bound))])} {_number(cumulative)}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(child_values[-1])}")
+                lines.append(f"{name}_count{_labels(labels)} {_number(cumulative)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(text: str, quotes: bool = True) -> str:
+    text = text.replace('\\', '\\\\').replace('\n', '\\n')
+    return text.replace('"', '\\"') if quotes else text
+
+
+def _labels(pairs: List[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+# Global registry of this process
+registry = MetricsRegistry()
+
+# ---------------------------------------------------------------------------
+# Metrics of the worker
+# ---------------------------------------------------------------------------
+
+ANALYSIS_REQUESTS = registry.counter(
+    'gradstat_analysis_requests_total',
+    'Analysis requests by type and outcome (success, cached, error or the abort code)',
+    ('analysis_type', 'outcome'))
+ANALYSIS_DURATION = registry.histogram(
+    'gradstat_analysis_duration_seconds',
+    'Time to answer an analysis request by type (in-process analyses include their wait for the analysis lock)',
+    ('analysis_type',))
+STAGE_DURATION = registry.histogram(
+    'gradstat_stage_duration_seconds',
+    'Duration of the stages of an analysis by type (compute includes the plot_render and '
+    'convert_types time spent inside the analysis)',
+    ('analysis_type', 'stage'))
+ANALYSIS_QUEUE = registry.gauge(
+    'gradstat_analysis_queue_depth',
+    'Analyses running, or waiting for the analysis lock (in-process analyses only)',
+    ('state',))
+CACHE_LOOKUPS = registry.counter(
+    'gradstat_cache_lookups_total',
+    'Cache lookups by cache and result (hit, miss or expired)',
+    ('cache', 'result'))
+CACHE_EVICTIONS = registry.counter(
+    'gradstat_cache_evictions_total',
+    'Cache entries evicted to make room for new ones',
+    ('cache',))
+CACHE_ENTRIES = registry.gauge(
+    'gradstat_cache_entries',
+    'Entries held by each cache',
+    ('cache',))
+LLM_REQUEST_DURATION = registry.histogram(
+    'gradstat_llm_request_duration_seconds',
+    'Time to the response headers of each LLM API call attempt, by outcome',
+    ('outcome',))
+PROCESS_RESIDENT_MEMORY = registry.gauge(
+    'gradstat_process_resident_memory_bytes',
+    'Resident memory of the server processes')
+PROFILES_KEPT = registry.counter(
+    'gradstat_profiles_kept_total',
+    'Analysis profiles stored, by reason (requested or slow; see profiler.py)',
+    ('reason',))
+
+STAGES = ('read_datafile', 'compute', 'plot_render', 'convert_types', 'report')
+
+QUEUE_WAITING = ANALYSIS_QUEUE.labels('waiting')
+QUEUE_RUNNING = ANALYSIS_QUEUE.labels('running')
+
+
+def _resident_bytes() -> float:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return math.nan
+
+
+PROCESS_RESIDENT_MEMORY.labels().set_function(_resident_bytes)
+
+# Stage histograms of the analysis running in this context, by stage
+_stage_timers: ContextVar[Optional[Dict[str, HistogramChild]]] = ContextVar('stage_timers', default=None)
+_stage_timers_by_type: Dict[str, Dict[str, HistogramChild]] = {}
+
+
+def analysis_label(analysis_type: str) -> str:
+    """The analysis_type label of a requested type (unknown types share one, to bound the label values)"""
+    from analysis_registry import ENTRY_POINTS
+    return analysis_type if analysis_type in ENTRY_POINTS else 'unknown'
+
+
+@contextmanager
+def analysis_stages(analysis_type: str):
+    """Attribute the observe_stage calls made inside the block to an analysis type"""
+    label = analysis_label(analysis_type)
+    timers = _stage_timers_by_type.get(label)
+    if timers is None:
+        timers = {stage: STAGE_DURATION.labels(label, stage) for stage in STAGES}
+        _stage_timers_by_type[label] = timers
+    token = _stage_timers.set(timers)
+    try:
+        yield
+    finally:
+        _stage_timers.reset(token)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Record the duration of a stage of the current analysis (ignored outside analysis_stages)"""
+    timers = _stage_timers.get()
+    if timers is not None:
+        timers[stage].observe(seconds)
+
+
+def record_analysis(analysis_type: str, outcome: str, seconds: float) -> None:
+    """Count a finished analysis request and record its duration"""
+    label = analysis_label(analysis_type)
+    ANALYSIS_REQUESTS.labels(label, outcome).inc()
+    ANALYSIS_DURATION.labels(label).observe(seconds)
+
+
+# ---------------------------------------------------------------------------
+# Several server processes
+# ---------------------------------------------------------------------------
+
+def _state_file(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f'{pid}.json')
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def write_state() -> None:
+    """Write this process's values to METRICS_DIR (atomically)"""
+    path = _state_file(os.getpid())
+    state = {name: [[list(key), values] for key, values in children.items()]
+             for name, children in registry.values().items()}
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+
+def collect() -> Values:
+    """
+    Values of all server processes
+
+    Without METRICS_DIR, those of this process. Otherwise the sum over the
+    state files of the processes: counters and histograms of processes that
+    have exited still count (so totals do not drop when a worker is
+    replaced), gauges only those of live processes.
+    """
+    if not METRICS_DIR:
+        return registry.values()
+    write_state()
+    totals: Values = {}
+    for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+        try:
+            pid = int(os.path.basename(path)[:-len('.json')])
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            continue
+        alive = pid == os.getpid() or _alive(pid)
+        for name, children in state.items():
+            family = registry.families.get(name)
+            if family is None or (family.kind == 'gauge' and not alive):
+                continue
+            merged = totals.setdefault(name, {})
+            for key, values in children:
+                key = tuple(key)
+                previous = merged.get(key)
+                merged[key] = values if previous is None else [a + b for a, b in zip(previous, values)]
+    return totals
+
+
+def render() -> str:
+    """The /metrics response body"""
+    return registry.render(collect())
+
+
+def clear_state_dir() -> None:
+    """Remove the state files of an earlier run (call once, before the server processes start)"""
+    if METRICS_DIR:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        for path in glob.glob(os.path.join(METRICS_DIR, '*.json*')):
+            os.unlink(path)
+
+
+def start_sharing() -> None:
+    """Write this process's values to METRICS_DIR every FLUSH_SECONDS (no-op without METRICS_DIR)"""
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+
+    def flush():
+        while True:
+            try:
+                write_state()
+            except OSError as e:
+                logger.warning(f"Could not write metrics state: {str(e)}")
+            time.sleep(FLUSH_SECONDS)
+
+    threading.Thread(target=flush, name='metrics-flush', daemon=True).start()
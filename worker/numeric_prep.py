@@ -0,0 +1,327 @@
+"""
+Shared numeric preparation for GradStat
+Caches the artifacts that several analyses and detectors derive from the
+numeric columns of a dataset (numeric block, complete-case mask,
+standardized matrix, correlation matrices, per-column moments, k-means
+sweep), so a wizard session followed by PCA and clustering prepares the data
+once
+"""
+
+import os
+import time
+import threading
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from logger_config import logger
+from cache_manager import dataframe_fingerprint, cache_sync
+
+# Above this many cells the standardized matrix is held in float32
+FLOAT32_MIN_CELLS = 1_000_000
+# Rows per chunk when accumulating cross-products
+CHUNK_ROWS = 65536
+
+# k-means sweep (elbow/silhouette): largest k, rows sampled for the fits and
+# for the silhouette scores, and the default time budget of the wizard's sweep
+SWEEP_MAX_K = 10
+SWEEP_SAMPLE_ROWS = 2000
+SWEEP_SILHOUETTE_ROWS = 1000
+SWEEP_TIME_BUDGET = float(os.getenv('CLUSTER_SWEEP_BUDGET', '1.0'))
+
+
+class NumericPrep:
+    """
+    Derived numeric artifacts of one dataset and column set
+
+    Artifacts are computed on first access and kept on the instance. The
+    standardized matrix uses the complete cases and the same scaling as
+    sklearn's StandardScaler (ddof=0, constant columns left at scale 1).
+    """
+
+    def __init__(self, block: pd.DataFrame, key: str):
+        """
+        Args:
+            block: Numeric columns of the dataset (may contain missing values)
+            key: Cache key (content hash of the block)
+        """
+        self.key = key
+        self.block = block
+        self.columns: List[str] = list(block.columns)
+        self._artifacts: Dict[str, Any] = {}
+        # The wizard and an analysis may extend the same k sweep concurrently
+        self._sweep_lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Sent back from analysis processes (see cache_manager.CacheSync); locks do not pickle
+        state = self.__dict__.copy()
+        del state['_sweep_lock']
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._sweep_lock = threading.Lock()
+
+    def version(self) -> tuple:
+        """Artifacts computed so far (and k values swept), to tell an extended prep apart"""
+        sweep = self._artifacts.get('k_sweep')
+        return tuple(sorted(self._artifacts)), len(sweep['k']) if sweep else 0
+
+    def _get(self, name: str, compute):
+        if name not in self._artifacts:
+            self._artifacts[name] = compute()
+        return self._artifacts[name]
+
+    @property
+    def complete_mask(self) -> np.ndarray:
+        """Boolean mask of rows without missing values"""
+        return self._get('complete_mask', lambda: self.block.notna().all(axis=1).to_numpy())
+
+    @property
+    def complete(self) -> pd.DataFrame:
+        """Complete-case rows of the numeric block"""
+        return self._get('complete', lambda: self.block[self.complete_mask])
+
+    def _column_stats(self) -> Dict[str, np.ndarray]:
+        # Column by column, without a float64 copy of the whole block
+        complete = self.complete.astype(np.float64, copy=False)
+        std = complete.std(ddof=0).to_numpy()
+        return {'mean': complete.mean().to_numpy(), 'std': std, 'scale': np.where(std > 0, std, 1.0)}
+
+    @property
+    def mean(self) -> np.ndarray:
+        """Complete-case column means"""
+        return self._get('column_stats', self._column_stats)['mean']
+
+    @property
+    def scale(self) -> np.ndarray:
+        """Complete-case column standard deviations (ddof=0), 1 for constant columns"""
+        return self._get('column_stats', self._column_stats)['scale']
+
+    @property
+    def varying(self) -> np.ndarray:
+        """Boolean mask of columns that are not constant over the complete cases"""
+        return self._get('column_stats', self._column_stats)['std'] > 0
+
+    def standardized(self) -> np.ndarray:
+        """
+        Standardized complete-case matrix (float32 above FLOAT32_MIN_CELLS cells)
+
+        Holds n x p values, so only callers that need the rows in memory
+        (randomized SVD, clustering) build it; others use standardized_chunks.
+        """
+        def compute():
+            n, p = self.complete.shape
+            dtype = np.float32 if n * p >= FLOAT32_MIN_CELLS else np.float64
+            out = np.empty((n, p), dtype=dtype)
+            for start, chunk in zip(range(0, n, CHUNK_ROWS), self.standardized_chunks()):
+                out[start:start + CHUNK_ROWS] = chunk
+            # Shared between analyses: guard against in-place modification
+            out.flags.writeable = False
+            return out
+        return self._get('standardized', compute)
+
+    def standardized_chunks(self, dtype=np.float64):
+        """
+        Yield the standardized complete cases in chunks of CHUNK_ROWS rows
+
+        Slices standardized() if it was already built; otherwise each chunk
+        is standardized on its own (centered and scaled in float64 before
+        any downcast), so only one chunk is held at a time.
+        """
+        built = self._artifacts.get('standardized')
+        for start in range(0, len(self.complete), CHUNK_ROWS):
+            if built is not None:
+                chunk = built[start:start + CHUNK_ROWS]
+            else:
+                values = self.complete.iloc[start:start + CHUNK_ROWS].to_numpy(dtype=np.float64)
+                chunk = (values - self.mean) / self.scale
+            yield chunk.astype(dtype, copy=False)
+
+    def complete_correlation(self) -> pd.DataFrame:
+        """
+        Correlation matrix of the complete cases
+
+        Accumulated chunk by chunk as the float64 cross-product of the
+        standardized rows, without holding the standardized matrix (it is
+        reused if another analysis already built it). Constant columns get
+        NaN, like DataFrame.corr().
+        """
+        def compute():
+            p = len(self.columns)
+            gram = np.zeros((p, p))
+            for chunk in self.standardized_chunks():
+                gram += chunk.T @ chunk
+            corr = gram / max(len(self.complete), 1)
+            corr[~self.varying, :] = np.nan
+            corr[:, ~self.varying] = np.nan
+            np.fill_diagonal(corr, np.where(self.varying, 1.0, np.nan))
+            return pd.DataFrame(np.clip(corr, -1, 1), index=self.columns, columns=self.columns)
+        return self._get('complete_correlation', compute)
+
+    def pairwise_correlation(self) -> pd.DataFrame:
+        """Pearson correlations using pairwise-complete observations (DataFrame.corr())"""
+        if self.complete_mask.all():
+            return self.complete_correlation()
+        return self._get('pairwise_correlation', lambda: self.block.corr())
+
+    def moments(self, complete: bool = False) -> pd.DataFrame:
+        """
+        Per-column moments: count, mean, var, std (ddof=1), min, max, skew, kurtosis
+
+        Args:
+            complete: Use only complete cases (default: all non-missing values per column)
+        """
+        def compute():
+            data = self.complete if complete else self.block
+            return pd.DataFrame({
+                'count': data.count(),
+                'mean': data.mean(),
+                'var': data.var(),
+                'std': data.std(),
+                'min': data.min(),
+                'max': data.max(),
+                'skew': data.skew(),
+                'kurtosis': data.kurtosis(),
+            })
+        return self._get('moments_complete' if complete else 'moments', compute)
+
+    def describe(self) -> pd.DataFrame:
+        """DataFrame.describe() of the numeric block"""
+        return self._get('describe', lambda: self.block.describe())
+
+    def k_sweep(self, time_budget: Optional[float] = None) -> Dict[str, Any]:
+        """
+        k-means elbow and silhouette sweep over k = 2..min(SWEEP_MAX_K, n - 1)
+
+        Fits KMeans(n_init=3) on at most SWEEP_SAMPLE_ROWS sampled rows of
+        the standardized matrix; inertias are scaled to the full row count.
+        The sweep is kept on the instance: a call that runs out of time
+        budget returns the k values done so far, and the next call continues
+        from there, so the wizard's quick sweep is reused by the clustering
+        analysis.
+
+        Args:
+            time_budget: Seconds this call may spend fitting (default: no limit)
+
+        Returns:
+            dict with k, inertia and silhouette lists, sampled_rows, n_rows,
+            complete and elapsed_ms (all calls together)
+        """
+        X = self.standardized()
+        n = len(X)
+        with self._sweep_lock:
+            return self._extend_sweep(X, n, time_budget)
+
+    def _extend_sweep(self, X: np.ndarray, n: int, time_budget: Optional[float]) -> Dict[str, Any]:
+        """Body of k_sweep, run under the sweep lock"""
+        from sklearn.cluster import KMeans
+        from sklearn.metrics import silhouette_score
+
+        sweep = self._artifacts.get('k_sweep')
+        if sweep is None:
+            rows = np.random.default_rng(42).choice(n, SWEEP_SAMPLE_ROWS, replace=False) if n > SWEEP_SAMPLE_ROWS else None
+            sweep = self._artifacts['k_sweep'] = {
+                'k': [], 'inertia': [], 'silhouette': [],
+                'sampled_rows': n if rows is None else SWEEP_SAMPLE_ROWS, 'n_rows': n,
+                'complete': False, 'elapsed_ms': 0.0, '_rows': rows,
+            }
+        sample = X if sweep['_rows'] is None else X[np.sort(sweep['_rows'])]
+
+        k_values = range(2, max(min(SWEEP_MAX_K, n - 1), 2) + 1)
+        start = time.perf_counter()
+        for k in k_values[len(sweep['k']):]:
+            if time_budget is not None and time.perf_counter() - start > time_budget:
+                break
+            model = KMeans(n_clusters=k, random_state=42, n_init=3).fit(sample)
+            try:
+                silhouette = float(silhouette_score(sample, model.labels_, random_state=42,
+                                                    sample_size=min(SWEEP_SILHOUETTE_ROWS, len(sample))))
+            except ValueError:
+                # Fewer distinct points than clusters
+                silhouette = float('nan')
+            sweep['k'].append(k)
+            sweep['inertia'].append(float(model.inertia_) * n / len(sample))
+            sweep['silhouette'].append(silhouette)
+
+        sweep['complete'] = len(sweep['k']) == len(k_values)
+        sweep['elapsed_ms'] = round(sweep['elapsed_ms'] + (time.perf_counter() - start) * 1000, 1)
+        return {key: list(value) if isinstance(value, list) else value
+                for key, value in sweep.items() if not key.startswith('_')}
+
+
+class NumericPrepCache:
+    """
+    In-memory cache of NumericPrep objects
+
+    Keys are a content hash of the numeric block (values and column names),
+    so any analysis or detector that looks at the same columns of the same
+    upload shares one set of artifacts.
+    """
+
+    def __init__(self, ttl_seconds: int = 3600, max_entries: int = 8):
+        """
+        Initialize cache
+
+        Args:
+            ttl_seconds: Time to live for cached preparations (default: 1 hour)
+            max_entries: Maximum number of datasets to keep (default: 8)
+        """
+        self.cache: Dict[str, Dict[str, Any]] = {}
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, df: pd.DataFrame, columns: Optional[List[str]] = None) -> NumericPrep:
+        """
+        Return the shared preparation for the numeric columns of df
+
+        Args:
+            df: Dataset
+            columns: Numeric columns to use (default: all numeric columns)
+
+        Returns:
+            NumericPrep for the selected columns
+        """
+        block = df[list(columns)] if columns is not None else df.select_dtypes(include=[np.number])
+        key = dataframe_fingerprint(block)
+
+        entry = self.cache.get(key)
+        if entry is not None and time.time() - entry['timestamp'] <= self.ttl_seconds:
+            self.hits += 1
+            logger.info(f"Numeric prep cache HIT: {key[:16]}... ({len(block.columns)} columns)")
+            return entry['prep']
+
+        self.misses += 1
+        # Own copy, so later edits to the caller's DataFrame cannot leak in
+        prep = NumericPrep(block.copy(), key)
+        if len(self.cache) >= self.max_entries:
+            oldest_key = min(self.cache.keys(), key=lambda k: self.cache[k]['timestamp'])
+            del self.cache[oldest_key]
+        self.cache[key] = {'prep': prep, 'timestamp': time.time()}
+        return prep
+
+    def clear(self) -> None:
+        """Clear all cached preparations"""
+        self.cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        return {
+            'entries': len(self.cache),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+# Global numeric preparation cache
+numeric_prep_cache = NumericPrepCache()
+cache_sync.register('numeric_prep', numeric_prep_cache, version=lambda entry: entry['prep'].version())
+
+
+def get_numeric_prep(df: pd.DataFrame, columns: Optional[List[str]] = None) -> NumericPrep:
+    """Shared numeric preparation for df (see NumericPrepCache.get)"""
+    return numeric_prep_cache.get(df, columns)
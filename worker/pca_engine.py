@@ -0,0 +1,196 @@
+"""
+PCA engine for GradStat
+Chooses a decomposition strategy from the shape of the data, keeps the full
+eigenvalue spectrum for the scree plot, and caches decompositions so that
+changing the number of components does not refit. Standardization and the
+correlation matrix come from the shared numeric preparation
+"""
+
+import time
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+from logger_config import logger
+from numeric_prep import NumericPrep
+from cache_manager import cache_sync
+
+# Up to this many columns the p x p covariance matrix is cheap to build and
+# diagonalize, and gives every eigenvalue and component exactly
+COVARIANCE_MAX_FEATURES = 2000
+# Above this many cells the matrix is streamed through IncrementalPCA
+IN_MEMORY_MAX_CELLS = 200_000_000
+# Minimum number of components fitted by the truncated solvers, so that
+# small changes of nComponents are served from the cache
+MIN_TRUNCATED_COMPONENTS = 10
+
+
+def _flip_signs(components: np.ndarray) -> np.ndarray:
+    """Make the largest loading of every component positive (sklearn's convention)"""
+    max_abs = np.argmax(np.abs(components), axis=1)
+    signs = np.sign(components[np.arange(len(components)), max_abs])
+    signs[signs == 0] = 1.0
+    return components * signs[:, None]
+
+
+def _fit_covariance(prep: NumericPrep) -> Dict[str, Any]:
+    """Exact decomposition from the (shared) complete-case correlation matrix"""
+    n = len(prep.complete)
+    # Covariance of the standardized columns; constant columns contribute nothing
+    cov = np.nan_to_num(prep.complete_correlation().to_numpy()) * n / (n - 1)
+    eigenvalues, eigenvectors = np.linalg.eigh(cov)
+    order = np.argsort(eigenvalues)[::-1]
+    eigenvalues = np.clip(eigenvalues[order], 0, None)
+    return {
+        'eigenvalues': eigenvalues,
+        'components': _flip_signs(eigenvectors[:, order].T),
+        'spectrum_complete': True,
+    }
+
+
+def _fit_randomized(prep: NumericPrep, n_fit: int) -> Dict[str, Any]:
+    """Truncated decomposition with randomized SVD on the standardized matrix"""
+    from sklearn.utils.extmath import randomized_svd
+
+    X = prep.standardized()
+    _, singular_values, vt = randomized_svd(X, n_components=n_fit, random_state=0)
+    return {
+        'eigenvalues': singular_values.astype(np.float64) ** 2 / (len(X) - 1),
+        'components': _flip_signs(vt.astype(np.float64)),
+        'spectrum_complete': False,
+    }
+
+
+def _fit_incremental(prep: NumericPrep, n_fit: int) -> Dict[str, Any]:
+    """Truncated decomposition streamed over row chunks with IncrementalPCA"""
+    from sklearn.decomposition import IncrementalPCA
+
+    ipca = IncrementalPCA(n_components=n_fit)
+    for chunk in prep.standardized_chunks(np.float32):
+        if len(chunk) >= n_fit:
+            ipca.partial_fit(chunk)
+    return {
+        'eigenvalues': ipca.explained_variance_.astype(np.float64),
+        'components': _flip_signs(ipca.components_.astype(np.float64)),
+        'spectrum_complete': False,
+    }
+
+
+class PCADecompositionCache:
+    """
+    In-memory cache of PCA decompositions
+
+    Keys are a content hash of the numeric block. Exact (covariance) fits hold
+    every component; truncated fits hold at least MIN_TRUNCATED_COMPONENTS and
+    are refitted only when more components are requested.
+    """
+
+    def __init__(self, ttl_seconds: int = 3600, max_entries: int = 16):
+        """
+        Initialize cache
+
+        Args:
+            ttl_seconds: Time to live for cached decompositions (default: 1 hour)
+            max_entries: Maximum number of decompositions to keep (default: 16)
+        """
+        self.cache: Dict[str, Dict[str, Any]] = {}
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, n_components: int) -> Optional[Dict[str, Any]]:
+        """Return a cached decomposition with at least n_components components"""
+        entry = self.cache.get(key)
+        if entry is None or time.time() - entry['timestamp'] > self.ttl_seconds:
+            return None
+        if len(entry['decomposition']['components']) < n_components:
+            return None
+        self.hits += 1
+        logger.info(f"PCA decomposition cache HIT: {key[:16]}...")
+        return entry['decomposition']
+
+    def set(self, key: str, decomposition: Dict[str, Any]) -> None:
+        """Store a decomposition, evicting the oldest entry when full"""
+        self.misses += 1
+        if key not in self.cache and len(self.cache) >= self.max_entries:
+            oldest_key = min(self.cache.keys(), key=lambda k: self.cache[k]['timestamp'])
+            del self.cache[oldest_key]
+        self.cache[key] = {'decomposition': decomposition, 'timestamp': time.time()}
+
+    def clear(self) -> None:
+        """Clear all cached decompositions"""
+        self.cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        return {
+            'entries': len(self.cache),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+# Global decomposition cache
+pca_cache = PCADecompositionCache()
+cache_sync.register('pca', pca_cache)
+
+
+def fit_pca(prep: NumericPrep, n_components: int) -> Dict[str, Any]:
+    """
+    Decompose the standardized complete cases of a numeric preparation
+
+    The strategy depends on the shape: an exact eigendecomposition of the
+    correlation matrix when there are at most COVARIANCE_MAX_FEATURES columns,
+    otherwise randomized SVD of the standardized matrix, or IncrementalPCA
+    over float32 row chunks for matrices too large to hold in memory.
+
+    Args:
+        prep: Shared numeric preparation (see numeric_prep.get_numeric_prep)
+        n_components: Number of components the caller needs
+
+    Returns:
+        dict with eigenvalues (descending), components (rows), total_variance,
+        spectrum_complete and method
+    """
+    n, p = prep.complete.shape
+    n_components = min(n_components, p)
+
+    cached = pca_cache.get(prep.key, n_components)
+    if cached is not None:
+        return cached
+
+    if n < 2:
+        raise ValueError("Need at least 2 complete rows for PCA")
+
+    if p <= COVARIANCE_MAX_FEATURES:
+        method = 'covariance'
+        decomposition = _fit_covariance(prep)
+    else:
+        n_fit = min(p, n, max(n_components, MIN_TRUNCATED_COMPONENTS))
+        if n * p <= IN_MEMORY_MAX_CELLS:
+            method = 'randomized'
+            decomposition = _fit_randomized(prep, n_fit)
+        else:
+            method = 'incremental'
+            decomposition = _fit_incremental(prep, n_fit)
+
+    # Every non-constant standardized column contributes n / (n - 1) to the trace
+    decomposition.update({
+        'total_variance': int(prep.varying.sum()) * n / (n - 1),
+        'method': method,
+    })
+    logger.info(f"PCA fitted with {method} solver on {n}x{p}")
+    pca_cache.set(prep.key, decomposition)
+    return decomposition
+
+
+def transform(prep: NumericPrep, decomposition: Dict[str, Any], n_components: int) -> np.ndarray:
+    """Project the standardized complete cases onto the first n_components components"""
+    components = decomposition['components'][:n_components].T
+    if decomposition['method'] == 'incremental':
+        # Too large to standardize in memory
+        return np.vstack([chunk @ components.astype(np.float32) for chunk in prep.standardized_chunks(np.float32)])
+    # Chunk by chunk, so the exact path never holds the standardized matrix
+    return np.vstack([chunk @ components for chunk in prep.standardized_chunks()])
@@ -0,0 +1,276 @@
+"""
+Analysis profiles for GradStat
+A background thread samples the Python stack of the analysis every
+PROFILE_INTERVAL_MS and counts the stacks it sees, in the "folded" format
+that flamegraph.pl, speedscope and inferno read. Profiles a client asks for
+(when PROFILING_ENABLED) also trace allocations with tracemalloc, which is
+too slow to leave on. With PROFILE_SLOW_SECONDS set, every analysis is
+sampled and the profiles of those that take longer are kept.
+"""
+
+import os
+import sys
+import hmac
+import json
+import time
+import uuid
+import tempfile
+import threading
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional
+
+from logger_config import logger
+from artifact_store import ArtifactStore, ARTIFACT_DIR
+from metrics import PROFILES_KEPT
+
+# Whether clients may ask for a profile (X-Profile header or "profile" option)
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() in ('true', '1', 'yes')
+# If set, a profile must be asked for with this value in the X-Profile header
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN') or None
+# Keep a sampled profile of every analysis request slower than this (0: off)
+PROFILE_SLOW_SECONDS = float(os.getenv('PROFILE_SLOW_SECONDS', '0'))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '10'))
+PROFILE_DIR = os.getenv('PROFILE_DIR') or os.path.join(ARTIFACT_DIR or tempfile.gettempdir(), 'gradstat-profiles')
+# Most recent profiles kept in PROFILE_DIR
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '100'))
+
+TOP_FUNCTIONS = 20
+TOP_ALLOCATIONS = 15
+
+profile_store = ArtifactStore(PROFILE_DIR)
+
+
+class ProfilingDenied(Exception):
+    """A profile was asked for but profiling is not enabled, or the token is wrong"""
+
+
+def requested(header: Optional[str], option: Any) -> bool:
+    """
+    Whether a request asks for a profile that it may have
+
+    Args:
+        header: X-Profile header value (the token, if PROFILING_TOKEN is set)
+        option: The "profile" analysis option
+
+    Raises:
+        ProfilingDenied: If a profile is asked for but not allowed
+    """
+    if not header and option not in (True, 'true', '1', 1):
+        return False
+    if not PROFILING_ENABLED:
+        raise ProfilingDenied('Profiling is not enabled on this worker (PROFILING_ENABLED)')
+    if PROFILING_TOKEN is not None and not hmac.compare_digest(header or '', PROFILING_TOKEN):
+        raise ProfilingDenied('Profiling needs the X-Profile header to carry the profiling token')
+    return True
+
+
+def _frame_name(code) -> str:
+    """function (dir/file.py:line) of a code object, short enough for flamegraph labels"""
+    path = code.co_filename.replace('\\', '/').split('/')
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread from a background thread
+
+    Stacks are counted by their code objects; names are only formatted
+    when the profile is read, so a sample costs a frame walk and a dict
+    update on the sampling thread and nothing on the sampled one.
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.stacks: Dict[tuple, int] = {}
+        self.samples = 0
+        self._target: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start sampling the calling thread"""
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            if stack:
+                key = tuple(stack)
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+
+    def folded(self) -> List[str]:
+        """Stacks as "root;...;leaf count" lines, most frequent first"""
+        return [f"{';'.join(_frame_name(code) for code in reversed(stack))} {count}"
+                for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1])]
+
+    def top_functions(self, limit: int = TOP_FUNCTIONS) -> List[Dict[str, Any]]:
+        """Functions by share of samples in them (self) and under them (total)"""
+        own: Dict[Any, int] = {}
+        total: Dict[Any, int] = {}
+        for stack, count in self.stacks.items():
+            own[stack[0]] = own.get(stack[0], 0) + count
+            for code in set(stack):
+                total[code] = total.get(code, 0) + count
+        ranked = sorted(total, key=lambda code: (-own.get(code, 0), -total[code]))[:limit]
+        return [{'function': _frame_name(code),
+                 'self_pct': round(100 * own.get(code, 0) / self.samples, 1),
+                 'total_pct': round(100 * total[code] / self.samples, 1)} for code in ranked]
+
+
+class Profile:
+    """
+    Profile of the code run inside the with block (on the calling thread)
+
+    Args:
+        trace_memory: Also trace allocations (peak and the largest
+            allocation sites still held at the end)
+        interval_ms: Sampling interval
+    """
+
+    def __init__(self, trace_memory: bool = False, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.trace_memory = trace_memory
+        self.sampler = StackSampler(interval_ms)
+        self.memory: Optional[Dict[str, Any]] = None
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self._start = (0.0, 0.0)
+        self._traced = False
+
+    def __enter__(self) -> 'Profile':
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._traced = True
+        self._start = (time.perf_counter(), time.process_time())
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.sampler.stop()
+        self.wall_seconds = time.perf_counter() - self._start[0]
+        self.cpu_seconds = time.process_time() - self._start[1]
+        if self._traced:
+            peak = tracemalloc.get_traced_memory()[1]
+            statistics = tracemalloc.take_snapshot().statistics('lineno')[:TOP_ALLOCATIONS]
+            tracemalloc.stop()
+            self.memory = {
+                'peak_mb': round(peak / 2 ** 20, 2),
+                'held_at_end': [{'site': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                                 'mb': round(stat.size / 2 ** 20, 3), 'blocks': stat.count}
+                                for stat in statistics],
+            }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Timings, samples, top functions, memory (if traced) and the folded stacks"""
+        return {
+            'wall_seconds': round(self.wall_seconds, 3),
+            'cpu_seconds': round(self.cpu_seconds, 3),
+            'interval_ms': self.sampler.interval * 1000,
+            'samples': self.sampler.samples,
+            'top_functions': self.sampler.top_functions(),
+            'memory': self.memory,
+            'folded': self.sampler.folded(),
+        }
+
+
+def mode(requested_profile: bool) -> Optional[str]:
+    """How to profile an analysis: 'full' if requested, 'sample' when slow ones are kept, else None"""
+    if requested_profile:
+        return 'full'
+    return 'sample' if PROFILE_SLOW_SECONDS > 0 else None
+
+
+def keep(profile: Dict[str, Any], analysis_type: str, request_seconds: float, requested_profile: bool,
+         details: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Store a profile if it was requested or the request was slow
+
+    Failures are logged, never raised: a profile must not fail its analysis.
+
+    Args:
+        profile: Profile.to_dict() of the analysis
+        analysis_type: Analysis type
+        request_seconds: Duration of the whole request
+        requested_profile: Whether the client asked for the profile
+        details: Further fields to store (e.g. options and cost estimate)
+
+    Returns:
+        dict: Summary of the stored profile (None if it was not kept)
+    """
+    reason = 'requested' if requested_profile else 'slow'
+    if not requested_profile and not (PROFILE_SLOW_SECONDS > 0 and request_seconds >= PROFILE_SLOW_SECONDS):
+        return None
+    profile_id = f"{int(time.time())}-{analysis_type}-{uuid.uuid4().hex[:8]}"
+    folded = profile.pop('folded')
+    summary = {
+        'id': profile_id,
+        'analysis_type': analysis_type,
+        'reason': reason,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'request_seconds': round(request_seconds, 3),
+        'peak_mb': profile['memory']['peak_mb'] if profile.get('memory') else None,
+    }
+    try:
+        profile_store.store_profile(profile_id, {**summary, **(details or {}), **profile}, '\n'.join(folded) + '\n')
+        _prune()
+    except (OSError, ValueError, RuntimeError) as e:
+        logger.warning(f"Could not store profile {profile_id}: {str(e)}")
+        return None
+    PROFILES_KEPT.labels(reason).inc()
+    logger.info(f"Kept {reason} profile {profile_id} ({request_seconds:.1f} s, {profile['samples']} samples)")
+    return summary
+
+
+def _profile_files() -> List[str]:
+    """Paths of the stored profiles, newest first"""
+    try:
+        names = [name for name in os.listdir(PROFILE_DIR) if name.endswith('.profile.json')]
+    except FileNotFoundError:
+        return []
+    paths = [os.path.join(PROFILE_DIR, name) for name in names]
+    return sorted(paths, key=lambda path: os.path.getmtime(path), reverse=True)
+
+
+def _prune() -> None:
+    """Remove all but the PROFILE_KEEP most recent profiles"""
+    for path in _profile_files()[PROFILE_KEEP:]:
+        for stale in (path, path[:-len('.profile.json')] + '.folded'):
+            try:
+                os.unlink(stale)
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(limit: int = 50) -> List[Dict[str, Any]]:
+    """Summaries of the most recent stored profiles"""
+    profiles = []
+    for path in _profile_files()[:limit]:
+        try:
+            with open(path) as f:
+                profile = json.load(f)
+        except (OSError, ValueError):
+            continue
+        profiles.append({key: profile.get(key) for key in
+                         ('id', 'analysis_type', 'reason', 'created', 'request_seconds', 'wall_seconds',
+                          'cpu_seconds', 'samples', 'peak_mb')})
+    return profiles
+
+
+def profile_path(profile_id: str, folded: bool = False) -> Optional[str]:
+    """Path of a stored profile (or of its folded stacks), None if there is none"""
+    if not profile_store.valid_id(profile_id):
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.folded" if folded else f"{profile_id}.profile.json")
+    return path if os.path.exists(path) else None
@@ -0,0 +1,157 @@
+"""
+Analysis progress reporting for GradStat
+Stage events (parse, fit, plots, report) with timings and an ETA learned
+from earlier runs. Code anywhere inside an analysis reports a stage through
+report_stage, which goes to the reporter of the current request (if any).
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Callable, Optional
+
+STAGES = ['parse', 'fit', 'plots', 'report']
+
+_current_reporter: ContextVar[Optional['ProgressReporter']] = ContextVar('progress_reporter', default=None)
+
+
+class StageHistory:
+    """
+    Typical stage durations by analysis type
+
+    Keeps an exponentially weighted average of each stage's duration and of
+    the row count it was measured on; estimates scale linearly with rows.
+    """
+
+    def __init__(self, alpha: float = 0.3):
+        """
+        Args:
+            alpha: Weight of the newest run in the averages
+        """
+        self.alpha = alpha
+        self.averages: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, analysis_type: str, timings: Dict[str, float], n_rows: int) -> None:
+        """Add the stage timings (ms) of a finished run"""
+        with self._lock:
+            averages = self.averages.setdefault(analysis_type, {})
+            for stage, ms in [*timings.items(), ('rows', float(max(n_rows, 1)))]:
+                previous = averages.get(stage)
+                averages[stage] = ms if previous is None else (1 - self.alpha) * previous + self.alpha * ms
+
+    def estimate(self, analysis_type: str, stage: str, n_rows: Optional[int]) -> Optional[float]:
+        """Expected duration (ms) of a stage, or None without history"""
+        averages = self.averages.get(analysis_type, {})
+        if stage not in averages:
+            return None
+        scale = max(n_rows or 1, 1) / averages['rows'] if n_rows else 1.0
+        return averages[stage] * scale
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Average stage durations (ms) and row counts by analysis type"""
+        return {analysis_type: {key: round(value, 1) for key, value in averages.items()}
+                for analysis_type, averages in self.averages.items()}
+
+
+# Global stage history
+stage_history = StageHistory()
+
+
+class ProgressReporter:
+    """
+    Progress of one analysis request
+
+    Stages only move forward (a plot rendered while building the report does
+    not go back to 'plots'); each new stage emits an event with the elapsed
+    time, the durations of the finished stages and the ETA.
+    """
+
+    def __init__(self, emit: Callable[[Dict[str, Any]], None], analysis_type: str,
+                 history: StageHistory = stage_history):
+        """
+        Args:
+            emit: Called with each stage event (from the analysis thread)
+            analysis_type: Analysis being run (keys the stage history)
+            history: Stage history used for ETAs and updated by finish()
+        """
+        self.emit = emit
+        self.analysis_type = analysis_type
+        self.history = history
+        self.start = time.perf_counter()
+        self.current: Optional[str] = None
+        self.stage_start = self.start
+        self.timings: Dict[str, float] = {}
+        self.n_rows: Optional[int] = None
+
+    def _ms(self, since: float) -> float:
+        return round((time.perf_counter() - since) * 1000, 1)
+
+    def stage(self, name: str, **info: Any) -> None:
+        """Enter a stage (ignored if it is the current stage or an earlier one)"""
+        if name not in STAGES or (self.current is not None and STAGES.index(name) <= STAGES.index(self.current)):
+            return
+        if self.current is not None:
+            self.timings[self.current] = self._ms(self.stage_start)
+        self.current = name
+        self.stage_start = time.perf_counter()
+        if info.get('n_rows') is not None:
+            self.n_rows = info['n_rows']
+
+        eta_ms = self.eta_ms()
+        elapsed_ms = self._ms(self.start)
+        if eta_ms is not None:
+            progress = round(100 * elapsed_ms / max(elapsed_ms + eta_ms, 1))
+        else:
+            progress = round(100 * STAGES.index(name) / len(STAGES))
+        self.emit({'stage': name, 'elapsed_ms': elapsed_ms, 'timings': dict(self.timings),
+                   'eta_ms': eta_ms, 'progress': progress, **info})
+
+    def eta_ms(self) -> Optional[float]:
+        """Expected remaining time (ms) of the current and later stages, or None without history"""
+        if self.current is None:
+            return None
+        remaining = 0.0
+        for stage in STAGES[STAGES.index(self.current):]:
+            estimate = self.history.estimate(self.analysis_type, stage, self.n_rows)
+            if estimate is None:
+                return None
+            if stage == self.current:
+                estimate = max(estimate - self._ms(self.stage_start), 0.0)
+            remaining += estimate
+        return round(remaining, 1)
+
+    def finish(self, record: bool = True) -> Dict[str, float]:
+        """
+        Close the current stage
+
+        Args:
+            record: Add the timings to the stage history (skip for cache hits)
+
+        Returns:
+            Stage durations (ms) plus total_ms
+        """
+        if self.current is not None and self.current not in self.timings:
+            self.timings[self.current] = self._ms(self.stage_start)
+        if record and self.timings:
+            self.history.record(self.analysis_type, {stage: self.timings.get(stage, 0.0) for stage in STAGES},
+                                self.n_rows or 1)
+        return {**self.timings, 'total_ms': self._ms(self.start)}
+
+
+@contextmanager
+def reporting(reporter: Optional[ProgressReporter]):
+    """Make reporter the target of report_stage within the block"""
+    token = _current_reporter.set(reporter)
+    try:
+        yield reporter
+    finally:
+        _current_reporter.reset(token)
+
+
+def report_stage(name: str, **info: Any) -> None:
+    """Report a stage to the current request's reporter (no-op outside a reporting block)"""
+    reporter = _current_reporter.get()
+    if reporter is not None:
+        reporter.stage(name, **info)
@@ -0,0 +1,145 @@
+"""
+Compact LLM prompt context for GradStat
+Summarizes analysis results within a token budget (plot payloads dropped,
+arrays truncated, numbers rounded), windows long conversation histories and
+estimates prompt token counts
+"""
+
+import os
+import json
+import math
+from typing import Dict, List, Any, Optional
+
+# Token budgets of the results/assumptions summary and of the conversation history
+CONTEXT_TOKEN_BUDGET = int(os.getenv('LLM_CONTEXT_TOKENS', '1200'))
+HISTORY_TOKEN_BUDGET = int(os.getenv('LLM_HISTORY_TOKENS', '800'))
+
+# Result fields that never help the model: rendered plots, code, report archives
+DROPPED_KEYS = {'plots', 'plot', 'charts', 'images', 'figures', 'code_snippet', 'report_zip'}
+
+# Strings longer than this are payloads (base64 images, embedded files), not text
+MAX_TEXT_CHARS = 400
+
+# Successively tighter (items per list, nesting depth, significant digits)
+# tried until the summary fits the budget
+_COMPACTION_LEVELS = [(8, 5, 4), (4, 4, 4), (3, 3, 3), (2, 2, 3)]
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding('cl100k_base')
+except (ImportError, ValueError):
+    _ENCODING = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Token count of text (tiktoken when installed, otherwise ~4 characters per token)"""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """Estimated prompt tokens of chat messages (content plus a few per message)"""
+    return sum(estimate_tokens(message.get('content') or '') + 4 for message in messages)
+
+
+def _compact(value: Any, max_items: int, depth: int, digits: int) -> Any:
+    """Compact copy of a result value at one compaction level"""
+    if isinstance(value, float):
+        return float(f"{value:.{digits}g}") if math.isfinite(value) else None
+    if isinstance(value, str):
+        if len(value) > MAX_TEXT_CHARS:
+            return value[:120] + f"... [{len(value)} chars omitted]" if ' ' in value[:200] else "[payload omitted]"
+        return value
+    if isinstance(value, dict):
+        if depth <= 0:
+            return f"{{{len(value)} fields}}"
+        compacted = {}
+        for key, item in value.items():
+            if str(key).lower() in DROPPED_KEYS:
+                continue
+            compacted[key] = _compact(item, max_items, depth - 1, digits)
+        return compacted
+    if isinstance(value, (list, tuple)):
+        if depth <= 0:
+            return f"[{len(value)} items]"
+        items = [_compact(item, max_items, depth - 1, digits) for item in value[:max_items]]
+        if len(value) > max_items:
+            # Matrices keep their shape visible
+            if value and isinstance(value[0], (list, tuple)):
+                items.append(f"... {len(value)} x {len(value[0])} total")
+            else:
+                items.append(f"... {len(value) - max_items} more")
+        return items
+    if hasattr(value, 'tolist'):
+        # NumPy arrays and scalars
+        return _compact(value.tolist(), max_items, depth, digits)
+    return value
+
+
+def compact_json(value: Any, token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Compact JSON summary of analysis results within a token budget
+
+    Plot payloads and code are dropped, long strings and arrays truncated
+    and numbers rounded, tightening step by step until the summary fits;
+    if it still does not, it is cut off with a note.
+
+    Args:
+        value: Results (or assumptions) to summarize
+        token_budget: Maximum tokens of the summary
+
+    Returns:
+        str: Compact JSON text
+    """
+    text = ''
+    for max_items, depth, digits in _COMPACTION_LEVELS:
+        text = json.dumps(_compact(value, max_items, depth, digits), separators=(',', ':'), default=str)
+        if estimate_tokens(text) <= token_budget:
+            return text
+    limit = token_budget * 4
+    return text[:limit] + ' ... [truncated]'
+
+
+def window_history(history: Optional[List[Dict[str, str]]],
+                   token_budget: int = HISTORY_TOKEN_BUDGET,
+                   max_messages: int = 6) -> List[Dict[str, str]]:
+    """
+    Recent conversation within a token budget
+
+    The newest messages (at most max_messages) are kept whole while they
+    fit; older questions are summarized in one note so the model knows
+    what was already discussed. Earlier answers are left out.
+
+    Args:
+        history: Conversation messages, oldest first
+        token_budget: Maximum tokens of the returned messages
+        max_messages: Maximum messages kept verbatim
+
+    Returns:
+        List of messages to send
+    """
+    if not history:
+        return []
+
+    kept: List[Dict[str, str]] = []
+    used = 0
+    for message in reversed(history[-max_messages:]):
+        tokens = estimate_tokens(message.get('content') or '') + 4
+        if used + tokens > token_budget:
+            break
+        kept.insert(0, message)
+        used += tokens
+
+    # Keep the exchange structure: do not start with an orphaned answer
+    while kept and kept[0].get('role') == 'assistant':
+        used -= estimate_tokens(kept.pop(0).get('content') or '') + 4
+
+    earlier = history[:len(history) - len(kept)]
+    questions = [m.get('content', '') for m in earlier if m.get('role') == 'user']
+    if questions:
+        listed = '; '.join(q if len(q) <= 80 else q[:77] + '...' for q in questions[-5:])
+        note = f"(Earlier in this conversation the user asked: {listed})"
+        if used + estimate_tokens(note) <= token_budget:
+            kept.insert(0, {'role': 'user', 'content': note})
+    return kept
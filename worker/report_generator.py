@@ -2,75 +2,54 @@
 Report generation utilities for GradStat
 """
 
-import os
+import io
 import json
 import base64
 import zipfile
 from pathlib import Path
 from datetime import datetime
+from typing import Union
 import nbformat as nbf
 from jinja2 import Template
 import pandas as pd
 
-def generate_report_package(results: dict, df: pd.DataFrame, opts: dict) -> str:
-    """Generate a ZIP package with report, notebook, and results"""
-    
-    # Create temporary directory for report files
-    import tempfile
-    temp_dir = tempfile.mkdtemp()
-    
-    # Generate HTML report
-    html_content = generate_html_report(results, opts)
-    html_path = os.path.join(temp_dir, 'report.html')
-    with open(html_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
-    
-    # Generate Jupyter notebook
-    notebook = generate_jupyter_notebook(results, opts)
-    notebook_path = os.path.join(temp_dir, 'analysis.ipynb')
-    with open(notebook_path, 'w', encoding='utf-8') as f:
-        nbf.write(notebook, f)
-    
-    # Save results JSON
-    results_path = os.path.join(temp_dir, 'results.json')
-    with open(results_path, 'w', encoding='utf-8') as f:
-        json.dump(results, f, indent=2, default=str)
-    
-    # Save plots as separate images
-    images_dir = os.path.join(temp_dir, 'images')
-    os.makedirs(images_dir, exist_ok=True)
-    
-    if 'plots' in results:
-        for i, plot in enumerate(results['plots']):
-            if 'base64' in plot:
-                img_data = base64.b64decode(plot['base64'])
-                img_path = os.path.join(images_dir, f'plot_{i+1}.png')
-                with open(img_path, 'wb') as f:
-                    f.write(img_data)
-    
-    # Create ZIP file
-    zip_path = os.path.join(temp_dir, 'report.zip')
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        zipf.write(html_path, 'report.html')
-        zipf.write(notebook_path, 'analysis.ipynb')
-        zipf.write(results_path, 'results.json')
-        
-        # Add images
-        for root, dirs, files in os.walk(images_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.join('images', file)
-                zipf.write(file_path, arcname)
-    
-    # Read ZIP and convert to base64
-    with open(zip_path, 'rb') as f:
-        zip_base64 = base64.b64encode(f.read()).decode('utf-8')
-    
-    # Cleanup
-    import shutil
-    shutil.rmtree(temp_dir)
+def generate_report_package(results: dict, df: pd.DataFrame, opts: dict, encode: bool = True) -> Union[str, bytes]:
+    """
+    Generate a ZIP package with report, notebook, and results
+
+    Returns the ZIP base64-encoded, or its raw bytes with encode=False
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        _write_report_files(zipf, results, opts)
+    if not encode:
+        return buffer.getvalue()
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+def generate_batch_report_package(entries: list, summary: dict) -> str:
+    """
+    Generate one ZIP package for a batch of analyses
+
+    Every successful entry gets its own folder (report, notebook, results and
+    images, as in generate_report_package); summary.json at the top level
+    lists the status and timing of all entries.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for entry in entries:
+            _write_report_files(zipf, entry['results'], entry['options'], prefix=f"{entry['request_id']}/")
+        zipf.writestr('summary.json', json.dumps(summary, indent=2, default=str))
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+def _write_report_files(zipf: zipfile.ZipFile, results: dict, opts: dict, prefix: str = '') -> None:
+    """Write report.html, analysis.ipynb, results.json and plot images into an open ZIP"""
+    zipf.writestr(f'{prefix}report.html', generate_html_report(results, opts))
+    zipf.writestr(f'{prefix}analysis.ipynb', nbf.writes(generate_jupyter_notebook(results, opts)))
+    zipf.writestr(f'{prefix}results.json', json.dumps(results, indent=2, default=str))
     
-    return zip_base64
+    for i, plot in enumerate(results.get('plots', [])):
+        if 'base64' in plot:
+            zipf.writestr(f'{prefix}images/plot_{i+1}.png', base64.b64decode(plot['base64']))
 
 def generate_html_report(results: dict, opts: dict) -> str:
     """Generate HTML report from results"""
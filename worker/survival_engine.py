@@ -0,0 +1,251 @@
+"""
+Survival analysis engine for GradStat
+Computes grouped Kaplan-Meier curves and the k-group log-rank test from a
+single sort of the duration column, and caches Cox regression fits
+"""
+
+import time
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from logger_config import logger
+from cache_manager import dataframe_fingerprint, cache_sync
+
+
+def kaplan_meier_groups(durations, events, groups=None, alpha: float = 0.05) -> Dict[str, Any]:
+    """
+    Compute Kaplan-Meier estimates for every group in one pass
+
+    The data are sorted once by duration. Deaths and exits per (time, group)
+    cell are counted with a single bincount, and the at-risk sets are
+    obtained from reversed cumulative sums instead of boolean masks per group.
+
+    Args:
+        durations: Array-like of follow-up times
+        events: Array-like of event indicators (1=event, 0=censored)
+        groups: Optional array-like of group labels (None = single 'Overall' group)
+        alpha: Significance level for the pointwise confidence band
+
+    Returns:
+        dict with the shared timeline, group labels, and per-time matrices
+        (n_at_risk, n_events, survival, ci_lower, ci_upper), each of shape
+        (n_times, n_groups)
+    """
+    durations = np.asarray(durations, dtype=float)
+    events = np.asarray(events, dtype=int)
+
+    if groups is None:
+        codes = np.zeros(len(durations), dtype=np.intp)
+        labels = ['Overall']
+    else:
+        # Preserve order of first appearance to match df[col].unique()
+        codes, uniques = pd.factorize(pd.Series(groups).reset_index(drop=True), sort=False)
+        labels = [str(u) for u in uniques]
+
+    order = np.argsort(durations, kind='mergesort')
+    durations = durations[order]
+    events = events[order]
+    codes = codes[order]
+
+    timeline, time_idx = np.unique(durations, return_inverse=True)
+    n_times = len(timeline)
+    n_groups = len(labels)
+
+    cell = time_idx * n_groups + codes
+    n_cells = n_times * n_groups
+    removed = np.bincount(cell, minlength=n_cells).reshape(n_times, n_groups)
+    deaths = np.bincount(cell, weights=events, minlength=n_cells).reshape(n_times, n_groups)
+
+    # Subjects still at risk just before each time = exits at or after it
+    at_risk = np.cumsum(removed[::-1], axis=0)[::-1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hazard = np.where(at_risk > 0, deaths / at_risk, 0.0)
+        survival = np.cumprod(1.0 - hazard, axis=0)
+
+        # Exponential Greenwood confidence interval (same as lifelines default)
+        greenwood = np.where(at_risk > deaths, deaths / (at_risk * (at_risk - deaths)), 0.0)
+        greenwood = np.cumsum(greenwood, axis=0)
+        z = stats.norm.ppf(1 - alpha / 2)
+        log_s = np.log(survival)
+        spread = z * np.sqrt(greenwood) / log_s
+        ci_lower = np.exp(-np.exp(np.log(-log_s) - spread))
+        ci_upper = np.exp(-np.exp(np.log(-log_s) + spread))
+
+    # Before the first event S=1 and the band collapses onto the estimate
+    ci_lower = np.where(np.isfinite(ci_lower), ci_lower, survival)
+    ci_upper = np.where(np.isfinite(ci_upper), ci_upper, survival)
+
+    return {
+        'timeline': timeline,
+        'labels': labels,
+        'n_at_risk': at_risk,
+        'n_events': deaths,
+        'n_removed': removed,
+        'survival': survival,
+        'ci_lower': ci_lower,
+        'ci_upper': ci_upper,
+        'group_n': removed.sum(axis=0).astype(int),
+        'group_events': deaths.sum(axis=0).astype(int),
+    }
+
+
+def median_survival(km: Dict[str, Any], group_idx: int = 0) -> Optional[float]:
+    """
+    Median survival time for one group
+
+    Returns the first time at which survival drops to 0.5 or below,
+    or None if the curve never reaches it.
+    """
+    below = np.nonzero(km['survival'][:, group_idx] <= 0.5)[0]
+    if len(below) == 0:
+        return None
+    return float(km['timeline'][below[0]])
+
+
+def survival_at(km: Dict[str, Any], times, group_idx: int = 0) -> np.ndarray:
+    """Evaluate the right-continuous step function of one group at the given times"""
+    idx = np.searchsorted(km['timeline'], np.asarray(times, dtype=float), side='right') - 1
+    curve = km['survival'][:, group_idx]
+    return np.where(idx >= 0, curve[np.clip(idx, 0, None)], 1.0)
+
+
+def logrank_test_k(km: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Log-rank test for k >= 2 groups from precomputed risk sets
+
+    Uses observed-minus-expected event counts and the hypergeometric
+    covariance summed over all distinct times. For two groups this is the
+    classic log-rank test.
+
+    Args:
+        km: Output of kaplan_meier_groups
+
+    Returns:
+        dict with test_statistic, p_value, degrees_of_freedom and per-group
+        observed/expected event counts
+    """
+    d = km['n_events']
+    n = km['n_at_risk'].astype(float)
+    d_tot = d.sum(axis=1)
+    n_tot = n.sum(axis=1)
+    k = d.shape[1]
+
+    keep = (d_tot > 0) & (n_tot > 0)
+    d, n, d_tot, n_tot = d[keep], n[keep], d_tot[keep], n_tot[keep]
+
+    share = n / n_tot[:, None]
+    expected = d_tot[:, None] * share
+    observed_minus_expected = (d - expected).sum(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.where(n_tot > 1, d_tot * (n_tot - d_tot) / (n_tot - 1), 0.0)
+    # V_gh = sum_t scale_t * share_g (delta_gh - share_h)
+    weighted = share * scale[:, None]
+    covariance = np.diag(weighted.sum(axis=0)) - weighted.T @ share
+
+    # Drop the last group: the full covariance matrix is singular
+    oe = observed_minus_expected[:k - 1]
+    v = covariance[:k - 1, :k - 1]
+    try:
+        statistic = float(oe @ np.linalg.solve(v, oe))
+    except np.linalg.LinAlgError:
+        statistic = float(oe @ np.linalg.pinv(v) @ oe)
+
+    dof = k - 1
+    p_value = float(stats.chi2.sf(statistic, dof))
+
+    return {
+        'test_statistic': statistic,
+        'p_value': p_value,
+        'degrees_of_freedom': dof,
+        'observed': d.sum(axis=0),
+        'expected': expected.sum(axis=0),
+    }
+
+
+class CoxFitCache:
+    """
+    In-memory cache of fitted Cox proportional hazards models
+
+    Keys combine a content hash of the model data with the covariate set,
+    so re-running a survival analysis with different plot options reuses
+    the previous fit instead of refitting.
+    """
+
+    def __init__(self, ttl_seconds: int = 3600, max_entries: int = 32):
+        """
+        Initialize cache
+
+        Args:
+            ttl_seconds: Time to live for cached fits (default: 1 hour)
+            max_entries: Maximum number of fits to keep (default: 32)
+        """
+        self.cache: Dict[str, Dict[str, Any]] = {}
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def _generate_key(self, cox_data: pd.DataFrame, covariates: List[str]) -> str:
+        return dataframe_fingerprint(cox_data) + ':' + ','.join(sorted(covariates))
+
+    def fit(self, cox_data: pd.DataFrame, duration_col: str, event_col: str,
+            covariates: List[str]):
+        """
+        Return a fitted CoxPHFitter, fitting only on a cache miss
+
+        Args:
+            cox_data: DataFrame containing duration, event and covariate columns
+            duration_col: Name of the duration column
+            event_col: Name of the event column
+            covariates: Covariates included in the model
+
+        Returns:
+            Fitted lifelines CoxPHFitter
+        """
+        from lifelines import CoxPHFitter
+
+        key = self._generate_key(cox_data, covariates)
+        entry = self.cache.get(key)
+        if entry is not None and time.time() - entry['timestamp'] <= self.ttl_seconds:
+            self.hits += 1
+            logger.info(f"Cox fit cache HIT: {key[:16]}... ({','.join(covariates)})")
+            return entry['model']
+
+        self.misses += 1
+        cph = CoxPHFitter()
+        cph.fit(cox_data, duration_col=duration_col, event_col=event_col)
+
+        if len(self.cache) >= self.max_entries:
+            oldest_key = min(self.cache.keys(), key=lambda k: self.cache[k]['timestamp'])
+            del self.cache[oldest_key]
+        self.cache[key] = {'model': cph, 'timestamp': time.time()}
+        return cph
+
+    def clear(self) -> None:
+        """Clear all cached fits"""
+        self.cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        return {
+            'entries': len(self.cache),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+# Global Cox fit cache
+cox_fit_cache = CoxFitCache()
+cache_sync.register('cox_fit', cox_fit_cache)
+
+
+def fit_cox_cached(cox_data: pd.DataFrame, duration_col: str, event_col: str,
+                   covariates: List[str]):
+    """Fit (or reuse) a Cox model for the given data and covariate set"""
+    return cox_fit_cache.fit(cox_data, duration_col, event_col, covariates)
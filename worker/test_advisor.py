@@ -5,8 +5,9 @@ Helps users select the appropriate statistical test based on their research ques
 
 from typing import Dict, List, Any
 import pandas as pd
-from scipy import stats
-from analysis_functions import convert_to_python_types
+from fast_json import convert_to_python_types
+from numeric_prep import get_numeric_prep, SWEEP_TIME_BUDGET
+from dataset_profile import get_dataset_profile
 
 
 def recommend_test(answers: Dict[str, Any]) -> List[Dict[str, Any]]:
@@ -229,35 +230,34 @@ def auto_detect_from_data(df: pd.DataFrame) -> Dict[str, Any]:
     Returns:
         Dictionary with data characteristics
     """
+    profile = get_dataset_profile(df)
+    
     characteristics = {
-        'n_rows': len(df),
-        'n_columns': len(df.columns),
+        'n_rows': profile.n_rows,
+        'n_columns': profile.n_columns,
         'column_types': {}
     }
     
     # Analyze each column
-    for col in df.columns:
+    for col in profile.columns:
         col_info = {
             'name': col,
-            'n_unique': int(df[col].nunique()),
-            'has_missing': bool(df[col].isnull().any())
+            'n_unique': profile.n_unique[col],
+            'has_missing': profile.has_missing[col]
         }
         
         # Classify column type
-        if df[col].dtype in ['int64', 'float64']:
+        if col in profile.numeric64_columns:
             col_info['type'] = 'continuous'
             
             # Check normality if enough data
-            if len(df[col].dropna()) >= 20:
-                try:
-                    _, p_value = stats.shapiro(df[col].dropna().sample(min(5000, len(df[col].dropna()))))
-                    col_info['is_normal'] = bool(p_value > 0.05)
-                except:
-                    col_info['is_normal'] = None
+            normality = profile.normality[col]
+            if normality['n'] >= 20:
+                col_info['is_normal'] = normality['is_normal']
                 
-        elif df[col].nunique() <= 10:
+        elif profile.n_unique[col] <= 10:
             col_info['type'] = 'categorical'
-            col_info['is_binary'] = bool(df[col].nunique() == 2)
+            col_info['is_binary'] = profile.n_unique[col] == 2
         else:
             col_info['type'] = 'text'
         
@@ -273,8 +273,9 @@ def detect_variable_types(df: pd.DataFrame) -> Dict:
     Returns:
         Dictionary with var1Type, var2Type, and details
     """
-    numeric_cols = df.select_dtypes(include=['float64', 'int64', 'int32', 'float32']).columns
-    categorical_cols = df.select_dtypes(include=['object', 'category']).columns
+    profile = get_dataset_profile(df)
+    numeric_cols = profile.numeric_columns
+    categorical_cols = profile.categorical_columns
     
     n_numeric = len(numeric_cols)
     n_categorical = len(categorical_cols)
@@ -333,7 +334,7 @@ def detect_num_predictors(df: pd.DataFrame) -> Dict:
     Returns:
         Dictionary with nPredictors and details
     """
-    numeric_cols = df.select_dtypes(include=['float64', 'int64', 'int32', 'float32']).columns
+    numeric_cols = get_dataset_profile(df).numeric_columns
     
     # Exclude likely ID columns
     predictor_cols = [col for col in numeric_cols 
@@ -362,6 +363,9 @@ def analyze_dataset_comprehensive(df: pd.DataFrame) -> Dict:
     """
     Analyze entire dataset and answer ALL wizard questions at once
     
+    The dataset is profiled once (see dataset_profile); every question
+    below is answered from that cached profile.
+    
     Args:
         df: DataFrame to analyze
         
@@ -383,6 +387,8 @@ def analyze_dataset_comprehensive(df: pd.DataFrame) -> Dict:
         'details': {}
     }
     
+    get_dataset_profile(df)
+    
     # 1. Test Normality (Compare Groups)
     try:
         normality_result = auto_detect_answer(df, 'isNormal')
@@ -507,52 +513,22 @@ def auto_detect_answer(df: pd.DataFrame, question_key: str) -> Dict[str, Any]:
         Dictionary with answer, confidence, and explanation
     """
     
+    profile = get_dataset_profile(df)
+    
     if question_key == 'isNormal':
-        # Log DataFrame info for debugging
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.info(f"DataFrame shape: {df.shape}")
-        logger.info(f"DataFrame columns: {list(df.columns)}")
-        logger.info(f"DataFrame dtypes: {df.dtypes.to_dict()}")
-        
-        # Test normality on numeric columns
-        numeric_cols = df.select_dtypes(include=['float64', 'int64', 'int32', 'float32']).columns
-        logger.info(f"Numeric columns found: {list(numeric_cols)}")
+        # Normality of the numeric columns (Shapiro-Wilk, from the profile)
+        numeric_cols = profile.numeric_columns
         
         if len(numeric_cols) == 0:
-            # Try to get all column types for debugging
-            col_types = {col: str(df[col].dtype) for col in df.columns}
+            col_types = dict(profile.dtypes)
             return {
                 'answer': None,
                 'confidence': 'low',
                 'explanation': f'No numeric columns found in your data. Column types detected: {col_types}',
-                'details': {'column_types': col_types, 'shape': df.shape}
+                'details': {'column_types': col_types, 'shape': (profile.n_rows, profile.n_columns)}
             }
         
-        normality_results = {}
-        for col in numeric_cols:
-            clean_data = df[col].dropna()
-            if len(clean_data) >= 3:  # Minimum 3 observations for Shapiro-Wilk
-                try:
-                    _, p_value = stats.shapiro(clean_data.sample(min(5000, len(clean_data))))
-                    normality_results[col] = {
-                        'is_normal': bool(p_value > 0.05),
-                        'p_value': float(p_value),
-                        'test': 'Shapiro-Wilk',
-                        'n': len(clean_data)
-                    }
-                except Exception as e:
-                    normality_results[col] = {
-                        'is_normal': None,
-                        'error': str(e),
-                        'n': len(clean_data)
-                    }
-            else:
-                normality_results[col] = {
-                    'is_normal': None,
-                    'error': f'Insufficient data: only {len(clean_data)} observations',
-                    'n': len(clean_data)
-                }
+        normality_results = {col: dict(profile.normality[col]) for col in numeric_cols}
         
         # Determine overall answer
         valid_results = [r for r in normality_results.values() if 'is_normal' in r and r['is_normal'] is not None]
@@ -596,7 +572,7 @@ def auto_detect_answer(df: pd.DataFrame, question_key: str) -> Dict[str, Any]:
     
     elif question_key == 'nGroups':
         # Detect number of groups from categorical columns
-        categorical_cols = df.select_dtypes(include=['object', 'category']).columns
+        categorical_cols = profile.categorical_columns
         
         if len(categorical_cols) == 0:
             # Default to 2 groups if no categorical columns found
@@ -610,7 +586,7 @@ def auto_detect_answer(df: pd.DataFrame, question_key: str) -> Dict[str, Any]:
         # Use the categorical column with most reasonable number of groups (2-10)
         group_counts = {}
         for col in categorical_cols:
-            n_unique = df[col].nunique()
+            n_unique = profile.n_unique[col]
             if 2 <= n_unique <= 10:
                 group_counts[col] = n_unique
         
@@ -632,24 +608,17 @@ def auto_detect_answer(df: pd.DataFrame, question_key: str) -> Dict[str, Any]:
             'explanation': f"✅ Detected {n_groups} groups in column '{best_col}'",
             'details': {
                 'column': best_col,
-                'groups': df[best_col].unique().tolist()
+                'groups': list(profile.uniques[best_col])
             }
         }
     
     elif question_key == 'isPaired':
         try:
-            # Check for paired data structure
-            has_id_column = any('id' in col.lower() or 'subject' in col.lower() or 'patient' in col.lower() 
-                               for col in df.columns)
-            has_time_column = any('time' in col.lower() or 'visit' in col.lower() or 'period' in col.lower() 
-                                 or 'pre' in col.lower() or 'post' in col.lower()
-                                 for col in df.columns)
-            
-            # Check if we have duplicate IDs (indicating repeated measures)
-            id_cols = [col for col in df.columns if 'id' in col.lower() or 'subject' in col.lower()]
-            has_duplicates = False
-            if id_cols:
-                has_duplicates = bool(df[id_cols[0]].duplicated().any())
+            # Check for paired data structure (ID and time columns by name,
+            # duplicate IDs indicating repeated measures)
+            has_id_column = profile.has_id_column
+            has_time_column = profile.has_time_column
+            has_duplicates = profile.id_has_duplicates
             
             if has_id_column and (has_time_column or has_duplicates):
                 return {
@@ -682,8 +651,8 @@ def auto_detect_answer(df: pd.DataFrame, question_key: str) -> Dict[str, Any]:
     
     elif question_key == 'outcomeType':
         # Detect outcome variable type
-        numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns
-        categorical_cols = df.select_dtypes(include=['object', 'category']).columns
+        numeric_cols = profile.numeric64_columns
+        categorical_cols = profile.categorical_columns
         
         # Look for likely outcome variables (usually last column or contains certain keywords)
         outcome_keywords = ['outcome', 'result', 'score', 'value', 'target', 'y', 'dependent']
@@ -705,13 +674,13 @@ def auto_detect_answer(df: pd.DataFrame, question_key: str) -> Dict[str, Any]:
                 'details': {'column': likely_outcome, 'type': 'continuous'}
             }
         elif likely_outcome in categorical_cols:
-            n_unique = df[likely_outcome].nunique()
+            n_unique = profile.n_unique[likely_outcome]
             if n_unique == 2:
                 return {
                     'answer': 'binary',
                     'confidence': 'high',
                     'explanation': f"✅ Detected binary outcome variable: '{likely_outcome}' (2 categories)",
-                    'details': {'column': likely_outcome, 'type': 'binary', 'categories': df[likely_outcome].unique().tolist()}
+                    'details': {'column': likely_outcome, 'type': 'binary', 'categories': list(profile.uniques[likely_outcome])}
                 }
             else:
                 return {
@@ -757,21 +726,24 @@ def detect_time_event_columns(df: pd.DataFrame) -> Dict:
     }
     
     try:
+        profile = get_dataset_profile(df)
+        stats = profile.numeric_stats
+        
         # Detect time column (numeric, likely named with time-related keywords)
         time_keywords = ['time', 'duration', 'days', 'months', 'years', 'survival', 'followup', 'follow_up']
-        numeric_cols = df.select_dtypes(include=['int64', 'float64', 'int32', 'float32']).columns
+        numeric_cols = profile.numeric_columns
         
         time_candidates = []
         for col in numeric_cols:
             col_lower = col.lower()
             if any(keyword in col_lower for keyword in time_keywords):
                 time_candidates.append((col, 'high'))
-            elif df[col].min() >= 0 and df[col].max() > 0:  # Positive values
+            elif stats.at[col, 'min'] >= 0 and stats.at[col, 'max'] > 0:  # Positive values
                 time_candidates.append((col, 'medium'))
         
         if time_candidates:
             # Prefer high confidence matches
-            time_candidates.sort(key=lambda x: (x[1] == 'high', df[x[0]].mean()), reverse=True)
+            time_candidates.sort(key=lambda x: (x[1] == 'high', stats.at[x[0], 'mean']), reverse=True)
             result['time_column'] = time_candidates[0][0]
             result['confidence']['time_column'] = time_candidates[0][1]
             result['details']['time_column_candidates'] = [c[0] for c in time_candidates]
@@ -780,13 +752,13 @@ def detect_time_event_columns(df: pd.DataFrame) -> Dict:
         event_keywords = ['event', 'status', 'censored', 'death', 'died', 'outcome', 'occurred']
         
         event_candidates = []
-        for col in df.columns:
+        for col in profile.columns:
             col_lower = col.lower()
-            n_unique = df[col].nunique()
+            n_unique = profile.n_unique[col]
             
             # Binary column (0/1 or True/False)
             if n_unique == 2:
-                unique_vals = sorted(df[col].unique())
+                unique_vals = sorted(profile.uniques[col])
                 # Check if it's 0/1 or boolean
                 if (set(unique_vals) == {0, 1} or 
                     set(unique_vals) == {False, True} or
@@ -805,17 +777,17 @@ def detect_time_event_columns(df: pd.DataFrame) -> Dict:
             
             # Calculate censoring percentage
             event_col = result['event_column']
-            censored_count = (df[event_col] == 0).sum()
-            total_count = len(df)
+            censored_count = profile.zero_counts[event_col]
+            total_count = profile.n_rows
             censoring_pct = (censored_count / total_count) * 100
             result['details']['censoring_pct'] = float(censoring_pct)
         
         # Detect group columns (categorical with 2-5 unique values)
-        categorical_cols = df.select_dtypes(include=['object', 'category']).columns
+        categorical_cols = profile.categorical_columns
         
         group_candidates = []
         for col in categorical_cols:
-            n_unique = df[col].nunique()
+            n_unique = profile.n_unique[col]
             if 2 <= n_unique <= 5:
                 group_candidates.append(col)
         
@@ -876,8 +848,9 @@ def detect_pca_options(df: pd.DataFrame) -> Dict:
     }
     
     try:
-        # Get numeric columns
-        numeric_cols = df.select_dtypes(include=['int64', 'float64', 'int32', 'float32']).columns
+        # Get numeric columns (shared preparation with the analyses)
+        prep = get_numeric_prep(df)
+        numeric_cols = prep.columns
         n_vars = len(numeric_cols)
         result['n_numeric_vars'] = n_vars
         
@@ -891,9 +864,9 @@ def detect_pca_options(df: pd.DataFrame) -> Dict:
         result['confidence']['n_components'] = 'high' if n_vars >= 5 else 'medium'
         
         # Check if scaling is needed (variance ratio > 10)
-        numeric_data = df[numeric_cols].dropna()
+        numeric_data = prep.complete
         if len(numeric_data) > 0:
-            variances = numeric_data.var()
+            variances = prep.moments(complete=True)['var']
             max_var = variances.max()
             min_var = variances.min()
             
@@ -904,7 +877,7 @@ def detect_pca_options(df: pd.DataFrame) -> Dict:
                 result['details']['variance_ratio'] = float(variance_ratio)
             
             # Calculate correlation strength
-            corr_matrix = numeric_data.corr()
+            corr_matrix = prep.complete_correlation()
             # Get upper triangle (excluding diagonal)
             upper_tri = corr_matrix.where(np.triu(np.ones(corr_matrix.shape), k=1).astype(bool))
             avg_corr = abs(upper_tri.stack()).mean()
@@ -936,8 +909,6 @@ def detect_clustering_options(df: pd.DataFrame) -> Dict:
         Dictionary with suggested clustering options
     """
     import numpy as np
-    from sklearn.preprocessing import StandardScaler
-    from sklearn.cluster import KMeans
     import logging
     logger = logging.getLogger(__name__)
     
@@ -955,8 +926,9 @@ def detect_clustering_options(df: pd.DataFrame) -> Dict:
     }
     
     try:
-        # Get numeric columns
-        numeric_cols = df.select_dtypes(include=['int64', 'float64', 'int32', 'float32']).columns
+        # Get numeric columns (shared preparation with the analyses)
+        prep = get_numeric_prep(df)
+        numeric_cols = prep.columns
         n_vars = len(numeric_cols)
         result['n_numeric_vars'] = n_vars
         
@@ -965,13 +937,13 @@ def detect_clustering_options(df: pd.DataFrame) -> Dict:
             return result
         
         # Prepare data
-        numeric_data = df[numeric_cols].dropna()
+        numeric_data = prep.complete
         if len(numeric_data) < 10:
             result['details']['warning'] = 'Need at least 10 observations for clustering'
             return result
         
         # Check scaling needed
-        variances = numeric_data.var()
+        variances = prep.moments(complete=True)['var']
         max_var = variances.max()
         min_var = variances.min()
         if min_var > 0:
@@ -980,8 +952,7 @@ def detect_clustering_options(df: pd.DataFrame) -> Dict:
             result['details']['variance_ratio'] = float(variance_ratio)
         
         # Scale data for analysis
-        scaler = StandardScaler()
-        scaled_data = scaler.fit_transform(numeric_data)
+        scaled_data = prep.standardized()
         
         # Detect outliers using IQR method
         Q1 = np.percentile(scaled_data, 25, axis=0)
@@ -1004,15 +975,15 @@ def detect_clustering_options(df: pd.DataFrame) -> Dict:
             result['suggested_algorithm'] = 'kmeans'
             result['confidence']['algorithm'] = 'high'
         
-        # Suggest k using elbow method (quick version)
+        # Suggest k using elbow method on the shared quick k-means sweep
+        # (sampled and time-boxed; the clustering analysis reuses it)
         if result['suggested_algorithm'] in ['kmeans', 'hierarchical']:
-            inertias = []
+            sweep = prep.k_sweep(time_budget=SWEEP_TIME_BUDGET)
             k_range = range(2, min(11, n_samples // 10))
-            
-            for k in k_range:
-                kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-                kmeans.fit(scaled_data)
-                inertias.append(kmeans.inertia_)
+            k_values = [k for k in sweep['k'] if k in k_range]
+            inertias = [inertia for k, inertia in zip(sweep['k'], sweep['inertia']) if k in k_range]
+            result['details']['k_sweep'] = {key: sweep[key] for key in
+                                            ['k', 'inertia', 'silhouette', 'sampled_rows', 'complete', 'elapsed_ms']}
             
             # Find elbow (simple method: max second derivative)
             if len(inertias) >= 3:
@@ -1022,7 +993,7 @@ def detect_clustering_options(df: pd.DataFrame) -> Dict:
                     second_derivatives.append(second_deriv)
                 
                 elbow_idx = np.argmax(second_derivatives) + 1
-                result['suggested_k'] = list(k_range)[elbow_idx]
+                result['suggested_k'] = k_values[elbow_idx]
                 result['confidence']['n_clusters'] = 'medium'
             else:
                 result['suggested_k'] = 3  # Default
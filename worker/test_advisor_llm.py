@@ -3,31 +3,30 @@ LLM-powered Test Advisor Assistant
 Provides intelligent guidance for statistical test selection
 """
 
-import os
 import logging
 from typing import Dict, Any, List, Optional
-from openai import OpenAI
+
+from llm_client import LLMClient, llm_client, DEFAULT_MODEL
+from cache_manager import get_llm_response, cache_llm_response
 
 logger = logging.getLogger(__name__)
 
 class TestAdvisorAI:
     """AI assistant for statistical test selection and guidance"""
     
-    def __init__(self):
-        """Initialize the Test Advisor AI with OpenAI client"""
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
+    def __init__(self, client: Optional[LLMClient] = None):
+        """Initialize the Test Advisor AI with the shared LLM client"""
+        self.client = client or llm_client
+        if not self.client.is_configured():
             logger.warning("OPENAI_API_KEY not set - Test Advisor AI features will be disabled")
-            self.client = None
         else:
-            self.client = OpenAI(api_key=api_key)
             logger.info("Test Advisor AI initialized successfully")
     
     def is_available(self) -> bool:
         """Check if the AI service is available"""
-        return self.client is not None
+        return self.client.is_configured()
     
-    def recommend_from_description(self, description: str, data_summary: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    async def recommend_from_description(self, description: str, data_summary: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Recommend statistical tests based on user's research description
         
@@ -74,8 +73,8 @@ Format your response as a structured recommendation that is clear, practical, an
 Focus on the most common and appropriate tests for their scenario.
 """
 
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
+            recommendation = await self.client.chat(
+                model=DEFAULT_MODEL,
                 messages=[
                     {"role": "system", "content": "You are an expert statistical consultant specializing in helping researchers choose appropriate statistical tests. Provide clear, practical guidance."},
                     {"role": "user", "content": prompt}
@@ -84,8 +83,6 @@ Focus on the most common and appropriate tests for their scenario.
                 max_tokens=800
             )
             
-            recommendation = response.choices[0].message.content
-            
             return {
                 "recommendation": recommendation,
                 "has_data": data_summary is not None,
@@ -99,7 +96,7 @@ Focus on the most common and appropriate tests for their scenario.
                 "success": False
             }
     
-    def answer_question(self, question: str, context: Optional[Dict[str, Any]] = None) -> str:
+    async def answer_question(self, question: str, context: Optional[Dict[str, Any]] = None) -> str:
         """
         Answer user's question about statistical tests or concepts
         
@@ -132,8 +129,8 @@ Question: {question}
 Provide a clear, practical answer that helps the user understand the concept and make informed decisions.
 Keep the response focused and actionable."""
 
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
+            return await self.client.chat(
+                model=DEFAULT_MODEL,
                 messages=[
                     {"role": "system", "content": "You are an expert statistical consultant. Provide clear, concise, and practical answers."},
                     {"role": "user", "content": prompt}
@@ -142,13 +139,11 @@ Keep the response focused and actionable."""
                 max_tokens=500
             )
             
-            return response.choices[0].message.content
-            
         except Exception as e:
             logger.error(f"Question answering error: {str(e)}")
             return f"Sorry, I encountered an error: {str(e)}"
     
-    def explain_assumption(self, assumption_name: str, test_type: Optional[str] = None) -> str:
+    async def explain_assumption(self, assumption_name: str, test_type: Optional[str] = None) -> str:
         """
         Explain a statistical assumption in plain language
         
@@ -162,6 +157,10 @@ Keep the response focused and actionable."""
         if not self.is_available():
             return "AI service not available. Please configure OpenAI API key."
         
+        cached = get_llm_response('explain', assumption_name, test_type)
+        if cached is not None:
+            return cached
+        
         try:
             test_context = f" for {test_type}" if test_type else ""
             
@@ -175,8 +174,8 @@ Include:
 
 Keep it concise (3-4 sentences) and practical for researchers."""
 
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
+            explanation = await self.client.chat(
+                model=DEFAULT_MODEL,
                 messages=[
                     {"role": "system", "content": "You are an expert at explaining statistical concepts in simple, practical terms."},
                     {"role": "user", "content": prompt}
@@ -184,14 +183,14 @@ Keep it concise (3-4 sentences) and practical for researchers."""
                 temperature=0.7,
                 max_tokens=300
             )
-            
-            return response.choices[0].message.content
+            cache_llm_response('explain', explanation, assumption_name, test_type)
+            return explanation
             
         except Exception as e:
             logger.error(f"Assumption explanation error: {str(e)}")
             return f"Sorry, I encountered an error: {str(e)}"
     
-    def compare_tests(self, test1: str, test2: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    async def compare_tests(self, test1: str, test2: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Compare two statistical tests and explain when to use each
         
@@ -209,6 +208,13 @@ Keep it concise (3-4 sentences) and practical for researchers."""
                 "message": "Test Advisor AI requires OpenAI API key to be configured"
             }
         
+        # The answer refers to "Test 1" and "Test 2", so the pair is keyed in order
+        n_rows = context['data_summary'].get('n_rows') if context and context.get('data_summary') else None
+        cache_inputs = (test1, test2, n_rows)
+        cached = get_llm_response('compare', *cache_inputs)
+        if cached is not None:
+            return {"comparison": cached, "test1": test1, "test2": test2, "success": True}
+        
         try:
             context_str = ""
             if context and 'data_summary' in context and context['data_summary'] is not None:
@@ -230,8 +236,8 @@ Provide:
 
 Format as a clear, structured comparison."""
 
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
+            comparison = await self.client.chat(
+                model=DEFAULT_MODEL,
                 messages=[
                     {"role": "system", "content": "You are an expert statistical consultant. Provide clear, practical comparisons of statistical tests."},
                     {"role": "user", "content": prompt}
@@ -239,8 +245,7 @@ Format as a clear, structured comparison."""
                 temperature=0.7,
                 max_tokens=600
             )
-            
-            comparison = response.choices[0].message.content
+            cache_llm_response('compare', comparison, *cache_inputs)
             
             return {
                 "comparison": comparison,
@@ -256,7 +261,7 @@ Format as a clear, structured comparison."""
                 "success": False
             }
     
-    def enhance_auto_detection(self, detection_result: Dict[str, Any], question_type: str) -> str:
+    async def enhance_auto_detection(self, detection_result: Dict[str, Any], question_type: str) -> str:
         """
         Enhance auto-detection results with AI explanation
         
@@ -288,8 +293,8 @@ Provide a brief (2-3 sentences) explanation of:
 
 Be encouraging and practical."""
 
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
+            return await self.client.chat(
+                model=DEFAULT_MODEL,
                 messages=[
                     {"role": "system", "content": "You are a helpful statistical assistant. Explain auto-detection results clearly and encouragingly."},
                     {"role": "user", "content": prompt}
@@ -298,13 +303,11 @@ Be encouraging and practical."""
                 max_tokens=200
             )
             
-            return response.choices[0].message.content
-            
         except Exception as e:
             logger.error(f"Enhancement error: {str(e)}")
             return detection_result.get('explanation', 'Auto-detection complete')
     
-    def suggest_sample_size(self, test_type: str, current_n: int, effect_size: str = "medium") -> Dict[str, Any]:
+    async def suggest_sample_size(self, test_type: str, current_n: int, effect_size: str = "medium") -> Dict[str, Any]:
         """
         Provide sample size guidance for a given test
         
@@ -322,6 +325,10 @@ Be encouraging and practical."""
                 "message": "Test Advisor AI requires OpenAI API key to be configured"
             }
         
+        cached = get_llm_response('sample-size', test_type, current_n, effect_size)
+        if cached is not None:
+            return {"guidance": cached, "current_n": current_n, "test_type": test_type, "success": True}
+        
         try:
             prompt = f"""Provide sample size guidance for this scenario:
 
@@ -337,8 +344,8 @@ Provide:
 
 Be practical and encouraging. Include specific numbers where possible."""
 
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
+            guidance = await self.client.chat(
+                model=DEFAULT_MODEL,
                 messages=[
                     {"role": "system", "content": "You are an expert in statistical power analysis. Provide practical sample size guidance."},
                     {"role": "user", "content": prompt}
@@ -346,8 +353,7 @@ Be practical and encouraging. Include specific numbers where possible."""
                 temperature=0.7,
                 max_tokens=400
             )
-            
-            guidance = response.choices[0].message.content
+            cache_llm_response('sample-size', guidance, test_type, current_n, effect_size)
             
             return {
                 "guidance": guidance,
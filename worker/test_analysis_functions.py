@@ -20,6 +20,7 @@ from analysis_functions import (
     clustering_analysis,
     pca_analysis,
     power_analysis,
+    time_series_analysis,
     convert_to_python_types
 )
 
@@ -149,6 +150,19 @@ class TestConvertToPythonTypes:
         result = convert_to_python_types(data)
         assert result['stats']['max'] is None
         assert result['stats']['values'][1] is None
+    
+    def test_handles_arrays_with_nan(self):
+        """Should convert non-finite array elements to None"""
+        result = convert_to_python_types({'components': np.array([[1.0, np.nan], [np.inf, 2.0]])})
+        assert result == {'components': [[1.0, None], [None, 2.0]]}
+    
+    def test_fast_json_matches_conversion(self):
+        """The response encoder should write numpy values and NaN/inf like convert_to_python_types"""
+        import json
+        from fast_json import dumps
+        
+        payload = {'matrix': np.array([[1.5, np.nan]]), 'n': np.int64(3), 'p': np.float64(np.inf), 'ok': np.bool_(True)}
+        assert json.loads(dumps(payload)) == convert_to_python_types(payload)
 
 
 # ============================================================================
@@ -315,6 +329,60 @@ class TestLogisticRegression:
         assert 'true_negatives' in result['test_results']
         assert 'true_positives' in result['test_results']
 
+    def test_cross_validation(self, sample_binary_data):
+        """Should report per-fold AUC with a confidence interval in CV mode"""
+        result = logistic_regression_analysis(sample_binary_data, {
+            'targetColumn': 'outcome',
+            'predictorColumns': ['age', 'bmi'],
+            'cvFolds': 5,
+            'cvRepeats': 2
+        })
+
+        cv = result['test_results']['cross_validation']
+        assert len(cv['fold_auc']) == 10
+        assert cv['auc_ci_lower'] <= cv['auc_mean'] <= cv['auc_ci_upper']
+        # Out-of-fold predictions cover every row
+        assert result['test_results']['n_test'] == len(sample_binary_data)
+
+    def test_coefficients_on_original_scale(self, sample_binary_data):
+        """Coefficients fitted on standardized predictors should predict on raw data"""
+        from logistic_engine import fit_logistic_model
+
+        X = sample_binary_data[['age', 'bmi']]
+        y = sample_binary_data['outcome']
+        fit = fit_logistic_model(X, y, {'cvFolds': 5})
+        assert fit['solver'] == 'lbfgs'
+
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.preprocessing import StandardScaler
+        X_std = StandardScaler().fit_transform(X)
+        reference = LogisticRegression(max_iter=1000).fit(X_std, y)
+        np.testing.assert_allclose(
+            X.to_numpy() @ fit['coefficients'] + fit['intercept'],
+            reference.decision_function(X_std),
+            rtol=1e-4, atol=1e-4
+        )
+
+    @pytest.mark.parametrize('cv_opts', [{}, {'cvFolds': 5, 'cvRepeats': 2}])
+    def test_code_snippet_reproduces_results(self, sample_binary_data, cv_opts, tmp_path, monkeypatch):
+        """Running the code snippet should give the reported AUC and coefficients"""
+        import logistic_regression_enhanced
+
+        sample_binary_data.to_csv(tmp_path / 'data.csv', index=False)
+        monkeypatch.chdir(tmp_path)
+        opts = {'targetColumn': 'outcome', 'predictorColumns': ['age', 'bmi'], **cv_opts}
+        for analysis in (logistic_regression_analysis, logistic_regression_enhanced.logistic_regression_analysis):
+            result = analysis(sample_binary_data, opts)
+
+            namespace = {'df': sample_binary_data}
+            exec(result['code_snippet'], namespace)
+            test_results = result['test_results']
+            assert namespace['auc'] == pytest.approx(test_results['auc_score'])
+            assert namespace['intercept'] == pytest.approx(test_results['intercept'], rel=1e-6)
+            np.testing.assert_allclose(namespace['coef'], list(test_results['coefficients'].values()), rtol=1e-6)
+            if cv_opts:
+                np.testing.assert_allclose(namespace['fold_auc'], test_results['cross_validation']['fold_auc'])
+
 
 # ============================================================================
 # TEST: Survival Analysis
@@ -354,7 +422,55 @@ class TestSurvivalAnalysis:
         
         # Should have Cox regression results (or error if unstable)
         assert 'cox_regression' in result['test_results'] or 'cox_regression_error' in result['test_results']
-    
+
+    def test_logrank_matches_lifelines(self, sample_survival_data):
+        """Should match lifelines log-rank test and medians for two groups"""
+        from lifelines import KaplanMeierFitter
+        from lifelines.statistics import logrank_test
+
+        df = sample_survival_data
+        result = survival_analysis(df, {
+            'durationColumn': 'time',
+            'eventColumn': 'event',
+            'groupColumn': 'treatment'
+        })
+
+        a, b = df['treatment'] == 0, df['treatment'] == 1
+        expected = logrank_test(df[a]['time'], df[b]['time'], df[a]['event'], df[b]['event'])
+        logrank = result['test_results']['logrank_test']
+        assert logrank['test_statistic'] == pytest.approx(expected.test_statistic)
+        assert logrank['p_value'] == pytest.approx(expected.p_value)
+
+        kmf = KaplanMeierFitter().fit(df[a]['time'], df[a]['event'])
+        median = result['test_results']['group_statistics']['0']['median_survival']
+        assert median == pytest.approx(kmf.median_survival_time_)
+
+    def test_logrank_more_than_two_groups(self, sample_survival_data):
+        """Should run the log-rank test for k > 2 groups"""
+        df = sample_survival_data.copy()
+        df['arm'] = np.resize(['A', 'B', 'C'], len(df))
+        result = survival_analysis(df, {
+            'durationColumn': 'time',
+            'eventColumn': 'event',
+            'groupColumn': 'arm'
+        })
+
+        logrank = result['test_results']['logrank_test']
+        assert logrank['degrees_of_freedom'] == 2
+        assert logrank['groups'] == ['A', 'B', 'C']
+        assert 0 <= logrank['p_value'] <= 1
+
+    def test_cox_fit_is_cached(self, sample_survival_data):
+        """Should reuse the Cox fit when only plot options change"""
+        from survival_engine import cox_fit_cache
+
+        cox_fit_cache.clear()
+        opts = {'durationColumn': 'time', 'eventColumn': 'event', 'covariates': ['age']}
+        survival_analysis(sample_survival_data, opts)
+        hits = cox_fit_cache.hits
+        survival_analysis(sample_survival_data, {**opts, 'showConfidenceIntervals': False})
+        assert cox_fit_cache.hits == hits + 1
+
     def test_no_inf_in_survival_output(self, sample_survival_data):
         """Should not contain inf values in survival output"""
         result = survival_analysis(sample_survival_data, {
@@ -423,6 +539,70 @@ class TestCategoricalAnalysis:
         assert 'test_results' in result
         assert 'chi2_statistic' in result['test_results'] or 'test' in result['test_results']
 
+    def test_matches_scipy_chi_square(self):
+        """Sparse chi-square and Cramér's V should match scipy on an r x c table"""
+        np.random.seed(0)
+        data = pd.DataFrame({
+            'region': np.random.choice(['N', 'S', 'E', 'W'], 400),
+            'product': np.random.choice(['a', 'b', 'c'], 400)
+        })
+        result = categorical_analysis(data, {'variable1': 'region', 'variable2': 'product'})
+        
+        from scipy import stats
+        chi2, p_value, dof, _ = stats.chi2_contingency(pd.crosstab(data['region'], data['product']))
+        assert result['test_results']['chi2_statistic'] == pytest.approx(chi2)
+        assert result['test_results']['p_value'] == pytest.approx(p_value)
+        assert result['test_results']['cramers_v'] == pytest.approx(np.sqrt(chi2 / (400 * 2)))
+    
+    def test_monte_carlo_for_sparse_table(self):
+        """Should use a Monte Carlo exact test when expected counts are small"""
+        np.random.seed(0)
+        data = pd.DataFrame({
+            'site': np.random.choice(list('ABCDE'), 40),
+            'grade': np.random.choice(list('xyz'), 40)
+        })
+        result = categorical_analysis(data, {
+            'variable1': 'site',
+            'variable2': 'grade',
+            'monteCarloSimulations': 2000
+        })
+        
+        test_results = result['test_results']
+        assert test_results['test'].startswith('Monte Carlo')
+        assert test_results['monte_carlo_simulations'] == 2000
+        assert abs(test_results['p_value'] - test_results['asymptotic_p_value']) < 0.15
+
+    @pytest.mark.parametrize('simulations', [0, -5, 10_000_000])
+    def test_rejects_out_of_range_simulations(self, sample_categorical_data, simulations):
+        """Should refuse simulation counts below 1 or above the cap"""
+        with pytest.raises(ValueError, match='monteCarloSimulations'):
+            categorical_analysis(sample_categorical_data, {
+                'variable1': 'gender',
+                'variable2': 'outcome',
+                'monteCarloSimulations': simulations
+            })
+
+    def test_high_cardinality_collapsed_for_display(self):
+        """Should pool rare levels into 'Other' in the display table"""
+        np.random.seed(0)
+        data = pd.DataFrame({
+            'zip': np.random.randint(0, 500, 5000).astype(str),
+            'plan': np.random.choice(['basic', 'plus', 'pro'], 5000)
+        })
+        result = categorical_analysis(data, {
+            'variable1': 'zip',
+            'variable2': 'plan',
+            'maxDisplayCategories': 10,
+            'monteCarloSimulations': 200
+        })
+        
+        test_results = result['test_results']
+        assert test_results['table_collapsed']
+        assert test_results['n_levels']['zip'] == 500
+        table = pd.DataFrame(test_results['contingency_table'])
+        assert table.shape == (11, 3)
+        assert table.to_numpy().sum() == 5000
+
 
 # ============================================================================
 # TEST: Clustering
@@ -485,6 +665,430 @@ class TestPCA:
         total = sum(variance.values()) if isinstance(variance, dict) else sum(variance)
         assert total <= 1.0
 
+    def test_matches_sklearn_with_full_spectrum(self, sample_numeric_data):
+        """Should match sklearn PCA and report every eigenvalue for the scree plot"""
+        from sklearn.decomposition import PCA
+        from sklearn.preprocessing import StandardScaler
+
+        result = pca_analysis(sample_numeric_data, {'nComponents': 2})
+        reference = PCA(2).fit(StandardScaler().fit_transform(sample_numeric_data))
+
+        test_results = result['test_results']
+        np.testing.assert_allclose(test_results['explained_variance_ratio'],
+                                   reference.explained_variance_ratio_)
+        np.testing.assert_allclose(np.abs(test_results['components']),
+                                   np.abs(reference.components_), atol=1e-8)
+        assert len(test_results['eigenvalues']) == 4
+        assert test_results['spectrum_complete']
+
+    def test_changing_components_reuses_decomposition(self, sample_numeric_data):
+        """Should not refit when only nComponents changes"""
+        from pca_engine import pca_cache
+
+        pca_cache.clear()
+        pca_analysis(sample_numeric_data, {'nComponents': 2})
+        hits = pca_cache.hits
+        result = pca_analysis(sample_numeric_data, {'nComponents': 3})
+        assert pca_cache.hits == hits + 1
+        assert result['test_results']['n_components'] == 3
+
+
+# ============================================================================
+# TEST: Time Series Analysis
+# ============================================================================
+
+class TestTimeSeries:
+    """Test resampling, decomposition and autocorrelation"""
+    
+    @pytest.fixture
+    def hourly_data(self):
+        np.random.seed(42)
+        n = 24 * 60
+        t = np.arange(n)
+        return pd.DataFrame({
+            'timestamp': pd.date_range('2024-01-01', periods=n, freq='h').astype(str),
+            'load': 10 + 5 * np.sin(2 * np.pi * t / 24) + np.random.normal(0, 1, n)
+        })
+    
+    def test_does_not_mutate_input(self, hourly_data):
+        """Should leave the caller's DataFrame unchanged"""
+        original = hourly_data.copy()
+        time_series_analysis(hourly_data.sample(frac=1, random_state=0), {'dateColumn': 'timestamp'})
+        pd.testing.assert_frame_equal(hourly_data, original)
+    
+    def test_detects_daily_seasonality(self, hourly_data):
+        """Should infer hourly frequency and a 24-hour seasonal period"""
+        result = time_series_analysis(hourly_data, {'dateColumn': 'timestamp'})
+        
+        series = result['test_results']['series']['load']
+        assert result['test_results']['frequency'] == 'h'
+        assert series['seasonal_period'] == 24
+        assert series['seasonal_strength'] > 0.8
+    
+    def test_resample_and_downsample(self, hourly_data):
+        """Should resample to the requested frequency and cap display points"""
+        result = time_series_analysis(hourly_data, {
+            'dateColumn': 'timestamp',
+            'resampleFrequency': 'D',
+            'maxDisplayPoints': 20
+        })
+        
+        assert result['test_results']['n_observations'] == 60
+        assert result['test_results']['resampled']
+        assert len(result['display_series']['load']['values']) <= 20
+    
+    def test_acf_matches_statsmodels(self, hourly_data):
+        """FFT-based ACF/PACF should match statsmodels"""
+        from statsmodels.tsa.stattools import acf, pacf
+        from timeseries_engine import acf_pacf
+        
+        values = hourly_data['load'].to_numpy()
+        result = acf_pacf(values, 30)
+        np.testing.assert_allclose(result['acf'], acf(values, nlags=30, fft=False), atol=1e-10)
+        np.testing.assert_allclose(result['pacf'], pacf(values, nlags=30, method='ldb'), atol=1e-10)
+    
+    def test_limits_user_lags_and_frequency(self, hourly_data):
+        """Should clamp nLags to the series length and refuse a grid far finer than the data"""
+        short = hourly_data.head(30)
+        result = time_series_analysis(short, {'dateColumn': 'timestamp', 'nLags': 100})
+        # Lags 0..14: a 30-point series supports at most n // 2 - 1 lags
+        assert len(result['test_results']['series']['load']['acf']) == 15
+        
+        with pytest.raises(ValueError, match='coarser frequency'):
+            time_series_analysis(hourly_data, {'dateColumn': 'timestamp', 'resampleFrequency': 's'})
+
+    def test_microsecond_index(self):
+        """Grid checks and inferred steps should not depend on the index's unit"""
+        from timeseries_engine import check_grid_size, infer_frequency
+
+        index = pd.date_range('2024-01-01', periods=24 * 60, freq='h', unit='us')
+        assert index.dtype == 'datetime64[us]'
+        with pytest.raises(ValueError, match='coarser frequency'):
+            check_grid_size(index, 's')
+        check_grid_size(index, '30min')
+
+        # Roughly hourly timestamps: the inferred grid is about an hour, not milliseconds
+        jitter = pd.to_timedelta(np.random.RandomState(0).randint(-60, 60, len(index)), unit='s')
+        irregular = (index + jitter).sort_values()
+        step = pd.Timedelta(pd.tseries.frequencies.to_offset(infer_frequency(irregular)))
+        assert pd.Timedelta(minutes=55) < step < pd.Timedelta(minutes=65)
+
+
+# ============================================================================
+# TEST: Shared Numeric Preparation
+# ============================================================================
+
+class TestNumericPrep:
+    """Test the per-dataset numeric artifact cache"""
+    
+    def test_pca_then_clustering_standardizes_once(self, sample_numeric_data):
+        """PCA and clustering on the same data should share one preparation"""
+        from numeric_prep import numeric_prep_cache
+        
+        numeric_prep_cache.clear()
+        pca_analysis(sample_numeric_data, {'nComponents': 2})
+        misses = numeric_prep_cache.misses
+        clustering_analysis(sample_numeric_data, {'nClusters': 3, 'showElbow': False})
+        assert numeric_prep_cache.misses == misses
+    
+    def test_artifacts_match_pandas_and_sklearn(self, sample_numeric_data):
+        """Standardized matrix and correlations should match StandardScaler and DataFrame.corr"""
+        from sklearn.preprocessing import StandardScaler
+        from numeric_prep import get_numeric_prep
+        
+        data = sample_numeric_data.copy()
+        data.loc[5, 'height'] = np.nan
+        prep = get_numeric_prep(data)
+        
+        assert prep.complete_mask.sum() == len(data) - 1
+        np.testing.assert_allclose(prep.standardized(), StandardScaler().fit_transform(data.dropna()))
+        np.testing.assert_allclose(prep.complete_correlation(), data.dropna().corr(), atol=1e-12)
+        np.testing.assert_allclose(prep.pairwise_correlation(), data.corr())
+        assert not prep.standardized().flags.writeable
+    
+    def test_correlation_does_not_hold_standardized_matrix(self, sample_numeric_data, monkeypatch):
+        """The exact correlation path should accumulate chunks instead of building the n x p matrix"""
+        import numeric_prep
+        from numeric_prep import NumericPrep
+        
+        monkeypatch.setattr(numeric_prep, 'CHUNK_ROWS', 7)
+        prep = NumericPrep(sample_numeric_data, 'test')
+        np.testing.assert_allclose(prep.complete_correlation(), sample_numeric_data.corr(), atol=1e-12)
+        assert 'standardized' not in prep._artifacts
+        np.testing.assert_allclose(np.vstack(list(prep.standardized_chunks())), prep.standardized())
+    
+    def test_k_sweep_shared_with_clustering(self, sample_numeric_data):
+        """The wizard's k-means sweep should be reused by the clustering elbow plot"""
+        from numeric_prep import get_numeric_prep, numeric_prep_cache
+        from test_advisor import detect_clustering_options
+        
+        numeric_prep_cache.clear()
+        options = detect_clustering_options(sample_numeric_data)
+        sweep = get_numeric_prep(sample_numeric_data).k_sweep()
+        assert sweep['complete']
+        assert options['details']['k_sweep']['k'] == sweep['k']
+        
+        clustering_analysis(sample_numeric_data, {'nClusters': 3, 'showElbow': True})
+        assert get_numeric_prep(sample_numeric_data).k_sweep()['elapsed_ms'] == sweep['elapsed_ms']
+    
+    def test_k_sweep_resumes_after_time_budget(self, sample_numeric_data):
+        """A sweep cut short by its time budget should continue on the next call"""
+        from numeric_prep import get_numeric_prep, numeric_prep_cache
+        
+        numeric_prep_cache.clear()
+        prep = get_numeric_prep(sample_numeric_data)
+        partial = prep.k_sweep(time_budget=0)
+        assert not partial['complete']
+        
+        sweep = prep.k_sweep()
+        assert sweep['complete']
+        assert sweep['k'] == list(range(2, 11))
+        assert sweep['inertia'] == sorted(sweep['inertia'], reverse=True)
+    
+    def test_k_sweep_concurrent_calls(self, sample_numeric_data):
+        """Concurrent sweeps of one prep should fit each k once and agree"""
+        from concurrent.futures import ThreadPoolExecutor
+        from numeric_prep import get_numeric_prep, numeric_prep_cache
+        
+        numeric_prep_cache.clear()
+        prep = get_numeric_prep(sample_numeric_data)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            sweeps = list(pool.map(lambda budget: prep.k_sweep(time_budget=budget), [0, None, 0, None]))
+        
+        final = prep.k_sweep()
+        assert final['k'] == list(range(2, 11))
+        assert len(final['inertia']) == len(final['silhouette']) == len(final['k'])
+        for sweep in sweeps:
+            assert sweep['k'] == final['k'][:len(sweep['k'])]
+            assert sweep['inertia'] == final['inertia'][:len(sweep['inertia'])]
+
+
+# ============================================================================
+# TEST: Dataset Profile
+# ============================================================================
+
+class TestDatasetProfile:
+    """Test the cached dataset profile behind the Test Advisor auto-detection"""
+    
+    def test_profile_computed_once_per_dataset(self, sample_grouped_data):
+        """All wizard questions on one dataset should share one profile"""
+        from dataset_profile import dataset_profile_cache
+        from test_advisor import analyze_dataset_comprehensive, auto_detect_answer, auto_detect_from_data
+        
+        dataset_profile_cache.clear()
+        misses = dataset_profile_cache.misses
+        analyze_dataset_comprehensive(sample_grouped_data)
+        auto_detect_answer(sample_grouped_data, 'isNormal')
+        auto_detect_from_data(sample_grouped_data)
+        auto_detect_answer(sample_grouped_data.copy(), 'nGroups')
+        assert dataset_profile_cache.misses == misses + 1
+    
+    def test_answers_match_direct_computation(self, sample_grouped_data):
+        """Profile-based answers should match tests run on the raw columns"""
+        from scipy import stats
+        from test_advisor import auto_detect_answer, auto_detect_from_data
+        
+        data = sample_grouped_data.copy()
+        data['event'] = np.tile([0, 1, 1], len(data) // 3 + 1)[:len(data)]
+        normality = auto_detect_answer(data, 'isNormal')['details']
+        _, p_value = stats.shapiro(data['value'])
+        assert normality['value']['p_value'] == pytest.approx(p_value)
+        assert normality['value']['n'] == len(data)
+        
+        groups = auto_detect_answer(data, 'nGroups')
+        assert groups['answer'] == data['group'].nunique()
+        assert groups['details']['groups'] == data['group'].unique().tolist()
+        
+        columns = auto_detect_from_data(data)['column_types']
+        assert columns['event']['type'] == 'continuous'
+        assert columns['group']['is_binary'] == (data['group'].nunique() == 2)
+
+
+# ============================================================================
+# TEST: Batch Analysis
+# ============================================================================
+
+class TestBatchRunner:
+    """Test running several analyses over one dataset"""
+
+    def test_batch_runs_isolated_with_errors_and_cache_hits(self, sample_numeric_data):
+        """Items should run in analysis processes, report errors per item and hit the cache on rerun"""
+        from batch_runner import normalize_items, run_batch
+        from cache_manager import clear_cache, content_digest
+
+        clear_cache()
+        items = normalize_items([
+            {'analysisType': 'descriptive', 'requestId': 'desc'},
+            {'analysisType': 'pca', 'nComponents': 2},
+            {'analysisType': 'no-such-analysis'},
+        ])
+        content_key = content_digest(sample_numeric_data.to_csv(index=False).encode())
+        outcomes = run_batch(sample_numeric_data, content_key, items, max_workers=2)
+
+        assert list(outcomes) == ['desc', '1-pca', '2-no-such-analysis']
+        assert outcomes['desc']['status'] == 'ok'
+        assert outcomes['1-pca']['results']['analysis_type'] == 'pca'
+        assert outcomes['2-no-such-analysis']['status'] == 'error'
+        assert all(not outcome['cache_hit'] for outcome in outcomes.values())
+
+        rerun = run_batch(sample_numeric_data, content_key, items)
+        assert rerun['desc']['cache_hit'] and rerun['1-pca']['cache_hit']
+        assert not rerun['2-no-such-analysis']['cache_hit']
+
+    def test_combined_report_has_folder_per_item(self, sample_numeric_data):
+        """The combined report should hold one folder per successful item and a summary"""
+        import base64
+        import io
+        import zipfile
+        from batch_runner import normalize_items, run_batch, batch_store, build_batch_report
+
+        items = normalize_items([{'analysisType': 'descriptive', 'requestId': 'a'},
+                                 {'analysisType': 'pca', 'nComponents': 2, 'requestId': 'b'}])
+        outcomes = run_batch(sample_numeric_data, 'batch-report-test', items, max_workers=1)
+        batch_id = batch_store.add(items, outcomes, {'total_ms': 0})
+
+        names = zipfile.ZipFile(io.BytesIO(base64.b64decode(build_batch_report(batch_store.get(batch_id))))).namelist()
+        assert 'summary.json' in names
+        assert 'a/report.html' in names and 'b/results.json' in names
+
+    def test_batches_are_read_back_from_disk(self, tmp_path):
+        """Any store over the same directory should find a batch (other processes), up to max_entries"""
+        from batch_runner import BatchStore
+
+        items = [{'request_id': 'a', 'options': {'analysisType': 'descriptive'}}]
+        outcomes = {'a': {'status': 'ok', 'results': {'mean': 1.5}, 'elapsed_ms': 1.0, 'cache_hit': False}}
+        batch_ids = [BatchStore(str(tmp_path), max_entries=2).add(items, outcomes, {'total_ms': 1.0})
+                     for _ in range(3)]
+
+        other = BatchStore(str(tmp_path))
+        assert other.get(batch_ids[0]) is None
+        assert other.get(batch_ids[2])['outcomes'] == outcomes
+        assert other.get('../x') is None
+        assert BatchStore(str(tmp_path), ttl_seconds=-1).get(batch_ids[1]) is None
+
+    def test_batch_admitted_by_summed_cost(self, sample_numeric_data, monkeypatch):
+        """A batch whose items fit one by one but not together should be refused before running"""
+        from batch_runner import normalize_items, run_batch
+        from cost_model import cost_model
+        from analysis_runner import AnalysisAborted
+        from cache_manager import clear_cache
+
+        clear_cache()
+        items = normalize_items([{'analysisType': 'descriptive'}, {'analysisType': 'pca', 'nComponents': 2}])
+        estimate = cost_model.estimate_batch([item['options'] for item in items], *sample_numeric_data.shape)
+        assert estimate['seconds'] == pytest.approx(sum(item['seconds'] for item in estimate['estimates']))
+        assert all(item['tier'] != 'over_budget' for item in estimate['estimates'])
+
+        monkeypatch.setattr(cost_model, 'batch_budget_seconds', estimate['seconds'] - 0.5)
+        with pytest.raises(AnalysisAborted) as aborted:
+            run_batch(sample_numeric_data, 'batch-budget-test', items)
+        assert aborted.value.code == 'over_budget'
+
+    def test_cancelled_batch_stops(self, sample_numeric_data):
+        """Cancelling a batch's job_id should stop its items and raise"""
+        from batch_runner import normalize_items, run_batch
+        from analysis_runner import AnalysisAborted, pending, cancel
+        from cache_manager import clear_cache
+
+        clear_cache()
+        items = normalize_items([{'analysisType': 'descriptive'}, {'analysisType': 'pca', 'nComponents': 2}])
+        with pending('batch-1'):
+            cancel('batch-1')
+            with pytest.raises(AnalysisAborted) as aborted:
+                run_batch(sample_numeric_data, 'batch-cancel-test', items, job_id='batch-1')
+        assert aborted.value.code == 'cancelled'
+
+    def test_rejects_duplicate_request_ids(self):
+        """Duplicate requestIds should be rejected"""
+        from batch_runner import normalize_items
+
+        with pytest.raises(ValueError):
+            normalize_items([{'requestId': 'x'}, {'requestId': 'x'}])
+
+    def test_rejects_unsafe_request_ids(self):
+        """requestIds become report folders, so path characters should be rejected"""
+        from batch_runner import normalize_items
+
+        with pytest.raises(ValueError, match='Invalid requestId'):
+            normalize_items([{'requestId': '../../x'}])
+        assert normalize_items([{'requestId': 'run_2-b'}])[0]['request_id'] == 'run_2-b'
+
+
+# ============================================================================
+# TEST: Cache Keys
+# ============================================================================
+
+class TestCacheKeys:
+    """Test canonical option normalization in analysis cache keys"""
+    
+    def test_equivalent_options_share_a_key(self):
+        """Defaults, numeric strings and unrelated fields should not change the key; column order should"""
+        from cache_manager import AnalysisCache, content_digest
+        
+        cache = AnalysisCache()
+        key = content_digest(b'a,b,c')
+        cache.set(key, {'analysisType': 'correlation', 'variables': ['a', 'b']}, {'results': 1})
+        
+        assert cache.get(b'a,b,c', {
+            'analysisType': 'correlation', 'variables': ['a', 'b'], 'alpha': '0.05',
+            'correlationMethod': 'pearson', 'nClusters': 4, 'theme': 'dark'
+        }) == {'results': 1}
+        # Column order shows in the matrix axes
+        assert cache.get(key, {'analysisType': 'correlation', 'variables': ['b', 'a']}) is None
+        assert cache.get(key, {'analysisType': 'correlation', 'variables': ['a', 'b'], 'alpha': 0.01}) is None
+        assert cache.get(key, {'analysisType': 'pca', 'variables': ['a', 'b']}) is None
+    
+    def test_unknown_analysis_keeps_all_options(self):
+        """Analysis types without a schema should key on every option"""
+        from cache_manager import canonical_options
+        
+        opts = {'analysisType': 'custom', 'anything': 1}
+        assert canonical_options(opts) == opts
+
+    def test_projected_cache_ignores_unused_columns(self, sample_numeric_data):
+        """Edits outside the analysed columns and dropped rows should hit the projected cache"""
+        from cache_manager import (
+            clear_cache, get_cache_stats, get_projected_result, cache_projected_result,
+            projection_fingerprint
+        )
+
+        opts = {'analysisType': 'regression', 'dependentVar': 'score', 'independentVars': ['age']}
+        edited = sample_numeric_data.assign(notes='edited')
+        edited.loc[len(edited)] = [np.nan, 1.0, 2.0, 3.0, 'incomplete row']
+
+        clear_cache()
+        before = get_cache_stats()['levels']['projected']
+        cache_projected_result(sample_numeric_data, opts, {'results': 'regression'})
+        assert get_projected_result(edited, opts) == {'results': 'regression'}
+        assert get_projected_result(edited.assign(score=edited['score'] + 1), opts) is None
+        assert projection_fingerprint(edited, {**opts, 'dependentVar': 'missing'}) is None
+
+        after = get_cache_stats()['levels']['projected']
+        assert after['lookups'] - before['lookups'] == 2
+        assert after['total_hits'] == 1 and 0 < after['hit_rate'] <= 1
+    
+    def test_spooled_upload_hashes_content(self, sample_numeric_data):
+        """Spooled uploads should hash like their content and be removed after the block"""
+        import asyncio
+        import io
+        import os
+        from starlette.datastructures import UploadFile
+        from cache_manager import spooled_upload, content_digest
+        
+        content = sample_numeric_data.to_csv(index=False).encode() * 3
+        
+        async def spool():
+            upload = UploadFile(file=io.BytesIO(content), filename='data.csv')
+            async with spooled_upload(upload) as (path, digest):
+                with open(path, 'rb') as f:
+                    assert f.read() == content
+                assert path.endswith('.csv')
+                return path, digest
+        
+        path, digest = asyncio.run(spool())
+        assert digest == content_digest(content)
+        assert not os.path.exists(path)
+
 
 # ============================================================================
 # TEST: Power Analysis
@@ -522,6 +1126,773 @@ class TestPowerAnalysis:
         assert 0 <= result['result'] <= 1
 
 
+# ============================================================================
+# ANALYSIS REGISTRY TESTS
+# ============================================================================
+
+class TestAnalysisRegistry:
+    """Test lazy analysis loading and warm-up"""
+    
+    def test_unknown_type_raises(self):
+        """Test that an unknown analysis type is rejected"""
+        from analysis_registry import load_analysis
+        
+        with pytest.raises(ValueError):
+            load_analysis('no-such-analysis')
+    
+    def test_run_analysis_matches_direct_call(self, sample_numeric_data):
+        """Test that the registry dispatches to the analysis function"""
+        from analysis_registry import run_analysis
+        
+        result = run_analysis(sample_numeric_data, {'analysisType': 'descriptive'})
+        direct = descriptive_analysis(sample_numeric_data, {'analysisType': 'descriptive'})
+        assert result['summary'] == direct['summary']
+    
+    def test_warm_up_reports_ready(self):
+        """Test that warm-up marks the service ready and profiles imports"""
+        from analysis_registry import warm_up, import_profile
+        
+        state = warm_up('imports')
+        assert state['ready'] is True
+        profile = import_profile()
+        assert profile['readiness']['ready'] is True
+        assert all({'module', 'ms', 'trigger'} <= set(entry) for entry in profile['imports'])
+
+
+# ============================================================================
+# LLM CLIENT TESTS
+# ============================================================================
+
+@pytest.fixture
+def llm_stub_server():
+    """Local OpenAI-compatible chat completions server with scripted failures"""
+    import json
+    import threading
+    import time
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    
+    state = {'fail_statuses': [], 'delay': 0.0, 'calls': 0, 'active': 0, 'max_active': 0}
+    lock = threading.Lock()
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            with lock:
+                state['calls'] += 1
+                state['active'] += 1
+                state['max_active'] = max(state['max_active'], state['active'])
+                status = state['fail_statuses'].pop(0) if state['fail_statuses'] else 200
+            time.sleep(state['delay'])
+            if status == 200 and body.get('stream'):
+                # Reply word by word as chat.completion.chunk events
+                words = ('echo: ' + body['messages'][-1]['content']).split(' ')
+                chunks = [' '.join(words[:1])] + [' ' + word for word in words[1:]]
+                events = b''.join(
+                    b'data: ' + json.dumps({'id': 'stub', 'object': 'chat.completion.chunk', 'created': 0,
+                                            'model': body['model'],
+                                            'choices': [{'index': 0, 'finish_reason': None,
+                                                         'delta': {'content': chunk}}]}).encode() + b'\n\n'
+                    for chunk in chunks
+                ) + b'data: [DONE]\n\n'
+                with lock:
+                    state['active'] -= 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Content-Length', str(len(events)))
+                self.end_headers()
+                self.wfile.write(events)
+                return
+            if status == 200:
+                payload = {'id': 'stub', 'object': 'chat.completion', 'created': 0, 'model': body['model'],
+                           'choices': [{'index': 0, 'finish_reason': 'stop',
+                                        'message': {'role': 'assistant',
+                                                    'content': 'echo: ' + body['messages'][-1]['content']}}]}
+            else:
+                payload = {'error': {'message': 'stub failure', 'type': 'server_error'}}
+            out = json.dumps(payload).encode()
+            with lock:
+                state['active'] -= 1
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state['base_url'] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    yield state
+    server.shutdown()
+
+
+class TestLLMClient:
+    """Test the shared LLM client against a local stub server"""
+    
+    def _run(self, client, coroutine_factory):
+        import asyncio
+        
+        async def main():
+            try:
+                return await coroutine_factory()
+            finally:
+                await client.aclose()
+        return asyncio.run(main())
+    
+    def test_interpreter_uses_shared_client(self, llm_stub_server):
+        """Test an interpretation round trip and the recorded statistics"""
+        pytest.importorskip('openai')
+        from llm_client import LLMClient
+        from llm_interpreter import StatisticalInterpreter
+        
+        client = LLMClient(api_key='test', base_url=llm_stub_server['base_url'])
+        interpreter = StatisticalInterpreter(client=client)
+        result = self._run(client, lambda: interpreter.interpret_results(
+            {'analysis_type': 'descriptive', 'results': {'p_value': 0.01}}))
+        
+        assert result['interpretation'].startswith('echo:')
+        stats = client.get_stats()
+        assert stats['successes'] == 1
+        assert stats['latency_ms']['p50'] is not None
+    
+    def test_retries_server_errors(self, llm_stub_server):
+        """Test that server errors are retried with backoff"""
+        pytest.importorskip('openai')
+        from llm_client import LLMClient
+        
+        llm_stub_server['fail_statuses'] = [500, 503]
+        client = LLMClient(api_key='test', base_url=llm_stub_server['base_url'],
+                           max_retries=2, backoff_base=0.01)
+        answer = self._run(client, lambda: client.chat([{'role': 'user', 'content': 'hi'}]))
+        
+        assert answer == 'echo: hi'
+        assert client.get_stats()['retries'] == 2
+        assert llm_stub_server['calls'] == 3
+    
+    def test_circuit_opens_and_rejects(self, llm_stub_server):
+        """Test that repeated failures open the circuit so later calls fail fast"""
+        pytest.importorskip('openai')
+        from llm_client import LLMClient, CircuitBreaker, CircuitOpenError
+        
+        llm_stub_server['fail_statuses'] = [500] * 10
+        client = LLMClient(api_key='test', base_url=llm_stub_server['base_url'], max_retries=0,
+                           breaker=CircuitBreaker(failure_threshold=2, reset_seconds=60))
+        
+        async def calls():
+            outcomes = []
+            for _ in range(3):
+                try:
+                    await client.chat([{'role': 'user', 'content': 'hi'}])
+                except Exception as e:
+                    outcomes.append(type(e))
+            return outcomes
+        outcomes = self._run(client, calls)
+        
+        assert outcomes[-1] is CircuitOpenError
+        assert llm_stub_server['calls'] == 2
+        assert client.get_stats()['circuit']['state'] == 'open'
+    
+    def test_circuit_recovers_from_cancelled_trial(self, llm_stub_server):
+        """Test that a half-open trial cancelled mid-call lets the next call try again"""
+        pytest.importorskip('openai')
+        import asyncio
+        from llm_client import LLMClient, CircuitBreaker
+        
+        llm_stub_server['fail_statuses'] = [500]
+        client = LLMClient(api_key='test', base_url=llm_stub_server['base_url'], max_retries=0,
+                           breaker=CircuitBreaker(failure_threshold=1, reset_seconds=0.05))
+        messages = [{'role': 'user', 'content': 'hi'}]
+        
+        async def calls():
+            with pytest.raises(Exception):
+                await client.chat(messages)
+            await asyncio.sleep(0.1)
+            llm_stub_server['delay'] = 1
+            trial = asyncio.create_task(client.chat(messages))
+            await asyncio.sleep(0.3)
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+            llm_stub_server['delay'] = 0
+            return await client.chat(messages)
+        answer = self._run(client, calls)
+        
+        assert answer == 'echo: hi'
+        assert client.get_stats()['circuit']['state'] == 'closed'
+    
+    def test_concurrency_is_bounded(self, llm_stub_server):
+        """Test that no more than max_concurrency requests reach the server at once"""
+        pytest.importorskip('openai')
+        import asyncio
+        from llm_client import LLMClient
+        
+        llm_stub_server['delay'] = 0.1
+        client = LLMClient(api_key='test', base_url=llm_stub_server['base_url'], max_concurrency=2)
+        answers = self._run(client, lambda: asyncio.gather(
+            *[client.chat([{'role': 'user', 'content': str(i)}]) for i in range(6)]))
+        
+        assert len(answers) == 6
+        assert llm_stub_server['max_active'] <= 2
+        assert client.get_stats()['queue_wait_ms']['max'] > 0
+
+
+    def test_stream_interpretation_sends_insights_first(self, llm_stub_server):
+        """Test that rule-based insights precede the streamed interpretation"""
+        pytest.importorskip('openai')
+        from cache_manager import llm_response_cache
+        from llm_client import LLMClient
+        from llm_interpreter import StatisticalInterpreter
+        
+        llm_response_cache.clear()
+        client = LLMClient(api_key='test', base_url=llm_stub_server['base_url'])
+        interpreter = StatisticalInterpreter(client=client)
+        
+        async def collect():
+            return [event async for event in interpreter.stream_interpretation(
+                {'analysis_type': 'descriptive', 'results': {'p_value': 0.01}})]
+        events = self._run(client, collect)
+        
+        names = [name for name, _ in events]
+        assert names[0] == 'insights'
+        assert 'key_findings' in events[0][1]
+        assert names.count('token') > 1
+        assert names[-1] == 'done'
+        assert events[-1][1]['text'] == ''.join(data['text'] for name, data in events if name == 'token')
+        llm_response_cache.clear()
+    
+    def test_stream_reports_errors_as_events(self, llm_stub_server):
+        """Test that a failed stream ends with an error event"""
+        pytest.importorskip('openai')
+        from llm_client import LLMClient
+        from llm_interpreter import StatisticalInterpreter
+        
+        llm_stub_server['fail_statuses'] = [400]
+        client = LLMClient(api_key='test', base_url=llm_stub_server['base_url'])
+        interpreter = StatisticalInterpreter(client=client)
+        
+        async def collect():
+            return [event async for event in interpreter.stream_what_if('n doubles', {'results': {}})]
+        events = self._run(client, collect)
+        
+        assert [name for name, _ in events] == ['error']
+
+
+class TestLLMResponseCache:
+    """Test the LLM response cache"""
+    
+    def test_normalized_inputs_share_entry(self):
+        """Test that spelling variants of the same terms hit the same entry"""
+        from cache_manager import LLMResponseCache
+        
+        cache = LLMResponseCache()
+        cache.set('explain', 'text', 'Homogeneity of Variance', "Student's t-test")
+        assert cache.get('explain', 'equal variances', 'T test') == 'text'
+        assert cache.get('compare', 'equal variances', 'T test') is None
+        assert cache.get_stats()['by_kind']['explain']['hit_rate'] == 1.0
+    
+    def test_byte_budget_evicts_oldest(self):
+        """Test that the oldest responses are evicted to stay within the byte budget"""
+        from cache_manager import LLMResponseCache
+        
+        cache = LLMResponseCache(max_bytes=300)
+        for i in range(3):
+            cache.set('explain', 'x' * 100, f'term {i}')
+        assert cache.get('explain', 'term 0') is None
+        assert cache.get('explain', 'term 2') == 'x' * 100
+        assert cache.get_stats()['bytes'] <= 300
+    
+    def test_advisor_explanation_served_from_cache(self, llm_stub_server):
+        """Test that a repeated explanation does not call the LLM again"""
+        pytest.importorskip('openai')
+        import asyncio
+        from cache_manager import llm_response_cache
+        from llm_client import LLMClient
+        from test_advisor_llm import TestAdvisorAI
+        
+        llm_response_cache.clear()
+        client = LLMClient(api_key='test', base_url=llm_stub_server['base_url'])
+        advisor = TestAdvisorAI(client=client)
+        
+        async def explain_twice():
+            first = await advisor.explain_assumption('normality', 't-test')
+            second = await advisor.explain_assumption('Normality', 'T-Test')
+            await client.aclose()
+            return first, second
+        first, second = asyncio.run(explain_twice())
+        
+        assert first == second
+        assert llm_stub_server['calls'] == 1
+        llm_response_cache.clear()
+    
+    def test_comparison_cached_per_test_order(self, llm_stub_server):
+        """Test that a comparison is not answered with the text written for the reverse order"""
+        pytest.importorskip('openai')
+        import asyncio
+        from cache_manager import llm_response_cache
+        from llm_client import LLMClient
+        from test_advisor_llm import TestAdvisorAI
+        
+        llm_response_cache.clear()
+        client = LLMClient(api_key='test', base_url=llm_stub_server['base_url'])
+        advisor = TestAdvisorAI(client=client)
+        
+        async def compare():
+            results = [await advisor.compare_tests(*pair)
+                       for pair in [('t-test', 'Mann-Whitney U'), ('Mann-Whitney U', 't-test'),
+                                    ('T-Test', 'Mann-Whitney U')]]
+            await client.aclose()
+            return results
+        forward, reverse, repeat = asyncio.run(compare())
+        
+        assert 'Test 1: Mann-Whitney U' in reverse['comparison']
+        assert reverse['test1'] == 'Mann-Whitney U'
+        assert repeat['comparison'] == forward['comparison']
+        assert llm_stub_server['calls'] == 2
+        llm_response_cache.clear()
+
+
+class TestPromptContext:
+    """Test compaction of the LLM prompt context"""
+    
+    def test_results_summary_fits_budget(self, sample_numeric_data):
+        """Test that plots are dropped and the summary stays within its token budget"""
+        import json
+        from prompt_context import compact_json, estimate_tokens
+        
+        results = descriptive_analysis(sample_numeric_data, {'analysisType': 'descriptive'})
+        results['matrix'] = np.random.rand(50, 50).tolist()
+        summary = compact_json(results, token_budget=500)
+        
+        assert estimate_tokens(summary) <= 520
+        assert 'plots' not in json.loads(summary)
+        assert len(summary) < len(json.dumps(results, indent=2, default=str)) / 10
+    
+    def test_history_is_windowed(self):
+        """Test that long histories keep the newest turns and note earlier questions"""
+        from prompt_context import window_history
+        
+        history = []
+        for i in range(10):
+            history.append({'role': 'user', 'content': f'question {i}'})
+            history.append({'role': 'assistant', 'content': f'answer {i} ' + 'word ' * 50})
+        windowed = window_history(history, token_budget=300)
+        
+        assert windowed[-1] == history[-1]
+        assert windowed[0]['content'].startswith('(Earlier in this conversation')
+        assert 'question 0' in windowed[0]['content'] or 'question 5' in windowed[0]['content']
+        assert sum(len(m['content']) for m in windowed) < sum(len(m['content']) for m in history)
+    
+    def test_prompt_tokens_reported(self, llm_stub_server):
+        """Test that prompt token counts are recorded per call"""
+        pytest.importorskip('openai')
+        from llm_client import LLMClient
+        
+        client = LLMClient(api_key='test', base_url=llm_stub_server['base_url'])
+        TestLLMClient()._run(client, lambda: client.chat([{'role': 'user', 'content': 'hello ' * 40}]))
+        
+        stats = client.get_stats()
+        assert stats['prompt_tokens'] > 40
+        assert stats['prompt_tokens_per_call']['max'] == stats['prompt_tokens']
+
+
+# ============================================================================
+# PROGRESS REPORTING TESTS
+# ============================================================================
+
+class TestProgressReporter:
+    """Test stage events and ETAs"""
+    
+    def test_stages_move_forward(self):
+        """Test that stage events are emitted in order and earlier stages are ignored"""
+        from progress import ProgressReporter, StageHistory, reporting, report_stage
+        
+        events = []
+        reporter = ProgressReporter(events.append, 'descriptive', history=StageHistory())
+        with reporting(reporter):
+            report_stage('parse')
+            report_stage('fit', n_rows=100)
+            report_stage('plots')
+            report_stage('plots')
+            report_stage('fit')
+            report_stage('report')
+        report_stage('fit')
+        timings = reporter.finish()
+        
+        assert [e['stage'] for e in events] == ['parse', 'fit', 'plots', 'report']
+        assert events[1]['n_rows'] == 100
+        assert set(events[-1]['timings']) == {'parse', 'fit', 'plots'}
+        assert events[0]['eta_ms'] is None
+        assert 'total_ms' in timings
+    
+    def test_eta_from_history(self):
+        """Test that ETAs come from earlier runs and scale with rows"""
+        from progress import ProgressReporter, StageHistory
+        
+        history = StageHistory()
+        history.record('regression', {'parse': 100, 'fit': 1000, 'plots': 400, 'report': 100}, n_rows=1000)
+        
+        events = []
+        reporter = ProgressReporter(events.append, 'regression', history=history)
+        reporter.stage('parse')
+        reporter.stage('fit', n_rows=2000)
+        
+        assert events[0]['eta_ms'] == pytest.approx(1600, abs=50)
+        assert events[1]['eta_ms'] == pytest.approx(3000, abs=50)
+        assert 0 <= events[1]['progress'] < 100
+        assert history.get_stats()['regression']['rows'] == 1000
+
+
+# ============================================================================
+# ARTIFACT STORE TESTS
+# ============================================================================
+
+class TestArtifactStore:
+    """Test results and reports written to the shared artifact directory"""
+    
+    def test_store_response_writes_files(self, tmp_path):
+        """Test that results and the report are written under the artifact id"""
+        import json
+        from artifact_store import ArtifactStore
+        
+        store = ArtifactStore(str(tmp_path))
+        report = bytes(range(256)) * 100
+        refs = store.store_response('job-1', {
+            'results': {'analysis_type': 'descriptive', 'value': np.float64(1.5)},
+            'report_zip': report,
+        })
+        
+        assert refs['report_zip'] == {'name': 'job-1.zip', 'bytes': len(report)}
+        assert (tmp_path / 'job-1.zip').read_bytes() == report
+        assert json.loads((tmp_path / 'job-1.json').read_text())['value'] == 1.5
+        assert sorted(p.name for p in tmp_path.iterdir()) == ['job-1.json', 'job-1.zip']
+    
+    def test_report_zip_stored_without_base64(self, tmp_path, sample_numeric_data):
+        """Test that a raw report ZIP goes to the artifact file as it is"""
+        import io
+        import zipfile
+        from artifact_store import ArtifactStore
+        from report_generator import generate_report_package
+        
+        results = {'analysis_type': 'descriptive', 'summary': 'ok', 'plots': []}
+        report = generate_report_package(results, sample_numeric_data, {'analysisType': 'descriptive'}, encode=False)
+        assert isinstance(report, bytes)
+        assert 'report.html' in zipfile.ZipFile(io.BytesIO(report)).namelist()
+        
+        ArtifactStore(str(tmp_path)).store_response('job-2', {'results': results, 'report_zip': report})
+        assert (tmp_path / 'job-2.zip').read_bytes() == report
+    
+    def test_rejects_unsafe_ids(self, tmp_path):
+        """Test that artifact ids cannot leave the directory"""
+        from artifact_store import ArtifactStore
+        
+        store = ArtifactStore(str(tmp_path))
+        with pytest.raises(ValueError):
+            store.store_response('../escape', {'results': {}})
+        assert not ArtifactStore(None).enabled
+
+
+# ============================================================================
+# ISOLATED ANALYSIS PROCESS TESTS
+# ============================================================================
+
+def _report_fit_stage():
+    """Analysis stand-in for run_isolated (module level, so it can be pickled)"""
+    from progress import report_stage
+    report_stage('fit')
+    return {'rows': 3}
+
+
+def _timed_analysis(path, filename, opts):
+    """_compute_analysis stand-in that reports when it ran"""
+    import time
+    start = time.time()
+    time.sleep(1)
+    return {'results': {'window': (start, time.time())}, 'report_zip': None}, False, None
+
+
+class TestAnalysisRunner:
+    """Test analyses run in limited child processes"""
+    
+    @pytest.fixture(autouse=True)
+    def run_dir(self, tmp_path, monkeypatch):
+        import analysis_runner
+        if not analysis_runner.isolation_available():
+            pytest.skip('fork or resource limits unavailable')
+        monkeypatch.setattr(analysis_runner, 'RUN_DIR', str(tmp_path))
+    
+    def test_results_errors_and_limits(self):
+        """Test that results, stages and errors pass through and limit hits are reported by code"""
+        import operator
+        import time
+        from analysis_runner import run_isolated, AnalysisAborted, AnalysisProcessError
+        
+        stages = []
+        assert run_isolated(_report_fit_stage, on_stage=lambda name, **info: stages.append(name)) == {'rows': 3}
+        assert stages == ['fit']
+        
+        with pytest.raises(AnalysisProcessError, match='bad column'):
+            run_isolated(operator.getitem, (pd.DataFrame(), 'bad column'))
+        
+        with pytest.raises(AnalysisAborted) as aborted:
+            run_isolated(bytearray, (512 << 20,), memory_mb=64)
+        assert aborted.value.to_dict()['code'] == 'memory_limit'
+        
+        with pytest.raises(AnalysisAborted) as aborted:
+            run_isolated(time.sleep, (10,), deadline_seconds=0.5)
+        assert aborted.value.code == 'deadline'
+    
+    def test_runs_in_a_forkserver_child(self):
+        """Test that analyses are not forked from the (multi-threaded) worker"""
+        import os
+        import analysis_runner
+        from analysis_runner import run_isolated
+        
+        assert analysis_runner.START_METHOD in ('forkserver', 'spawn')
+        assert run_isolated(os.getppid) != os.getpid()
+    
+    def test_cancel_by_job_id(self, tmp_path):
+        """Test that cancel stops a running analysis and a waiting one, and ignores unknown jobs"""
+        import os
+        import threading
+        import time
+        from analysis_runner import run_isolated, cancel, pending, AnalysisAborted, _pid_file
+        
+        outcome = {}
+        def run():
+            try:
+                run_isolated(time.sleep, (10,), job_id='job-1')
+            except AnalysisAborted as e:
+                outcome['code'] = e.code
+        thread = threading.Thread(target=run)
+        thread.start()
+        deadline = time.monotonic() + 10
+        while not os.path.exists(_pid_file('job-1')) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        
+        assert cancel('job-1')
+        thread.join(timeout=5)
+        assert outcome == {'code': 'cancelled'}
+        
+        # Waiting for its turn: cancelled before the process starts
+        with pending('job-2'):
+            assert not cancel('job-2')
+            with pytest.raises(AnalysisAborted, match='cancelled'):
+                run_isolated(time.sleep, (10,), job_id='job-2')
+        
+        # Not known here: no marker is left to cancel a later run
+        assert not cancel('job-3')
+        assert os.listdir(tmp_path) == []
+        assert run_isolated(time.sleep, (0,), job_id='job-3') is None
+    
+    def test_isolated_analyses_overlap(self, monkeypatch):
+        """Test that an isolated analysis does not wait for another one to finish"""
+        import threading
+        import analyze
+        
+        monkeypatch.setattr(analyze, '_compute_analysis', _timed_analysis)
+        windows = []
+        def run():
+            response, _ = analyze._analyze_upload(None, None, None, {'analysisType': 'power'})
+            windows.append(response['results']['window'])
+        threads = [threading.Thread(target=run) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=30)
+        
+        assert len(windows) == 2
+        assert max(start for start, _ in windows) < min(end for _, end in windows)
+    
+    def test_cache_entries_kept_across_runs(self, sample_numeric_data, sample_survival_data):
+        """Test that preparations and fits made in the analysis process reach the worker's caches"""
+        from analysis_runner import run_isolated
+        from numeric_prep import get_numeric_prep, numeric_prep_cache
+        from survival_engine import cox_fit_cache
+        
+        numeric_prep_cache.clear()
+        cox_fit_cache.clear()
+        opts = {'nClusters': 3, 'showElbow': True}
+        misses = numeric_prep_cache.misses
+        run_isolated(clustering_analysis, (sample_numeric_data, opts))
+        assert numeric_prep_cache.get_stats()['entries'] == 1
+        assert numeric_prep_cache.misses == misses + 1
+        sweep = numeric_prep_cache.get(sample_numeric_data).k_sweep()
+        assert sweep['complete']
+        
+        # The second run hits the prep (and its sweep) made by the first
+        hits = numeric_prep_cache.hits
+        run_isolated(clustering_analysis, (sample_numeric_data, opts))
+        assert numeric_prep_cache.hits >= hits + 1
+        assert numeric_prep_cache.misses == misses + 1
+        assert get_numeric_prep(sample_numeric_data).k_sweep()['elapsed_ms'] == sweep['elapsed_ms']
+        
+        run_isolated(survival_analysis, (sample_survival_data, {
+            'durationColumn': 'time', 'eventColumn': 'event', 'covariates': ['age']}))
+        assert cox_fit_cache.get_stats()['entries'] == 1
+
+# ============================================================================
+# COST MODEL TESTS
+# ============================================================================
+
+class TestCostModel:
+    """Test pre-flight cost estimates, admission tiers and calibration"""
+    
+    def test_tiers_and_downgrade(self):
+        """Test that estimates grow with the data and over-budget jobs get cheaper options"""
+        from cost_model import CostModel
+        
+        model = CostModel(heavy_seconds=10, budget_seconds=100, budget_mb=2000)
+        small = model.estimate('descriptive', 1000, 5, {})
+        assert small['tier'] == 'light'
+        assert model.estimate('descriptive', 10_000_000, 5, {})['seconds'] > small['seconds']
+        
+        estimate = model.estimate('clustering', 20000, 3, {'nClusters': 3, 'method': 'hierarchical'})
+        assert estimate['tier'] == 'over_budget'
+        assert estimate['memory_mb'] > 2000
+        downgrade = estimate['downgrade']
+        assert downgrade['options']['method'] == 'kmeans'
+        assert downgrade['changes'] == ['k-means instead of hierarchical clustering']
+        assert model.estimate('clustering', 20000, 3, downgrade['options'])['tier'] == 'heavy'
+        # The silhouette over all rows leaves nothing cheaper that fits
+        assert model.estimate('clustering', 200000, 3, {'nClusters': 3})['downgrade'] is None
+    
+    def test_calibration_from_runs(self):
+        """Test that measured runs replace the prior and are reported as predicted vs actual"""
+        from cost_model import CostModel, MIN_CALIBRATION_RUNS
+        
+        model = CostModel()
+        for n_rows in [1000 * 2 ** i for i in range(MIN_CALIBRATION_RUNS)]:
+            estimate = model.estimate('pca', n_rows, 10, {})
+            model.record(estimate, 1.0 + estimate['units'] * 1e-7, peak_mb=2 * estimate['memory_mb'])
+        
+        overhead, per_unit = model.coefficients['pca']
+        assert overhead == pytest.approx(1.0)
+        assert per_unit == pytest.approx(1e-7)
+        assert model.estimate('pca', 100000, 10, {})['calibrated']
+        stats = model.get_stats()['by_type']['pca']
+        assert stats['runs'] == MIN_CALIBRATION_RUNS
+        assert stats['memory_factor'] == pytest.approx(2.0, rel=1e-3)
+        assert stats['memory_log2_error_median'] == pytest.approx(1.0, abs=1e-3)
+    
+    def test_calibration_shared_between_pools(self):
+        """Test that runs measured by another pool calibrate this one, with its own budgets"""
+        from cost_model import CostModel, MIN_CALIBRATION_RUNS
+        
+        heavy_pool = CostModel(budget_mb=3072)
+        light_pool = CostModel(budget_mb=2048)
+        runs = []
+        for n_rows in [100000 * 2 ** i for i in range(MIN_CALIBRATION_RUNS)]:
+            estimate = heavy_pool.estimate('pca', n_rows, 10, {})
+            runs.append(heavy_pool.record(estimate, 2.0 + estimate['units'] * 1e-7))
+        
+        assert light_pool.add_runs(runs + [{'analysis_type': 'pca', 'seconds': 'slow'}, {}]) == MIN_CALIBRATION_RUNS
+        assert light_pool.coefficients['pca'] == pytest.approx(heavy_pool.coefficients['pca'])
+        assert light_pool.get_stats()['recent'] == []
+        assert light_pool.estimate('pca', 1000, 10, {})['budget_mb'] == 2048
+
+# ============================================================================
+# METRICS TESTS
+# ============================================================================
+
+class TestMetrics:
+    """Test the metrics registry, its text exposition and merging across processes"""
+    
+    def test_exposition_format(self):
+        """Test that histograms export cumulative buckets, sum and count with escaped labels"""
+        from metrics import MetricsRegistry
+        
+        registry = MetricsRegistry()
+        requests = registry.counter('test_requests_total', 'Requests', ('kind',))
+        latency = registry.histogram('test_seconds', 'Latency', ('kind',), buckets=(0.1, 1.0))
+        requests.labels('a "quoted" kind').inc(2)
+        child = latency.labels('a')
+        for value in [0.05, 0.1, 0.5, 3.0]:
+            child.observe(value)
+        
+        lines = registry.render().splitlines()
+        assert '# TYPE test_seconds histogram' in lines
+        assert 'test_requests_total{kind="a \\"quoted\\" kind"} 2' in lines
+        assert 'test_seconds_bucket{kind="a",le="0.1"} 2' in lines
+        assert 'test_seconds_bucket{kind="a",le="1"} 3' in lines
+        assert 'test_seconds_bucket{kind="a",le="+Inf"} 4' in lines
+        assert 'test_seconds_count{kind="a"} 4' in lines
+        assert 'test_seconds_sum{kind="a"} 3.65' in lines
+    
+    def test_delta_merge(self):
+        """Test that a forked process's changes are added to the parent and gauges are left alone"""
+        from metrics import MetricsRegistry
+        
+        registry = MetricsRegistry()
+        counter = registry.counter('test_total', 'Count').labels()
+        gauge = registry.gauge('test_gauge', 'Level').labels()
+        histogram = registry.histogram('test_seconds', 'Latency', buckets=(1.0,)).labels()
+        counter.inc(5)
+        since = registry.values(('counter', 'histogram'))
+        counter.inc(3)
+        histogram.observe(2.0)
+        gauge.set(7)
+        delta = registry.delta(since)
+        assert delta == {'test_total': {(): [3.0]}, 'test_seconds': {(): [0, 1, 2.0]}}
+        
+        registry.reset()
+        registry.merge(delta)
+        registry.merge({'test_gauge': {(): [1.0]}, 'unknown_total': {(): [1.0]}})
+        assert counter.value == 3.0
+        assert histogram.counts == [0, 1]
+        assert gauge.value == 0.0
+
+# ============================================================================
+# PROFILER TESTS
+# ============================================================================
+
+class TestProfiler:
+    """Test the sampling profiler and which profiles are kept"""
+    
+    def test_samples_stacks_and_memory(self):
+        """Test that the sampler attributes time to the running function and tracemalloc sees the peak"""
+        import time
+        from profiler import Profile
+        
+        def busy_loop(seconds):
+            end = time.perf_counter() + seconds
+            while time.perf_counter() < end:
+                pass
+        
+        with Profile(trace_memory=True, interval_ms=2) as profile:
+            block = bytearray(8 * 2 ** 20)
+            busy_loop(0.2)
+            del block
+        result = profile.to_dict()
+        
+        assert result['samples'] > 10
+        assert result['top_functions'][0]['function'].startswith('busy_loop (')
+        assert result['memory']['peak_mb'] >= 8
+        stack, count = result['folded'][0].rsplit(' ', 1)
+        assert stack.split(';')[-1].startswith('busy_loop (') and int(count) > 0
+    
+    def test_keeps_requested_and_slow_profiles(self, tmp_path, monkeypatch):
+        """Test that fast unrequested profiles are dropped and old ones pruned"""
+        import profiler
+        from artifact_store import ArtifactStore
+        
+        monkeypatch.setattr(profiler, 'PROFILE_DIR', str(tmp_path))
+        monkeypatch.setattr(profiler, 'profile_store', ArtifactStore(str(tmp_path)))
+        monkeypatch.setattr(profiler, 'PROFILE_SLOW_SECONDS', 1.0)
+        monkeypatch.setattr(profiler, 'PROFILE_KEEP', 2)
+        new_profile = lambda: {'samples': 1, 'memory': None, 'folded': ['main (a.py:1) 1']}
+        
+        assert profiler.keep(new_profile(), 'pca', 0.5, False) is None
+        requested = profiler.keep(new_profile(), 'pca', 0.5, True)
+        assert requested['reason'] == 'requested'
+        assert profiler.profile_path(requested['id'], folded=True) is not None
+        for _ in range(2):
+            assert profiler.keep(new_profile(), 'pca', 1.5, False)['reason'] == 'slow'
+        
+        assert len(profiler.list_profiles()) == 2
+        assert profiler.profile_path('../etc/passwd') is None
+
 # ============================================================================
 # RUN TESTS
 # ============================================================================
@@ -0,0 +1,281 @@
+"""
+Time series engine for GradStat
+Aligns series on a regular grid with vectorized resampling, then computes
+rolling statistics, STL decomposition and FFT-based ACF/PACF for every
+series in parallel, and downsamples series for display
+"""
+
+import os
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from logger_config import logger
+
+# Points kept per series for display (min/max pairs per bucket)
+MAX_DISPLAY_POINTS = 2000
+# Never build a regular grid more than this many times longer than the data
+MAX_GRID_EXPANSION = 10
+# Longer series use moving-average decomposition instead of STL, whose
+# LOESS passes take seconds per 100k points
+STL_MAX_POINTS = 50_000
+
+# Seasonal period implied by common pandas frequency codes
+SEASONAL_PERIODS = {
+    'min': 60, 'T': 60,
+    'h': 24, 'H': 24,
+    'D': 7, 'B': 5,
+    'W': 52,
+    'M': 12, 'ME': 12, 'MS': 12,
+    'Q': 4, 'QE': 4, 'QS': 4,
+}
+
+
+def prepare_frame(df: pd.DataFrame, date_col: str, value_cols: List[str]) -> pd.DataFrame:
+    """
+    Build a time-indexed frame of the value columns, sorted by time
+
+    Works on a new frame; the caller's DataFrame is neither converted nor sorted.
+    """
+    dates = pd.to_datetime(df[date_col], errors='coerce')
+    valid = dates.notna().to_numpy()
+    frame = pd.DataFrame(
+        df.loc[valid, value_cols].to_numpy(dtype=float),
+        index=pd.DatetimeIndex(dates[valid]),
+        columns=value_cols
+    )
+    frame.index.name = date_col
+    if not frame.index.is_monotonic_increasing:
+        frame = frame.sort_index(kind='mergesort')
+    return frame
+
+
+def infer_frequency(index: pd.DatetimeIndex) -> Optional[str]:
+    """
+    Regular sampling frequency of the index as a pandas offset alias
+
+    Uses pd.infer_freq when the spacing is exactly regular, otherwise the
+    median spacing between distinct timestamps. The step is widened when a
+    grid at the median spacing would be far longer than the data.
+    """
+    unique_index = index.unique()
+    if len(unique_index) < 3:
+        return None
+    freq = pd.infer_freq(unique_index)
+    if freq is not None:
+        return freq
+
+    # Timedelta arithmetic keeps the step right whatever the index's unit
+    step = (unique_index[1:] - unique_index[:-1]).median()
+    span = unique_index[-1] - unique_index[0]
+    if step <= pd.Timedelta(0):
+        return None
+    if span / step > MAX_GRID_EXPANSION * len(unique_index):
+        step = span / len(unique_index)
+    return pd.tseries.frequencies.to_offset(step).freqstr
+
+
+def check_grid_size(index: pd.DatetimeIndex, freq: str) -> None:
+    """
+    Refuse a requested frequency whose grid would be far longer than the data
+
+    Raises:
+        ValueError: If freq is not a frequency alias, or its grid over the
+            index's span exceeds MAX_GRID_EXPANSION times the distinct timestamps
+    """
+    offset = pd.tseries.frequencies.to_offset(freq)
+    unique_index = index.unique()
+    if len(unique_index) < 2 or not isinstance(offset, pd.tseries.offsets.Tick):
+        # Calendar frequencies (months, years) are never finer than days
+        return
+    points = (unique_index[-1] - unique_index[0]) / pd.Timedelta(offset)
+    limit = MAX_GRID_EXPANSION * len(unique_index)
+    if points > limit:
+        raise ValueError(f"Resample frequency {freq} would make {int(points) + 1} points from "
+                         f"{len(unique_index)} timestamps (at most {limit}); choose a coarser frequency")
+
+
+def resample(frame: pd.DataFrame, freq: str, aggregation: str = 'mean') -> pd.DataFrame:
+    """Aggregate onto a regular grid at freq and fill empty bins by time interpolation"""
+    regular = frame.resample(freq).agg(aggregation)
+    if regular.isna().any().any():
+        regular = regular.interpolate(method='time', limit_direction='both')
+    return regular
+
+
+def seasonal_period_for(freq: Optional[str]) -> Optional[int]:
+    """Default seasonal period for a pandas frequency alias (None if unknown)"""
+    if not freq:
+        return None
+    base = pd.tseries.frequencies.to_offset(freq)
+    if base.n != 1:
+        return None
+    return SEASONAL_PERIODS.get(base.name.split('-')[0])
+
+
+def acf_pacf(values: np.ndarray, n_lags: int) -> Dict[str, np.ndarray]:
+    """
+    Autocorrelation via FFT and partial autocorrelation via Durbin-Levinson
+
+    The autocovariance is computed once with an FFT (O(n log n)); the PACF is
+    derived from it by the Levinson recursion instead of fitting one
+    regression per lag.
+    """
+    from statsmodels.tsa.stattools import acovf, levinson_durbin
+
+    acov = acovf(values, fft=True, nlag=n_lags)
+    bound = 1.96 / np.sqrt(len(values))
+    if acov[0] <= 0:
+        # Constant series: no autocorrelation structure to report
+        return {'acf': np.zeros(n_lags + 1), 'pacf': np.zeros(n_lags + 1), 'confidence_bound': bound}
+    acf = acov / acov[0]
+    _, _, pacf, _, _ = levinson_durbin(acov, nlags=n_lags, isacov=True)
+    return {'acf': acf, 'pacf': pacf, 'confidence_bound': bound}
+
+
+def _seasonal_peak(acf: np.ndarray, bound: float) -> Optional[int]:
+    """First local maximum of the ACF beyond lag 1 that is significant"""
+    for lag in range(2, len(acf) - 1):
+        if acf[lag] > acf[lag - 1] and acf[lag] >= acf[lag + 1] and acf[lag] > bound:
+            return lag
+    return None
+
+
+def downsample_minmax(series: pd.Series, max_points: int = MAX_DISPLAY_POINTS) -> pd.Series:
+    """
+    Reduce a series for display, keeping the min and max of each bucket
+
+    Peaks and troughs survive downsampling, so the shape of the plotted line
+    is preserved with at most max_points points.
+    """
+    n = len(series)
+    if n <= max_points:
+        return series
+    n_buckets = max(1, max_points // 2)
+    buckets = (np.arange(n) * n_buckets) // n
+    # Sorting by (bucket, value) puts each bucket's min first and max last
+    order = np.lexsort((series.to_numpy(), buckets))
+    starts = np.searchsorted(buckets, np.arange(n_buckets))
+    ends = np.append(starts[1:], n) - 1
+    keep = np.concatenate([order[starts], order[ends]])
+    return series.iloc[np.unique(keep)]
+
+
+def analyze_series(series: pd.Series, freq: Optional[str], opts: Dict) -> Dict[str, Any]:
+    """
+    Rolling statistics, seasonal decomposition and ACF/PACF for one regular series
+
+    Args:
+        series: Series on a regular DatetimeIndex without missing values
+        freq: Frequency alias of the grid (used for the default seasonal period)
+        opts: Analysis options (rollingWindow, seasonalPeriod, nLags, robustDecomposition)
+
+    Returns:
+        dict with summary statistics, rolling mean/std, acf/pacf, the
+        decomposition (if the series is long enough) and trend/seasonal strength
+    """
+    values = series.to_numpy(dtype=float)
+    n = len(values)
+    max_lags = max(1, n // 2 - 1)
+    n_lags = opts.get('nLags')
+    if n_lags:
+        n_lags = int(n_lags)
+        if n_lags < 1:
+            raise ValueError("nLags must be at least 1")
+        n_lags = min(n_lags, max_lags)
+    else:
+        n_lags = min(40, max_lags)
+    correlations = acf_pacf(values, n_lags)
+
+    period = opts.get('seasonalPeriod')
+    period = int(period) if period else seasonal_period_for(freq)
+    if period is None:
+        period = _seasonal_peak(correlations['acf'], correlations['confidence_bound'])
+
+    window = int(opts.get('rollingWindow') or period or max(3, n // 20))
+    window = max(2, min(window, n))
+    # pandas' rolling kernels add and drop one point per step, so this is O(n)
+    # regardless of the window length
+    rolling = series.rolling(window, min_periods=1)
+
+    result = {
+        'n_observations': n,
+        'mean': float(values.mean()),
+        'std': float(values.std(ddof=1)) if n > 1 else 0.0,
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'rolling_window': window,
+        'rolling_mean': rolling.mean(),
+        'rolling_std': rolling.std(),
+        'n_lags': n_lags,
+        'acf': correlations['acf'],
+        'pacf': correlations['pacf'],
+        'confidence_bound': correlations['confidence_bound'],
+        'significant_lags': [
+            lag for lag in range(1, len(correlations['acf']))
+            if abs(correlations['acf'][lag]) > correlations['confidence_bound']
+        ],
+        'seasonal_period': period,
+        'decomposition': None,
+    }
+
+    if period and period >= 2 and n >= 2 * period:
+        if n <= STL_MAX_POINTS:
+            from statsmodels.tsa.seasonal import STL
+
+            decomposition = STL(series, period=period, robust=bool(opts.get('robustDecomposition'))).fit()
+            result['decomposition_method'] = 'STL'
+        else:
+            from statsmodels.tsa.seasonal import seasonal_decompose
+
+            decomposition = seasonal_decompose(series, period=period)
+            result['decomposition_method'] = 'moving average'
+
+        trend, seasonal, resid = decomposition.trend, decomposition.seasonal, decomposition.resid
+        result['decomposition'] = {'trend': trend, 'seasonal': seasonal, 'resid': resid}
+        # Strength of trend and seasonality (Wang, Smith & Hyndman, 2006); the
+        # moving-average trend is undefined for half a period at each end
+        resid_var = np.nanvar(resid)
+        result['trend_strength'] = float(max(0.0, 1 - resid_var / np.nanvar(trend + resid)))
+        result['seasonal_strength'] = float(max(0.0, 1 - resid_var / np.nanvar(seasonal + resid)))
+
+    return result
+
+
+def analyze_frame(frame: pd.DataFrame, opts: Dict) -> Dict[str, Any]:
+    """
+    Regularize a time-indexed frame and analyze every column in parallel
+
+    Args:
+        frame: Output of prepare_frame
+        opts: Analysis options (resampleFrequency, aggregation, rollingWindow,
+              seasonalPeriod, nLags)
+
+    Returns:
+        dict with the regular frame, its frequency, whether it was resampled,
+        and per-column results from analyze_series
+    """
+    freq = opts.get('resampleFrequency')
+    if freq:
+        check_grid_size(frame.index, freq)
+    else:
+        freq = infer_frequency(frame.index)
+    if freq is None:
+        raise ValueError("Need at least 3 distinct timestamps for time series analysis")
+
+    regular = resample(frame, freq, opts.get('aggregation', 'mean'))
+    regular = regular.dropna(axis=1, how='all')
+    logger.info(f"Time series regularized: {len(frame)} rows -> {len(regular)} at freq {freq}")
+
+    n_jobs = min(len(regular.columns), os.cpu_count() or 1) or 1
+    analyses = Parallel(n_jobs=n_jobs, prefer='threads')(
+        delayed(analyze_series)(regular[col], freq, opts) for col in regular.columns
+    )
+    return {
+        'regular': regular,
+        'frequency': freq,
+        'resampled': len(regular) != len(frame),
+        'series': dict(zip(regular.columns, analyses)),
+    }
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Concurrent large-upload load test
+
+Posts a generated CSV of the given size to an upload endpoint (the worker's
+/validate by default) from several clients at once, streaming each request
+body from disk, and samples the resident memory of a server process while
+it runs. Use it to see how many concurrent large uploads one pod can hold.
+
+    python upload_load_test.py --url http://localhost:8001/validate \\
+        --size-mb 50 --concurrency 1,2,4,8 --pid $(pgrep -f "uvicorn analyze:app" | head -1)
+"""
+
+import argparse
+import http.client
+import os
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+CHUNK_BYTES = 1 << 20
+
+
+def make_csv(size_mb: float, path: str) -> None:
+    """Write a numeric CSV of about size_mb megabytes"""
+    row = ','.join(f'{i * 1.5:.3f}' for i in range(10)) + ',group_a\n'
+    header = ','.join(f'x{i}' for i in range(10)) + ',group\n'
+    n_rows = int(size_mb * (1 << 20) / len(row))
+    with open(path, 'w') as f:
+        f.write(header)
+        block = row * 10000
+        for _ in range(n_rows // 10000):
+            f.write(block)
+        f.write(row * (n_rows % 10000))
+
+
+def _children(pid: int) -> list:
+    """Direct children of a process (Linux /proc)"""
+    children = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # The ppid follows the parenthesised command name
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        children.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    return children
+
+
+def rss_mb(pid: int) -> float:
+    """Resident memory of a process and its descendants (Linux /proc)"""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending += _children(current)
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total / 1024
+
+
+def post_file(url: str, path: str, fields: dict) -> tuple:
+    """POST path as multipart/form-data, streaming it from disk; returns (status, seconds)"""
+    parsed = urlparse(url)
+    boundary = uuid.uuid4().hex
+    head = ''.join(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+                   for name, value in fields.items())
+    head += (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="load.csv"\r\n'
+             'Content-Type: text/csv\r\n\r\n')
+    tail = f'\r\n--{boundary}--\r\n'.encode()
+    head = head.encode()
+
+    def body():
+        yield head
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+        yield tail
+
+    start = time.perf_counter()
+    connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=600)
+    connection.request('POST', parsed.path, body=body(), headers={
+        'Content-Type': f'multipart/form-data; boundary={boundary}',
+        'Content-Length': str(len(head) + os.path.getsize(path) + len(tail)),
+    })
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response.status, time.perf_counter() - start
+
+
+def run_level(url: str, path: str, fields: dict, concurrency: int, pid: int = None) -> dict:
+    """Send concurrency uploads at once; returns statuses, latencies and peak RSS"""
+    results = []
+    peak = [rss_mb(pid) if pid else 0.0]
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            peak[0] = max(peak[0], rss_mb(pid))
+            time.sleep(0.05)
+
+    def client():
+        try:
+            results.append(post_file(url, path, fields))
+        except Exception as e:
+            results.append((str(e), None))
+
+    sampler = threading.Thread(target=sample, daemon=True) if pid else None
+    if sampler:
+        sampler.start()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    done.set()
+    if sampler:
+        sampler.join()
+
+    latencies = sorted(seconds for _, seconds in results if seconds is not None)
+    return {
+        'concurrency': concurrency,
+        'ok': sum(1 for status, _ in results if status == 200),
+        'failed': sum(1 for status, _ in results if status != 200),
+        'wall_s': round(time.perf_counter() - start, 2),
+        'p50_s': round(latencies[len(latencies) // 2], 2) if latencies else None,
+        'max_s': round(latencies[-1], 2) if latencies else None,
+        'peak_rss_mb': round(peak[0], 1) if pid else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default='http://localhost:8001/validate')
+    parser.add_argument('--size-mb', type=float, default=50)
+    parser.add_argument('--concurrency', default='1,2,4,8', help='Comma-separated levels')
+    parser.add_argument('--pid', type=int, help='Server process to sample RSS of (with its children)')
+    parser.add_argument('--field', action='append', default=[],
+                        help='Extra form field name=value (e.g. options={"analysisType":"descriptive"})')
+    args = parser.parse_args()
+
+    fields = dict(field.split('=', 1) for field in args.field)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'load.csv')
+        make_csv(args.size_mb, path)
+        print(f'Upload: {os.path.getsize(path) / (1 << 20):.1f} MB to {args.url}')
+        if args.pid:
+            print(f'Idle RSS: {rss_mb(args.pid):.1f} MB')
+        for level in (int(c) for c in args.concurrency.split(',')):
+            print(run_level(args.url, path, fields, level, args.pid))
+
+
+if __name__ == '__main__':
+    main()